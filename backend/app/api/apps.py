@@ -1,3 +1,4 @@
+import logging
 from fastapi import APIRouter, Depends, HTTPException, Body
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
@@ -7,6 +8,7 @@ from app.api.auth import get_current_user
 from app.services.session_manager import SessionManager
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
 
 class AppCreate(BaseModel):
@@ -204,9 +206,10 @@ async def switch_app(
         error_msg = result.get("error", "Failed to activate app")
         requires_totp = result.get("requires_totp", False)
         
-        # Log the error for debugging
-        print(f"Session activation failed: {error_msg}")
-        print(f"Result: {result}")
+        logger.warning(
+            "Session activation failed: %s", error_msg,
+            extra={"app_id": app_id, "requires_totp": requires_totp}
+        )
         
         raise HTTPException(
             status_code=400,
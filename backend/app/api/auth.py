@@ -5,7 +5,9 @@ import bcrypt
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
 from pydantic import BaseModel
+from typing import Optional
 from app.models import get_db, User
+from app.services.request_timing import span
 
 router = APIRouter()
 
@@ -84,21 +86,27 @@ async def get_current_user(
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    if not token:
+    user = user_from_token(token, db)
+    if user is None:
         raise credentials_exception
+    return user
+
+
+def user_from_token(token: Optional[str], db: Session) -> Optional[User]:
+    """The user a session token belongs to, or None if it is missing, invalid or expired."""
+    if not token:
+        return None
     
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        with span("auth"):
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
         if username is None:
-            raise credentials_exception
-    except JWTError as e:
-        raise credentials_exception
+            return None
+    except JWTError:
+        return None
     
-    user = db.query(User).filter(User.username == username).first()
-    if user is None:
-        raise credentials_exception
-    return user
+    return db.query(User).filter(User.username == username).first()
 
 
 @router.post("/login", response_model=Token)
@@ -0,0 +1,65 @@
+from typing import Dict, Optional
+from fastapi import APIRouter, WebSocket, status
+from app.api.auth import user_from_token
+from app.models import App, Strategy
+from app.models.database import SessionLocal
+from app.services.pnl_engine import ACCOUNT, STRATEGY
+from app.services.ui_feed import UIFeed, negotiate
+
+router = APIRouter()
+
+
+class BookScope:
+    """
+    The P&L books a user may see: their apps' accounts and those apps'
+    strategies. Owners are looked up once per connection; a book created
+    after the connection opened is looked up when it is first published.
+    """
+
+    def __init__(self, user_id: int):
+        self.user_id = user_id
+        self._allowed: Dict[str, bool] = {}
+
+    def __call__(self, owner: str) -> bool:
+        allowed = self._allowed.get(owner)
+        if allowed is None:
+            allowed = self._allowed[owner] = self._lookup(owner)
+        return allowed
+
+    def _lookup(self, owner: str) -> bool:
+        kind, _, book_id = owner.partition(":")
+        if not book_id.isdigit():
+            return False
+        db = SessionLocal()
+        try:
+            if kind == ACCOUNT:
+                query = db.query(App.id).filter(App.id == int(book_id))
+            elif kind == STRATEGY:
+                query = db.query(Strategy.id).join(App, Strategy.app_id == App.id).filter(Strategy.id == int(book_id))
+            else:
+                return False
+            return query.filter(App.user_id == self.user_id).first() is not None
+        finally:
+            db.close()
+
+
+@router.websocket("/ws/live")
+async def live_feed(websocket: WebSocket, token: Optional[str] = None):
+    """
+    Live ticks and updates for the UI. Browsers cannot set headers on a
+    WebSocket, so the session token comes as ?token=. The encoding is
+    negotiated with the subprotocol; see app.services.ui_feed. P&L topics
+    are limited to the user's own apps and strategies.
+    """
+    db = SessionLocal()
+    try:
+        user = user_from_token(token, db)
+    finally:
+        db.close()
+    if user is None:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    subprotocol, encoding = negotiate(websocket.scope.get("subprotocols", ()))
+    await websocket.accept(subprotocol=subprotocol)
+    await UIFeed.get_instance().serve(websocket, encoding, may_see=BookScope(user.id))
@@ -1,19 +1,50 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
 from sqlalchemy.orm import Session
-from typing import List, Optional
-from app.models import get_db, Order, User, App, AppSecret
+from typing import List, Optional, Tuple
+from pydantic import BaseModel
+from app.models import get_db, Order, User, App, AppSecret, Strategy
 from app.api.auth import get_current_user
+from app.services.broker_models import to_payloads
+from app.services.bulk_orders import BulkOrders
+from app.services.execution import SLICED_ORDER_PREFIX, BasketValidationError, ExecutionLayer, OrderLeg
+from app.services.resource_versions import ORDERS, ResourceVersions
 from app.services.session_manager import SessionManager
+from app.services.smartapi_client import SmartAPIClient
 
 router = APIRouter()
 
 
-@router.get("")
-async def list_orders(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
-):
-    """Get order book from SmartAPI."""
+class BasketLeg(BaseModel):
+    symbol: Optional[str] = None  # trading symbol, or give symbol_token
+    symbol_token: Optional[str] = None
+    exchange: str = "NFO"
+    side: str  # BUY or SELL
+    quantity: int
+    order_type: str = "MARKET"  # MARKET or LIMIT
+    price: float = 0.0
+    product_type: str = "INTRADAY"
+
+
+class PlaceOrderRequest(BasketLeg):
+    strategy_id: Optional[int] = None
+    slice_interval: Optional[float] = None  # seconds between child orders above the freeze quantity
+
+
+class BasketOrderRequest(BaseModel):
+    legs: List[BasketLeg]
+    strategy_id: Optional[int] = None
+    hedge_first: bool = True  # BUY legs are placed before SELL legs
+    on_failure: str = "rollback"  # rollback or flag
+
+
+class BulkOrderRequest(BaseModel):
+    app_id: Optional[int] = None  # defaults to the active app
+    strategy_id: Optional[int] = None
+    symbol: Optional[str] = None  # trading symbol or symbol token
+
+
+async def _get_smartapi_client(current_user: User, db: Session) -> Tuple[int, SmartAPIClient]:
+    """Active app id and its SmartAPI client, restoring the session if needed."""
     # Get session manager and check for active session
     session_manager = SessionManager.get_instance()
     
@@ -63,8 +94,40 @@ async def list_orders(
             detail="No active session found. Please switch to an app to establish a session. Go to Apps page and click 'Switch to App'."
         )
     
+    return active_app_id, smartapi_client
+
+
+async def _bulk_target(request: BulkOrderRequest, current_user: User, db: Session) -> Tuple[int, SmartAPIClient]:
+    active_app_id, smartapi_client = await _get_smartapi_client(current_user, db)
+    if request.app_id is not None and request.app_id != active_app_id:
+        raise HTTPException(status_code=400, detail="Only the active app's orders can be acted on. Switch to that app first.")
+    _check_strategy(db, request.strategy_id, active_app_id)
+    return active_app_id, smartapi_client
+
+
+def _check_strategy(db: Session, strategy_id: Optional[int], app_id: int):
+    if strategy_id is not None:
+        strategy = db.query(Strategy).filter(Strategy.id == strategy_id, Strategy.app_id == app_id).first()
+        if not strategy:
+            raise HTTPException(status_code=404, detail="Strategy not found")
+
+
+@router.get("")
+async def list_orders(
+    request: Request,
+    response: Response,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Get order book from SmartAPI. Reads within BROKER_STATE_MAX_AGE share
+    one broker call; a matching If-None-Match is answered 304.
+    """
+    active_app_id, smartapi_client = await _get_smartapi_client(current_user, db)
+    
     # Get order book from SmartAPI
-    result = await smartapi_client.get_order_book()
+    versions = ResourceVersions.get_instance()
+    result = await versions.fetch(active_app_id, ORDERS, smartapi_client.get_order_book)
     
     if not result.get("success"):
         error_msg = result.get("error", "Failed to fetch order book")
@@ -73,11 +136,53 @@ async def list_orders(
             detail=error_msg
         )
     
+    not_modified = versions.not_modified(request, response, active_app_id, ORDERS)
+    if not_modified:
+        return not_modified
+    
     return {
         "status": True,
         "message": "SUCCESS",
         "errorcode": "",
-        "data": result.get("data", [])
+        "data": to_payloads(result["data"])
+    }
+
+
+@router.post("")
+async def place_order(
+    request: PlaceOrderRequest,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Place an order. Orders at or above the exchange freeze quantity are
+    split into child orders and returned (and recorded) as one parent
+    order with a SLICE_ id.
+    """
+    active_app_id, smartapi_client = await _get_smartapi_client(current_user, db)
+    _check_strategy(db, request.strategy_id, active_app_id)
+    leg = OrderLeg(
+        symbol=request.symbol or "", exchange=request.exchange, side=request.side, quantity=request.quantity,
+        order_type=request.order_type, price=request.price, product_type=request.product_type,
+        symbol_token=request.symbol_token
+    )
+    try:
+        order = await ExecutionLayer.get_instance().execute_sliced_order(
+            smartapi_client, active_app_id, leg, request.strategy_id, request.slice_interval
+        )
+    except BasketValidationError as e:
+        raise HTTPException(status_code=400, detail=e.errors.get(0, str(e)))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        # Symbol master unavailable
+        raise HTTPException(status_code=502, detail=str(e))
+
+    return {
+        "status": order.status != "rejected",
+        "message": "SUCCESS" if order.status != "rejected" else "Order rejected",
+        "errorcode": "",
+        "data": order.to_dict()
     }
 
 
@@ -88,54 +193,17 @@ async def get_order_details(
     db: Session = Depends(get_db)
 ):
     """Get order details by order ID from SmartAPI."""
-    # Get session manager and check for active session
-    session_manager = SessionManager.get_instance()
+    active_app_id, smartapi_client = await _get_smartapi_client(current_user, db)
     
-    # Check if there's an active session in SessionManager
-    active_app_id = session_manager.get_active_app_id()
-    
-    # If no active session, check if user has an active app set (for backward compatibility)
-    if not active_app_id:
-        active_app_id = getattr(current_user, "_active_app_id", None)
-    
-    # If still no active app, check if user has apps and try to use default
-    if not active_app_id:
-        user_apps = db.query(App).filter(App.user_id == current_user.id).all()
-        if user_apps:
-            # Try to find default app
-            default_app = next((app for app in user_apps if app.is_default), None)
-            if default_app:
-                active_app_id = default_app.id
-            else:
-                # Use first app if no default
-                active_app_id = user_apps[0].id
-    
-    if not active_app_id:
-        raise HTTPException(
-            status_code=400,
-            detail="No active app selected. Please switch to an app first."
-        )
-    
-    # Get SmartAPI client from session manager
-    smartapi_client = session_manager.get_smartapi_client()
-    
-    # If no client, try to restore session from app
-    if not smartapi_client:
-        # Get app and secrets
-        app = db.query(App).filter(App.id == active_app_id).first()
-        if app:
-            secrets = db.query(AppSecret).filter(AppSecret.app_id == active_app_id).first()
-            if secrets:
-                # Try to restore session (will check token validity and refresh if needed)
-                restored = await session_manager.restore_session(active_app_id, app, secrets)
-                if restored:
-                    smartapi_client = session_manager.get_smartapi_client()
-    
-    if not smartapi_client:
-        raise HTTPException(
-            status_code=400,
-            detail="No active session found. Please switch to an app to establish a session. Go to Apps page and click 'Switch to App'."
-        )
+    if order_id.startswith(SLICED_ORDER_PREFIX):
+        # Sliced orders only exist here; roll the children's fills up from the order book
+        try:
+            order = await ExecutionLayer.get_instance().refresh_order(smartapi_client, active_app_id, order_id)
+        except RuntimeError as e:
+            raise HTTPException(status_code=502, detail=str(e))
+        if order is None:
+            raise HTTPException(status_code=404, detail="Order not found")
+        return {"status": True, "message": "SUCCESS", "errorcode": "", "data": order.to_dict()}
     
     # Get order details from SmartAPI
     result = await smartapi_client.get_order_details(order_id)
@@ -147,10 +215,114 @@ async def get_order_details(
             detail=error_msg
         )
     
+    # New fills of an order we placed move the account P&L
+    details = result["data"]
+    ExecutionLayer.get_instance().observe_order(order_id, details.state, details.filledshares, details.averageprice)
+    
     return {
         "status": True,
         "message": "SUCCESS",
         "errorcode": "",
-        "data": result.get("data")
+        "data": result["data"].to_payload()
+    }
+
+
+@router.post("/basket")
+async def place_basket_order(
+    request: BasketOrderRequest,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Place a multi-leg basket. Every leg is validated against the symbol
+    master before any is sent; legs are then placed concurrently. If a leg
+    is rejected the others are rolled back (or, with on_failure=flag, left
+    open and reported), and the outcome of every leg is returned.
+    """
+    if request.on_failure not in ("rollback", "flag"):
+        raise HTTPException(status_code=400, detail="on_failure must be 'rollback' or 'flag'")
+    active_app_id, smartapi_client = await _get_smartapi_client(current_user, db)
+    _check_strategy(db, request.strategy_id, active_app_id)
+
+    legs = [
+        OrderLeg(
+            symbol=leg.symbol or "", exchange=leg.exchange, side=leg.side, quantity=leg.quantity,
+            order_type=leg.order_type, price=leg.price, product_type=leg.product_type,
+            symbol_token=leg.symbol_token
+        )
+        for leg in request.legs
+    ]
+    try:
+        basket = await ExecutionLayer.get_instance().execute_basket(
+            smartapi_client, active_app_id, legs, request.strategy_id,
+            hedge_first=request.hedge_first, on_failure=request.on_failure
+        )
+    except BasketValidationError as e:
+        raise HTTPException(
+            status_code=400,
+            detail={"message": str(e), "legs": {str(index): error for index, error in e.errors.items()}}
+        )
+    except RuntimeError as e:
+        # Symbol master unavailable
+        raise HTTPException(status_code=502, detail=str(e))
+
+    return {
+        "status": basket.status == "placed",
+        "message": "SUCCESS" if basket.status == "placed" else f"Basket {basket.status}",
+        "errorcode": "",
+        "data": basket.to_dict()
     }
 
+
+@router.post("/cancel-all")
+async def cancel_all_orders(
+    request: BulkOrderRequest,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Cancel every open order, optionally only a strategy's or one symbol's.
+    The order book is read once and the cancels are sent concurrently;
+    the outcome of each order is returned.
+    """
+    active_app_id, smartapi_client = await _bulk_target(request, current_user, db)
+    try:
+        outcomes = await BulkOrders().cancel_all(smartapi_client, active_app_id, request.strategy_id, request.symbol)
+    except RuntimeError as e:
+        raise HTTPException(status_code=502, detail=str(e))
+
+    failed = sum(outcome.status == "failed" for outcome in outcomes)
+    return {
+        "status": not failed,
+        "message": "SUCCESS" if not failed else f"{failed} of {len(outcomes)} cancels failed",
+        "errorcode": "",
+        "data": [outcome.to_dict() for outcome in outcomes]
+    }
+
+
+@router.post("/exit-all-positions")
+async def exit_all_positions(
+    request: BulkOrderRequest,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Cancel matching open orders, then close every matching position at
+    market. With a strategy, that strategy's own (ledger) positions are
+    closed rather than the account's.
+    """
+    active_app_id, smartapi_client = await _bulk_target(request, current_user, db)
+    try:
+        result = await BulkOrders().exit_all_positions(
+            smartapi_client, active_app_id, request.strategy_id, request.symbol
+        )
+    except RuntimeError as e:
+        raise HTTPException(status_code=502, detail=str(e))
+
+    failed = sum(outcome.status in ("failed", "rejected") for outcomes in result.values() for outcome in outcomes)
+    return {
+        "status": not failed,
+        "message": "SUCCESS" if not failed else f"{failed} orders failed",
+        "errorcode": "",
+        "data": {name: [outcome.to_dict() for outcome in outcomes] for name, outcomes in result.items()}
+    }
@@ -1,3 +1,4 @@
+import logging
 from fastapi import APIRouter, Depends, HTTPException, Body, Request
 from sqlalchemy.orm import Session
 from typing import Optional
@@ -7,8 +8,11 @@ from app.models import get_db, User, App, AppSecret
 from app.api.auth import get_current_user
 from app.services.session_manager import SessionManager
 from app.services.smartapi_client import SmartAPIClient
+from app.services.market_breadth import BUILDUP_TYPES, MarketBreadthService
+from app.services.option_chain import OptionChainService
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
 
 class SessionRestoreRequest(BaseModel):
@@ -170,7 +174,7 @@ async def get_funds(
             detail=error_msg
         )
     
-    return funds_result
+    return {**funds_result, "data": funds_result["data"].to_payload()} if funds_result.get("data") else funds_result
 
 
 @router.get("/market/gainers-losers")
@@ -182,6 +186,23 @@ async def get_top_gainers_losers(
     limit: int = 20
 ):
     """Get top gainers and losers for the day."""
+    # Rank the subscribed universe locally while the feed is live; no broker call
+    breadth = MarketBreadthService.get_instance()
+    if breadth.is_live():
+        kind = "OI" if datatype.startswith("PercOI") else "Price"
+        return {
+            "status": True,
+            "message": "SUCCESS",
+            "errorcode": "",
+            "data": {
+                "gainers": breadth.rank(f"Perc{kind}Gainers", limit),
+                "losers": breadth.rank(f"Perc{kind}Losers", limit),
+                "expirytype": expirytype,
+                "source": "feed",
+                "timestamp": datetime.now().isoformat()
+            }
+        }
+
     # Get session manager and check for active session
     session_manager = SessionManager.get_instance()
     
@@ -233,15 +254,11 @@ async def get_top_gainers_losers(
             limit=limit
         )
         
-        # Log results for debugging
-        print(f"Gainers result: {gainers_result}")
-        print(f"Losers result: {losers_result}")
-        
         # Check if both requests succeeded
         if not gainers_result.get("success"):
             error_msg = gainers_result.get("error", "Failed to fetch top gainers")
             errorcode = gainers_result.get("errorcode", "")
-            print(f"Failed to fetch gainers: {error_msg} (errorcode: {errorcode})")
+            logger.warning("Failed to fetch gainers: %s", error_msg, extra={"errorcode": errorcode})
             raise HTTPException(
                 status_code=400,
                 detail=f"Failed to fetch top gainers: {error_msg}"
@@ -250,7 +267,7 @@ async def get_top_gainers_losers(
         if not losers_result.get("success"):
             error_msg = losers_result.get("error", "Failed to fetch top losers")
             errorcode = losers_result.get("errorcode", "")
-            print(f"Failed to fetch losers: {error_msg} (errorcode: {errorcode})")
+            logger.warning("Failed to fetch losers: %s", error_msg, extra={"errorcode": errorcode})
             raise HTTPException(
                 status_code=400,
                 detail=f"Failed to fetch top losers: {error_msg}"
@@ -258,9 +275,7 @@ async def get_top_gainers_losers(
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Unexpected error in get_top_gainers_losers endpoint: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Unexpected error in get_top_gainers_losers endpoint")
         raise HTTPException(
             status_code=500,
             detail=f"Internal server error: {str(e)}"
@@ -281,6 +296,74 @@ async def get_top_gainers_losers(
             "gainers": gainers,
             "losers": losers,
             "expirytype": expirytype,
+            "source": "broker",
             "timestamp": datetime.now().isoformat()
         }
-    }
\ No newline at end of file
+    }
+
+
+@router.get("/market/oi-buildup")
+async def get_oi_buildup(
+    current_user: User = Depends(get_current_user),
+    buildup_type: str = "Long Built Up",
+    limit: int = 20
+):
+    """OI buildup (Long Built Up, Short Built Up, Short Covering, Long Unwinding) from the live feed."""
+    if buildup_type not in BUILDUP_TYPES:
+        raise HTTPException(status_code=400, detail=f"buildup_type must be one of {', '.join(BUILDUP_TYPES)}")
+    breadth = MarketBreadthService.get_instance()
+    if not breadth.is_live():
+        raise HTTPException(status_code=503, detail="Market feed is not streaming")
+    return {
+        "status": True,
+        "message": "SUCCESS",
+        "errorcode": "",
+        "data": breadth.oi_buildup(buildup_type, limit)
+    }
+
+
+def _require_smartapi_client() -> SmartAPIClient:
+    smartapi_client = SessionManager.get_instance().get_smartapi_client()
+    if not smartapi_client:
+        raise HTTPException(
+            status_code=400,
+            detail="No active session. Please switch to an app first."
+        )
+    return smartapi_client
+
+
+@router.get("/market/option-chain/expiries")
+async def get_option_expiries(
+    underlying: str,
+    current_user: User = Depends(get_current_user)
+):
+    """List option expiries for an NFO underlying (e.g. NIFTY, BANKNIFTY)."""
+    smartapi_client = _require_smartapi_client()
+    try:
+        expiries = await OptionChainService.get_instance().expiries(smartapi_client, underlying)
+    except RuntimeError as e:
+        raise HTTPException(status_code=502, detail=str(e))
+    return {"status": True, "message": "SUCCESS", "errorcode": "", "data": {"underlying": underlying.upper(), "expiries": expiries}}
+
+
+@router.get("/market/option-chain")
+async def get_option_chain(
+    underlying: str,
+    expiry: Optional[str] = None,
+    strikes: Optional[int] = None,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Option chain with IV, Greeks and PCR for an underlying/expiry
+    (nearest expiry if omitted). `strikes` limits the ladder to that
+    many strikes either side of the ATM strike.
+    """
+    smartapi_client = _require_smartapi_client()
+    try:
+        chain = await OptionChainService.get_instance().get_chain(smartapi_client, underlying, expiry)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e.args[0]))
+    except RuntimeError as e:
+        raise HTTPException(status_code=502, detail=str(e))
+    return {"status": True, "message": "SUCCESS", "errorcode": "", "data": chain.to_dict(strikes)}
+
@@ -1,9 +1,11 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
+from dataclasses import asdict
 from typing import Optional
-from app.models import get_db, Setting, User
+from app.models import get_db, App, User
 from app.api.auth import get_current_user
+from app.services.settings_service import SettingsService
 
 router = APIRouter()
 
@@ -13,55 +15,33 @@ class SettingsUpdate(BaseModel):
     default_lot_size: Optional[int] = None
 
 
+def _check_app_access(app_id: Optional[int], current_user: User, db: Session):
+    if app_id is None:
+        return
+    app = db.query(App).filter(App.id == app_id, App.user_id == current_user.id).first()
+    if not app:
+        raise HTTPException(status_code=404, detail="App not found")
+
+
 @router.get("")
 async def get_settings(
+    app_id: Optional[int] = None,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    settings = db.query(Setting).filter(Setting.app_id == None).all()
-    result = {}
-    for setting in settings:
-        result[setting.key] = setting.value
-    
-    # Default values
-    defaults = {
-        "paper_mode": "false",
-        "default_lot_size": "1"
-    }
-    
-    for key, value in defaults.items():
-        if key not in result:
-            result[key] = value
-    
-    # Convert to proper types
-    return {
-        "paper_mode": result.get("paper_mode", "false") == "true",
-        "default_lot_size": int(result.get("default_lot_size", "1"))
-    }
+    """Get effective settings (global, or with the given app's overrides applied)."""
+    _check_app_access(app_id, current_user, db)
+    return asdict(SettingsService.get_instance().get(app_id))
 
 
 @router.put("")
 async def update_settings(
     settings_data: SettingsUpdate,
+    app_id: Optional[int] = None,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    if settings_data.paper_mode is not None:
-        setting = db.query(Setting).filter(Setting.key == "paper_mode", Setting.app_id == None).first()
-        if setting:
-            setting.value = str(settings_data.paper_mode)
-        else:
-            setting = Setting(key="paper_mode", value=str(settings_data.paper_mode))
-            db.add(setting)
-    
-    if settings_data.default_lot_size is not None:
-        setting = db.query(Setting).filter(Setting.key == "default_lot_size", Setting.app_id == None).first()
-        if setting:
-            setting.value = str(settings_data.default_lot_size)
-        else:
-            setting = Setting(key="default_lot_size", value=str(settings_data.default_lot_size))
-            db.add(setting)
-    
-    db.commit()
-    return {"message": "Settings updated successfully"}
-
+    """Update global settings, or per-app overrides when app_id is given."""
+    _check_app_access(app_id, current_user, db)
+    snapshot = SettingsService.get_instance().update(db, settings_data.model_dump(), app_id=app_id)
+    return {"message": "Settings updated successfully", "settings": asdict(snapshot)}
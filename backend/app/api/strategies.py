@@ -1,12 +1,24 @@
-from fastapi import APIRouter, Depends, HTTPException
+import asyncio
+import json
+from datetime import datetime
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
-from typing import List, Optional
-from app.models import get_db, Strategy, App, User
+from typing import Any, Dict, List, Optional
+from app.models import get_db, Strategy, StrategyRun, App, User
 from app.api.auth import get_current_user
+from app.services import optimizer
+from app.services.intent_netting import IntentNetter
+from app.services.resource_versions import STRATEGIES, ResourceVersions
+from app.services.session_manager import SessionManager
+from app.services.strategy_engine import StrategyEngine
+from app.services.strategy_rules import RULE_CACHE, StrategyRuleError, validate_params_json
 
 router = APIRouter()
 
+# Keep references to running optimisation tasks so they are not garbage collected
+_optimization_tasks = set()
+
 
 class StrategyCreate(BaseModel):
     name: str
@@ -15,6 +27,32 @@ class StrategyCreate(BaseModel):
     enabled: bool = False
 
 
+class StrategyUpdate(BaseModel):
+    name: Optional[str] = None
+    type: Optional[str] = None
+    params_json: Optional[str] = None
+    enabled: Optional[bool] = None
+
+
+class OptimizeRequest(BaseModel):
+    template: Optional[str] = None  # defaults to the strategy's type
+    search: str = "grid"  # grid or random
+    space: Dict[str, Any]
+    samples: int = 200  # random search only
+    seed: Optional[int] = None
+    objective: str = "sharpe"
+    prune_fraction: Optional[float] = 0.3
+    keep_ratio: float = 0.25
+    cost: float = 0.0
+    periods_per_year: float = 252
+    top: int = 50
+    # Bars: either inline columns, or candles fetched from the broker
+    bars: Optional[Dict[str, List[float]]] = None
+    exchange: Optional[str] = None
+    symbol_token: Optional[str] = None
+    interval: str = "FIVE_MINUTE"
+
+
 class StrategyResponse(BaseModel):
     id: int
     app_id: int
@@ -23,7 +61,7 @@ class StrategyResponse(BaseModel):
     params_json: str
     enabled: bool
     status: Optional[str] = "stopped"
-    created_at: str
+    created_at: datetime
 
     class Config:
         from_attributes = True
@@ -31,6 +69,8 @@ class StrategyResponse(BaseModel):
 
 @router.get("", response_model=List[StrategyResponse])
 async def list_strategies(
+    request: Request,
+    response: Response,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
@@ -39,6 +79,11 @@ async def list_strategies(
     if not active_app_id:
         return []
     
+    # Strategies only change through this API, so the version is the ETag
+    not_modified = ResourceVersions.get_instance().not_modified(request, response, active_app_id, STRATEGIES)
+    if not_modified:
+        return not_modified
+    
     strategies = db.query(Strategy).filter(Strategy.app_id == active_app_id).all()
     return [
         {
@@ -74,6 +119,11 @@ async def create_strategy(
     active_app_id = getattr(current_user, "_active_app_id", None)
     if not active_app_id:
         raise HTTPException(status_code=400, detail="No active app selected")
+
+    try:
+        validate_params_json(strategy_data.params_json)
+    except StrategyRuleError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
     new_strategy = Strategy(
         app_id=active_app_id,
@@ -85,6 +135,7 @@ async def create_strategy(
     db.add(new_strategy)
     db.commit()
     db.refresh(new_strategy)
+    ResourceVersions.get_instance().touch(active_app_id)
     
     return {
         **new_strategy.__dict__,
@@ -92,6 +143,41 @@ async def create_strategy(
     }
 
 
+@router.put("/{strategy_id}", response_model=StrategyResponse)
+async def update_strategy(
+    strategy_id: int,
+    strategy_data: StrategyUpdate,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    strategy = db.query(Strategy).filter(Strategy.id == strategy_id).first()
+    if not strategy:
+        raise HTTPException(status_code=404, detail="Strategy not found")
+
+    updates = strategy_data.model_dump(exclude_unset=True)
+    if "params_json" in updates:
+        try:
+            validate_params_json(updates["params_json"])
+        except StrategyRuleError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    params_changed = "params_json" in updates and updates["params_json"] != strategy.params_json
+    for field, value in updates.items():
+        setattr(strategy, field, value)
+    db.commit()
+    db.refresh(strategy)
+    # The compiled rules are rebuilt on next use
+    RULE_CACHE.invalidate(strategy_id)
+    if params_changed:
+        # A running strategy holds its own compiled rules (here or in a shard)
+        await StrategyEngine.get_instance().reload_strategy(strategy)
+    ResourceVersions.get_instance().touch(strategy.app_id)
+
+    return {
+        **strategy.__dict__,
+        "status": getattr(strategy, "_runtime_status", "stopped")
+    }
+
+
 @router.post("/{strategy_id}/start")
 async def start_strategy(
     strategy_id: int,
@@ -102,8 +188,12 @@ async def start_strategy(
     if not strategy:
         raise HTTPException(status_code=404, detail="Strategy not found")
     
-    # TODO: Implement actual strategy start logic
+    try:
+        await StrategyEngine.get_instance().start_strategy(strategy)
+    except StrategyRuleError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     setattr(strategy, "_runtime_status", "running")
+    ResourceVersions.get_instance().touch(strategy.app_id)
     
     return {"message": "Strategy started", "strategy_id": strategy_id}
 
@@ -118,8 +208,9 @@ async def stop_strategy(
     if not strategy:
         raise HTTPException(status_code=404, detail="Strategy not found")
     
-    # TODO: Implement actual strategy stop logic
+    await StrategyEngine.get_instance().stop_strategy(strategy_id)
     setattr(strategy, "_runtime_status", "stopped")
+    ResourceVersions.get_instance().touch(strategy.app_id)
     
     return {"message": "Strategy stopped", "strategy_id": strategy_id}
 
@@ -134,8 +225,9 @@ async def pause_strategy(
     if not strategy:
         raise HTTPException(status_code=404, detail="Strategy not found")
     
-    # TODO: Implement actual strategy pause logic
+    await StrategyEngine.get_instance().pause_strategy(strategy_id)
     setattr(strategy, "_runtime_status", "paused")
+    ResourceVersions.get_instance().touch(strategy.app_id)
     
     return {"message": "Strategy paused", "strategy_id": strategy_id}
 
@@ -192,7 +284,132 @@ async def delete_strategy(
     if not strategy:
         raise HTTPException(status_code=404, detail="Strategy not found")
     
+    await StrategyEngine.get_instance().stop_strategy(strategy_id)
+    app_id = strategy.app_id
     db.delete(strategy)
     db.commit()
+    RULE_CACHE.invalidate(strategy_id)
+    ResourceVersions.get_instance().touch(app_id)
     return {"message": "Strategy deleted successfully"}
 
+
+async def _candle_bars(request: OptimizeRequest) -> Dict[str, List[float]]:
+    smartapi_client = SessionManager.get_instance().get_smartapi_client()
+    if not smartapi_client:
+        raise HTTPException(status_code=400, detail="No active session. Please switch to an app first.")
+    result = await smartapi_client.get_market_data(request.exchange, request.symbol_token, request.interval)
+    candles = result.get("data") if result.get("status") else None
+    if not candles:
+        raise HTTPException(status_code=502, detail=result.get("message") or result.get("error") or "No candle data")
+    # Candles are [timestamp, open, high, low, close, volume]
+    columns = list(zip(*candles))
+    return {name: list(columns[i]) for i, name in enumerate(("open", "high", "low", "close", "volume"), start=1)}
+
+
+@router.post("/{strategy_id}/optimize")
+async def optimize_strategy(
+    strategy_id: int,
+    request: OptimizeRequest,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Start a parameter sweep in the background. Results are written to a
+    StrategyRun; poll GET /{strategy_id}/runs/{run_id}.
+    """
+    strategy = db.query(Strategy).filter(Strategy.id == strategy_id).first()
+    if not strategy:
+        raise HTTPException(status_code=404, detail="Strategy not found")
+
+    template = request.template or strategy.type
+    if template not in optimizer.TEMPLATES:
+        raise HTTPException(status_code=400, detail=f"template must be one of {', '.join(optimizer.TEMPLATES)}")
+    if request.objective not in optimizer.OBJECTIVES:
+        raise HTTPException(status_code=400, detail=f"objective must be one of {', '.join(optimizer.OBJECTIVES)}")
+    # Sizes are checked before any parameter set is generated
+    if request.search == "grid":
+        if not all(isinstance(values, list) for values in request.space.values()):
+            raise HTTPException(status_code=400, detail="Grid search needs a list of values for each parameter")
+        if optimizer.grid_size(request.space) > optimizer.MAX_PARAM_SETS:
+            raise HTTPException(status_code=400, detail=f"Sweep exceeds {optimizer.MAX_PARAM_SETS} parameter sets")
+        param_sets = optimizer.grid_search(request.space)
+    elif request.search == "random":
+        if not 1 <= request.samples <= optimizer.MAX_PARAM_SETS:
+            raise HTTPException(status_code=400, detail=f"samples must be between 1 and {optimizer.MAX_PARAM_SETS}")
+        param_sets = optimizer.random_search(request.space, request.samples, request.seed)
+    else:
+        raise HTTPException(status_code=400, detail="search must be grid or random")
+
+    if request.bars is not None:
+        bars = request.bars
+    elif request.exchange and request.symbol_token:
+        bars = await _candle_bars(request)
+    else:
+        raise HTTPException(status_code=400, detail="Provide bars or exchange and symbol_token")
+    if "close" not in bars:
+        raise HTTPException(status_code=400, detail="bars must include close")
+
+    run = StrategyRun(strategy_id=strategy_id, status="running")
+    db.add(run)
+    db.commit()
+    db.refresh(run)
+
+    task = asyncio.create_task(optimizer.optimize_strategy(
+        run.id, bars, template, param_sets, top=request.top,
+        objective=request.objective, prune_fraction=request.prune_fraction, keep_ratio=request.keep_ratio,
+        cost=request.cost, periods_per_year=request.periods_per_year
+    ))
+    _optimization_tasks.add(task)
+    task.add_done_callback(_optimization_tasks.discard)
+
+    return {"message": "Optimisation started", "run_id": run.id, "parameter_sets": len(param_sets)}
+
+
+@router.get("/{strategy_id}/runs")
+async def list_strategy_runs(
+    strategy_id: int,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    runs = db.query(StrategyRun).filter(StrategyRun.strategy_id == strategy_id).order_by(StrategyRun.id.desc()).all()
+    return [
+        {
+            "id": run.id,
+            "status": run.status,
+            "started_at": run.started_at,
+            "ended_at": run.ended_at
+        }
+        for run in runs
+    ]
+
+
+@router.get("/{strategy_id}/runs/{run_id}")
+async def get_strategy_run(
+    strategy_id: int,
+    run_id: int,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    run = db.query(StrategyRun).filter(StrategyRun.id == run_id, StrategyRun.strategy_id == strategy_id).first()
+    if not run:
+        raise HTTPException(status_code=404, detail="Run not found")
+    return {
+        "id": run.id,
+        "status": run.status,
+        "started_at": run.started_at,
+        "ended_at": run.ended_at,
+        "result": json.loads(run.result_json) if run.result_json else None
+    }
+
+
+@router.get("/{strategy_id}/positions")
+async def get_strategy_positions(
+    strategy_id: int,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """The strategy's own positions from its allocated fills (after netting across strategies)."""
+    strategy = db.query(Strategy).filter(Strategy.id == strategy_id).first()
+    if not strategy:
+        raise HTTPException(status_code=404, detail="Strategy not found")
+    return {"strategy_id": strategy_id, "positions": IntentNetter.get_instance().ledger.for_strategy(strategy_id)}
@@ -0,0 +1,33 @@
+import asyncio
+from fastapi import APIRouter, Depends
+from app.models import User
+from app.api.auth import get_current_user
+from app.services.resource_versions import ORDERS, POSITIONS, ResourceVersions
+from app.services.session_manager import SessionManager
+
+router = APIRouter()
+
+
+@router.get("")
+async def get_versions(current_user: User = Depends(get_current_user)):
+    """
+    Change counters for the active app's positions, orders and strategies.
+    Poll this and refetch a list only when its counter moves. Positions and
+    orders are revalidated through the shared broker cache, so however many
+    clients poll, the broker is read at most once per BROKER_STATE_MAX_AGE.
+    """
+    session_manager = SessionManager.get_instance()
+    active_app_id = session_manager.get_active_app_id() or getattr(current_user, "_active_app_id", None)
+    if not active_app_id:
+        return {"app_id": None, "versions": {}}
+
+    versions = ResourceVersions.get_instance()
+    smartapi_client = session_manager.get_smartapi_client()
+    if smartapi_client:
+        # A failed read leaves its counter where it was
+        await asyncio.gather(
+            versions.fetch(active_app_id, POSITIONS, smartapi_client.get_positions),
+            versions.fetch(active_app_id, ORDERS, smartapi_client.get_order_book),
+            return_exceptions=True
+        )
+    return {"app_id": active_app_id, "versions": versions.versions(active_app_id)}
@@ -0,0 +1,240 @@
+"""
+Logging Config - Non-blocking structured logging for the backend
+
+Log calls on the event loop only enqueue the record; a background listener
+thread formats, redacts and writes it, so a slow terminal or pipe never
+blocks request handling.
+
+Environment variables:
+    LOG_LEVEL          Root level (default: INFO)
+    LOG_LEVELS         Per-module levels, e.g. "app.services.smartapi_client=DEBUG,app.api=WARNING"
+    LOG_FORMAT         "json" (default) or "text"
+    LOG_SAMPLE_RATES   Keep 1 in N records for high-frequency loggers, e.g. "app.services.feed=100"
+    LOG_QUEUE_SIZE     Max queued records before new ones are dropped (default: 10000)
+"""
+import json
+import logging
+import os
+import queue
+import re
+import sys
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional
+
+
+# Attributes present on every LogRecord; anything else came in via `extra=`
+_RESERVED_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+# Header / payload keys whose values must never reach the logs
+_SECRET_KEYS = (
+    "authorization", "access_token", "refresh_token", "feed_token", "jwtToken",
+    "refreshToken", "feedToken", "X-PrivateKey", "api_key", "secret_key",
+    "password", "mpin", "totp", "token"
+)
+_SECRET_KEYS_LOWER = {key.lower() for key in _SECRET_KEYS}
+
+_REDACTIONS = [
+    # Bearer tokens
+    (re.compile(r"(Bearer\s+)[A-Za-z0-9\-_.=]+", re.IGNORECASE), r"\1[REDACTED]"),
+    # JWTs anywhere in a message
+    (re.compile(r"eyJ[A-Za-z0-9\-_]+\.[A-Za-z0-9\-_]+\.[A-Za-z0-9\-_]*"), "[REDACTED_JWT]"),
+    # key=value / "key": "value" / 'key': 'value' pairs for known secret keys
+    (
+        re.compile(
+            r"""((?<![A-Za-z0-9_])["']?(?:%s)["']?\s*[:=]\s*["']?)[^"',}\s&]+""" % "|".join(map(re.escape, _SECRET_KEYS)),
+            re.IGNORECASE
+        ),
+        r"\1[REDACTED]"
+    ),
+]
+
+
+def redact(text: str) -> str:
+    """Mask tokens, secrets and credentials in a log string."""
+    for pattern, replacement in _REDACTIONS:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+class RedactingFilter(logging.Filter):
+    """Redacts secrets from the rendered message and structured fields."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.msg = redact(record.getMessage())
+        record.args = None
+        for key, value in _extra_fields(record).items():
+            if key.lower() in _SECRET_KEYS_LOWER:
+                setattr(record, key, "[REDACTED]")
+            elif isinstance(value, str):
+                setattr(record, key, redact(value))
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps 1 in N records for configured loggers (and their children).
+    Sampling is counted per call site, so a rare message is not starved
+    by a frequent one from the same logger. WARNING and above always pass.
+    """
+
+    def __init__(self, rates: Dict[str, int]):
+        super().__init__()
+        self.rates = {name: rate for name, rate in rates.items() if rate > 1}
+        self._counters: Dict[tuple, int] = {}
+
+    def _rate_for(self, name: str) -> int:
+        while name:
+            rate = self.rates.get(name)
+            if rate:
+                return rate
+            name = name.rpartition(".")[0]
+        return 1
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not self.rates or record.levelno >= logging.WARNING:
+            return True
+        rate = self._rate_for(record.name)
+        if rate == 1:
+            return True
+        key = (record.name, record.pathname, record.lineno)
+        count = self._counters.get(key, 0)
+        self._counters[key] = count + 1
+        if count % rate:
+            return False
+        record.sample_rate = rate
+        return True
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """QueueHandler that drops records instead of blocking when the queue is full."""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line with any `extra=` fields merged in."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        entry.update(_extra_fields(record))
+        if record.exc_info:
+            entry["exc"] = redact(self.formatException(record.exc_info))
+        elif record.exc_text:
+            entry["exc"] = redact(record.exc_text)
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Human-readable format for local development, with `extra=` fields appended."""
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)-7s %(name)s: %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        fields = _extra_fields(record)
+        if fields:
+            text += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        return redact(text) if record.exc_info or record.exc_text else text
+
+
+def _extra_fields(record: logging.LogRecord) -> Dict:
+    return {key: value for key, value in vars(record).items() if key not in _RESERVED_ATTRS}
+
+
+def _parse_mapping(spec: str) -> Dict[str, str]:
+    mapping = {}
+    for item in spec.split(","):
+        name, sep, value = item.partition("=")
+        if sep and name.strip() and value.strip():
+            mapping[name.strip()] = value.strip()
+    return mapping
+
+
+_listener: Optional[QueueListener] = None
+_queue_handler: Optional[NonBlockingQueueHandler] = None
+_setup_lock = threading.Lock()
+
+
+def setup_logging(
+    level: Optional[str] = None,
+    module_levels: Optional[Dict[str, str]] = None,
+    sample_rates: Optional[Dict[str, int]] = None,
+    fmt: Optional[str] = None,
+    stream=None
+) -> NonBlockingQueueHandler:
+    """
+    Install the queue-based logging pipeline on the root logger.
+    Safe to call more than once; later calls are no-ops until shutdown_logging().
+
+    Args:
+        level: Root log level (overrides LOG_LEVEL)
+        module_levels: Logger name -> level (merged over LOG_LEVELS)
+        sample_rates: Logger name -> keep 1 in N (merged over LOG_SAMPLE_RATES)
+        fmt: "json" or "text" (overrides LOG_FORMAT)
+        stream: Output stream for the listener (default: sys.stdout)
+    """
+    global _listener, _queue_handler
+
+    with _setup_lock:
+        if _queue_handler is not None:
+            return _queue_handler
+
+        levels = _parse_mapping(os.getenv("LOG_LEVELS", ""))
+        levels.update(module_levels or {})
+        rates = {name: int(rate) for name, rate in _parse_mapping(os.getenv("LOG_SAMPLE_RATES", "")).items()}
+        rates.update(sample_rates or {})
+        fmt = (fmt or os.getenv("LOG_FORMAT", "json")).lower()
+
+        output = logging.StreamHandler(stream or sys.stdout)
+        output.setFormatter(TextFormatter() if fmt == "text" else JSONFormatter())
+        output.addFilter(RedactingFilter())
+
+        log_queue = queue.Queue(maxsize=int(os.getenv("LOG_QUEUE_SIZE", "10000")))
+        _queue_handler = NonBlockingQueueHandler(log_queue)
+        # Sampling runs in the caller so dropped records are never enqueued
+        _queue_handler.addFilter(SamplingFilter(rates))
+
+        root = logging.getLogger()
+        root.handlers = [_queue_handler]
+        root.setLevel((level or os.getenv("LOG_LEVEL", "INFO")).upper())
+        for name, module_level in levels.items():
+            logging.getLogger(name).setLevel(module_level.upper())
+
+        # Route uvicorn's loggers through the same pipeline
+        for name in ("uvicorn", "uvicorn.error", "uvicorn.access"):
+            uvicorn_logger = logging.getLogger(name)
+            uvicorn_logger.handlers = []
+            uvicorn_logger.propagate = True
+
+        _listener = QueueListener(log_queue, output, respect_handler_level=True)
+        _listener.start()
+        return _queue_handler
+
+
+def shutdown_logging():
+    """Flush queued records and stop the listener thread."""
+    global _listener, _queue_handler
+
+    with _setup_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+        if _queue_handler is not None:
+            logging.getLogger().removeHandler(_queue_handler)
+            _queue_handler = None
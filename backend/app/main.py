@@ -1,15 +1,109 @@
-from fastapi import FastAPI
+from app.startup_profile import startup_profile  # first, so STARTUP_PROFILE=1 times every import below
+import asyncio
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
+from fastapi.responses import Response
 from fastapi.middleware.cors import CORSMiddleware
-from app.api import auth, apps, strategies, orders, settings, profile, positions
-from app.models.database import engine, Base
+from app.logging_config import setup_logging, shutdown_logging
+from app.api import auth, apps, strategies, orders, settings, profile, positions, versions, live
+from app.models.database import engine
+from app.models.migrations import init_db
+from app.services.settings_service import SettingsService
+from app.services import metrics
+from app.services import request_timing
+from app.services import deadlines
+from app.services import indicator_engine
+from app.services.compute_pool import ComputePool
+from app.services.strategy_shards import StrategyShardPool
+from app.services.snapshots import SnapshotService
+from app.services.strategy_engine import StrategyEngine
+from app.services.intent_netting import IntentNetter
+from app.services.pnl_engine import PnLEngine
+from app.services.market_stream import MarketStream
+
+log_handler = setup_logging()
+
+HTTP_LATENCY = metrics.histogram(
+    "http_request_duration_seconds",
+    "API request latency by route",
+    ("method", "route", "status_code")
+)
+metrics.gauge("log_queue_depth", "Log records waiting to be written").set_function(lambda: log_handler.queue.qsize())
+metrics.gauge("log_records_dropped", "Log records dropped because the queue was full").set_function(lambda: log_handler.dropped)
+
+logger = logging.getLogger("app.requests")
+
+# Requests slower than this are logged with their span breakdown
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "1000"))
+
+# Seconds a request may spend waiting on the broker; a client's X-Request-Timeout header can shorten it
+REQUEST_DEADLINE = float(os.getenv("REQUEST_DEADLINE", "0"))
+
+# Import pandas_ta in the background after startup instead of on the first indicator request
+INDICATOR_WARMUP = os.getenv("INDICATOR_WARMUP", "true").lower() in ("1", "true", "yes")
+
+request_timing.instrument_engine(engine)
+
+
+async def warm_up_indicators():
+    started = time.perf_counter()
+    try:
+        await asyncio.to_thread(indicator_engine.warm_up)
+    except ImportError as e:
+        logger.warning("Indicator warm-up skipped: %s", e)
+        return
+    logger.info("Indicator libraries loaded in %.0fms", (time.perf_counter() - started) * 1000)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    with startup_profile.phase("schema"):
+        init_db(engine)
+    with startup_profile.phase("settings"):
+        # Load settings once; request handlers read the in-memory snapshot
+        SettingsService.get_instance().reload()
+    with startup_profile.phase("strategies"):
+        # Strategy intents are netted across strategies before they become broker orders
+        netter = IntentNetter.get_instance()
+        await asyncio.to_thread(netter.ledger.rebuild)
+        StrategyEngine.get_instance().set_intent_handler(netter.submit)
+        # Strategy P&L starts from the ledger; account P&L from the broker once a session is active
+        pnl = PnLEngine.get_instance()
+        pnl.load_ledger(netter.ledger)
+        pnl.start()
+        # Live orders' fills move the account P&L as they are seen in the order book
+        execution = netter.execution
+        execution.start()
+        # Ticks for strategy bars, P&L and the UI come from SmartStream once a session is active
+        stream = MarketStream.get_instance()
+        stream.start()
+        # Resume strategies from the last snapshot; missed bars are fetched in the background
+        snapshots = SnapshotService.get_instance()
+        await snapshots.restore()
+        snapshots.start()
+    warm_up_task = asyncio.create_task(warm_up_indicators()) if INDICATOR_WARMUP else None
+    startup_profile.report()
+    yield
+    if warm_up_task is not None and not warm_up_task.done():
+        warm_up_task.cancel()
+    await snapshots.stop()
+    await stream.stop()
+    await pnl.stop()
+    await execution.stop()
+    await netter.drain()
+    await asyncio.to_thread(StrategyShardPool.get_instance().shutdown)
+    await asyncio.to_thread(ComputePool.get_instance().shutdown)
+    shutdown_logging()
 
-# Create database tables
-Base.metadata.create_all(bind=engine)
 
 app = FastAPI(
     title="AlgoPilot API",
     description="Trading Automation Platform API",
-    version="0.1.0"
+    version="0.1.0",
+    lifespan=lifespan
 )
 
 # CORS middleware
@@ -21,6 +115,58 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    started = time.perf_counter()
+    status_code = 500  # unless call_next returns, the request ends in an error response
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        # Label by route template, not raw path, to keep cardinality bounded
+        route = request.scope.get("route")
+        HTTP_LATENCY.labels(
+            request.method,
+            route.path if route is not None else "unmatched",
+            str(status_code)
+        ).observe(time.perf_counter() - started)
+
+
+@app.middleware("http")
+async def server_timing(request: Request, call_next):
+    spans = request_timing.start_request()
+    started = time.perf_counter()
+    response = await call_next(request)
+    total = time.perf_counter() - started
+
+    summary = request_timing.summarize(spans)
+    response.headers["Server-Timing"] = request_timing.server_timing_header(summary, total)
+    if total * 1000 >= SLOW_REQUEST_MS:
+        logger.warning(
+            "Slow request %s %s took %.1fms", request.method, request.url.path, total * 1000,
+            extra={
+                "status_code": response.status_code,
+                "spans": {name: {"ms": round(duration * 1000, 1), "count": count} for name, (duration, count) in summary.items()}
+            }
+        )
+    return response
+
+
+@app.middleware("http")
+async def request_deadline(request: Request, call_next):
+    """Propagate the request's deadline to the broker calls made while handling it."""
+    seconds = REQUEST_DEADLINE
+    header = request.headers.get("x-request-timeout")
+    if header:
+        try:
+            seconds = min(seconds, float(header)) if seconds > 0 else float(header)
+        except ValueError:
+            pass
+    with deadlines.deadline(seconds):
+        return await call_next(request)
+
+
 # Include routers
 app.include_router(auth.router, prefix="/api", tags=["auth"])
 app.include_router(apps.router, prefix="/api/apps", tags=["apps"])
@@ -29,6 +175,8 @@ app.include_router(orders.router, prefix="/api/orders", tags=["orders"])
 app.include_router(positions.router, prefix="/api/positions", tags=["positions"])
 app.include_router(settings.router, prefix="/api/settings", tags=["settings"])
 app.include_router(profile.router, prefix="/api/profile", tags=["profile"])
+app.include_router(versions.router, prefix="/api/versions", tags=["versions"])
+app.include_router(live.router, tags=["live"])
 
 
 @app.get("/")
@@ -36,6 +184,11 @@ async def root():
     return {"message": "AlgoPilot API", "version": "0.1.0"}
 
 
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    return Response(content=metrics.REGISTRY.render(), media_type=metrics.MetricsRegistry.CONTENT_TYPE)
+
+
 @app.get("/health")
 async def health():
     return {"status": "healthy"}
@@ -0,0 +1,100 @@
+"""
+Schema setup and idempotent migrations, run from the application lifespan hook
+"""
+import logging
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine
+from app.models.database import Base, engine as default_engine
+from app.models import models  # noqa: F401 - registers tables on Base.metadata
+
+logger = logging.getLogger(__name__)
+
+
+def _add_app_secret_columns(conn):
+    """Add mpin and base_url to app_secrets tables created before they existed."""
+    columns = {column["name"] for column in inspect(conn).get_columns("app_secrets")}
+    if "mpin" not in columns:
+        conn.execute(text("ALTER TABLE app_secrets ADD COLUMN mpin TEXT"))
+        logger.info("Added mpin column to app_secrets")
+    if "base_url" not in columns:
+        conn.execute(text(
+            "ALTER TABLE app_secrets ADD COLUMN base_url TEXT DEFAULT 'https://apiconnect.angelbroking.com'"
+        ))
+        logger.info("Added base_url column to app_secrets")
+
+
+def _scope_settings_per_app(conn):
+    """
+    Replace UNIQUE(key) on settings with UNIQUE(key, app_id), make global
+    keys unique and normalise booleans.
+    """
+    if conn.dialect.name == "sqlite":
+        table_sql = conn.execute(
+            text("SELECT sql FROM sqlite_master WHERE type='table' AND name='settings'")
+        ).scalar()
+        if table_sql and "uq_settings_key_app" not in table_sql:
+            conn.execute(text("ALTER TABLE settings RENAME TO settings_old"))
+            conn.execute(text("""
+                CREATE TABLE settings (
+                    id INTEGER NOT NULL PRIMARY KEY,
+                    "key" VARCHAR NOT NULL,
+                    value TEXT,
+                    app_id INTEGER REFERENCES apps (id),
+                    created_at DATETIME DEFAULT (CURRENT_TIMESTAMP),
+                    updated_at DATETIME,
+                    CONSTRAINT uq_settings_key_app UNIQUE ("key", app_id)
+                )
+            """))
+            conn.execute(text("""
+                INSERT INTO settings (id, "key", value, app_id, created_at, updated_at)
+                SELECT id, "key", value, app_id, created_at, updated_at FROM settings_old
+            """))
+            conn.execute(text("DROP TABLE settings_old"))
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_settings_id ON settings (id)"))
+            logger.info("Rebuilt settings table with UNIQUE(key, app_id)")
+    # UNIQUE(key, app_id) treats every NULL app_id as distinct; keep the newest global row per key
+    duplicates = conn.execute(text("""
+        DELETE FROM settings WHERE app_id IS NULL AND id NOT IN (
+            SELECT max(id) FROM settings WHERE app_id IS NULL GROUP BY "key"
+        )
+    """)).rowcount
+    if duplicates:
+        logger.info("Removed %d duplicate global settings rows", duplicates)
+    conn.execute(text(
+        'CREATE UNIQUE INDEX IF NOT EXISTS uq_settings_key_global ON settings ("key") WHERE app_id IS NULL'
+    ))
+    # str(bool) used to be stored, which the settings endpoint never read back as true
+    conn.execute(text("UPDATE settings SET value = lower(value) WHERE value IN ('True', 'False')"))
+
+
+def _add_order_fill_columns(conn):
+    """Add filled_qty and average_price to orders tables created before they existed."""
+    columns = {column["name"] for column in inspect(conn).get_columns("orders")}
+    if "filled_qty" not in columns:
+        conn.execute(text("ALTER TABLE orders ADD COLUMN filled_qty INTEGER DEFAULT 0"))
+        logger.info("Added filled_qty column to orders")
+    if "average_price" not in columns:
+        conn.execute(text("ALTER TABLE orders ADD COLUMN average_price FLOAT"))
+        logger.info("Added average_price column to orders")
+
+
+MIGRATIONS = (
+    ("app_secrets", _add_app_secret_columns),
+    ("settings", _scope_settings_per_app),
+    ("orders", _add_order_fill_columns),
+)
+
+
+def run_migrations(engine: Engine = default_engine):
+    """Apply pending migrations to tables that already exist."""
+    existing = set(inspect(engine).get_table_names())
+    with engine.begin() as conn:
+        for table, migration in MIGRATIONS:
+            if table in existing:
+                migration(conn)
+
+
+def init_db(engine: Engine = default_engine):
+    """Migrate existing tables, then create any missing ones."""
+    run_migrations(engine)
+    Base.metadata.create_all(bind=engine)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Boolean, Float
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Boolean, Float, Index, UniqueConstraint, text
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.models.database import Base
@@ -86,6 +86,8 @@ class Order(Base):
     qty = Column(Integer)
     price = Column(Float)
     status = Column(String)
+    filled_qty = Column(Integer, default=0)
+    average_price = Column(Float)
     response_json = Column(Text)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
@@ -95,9 +97,17 @@ class Order(Base):
 
 class Setting(Base):
     __tablename__ = "settings"
+    __table_args__ = (
+        UniqueConstraint("key", "app_id", name="uq_settings_key_app"),
+        # NULLs are distinct in UNIQUE constraints, so global keys need their own index
+        Index(
+            "uq_settings_key_global", "key", unique=True,
+            sqlite_where=text("app_id IS NULL"), postgresql_where=text("app_id IS NULL")
+        ),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
-    key = Column(String, unique=True, nullable=False)
+    key = Column(String, nullable=False)
     value = Column(Text)
     app_id = Column(Integer, ForeignKey("apps.id"), nullable=True)  # null for global settings
     created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -0,0 +1,78 @@
+"""
+Backtest - Vectorized long-only backtest of entry/exit signals over bar closes
+"""
+from typing import Dict
+import numpy as np
+
+# Default annualisation assumes daily bars; pass bars-per-year for intraday data
+TRADING_DAYS_PER_YEAR = 252
+
+
+def positions_from_signals(entries: np.ndarray, exits: np.ndarray) -> np.ndarray:
+    """
+    Position (0 or 1) held after each bar's close: entering on an entry
+    signal, flat on an exit signal, otherwise carrying the previous state.
+    An entry and exit on the same bar counts as an entry.
+    """
+    state = np.full(len(entries), np.nan)
+    state[exits] = 0.0
+    state[entries] = 1.0
+    known = ~np.isnan(state)
+    # Forward-fill the last known state
+    last = np.maximum.accumulate(np.where(known, np.arange(len(state)), 0))
+    position = state[last]
+    position[np.isnan(position)] = 0.0
+    return position
+
+
+def run_backtest(
+    close: np.ndarray,
+    entries: np.ndarray,
+    exits: np.ndarray,
+    cost: float = 0.0,
+    periods_per_year: float = TRADING_DAYS_PER_YEAR
+) -> Dict[str, float]:
+    """
+    Trade at the close of the signal bar and hold until the close of the exit bar.
+
+    Args:
+        close: Close prices
+        entries, exits: Boolean signal arrays aligned with `close`
+        cost: Round-trip fraction charged half on entry, half on exit
+        periods_per_year: Bars per year, for the annualised Sharpe ratio
+
+    Returns:
+        total_return, sharpe, max_drawdown, trades, win_rate, exposure
+    """
+    close = np.asarray(close, dtype=np.float64)
+    if len(close) < 2:
+        return {"total_return": 0.0, "sharpe": 0.0, "max_drawdown": 0.0, "trades": 0, "win_rate": 0.0, "exposure": 0.0}
+
+    position = positions_from_signals(np.asarray(entries, dtype=bool), np.asarray(exits, dtype=bool))
+    held = position[:-1]
+    bar_returns = np.diff(close) / close[:-1]
+    changes = np.abs(np.diff(position, prepend=0.0))[:-1]
+    strategy_returns = held * bar_returns - changes * (cost / 2.0)
+
+    equity = np.cumprod(1.0 + strategy_returns)
+    drawdown = 1.0 - equity / np.maximum.accumulate(equity)
+    deviation = strategy_returns.std()
+    sharpe = float(strategy_returns.mean() / deviation * np.sqrt(periods_per_year)) if deviation > 0 else 0.0
+
+    # Per-trade returns: number the holding periods, then sum log returns within each
+    starts = np.diff(position, prepend=0.0) > 0
+    trade_ids = np.cumsum(starts)[:-1] * (held > 0)
+    trades = int(starts.sum())
+    win_rate = 0.0
+    if trades:
+        per_trade = np.bincount(trade_ids, weights=np.log1p(strategy_returns), minlength=trades + 1)[1:]
+        win_rate = float((per_trade > 0).mean())
+
+    return {
+        "total_return": float(equity[-1] - 1.0),
+        "sharpe": sharpe,
+        "max_drawdown": float(drawdown.max()),
+        "trades": trades,
+        "win_rate": win_rate,
+        "exposure": float(held.mean()),
+    }
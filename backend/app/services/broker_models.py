@@ -0,0 +1,154 @@
+"""
+Broker Models - Slotted models for SmartAPI positions, orders, quotes and funds
+
+SmartAPI sends most numbers as strings ("netqty": "25", "price": "101.50").
+SmartAPIClient parses each payload once into one of these models, so the
+execution, risk and P&L code reads typed numbers instead of re-parsing
+strings from dicts, and each row costs a slotted object rather than a
+dict. to_payload() gives the API the broker's keys back (numbers as JSON
+numbers); fields the models do not know about are kept in `extra` and
+passed through unchanged.
+"""
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+
+def _text(value) -> Optional[str]:
+    return None if value is None else str(value)
+
+
+def _int(value) -> Optional[int]:
+    if value is None or value == "":
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        try:
+            return int(float(value))
+        except (TypeError, ValueError):
+            return None
+
+
+def _float(value) -> Optional[float]:
+    if value is None or value == "":
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _raw(value):
+    return value
+
+
+Field = Tuple[str, str, Callable[[Any], Any]]  # broker key, attribute, parser
+
+
+def _fields(parser: Callable[[Any], Any], *keys: str) -> Tuple[Field, ...]:
+    return tuple((key, key, parser) for key in keys)
+
+
+class BrokerModel:
+    """Base for the payload models; subclasses list FIELDS and matching __slots__."""
+    __slots__ = ("extra",)
+    FIELDS: Tuple[Field, ...] = ()
+    _KEYS: frozenset = frozenset()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._KEYS = frozenset(key for key, _, _ in cls.FIELDS)
+
+    @classmethod
+    def from_payload(cls, payload: Dict[str, Any]):
+        model = cls.__new__(cls)
+        for key, attribute, parser in cls.FIELDS:
+            setattr(model, attribute, parser(payload.get(key)))
+        model.extra = None
+        if not cls._KEYS.issuperset(payload):
+            model.extra = {key: value for key, value in payload.items() if key not in cls._KEYS}
+        return model
+
+    @classmethod
+    def from_payloads(cls, payloads: Optional[Iterable[Dict[str, Any]]]) -> List[Any]:
+        return [cls.from_payload(payload) for payload in payloads or ()]
+
+    def to_payload(self) -> Dict[str, Any]:
+        """The broker's keys and values; fields that were missing or null are left out."""
+        payload = {}
+        for key, attribute, _ in self.FIELDS:
+            value = getattr(self, attribute)
+            if value is not None:
+                payload[key] = value
+        if self.extra:
+            payload.update(self.extra)
+        return payload
+
+    def __repr__(self) -> str:
+        shown = ", ".join(f"{attribute}={getattr(self, attribute)!r}" for _, attribute, _ in self.FIELDS[:4])
+        return f"{type(self).__name__}({shown}, ...)"
+
+
+def to_payloads(models: Iterable[BrokerModel]) -> List[Dict[str, Any]]:
+    return [model.to_payload() for model in models]
+
+
+class Position(BrokerModel):
+    """One row of getPosition."""
+    FIELDS = (
+        _fields(
+            _text, "exchange", "symboltoken", "producttype", "tradingsymbol", "symbolname", "instrumenttype",
+            "symbolgroup", "optiontype", "expirydate"
+        )
+        + _fields(_int, "buyqty", "sellqty", "netqty", "cfbuyqty", "cfsellqty", "lotsize", "boardlotsize", "precision")
+        + _fields(
+            _float, "priceden", "pricenum", "genden", "gennum", "multiplier", "strikeprice",
+            "buyamount", "sellamount", "buyavgprice", "sellavgprice", "avgnetprice", "netvalue", "netprice",
+            "totalbuyvalue", "totalsellvalue", "totalbuyavgprice", "totalsellavgprice",
+            "cfbuyamount", "cfsellamount", "cfbuyavgprice", "cfsellavgprice", "ltp", "close", "pnl"
+        )
+    )
+    __slots__ = tuple(attribute for _, attribute, _ in FIELDS)
+
+
+class BrokerOrder(BrokerModel):
+    """One row of getOrderBook, or an orderDetails response."""
+    FIELDS = (
+        _fields(
+            _text, "variety", "ordertype", "producttype", "duration", "tradingsymbol", "transactiontype",
+            "exchange", "symboltoken", "ordertag", "instrumenttype", "optiontype", "expirydate", "orderid",
+            "text", "status", "orderstatus", "updatetime", "exchtime", "exchorderupdatetime", "fillid",
+            "filltime", "parentorderid", "uniqueorderid"
+        )
+        + _fields(_int, "quantity", "disclosedquantity", "lotsize", "cancelsize", "filledshares", "unfilledshares")
+        + _fields(_float, "price", "triggerprice", "squareoff", "stoploss", "trailingstoploss", "strikeprice", "averageprice")
+    )
+    __slots__ = tuple(attribute for _, attribute, _ in FIELDS)
+
+    @property
+    def state(self) -> str:
+        """Lower-case order status (orderstatus, falling back to status)."""
+        return (self.orderstatus or self.status or "").lower()
+
+
+class Quote(BrokerModel):
+    """One fetched instrument of getQuote (LTP, OHLC or FULL mode)."""
+    FIELDS = (
+        _fields(_text, "exchange", "tradingSymbol", "symbolToken", "exchFeedTime", "exchTradeTime")
+        + _fields(
+            _float, "ltp", "open", "high", "low", "close", "netChange", "percentChange", "avgPrice",
+            "lowerCircuit", "upperCircuit"
+        )
+        + _fields(_int, "lastTradeQty", "tradeVolume", "opnInterest", "totBuyQuan", "totSellQuan")
+        + (("52WeekLow", "week52_low", _float), ("52WeekHigh", "week52_high", _float), ("depth", "depth", _raw))
+    )
+    __slots__ = tuple(attribute for _, attribute, _ in FIELDS)
+
+
+class Funds(BrokerModel):
+    """getRMS: available funds and margin use."""
+    FIELDS = _fields(
+        _float, "net", "availablecash", "availableintradaypayin", "availablelimitmargin", "collateral",
+        "m2munrealized", "m2mrealized", "utiliseddebits", "utilisedspan", "utilisedoptionpremium",
+        "utilisedholdingsales", "utilisedexposure", "utilisedturnover", "utilisedpayout"
+    )
+    __slots__ = tuple(attribute for _, attribute, _ in FIELDS)
@@ -0,0 +1,240 @@
+"""
+Bulk Orders - Cancel-all and exit-all-positions for kill switches and square-off
+
+The order book (or position book) is fetched once, filtered by strategy
+and symbol, and every matching order is then cancelled - or position
+closed - concurrently. Each broker call still goes through its endpoint's
+rate limiter, so a burst of 50 cancels takes about 50 / rate seconds
+rather than 50 round trips back to back. Every order's outcome is
+reported; one failure does not stop the others.
+"""
+import asyncio
+import json
+import logging
+import time
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, List, Optional, Set
+from app.models import Order
+from app.models.database import SessionLocal
+from app.services import metrics
+from app.services.broker_models import BrokerOrder
+from app.services.execution import TERMINAL_ORDER_STATES, BasketValidationError, ExecutionLayer, OrderLeg
+from app.services.intent_netting import IntentNetter
+from app.services.resource_versions import ORDERS, ResourceVersions
+from app.services.smartapi_client import SmartAPIClient
+from app.services.strategy_runner import TradeIntent
+
+logger = logging.getLogger(__name__)
+
+BULK_OUTCOMES = metrics.counter(
+    "bulk_order_outcomes_total",
+    "Orders acted on by cancel-all / exit-all-positions, by operation and outcome",
+    ("operation", "outcome")
+)
+
+
+@dataclass
+class BulkOutcome:
+    """
+    What happened to one order or position. status is cancelled or failed
+    for cancels; for exits, the closing order's status, crossed (closed
+    against another strategy's intent without a broker order) or failed.
+    """
+    symbol: Optional[str]
+    symbol_token: Optional[str]
+    status: str
+    order_id: Optional[str] = None
+    quantity: Optional[int] = None
+    side: Optional[str] = None
+    error: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+def _matches_symbol(symbol: Optional[str], token: Optional[str], wanted: Optional[str]) -> bool:
+    """`wanted` may be a trading symbol or a symbol token."""
+    if not wanted:
+        return True
+    wanted = wanted.upper()
+    return (symbol or "").upper() == wanted or str(token or "") == wanted
+
+
+def _strategy_order_ids(app_id: int, strategy_id: int) -> Set[str]:
+    """
+    Broker order ids placed for a strategy: its own orders, the children
+    of its sliced orders, and netted orders it has allocations in.
+    """
+    db = SessionLocal()
+    try:
+        rows = db.query(Order).filter(Order.app_id == app_id, Order.strategy_id == strategy_id).all()
+        order_ids = {row.order_id for row in rows if row.order_id}
+        sliced = [row for row in rows if row.response_json and '"children"' in row.response_json]
+        # Netted orders shared with other strategies are recorded without a strategy
+        shared = order_ids - {row.order_id for row in sliced}
+        if shared:
+            sliced += db.query(Order).filter(
+                Order.app_id == app_id, Order.order_id.in_(shared), Order.status != "allocated"
+            ).all()
+        for row in sliced:
+            if row.response_json and '"children"' in row.response_json:
+                order_ids.update(
+                    child["order_id"] for child in json.loads(row.response_json)["children"] if child.get("order_id")
+                )
+        return order_ids
+    finally:
+        db.close()
+
+
+class BulkOrders:
+    """Cancel-all and exit-all-positions across the active app's orders."""
+
+    def __init__(self, execution: Optional[ExecutionLayer] = None, netter: Optional[IntentNetter] = None):
+        self.execution = execution or ExecutionLayer.get_instance()
+        self.netter = netter or IntentNetter.get_instance()
+
+    async def cancel_all(
+        self,
+        client: SmartAPIClient,
+        app_id: int,
+        strategy_id: Optional[int] = None,
+        symbol: Optional[str] = None
+    ) -> List[BulkOutcome]:
+        """Cancel every open order matching the filters, concurrently."""
+        if self.execution.is_paper_mode(app_id):
+            return []  # paper orders fill on placement; nothing is ever open
+        async with client.rate_limiters["getOrderBook"]:
+            book = await client.get_order_book()
+        if not book.get("success"):
+            raise RuntimeError(book.get("error") or "getOrderBook failed")
+        strategy_orders = (
+            await asyncio.to_thread(_strategy_order_ids, app_id, strategy_id) if strategy_id is not None else None
+        )
+
+        open_orders = [
+            order for order in book["data"]
+            if order.state not in TERMINAL_ORDER_STATES
+            and _matches_symbol(order.tradingsymbol, order.symboltoken, symbol)
+            and (strategy_orders is None or order.orderid in strategy_orders)
+        ]
+        started = time.perf_counter()
+        outcomes = await asyncio.gather(*(self._cancel(client, order) for order in open_orders))
+        if outcomes:
+            ResourceVersions.get_instance().invalidate(app_id, ORDERS)
+            logger.info(
+                "Cancelled %d of %d open orders in %.2fs",
+                sum(outcome.status == "cancelled" for outcome in outcomes), len(outcomes),
+                time.perf_counter() - started,
+                extra={"app_id": app_id, "strategy_id": strategy_id, "symbol": symbol}
+            )
+        return list(outcomes)
+
+    async def _cancel(self, client: SmartAPIClient, order: BrokerOrder) -> BulkOutcome:
+        outcome = BulkOutcome(
+            symbol=order.tradingsymbol, symbol_token=order.symboltoken, status="failed", order_id=order.orderid,
+            quantity=order.unfilledshares if order.unfilledshares is not None else order.quantity,
+            side=order.transactiontype
+        )
+        try:
+            async with client.rate_limiters["cancelOrder"]:
+                response = await client.cancel_order(order.orderid, order.variety or "NORMAL")
+            if response.get("status"):
+                outcome.status = "cancelled"
+            else:
+                outcome.error = response.get("message") or response.get("error") or "cancelOrder failed"
+        except Exception as e:
+            logger.exception("Cancelling order %s failed", outcome.order_id)
+            outcome.error = str(e)
+        BULK_OUTCOMES.labels("cancel", outcome.status).inc()
+        return outcome
+
+    async def exit_all_positions(
+        self,
+        client: SmartAPIClient,
+        app_id: int,
+        strategy_id: Optional[int] = None,
+        symbol: Optional[str] = None
+    ) -> Dict[str, List[BulkOutcome]]:
+        """
+        Cancel matching open orders first, so nothing fills behind the exit,
+        then close every matching position with a MARKET order.
+
+        Without a strategy the broker's position book is closed. A strategy's
+        positions only exist in the netting ledger (the broker nets all
+        strategies together), so with one its ledger positions are closed
+        through the netting stage instead.
+        """
+        cancelled = await self.cancel_all(client, app_id, strategy_id, symbol)
+        if strategy_id is None:
+            exits = await self._exit_account(client, app_id, symbol)
+        else:
+            exits = await self._exit_strategy(client, app_id, strategy_id, symbol)
+        return {"cancelled": cancelled, "exits": exits}
+
+    async def _exit_account(self, client: SmartAPIClient, app_id: int, symbol: Optional[str]) -> List[BulkOutcome]:
+        async with client.rate_limiters["getPosition"]:
+            result = await client.get_positions()
+        if not result.get("success"):
+            raise RuntimeError(result.get("error") or "getPosition failed")
+        legs = [
+            OrderLeg(
+                symbol=position.tradingsymbol or "", exchange=position.exchange or "NSE",
+                side="SELL" if position.netqty > 0 else "BUY", quantity=abs(position.netqty),
+                product_type=position.producttype or "INTRADAY", symbol_token=position.symboltoken
+            )
+            for position in result["data"]
+            if position.netqty and _matches_symbol(position.tradingsymbol, position.symboltoken, symbol)
+        ]
+        return list(await asyncio.gather(*(self._exit_leg(client, app_id, leg) for leg in legs)))
+
+    async def _exit_leg(self, client: SmartAPIClient, app_id: int, leg: OrderLeg) -> BulkOutcome:
+        outcome = BulkOutcome(leg.symbol, leg.symbol_token, "failed", quantity=leg.quantity, side=leg.side)
+        try:
+            order = await self.execution.execute_sliced_order(client, app_id, leg)
+            outcome.order_id, outcome.status = order.order_id, order.status
+            if order.status == "rejected":
+                outcome.error = next((child.error for child in order.children if child.error), None)
+        except BasketValidationError as e:
+            outcome.error = e.errors.get(0, str(e))
+        except Exception as e:
+            logger.exception("Exiting %s:%s failed", leg.exchange, leg.symbol)
+            outcome.error = str(e)
+        BULK_OUTCOMES.labels("exit", "failed" if outcome.status in ("failed", "rejected") else "sent").inc()
+        return outcome
+
+    async def _exit_strategy(self, client: SmartAPIClient, app_id: int, strategy_id: int,
+                             symbol: Optional[str]) -> List[BulkOutcome]:
+        ledger = self.netter.ledger
+        positions = [
+            (key, position) for key, position in ledger.open_positions(strategy_id)
+            if _matches_symbol(ledger.symbols.get((key[1], key[2])), key[2], symbol)
+        ]
+        if not positions:
+            return []
+        quotes = await client.get_quotes([(exchange, token) for (_, exchange, token, _), _ in positions], mode="LTP")
+        intents = []
+        for (_, exchange, token, product_type), position in positions:
+            quote = quotes.get(token, exchange)
+            intents.append(TradeIntent(
+                strategy_id=strategy_id, app_id=app_id, symbol_token=token, exchange=exchange,
+                symbol=ledger.symbols.get((exchange, token)), side="SELL" if position.quantity > 0 else "BUY",
+                quantity=abs(position.quantity), signal="exit",
+                price=(quote and quote.ltp) or position.average_price, bar_time=time.time(),
+                product_type=product_type
+            ))
+        for intent in intents:
+            await self.netter.submit(intent)
+        return list(await asyncio.gather(*(self._flush_exit(intent) for intent in intents)))
+
+    async def _flush_exit(self, intent: TradeIntent) -> BulkOutcome:
+        outcome = BulkOutcome(intent.symbol, intent.symbol_token, "failed", quantity=intent.quantity, side=intent.side)
+        try:
+            order = await self.netter.flush((intent.app_id, intent.exchange, intent.symbol_token, intent.product_type))
+            if order is None:
+                outcome.status = "crossed"
+            else:
+                outcome.order_id, outcome.status = order.order_id, order.status
+        except Exception as e:
+            outcome.error = str(e)  # logged by the netter
+        BULK_OUTCOMES.labels("exit", "failed" if outcome.status in ("failed", "rejected") else "sent").inc()
+        return outcome
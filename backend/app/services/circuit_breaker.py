@@ -0,0 +1,94 @@
+"""
+Circuit Breaker - Fail fast on SmartAPI endpoints that keep timing out or erroring
+
+After SMARTAPI_BREAKER_THRESHOLD consecutive transient failures (timeouts,
+connection errors, 5xx) an endpoint's breaker opens and calls fail at once
+instead of each waiting out its deadline. After SMARTAPI_BREAKER_COOLDOWN
+seconds one probe call is let through; it closes the breaker on success
+and reopens it on failure. A probe that ends without telling either way
+(cut short by its caller's deadline, rate limited, cancelled) hands the
+probe to the next call.
+"""
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+BREAKER_THRESHOLD = int(os.getenv("SMARTAPI_BREAKER_THRESHOLD", "5"))
+BREAKER_COOLDOWN = float(os.getenv("SMARTAPI_BREAKER_COOLDOWN", "30"))
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker for one endpoint."""
+
+    def __init__(self, threshold: int = BREAKER_THRESHOLD, cooldown: float = BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.state = CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+
+    def allow(self) -> bool:
+        """Whether a call may go out now; moving to half-open lets exactly one probe through."""
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN and time.monotonic() - self._opened_at >= self.cooldown:
+            self.state = HALF_OPEN
+            return True
+        return False
+
+    def release_probe(self):
+        """
+        End a half-open probe that gave no verdict. The breaker goes back
+        to OPEN with its cooldown already served, so the next call probes.
+        """
+        if self.state == HALF_OPEN:
+            self.state = OPEN
+
+    def record_success(self):
+        self.state = CLOSED
+        self.failures = 0
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == HALF_OPEN or self.failures >= self.threshold:
+            self.state = OPEN
+            self._opened_at = time.monotonic()
+
+
+class CircuitBreakers:
+    """Lazily created breaker per endpoint."""
+
+    def __init__(self, threshold: int = BREAKER_THRESHOLD, cooldown: float = BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._breakers: Dict[str, CircuitBreaker] = {}
+
+    def __getitem__(self, endpoint: str) -> CircuitBreaker:
+        breaker = self._breakers.get(endpoint)
+        if breaker is None:
+            breaker = self._breakers[endpoint] = CircuitBreaker(self.threshold, self.cooldown)
+        return breaker
+
+    def states(self) -> Dict[str, str]:
+        return {endpoint: breaker.state for endpoint, breaker in self._breakers.items()}
+
+
+class ResponseCache:
+    """Last good response per call, served while the endpoint's breaker is open."""
+
+    def __init__(self, max_entries: int = 512):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+
+    def put(self, key: Hashable, response: Any):
+        self._entries[key] = (time.time(), response)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, key: Hashable) -> Optional[Tuple[float, Any]]:
+        """(stored at, response), or None."""
+        return self._entries.get(key)
@@ -0,0 +1,301 @@
+"""
+Compute Pool - Process pool for CPU-bound indicator, scan and backtest jobs
+
+Jobs run in worker processes so pandas/NumPy work never holds the event loop
+that serves API requests and places orders. Bar arrays are copied once into a
+shared-memory block and mapped by the worker as NumPy views, so large series
+are never pickled. Workers run at a lower CPU priority and the default pool
+size leaves one core for the API process. NumPy is imported on first use
+so that importing this module stays cheap at startup.
+
+Job functions must be importable module-level functions with the signature
+fn(ctx, *args) or, when bars are passed, fn(ctx, bars, *args). Long-running
+jobs should call ctx.check_cancelled() between steps. Results are pickled
+back, so return small values, not views into `bars`.
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
+from multiprocessing import shared_memory
+from typing import Any, Callable, Dict, Iterator, List, Mapping, Optional, Tuple, Union
+from app.services import metrics
+
+logger = logging.getLogger(__name__)
+
+# Each job owns a two-byte slot in the control block: [state, cancel flag]
+_QUEUED, _RUNNING, _DONE = 0, 1, 2
+MAX_PENDING_JOBS = 4096
+
+JOB_DURATION = metrics.histogram(
+    "compute_pool_job_duration_seconds",
+    "Time spent executing jobs in worker processes",
+    ("job",)
+)
+JOB_RESULTS = metrics.counter(
+    "compute_pool_jobs_total",
+    "Finished compute jobs by job and outcome",
+    ("job", "outcome")
+)
+
+# Set in each worker by _init_worker
+_control: Optional[shared_memory.SharedMemory] = None
+
+
+class JobCancelled(Exception):
+    """Raised inside a job (and to its awaiter) when the job was cancelled."""
+
+
+@dataclass(frozen=True)
+class SharedBars:
+    """Picklable description of bar columns stored in a shared-memory block."""
+    name: str
+    length: int
+    columns: Tuple[str, ...]
+    dtype: str = "float64"
+
+
+def share_bars(bars: Mapping[str, Any]) -> Tuple[shared_memory.SharedMemory, SharedBars]:
+    """
+    Copy equal-length bar columns (a dict of arrays/lists or a DataFrame)
+    into a new shared-memory block. The caller owns the block and must
+    close and unlink it.
+    """
+    import numpy as np
+
+    columns = tuple(bars)
+    arrays = [np.ascontiguousarray(bars[column], dtype=np.float64) for column in columns]
+    length = len(arrays[0]) if arrays else 0
+    if any(array.shape != (length,) for array in arrays):
+        raise ValueError("Bar columns must be one-dimensional and of equal length")
+
+    block = shared_memory.SharedMemory(create=True, size=max(1, 8 * length * len(columns)))
+    matrix = np.ndarray((len(columns), length), dtype=np.float64, buffer=block.buf)
+    for row, array in enumerate(arrays):
+        matrix[row] = array
+    del matrix
+    return block, SharedBars(block.name, length, columns)
+
+
+class JobContext:
+    """Passed to job functions in the worker process."""
+    __slots__ = ("slot",)
+
+    def __init__(self, slot: int):
+        self.slot = slot
+
+    @property
+    def cancelled(self) -> bool:
+        return _control is not None and _control.buf[self.slot * 2 + 1] == 1
+
+    def check_cancelled(self):
+        if self.cancelled:
+            raise JobCancelled()
+
+
+def _init_worker(control_name: str, niceness: int):
+    global _control
+    if niceness:
+        try:
+            os.nice(niceness)
+        except OSError:
+            pass
+    _control = shared_memory.SharedMemory(name=control_name)
+
+
+def _run_job(fn: Callable, slot: int, bars: Optional[SharedBars], args: tuple, kwargs: dict):
+    """Worker-side wrapper: maps the bars, runs the job and returns (result, seconds)."""
+    import numpy as np
+
+    _control.buf[slot * 2] = _RUNNING
+    started = time.perf_counter()
+    block = None
+    try:
+        if bars is not None:
+            block = shared_memory.SharedMemory(name=bars.name)
+            matrix = np.ndarray((len(bars.columns), bars.length), dtype=bars.dtype, buffer=block.buf)
+            args = ({column: matrix[row] for row, column in enumerate(bars.columns)},) + args
+            del matrix
+        result = fn(JobContext(slot), *args, **kwargs)
+        return result, time.perf_counter() - started
+    finally:
+        args = None
+        if block is not None:
+            try:
+                block.close()
+            except BufferError:
+                # A view escaped into the result; the mapping is released when it is collected
+                pass
+        _control.buf[slot * 2] = _DONE
+
+
+class ComputeJob:
+    """Handle for a submitted job. Await it for the result, or cancel() it."""
+
+    def __init__(self, name: str, slot: int, future: Future, control: shared_memory.SharedMemory):
+        self.name = name
+        self.slot = slot
+        self._future = future
+        self._control = control
+
+    def done(self) -> bool:
+        return self._future.done()
+
+    def cancel(self):
+        """Drop the job if it has not started, otherwise ask it to stop."""
+        if not self._future.cancel() and not self._future.done():
+            self._control.buf[self.slot * 2 + 1] = 1
+
+    async def result(self) -> Any:
+        try:
+            result, _ = await asyncio.wrap_future(self._future)
+        except asyncio.CancelledError:
+            self.cancel()
+            raise
+        return result
+
+    def __await__(self):
+        return self.result().__await__()
+
+
+class ComputePool:
+    """
+    Manages the worker processes and the per-job control slots.
+    Workers are started on the first submission, not at import.
+    """
+    _instance = None
+
+    def __init__(self, max_workers: Optional[int] = None, niceness: Optional[int] = None):
+        if ComputePool._instance is not None:
+            raise Exception("ComputePool is a singleton")
+        ComputePool._instance = self
+        self.max_workers = max_workers or int(os.getenv("COMPUTE_POOL_WORKERS", "0")) or max(1, (os.cpu_count() or 2) - 1)
+        self.niceness = niceness if niceness is not None else int(os.getenv("COMPUTE_POOL_NICE", "10"))
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._control: Optional[shared_memory.SharedMemory] = None
+        self._free_slots: List[int] = []
+        self._active: Dict[int, str] = {}
+        self._lock = threading.Lock()
+
+        metrics.gauge("compute_pool_queued_jobs", "Jobs waiting for a worker process").set_function(
+            lambda: self._count(_QUEUED)
+        )
+        metrics.gauge("compute_pool_running_jobs", "Jobs executing in worker processes").set_function(
+            lambda: self._count(_RUNNING)
+        )
+        metrics.gauge("compute_pool_workers", "Configured worker processes").set(self.max_workers)
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    def _count(self, state: int) -> int:
+        if self._control is None:
+            return 0
+        buf = self._control.buf
+        return sum(1 for slot in list(self._active) if buf[slot * 2] == state)
+
+    def _start(self):
+        self._control = shared_memory.SharedMemory(create=True, size=MAX_PENDING_JOBS * 2)
+        self._control.buf[:] = bytes(MAX_PENDING_JOBS * 2)
+        self._free_slots = list(range(MAX_PENDING_JOBS - 1, -1, -1))
+        # spawn, not fork: the API process has running threads (log listener, event loop)
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self._control.name, self.niceness)
+        )
+        logger.info("Compute pool started with %d workers", self.max_workers)
+
+    def submit(
+        self,
+        fn: Callable,
+        *args,
+        bars: Optional[Union[Mapping[str, Any], SharedBars]] = None,
+        name: Optional[str] = None,
+        **kwargs
+    ) -> ComputeJob:
+        """
+        Queue fn(ctx, [bars,] *args, **kwargs) on a worker process.
+
+        Args:
+            fn: Module-level job function
+            bars: Optional bar columns, copied to shared memory for this job,
+                  or a SharedBars from shared_bars() to reuse one block across jobs
+            name: Job name used in metrics (defaults to the function name)
+        """
+        name = name or fn.__name__
+        with self._lock:
+            if self._executor is None:
+                self._start()
+            if not self._free_slots:
+                raise RuntimeError(f"Compute pool has {MAX_PENDING_JOBS} jobs pending")
+            slot = self._free_slots.pop()
+            self._control.buf[slot * 2:slot * 2 + 2] = bytes((_QUEUED, 0))
+            self._active[slot] = name
+
+        block = None
+        try:
+            spec = bars if isinstance(bars, SharedBars) else None
+            if bars is not None and spec is None:
+                block, spec = share_bars(bars)
+            future = self._executor.submit(_run_job, fn, slot, spec, args, kwargs)
+        except Exception:
+            self._release(slot, block)
+            raise
+        future.add_done_callback(lambda done: self._finished(name, slot, block, done))
+        return ComputeJob(name, slot, future, self._control)
+
+    @contextmanager
+    def shared_bars(self, bars: Mapping[str, Any]) -> Iterator[SharedBars]:
+        """
+        Copy bars into shared memory once for a batch of jobs (e.g. a parameter
+        sweep). Await every job before leaving the block; it is unlinked on exit.
+        """
+        block, spec = share_bars(bars)
+        try:
+            yield spec
+        finally:
+            block.close()
+            block.unlink()
+
+    def _finished(self, name: str, slot: int, block: Optional[shared_memory.SharedMemory], future: Future):
+        # Runs on the executor's management thread
+        if future.cancelled():
+            outcome = "cancelled"
+        elif future.exception() is not None:
+            outcome = "cancelled" if isinstance(future.exception(), JobCancelled) else "error"
+        else:
+            outcome = "ok"
+            JOB_DURATION.labels(name).observe(future.result()[1])
+        JOB_RESULTS.labels(name, outcome).inc()
+        self._release(slot, block)
+
+    def _release(self, slot: int, block: Optional[shared_memory.SharedMemory]):
+        if block is not None:
+            block.close()
+            block.unlink()
+        with self._lock:
+            if self._active.pop(slot, None) is not None:
+                self._free_slots.append(slot)
+
+    def shutdown(self):
+        """Cancel queued jobs and stop the workers."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is None:
+            return
+        for slot in list(self._active):
+            self._control.buf[slot * 2 + 1] = 1
+        executor.shutdown(wait=True, cancel_futures=True)
+        self._control.close()
+        self._control.unlink()
+        self._control = None
@@ -0,0 +1,81 @@
+"""
+Deadlines - Per-endpoint SmartAPI deadlines and the current request's deadline
+
+Each broker call gets the endpoint's deadline from SMARTAPI_DEADLINES, cut
+short by whatever is left of the deadline of the request it runs under,
+so a handler never waits on the broker longer than its caller will wait
+for it. SMARTAPI_DEADLINES ("getQuote=1.5,getCandleData=20") overrides
+the defaults below.
+"""
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+# Seconds per attempt; quotes and orders are latency-critical, history and the master are not
+SMARTAPI_DEADLINES: Dict[str, float] = {
+    "getQuote": 2.0,
+    "getLtpData": 2.0,
+    "placeOrder": 5.0,
+    "modifyOrder": 5.0,
+    "cancelOrder": 5.0,
+    "orderDetails": 5.0,
+    "getOrderBook": 5.0,
+    "getTradeBook": 5.0,
+    "getPosition": 5.0,
+    "getHolding": 5.0,
+    "getRMS": 5.0,
+    "getProfile": 5.0,
+    "getMarketStatus": 5.0,
+    "gainersLosers": 5.0,
+    "getCandleData": 15.0,
+    "loginByPassword": 15.0,
+    "loginByMPIN": 15.0,
+    "generateTokens": 15.0,
+    "getSymbolMaster": 60.0,
+}
+DEFAULT_DEADLINE = 10.0
+
+
+def _parse_deadlines(value: str) -> Dict[str, float]:
+    overrides = {}
+    for item in value.split(","):
+        if "=" in item:
+            endpoint, seconds = item.split("=", 1)
+            overrides[endpoint.strip()] = float(seconds)
+    return overrides
+
+
+SMARTAPI_DEADLINES.update(_parse_deadlines(os.getenv("SMARTAPI_DEADLINES", "")))
+
+# time.monotonic() by which the current request must be answered; None if unbounded
+_request_deadline: ContextVar[Optional[float]] = ContextVar("request_deadline", default=None)
+
+
+@contextmanager
+def deadline(seconds: Optional[float]):
+    """Bound everything in the block to `seconds` from now (never extending an outer deadline)."""
+    if not seconds or seconds <= 0:
+        yield
+        return
+    at = time.monotonic() + seconds
+    outer = _request_deadline.get()
+    token = _request_deadline.set(at if outer is None else min(at, outer))
+    try:
+        yield
+    finally:
+        _request_deadline.reset(token)
+
+
+def remaining() -> Optional[float]:
+    """Seconds left before the current deadline, or None without one."""
+    at = _request_deadline.get()
+    return None if at is None else at - time.monotonic()
+
+
+def endpoint_timeout(endpoint: str) -> float:
+    """Timeout for one call to `endpoint`: its deadline, or less if the request's runs out sooner."""
+    timeout = SMARTAPI_DEADLINES.get(endpoint, DEFAULT_DEADLINE)
+    left = remaining()
+    return timeout if left is None else min(timeout, left)
@@ -1,17 +1,301 @@
 """
 Execution Layer - Handles order placement and risk management
 """
-from typing import Dict, Optional
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from dataclasses import asdict, dataclass, field, replace
+from typing import Any, Dict, List, Optional, Sequence, Tuple
 from app.models import Order
+from app.models.database import SessionLocal
+from app.services import metrics
+from app.services.pnl_engine import ACCOUNT, PnLEngine
+from app.services.resource_versions import ORDERS, ResourceVersions
+from app.services.session_manager import SessionManager
+from app.services.settings_service import SettingsService, SettingsState
+from app.services.smartapi_client import SmartAPIClient
+from app.services.symbol_master import SymbolMaster, SymbolMasterService
+
+logger = logging.getLogger(__name__)
+
+SIDES = ("BUY", "SELL")
+BASKET_ORDER_TYPES = ("MARKET", "LIMIT")
+# Broker order states after which nothing more will fill
+TERMINAL_ORDER_STATES = ("complete", "rejected", "cancelled")
+# Broker order states of an order the exchange has accepted
+WORKING_ORDER_STATES = ("open", "trigger pending", "complete")
+# How long to wait for a hedge leg to be accepted, or a cancel to land, and how often to look
+ORDER_STATE_TIMEOUT = float(os.getenv("ORDER_STATE_TIMEOUT", "5"))
+ORDER_STATE_POLL = 0.25
+# Seconds between order book reads while live orders are still working, to move the account P&L with their fills
+ORDER_FILL_POLL = float(os.getenv("ORDER_FILL_POLL", "2.0"))
+# Seconds between the child orders of a sliced order; 0 sends them all at once
+ORDER_SLICE_INTERVAL = float(os.getenv("ORDER_SLICE_INTERVAL", "0"))
+SLICED_ORDER_PREFIX = "SLICE_"
+
+BASKET_ORDERS = metrics.counter(
+    "basket_orders_total",
+    "Basket orders by outcome (placed/rolled_back/partial/failed)",
+    ("status",)
+)
+CHILD_ORDERS = metrics.counter(
+    "sliced_child_orders_total",
+    "Child orders sent for orders above the exchange freeze quantity"
+)
+
+
+class BasketValidationError(ValueError):
+    """One or more legs of a basket are invalid; `errors` maps leg index to reason."""
+
+    def __init__(self, message: str, errors: Optional[Dict[int, str]] = None):
+        super().__init__(message)
+        self.errors = errors or {}
+
+
+@dataclass(frozen=True)
+class OrderLeg:
+    symbol: str
+    exchange: str
+    side: str  # BUY or SELL
+    quantity: int
+    order_type: str = "MARKET"
+    price: float = 0.0
+    product_type: str = "INTRADAY"
+    symbol_token: Optional[str] = None
+
+
+@dataclass
+class LegResult:
+    """
+    Outcome of one leg. status is one of not_sent, placed, filled (paper),
+    rejected, cancelled or reversed (rolled back), rollback_failed.
+    """
+    index: int
+    leg: OrderLeg
+    status: str = "not_sent"
+    order_id: Optional[str] = None
+    error: Optional[str] = None
+    rollback_order_id: Optional[str] = None
+    response: Optional[Dict[str, Any]] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "index": self.index,
+            "symbol": self.leg.symbol,
+            "symbol_token": self.leg.symbol_token,
+            "exchange": self.leg.exchange,
+            "side": self.leg.side,
+            "quantity": self.leg.quantity,
+            "order_type": self.leg.order_type,
+            "price": self.leg.price,
+            "status": self.status,
+            "order_id": self.order_id,
+            "error": self.error,
+            "rollback_order_id": self.rollback_order_id,
+        }
+
+
+@dataclass
+class BasketResult:
+    """
+    status: placed (every leg accepted), rolled_back (a leg failed and the
+    others were undone), partial (legs are left open and need attention)
+    or failed (nothing was placed).
+    """
+    basket_id: str
+    status: str
+    legs: List[LegResult] = field(default_factory=list)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"basket_id": self.basket_id, "status": self.status, "legs": [leg.to_dict() for leg in self.legs]}
+
+
+@dataclass
+class ChildOrder:
+    quantity: int
+    order_id: Optional[str] = None
+    status: str = "not_sent"  # not_sent, rejected, or the broker's order status
+    filled_qty: int = 0
+    average_price: Optional[float] = None
+    error: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+@dataclass
+class SlicedOrder:
+    """
+    One order as the user placed it, sent as one or more child orders.
+    Unsliced orders use the broker's order id; sliced ones get a
+    SLICE_ parent id and their children are kept in the parent record.
+    """
+    order_id: str
+    leg: OrderLeg
+    children: List[ChildOrder]
+
+    @property
+    def filled_qty(self) -> int:
+        return sum(child.filled_qty for child in self.children)
+
+    @property
+    def average_price(self) -> Optional[float]:
+        filled = [child for child in self.children if child.filled_qty and child.average_price is not None]
+        quantity = sum(child.filled_qty for child in filled)
+        if not quantity:
+            return None
+        return sum(child.filled_qty * child.average_price for child in filled) / quantity
+
+    @property
+    def status(self) -> str:
+        """rejected, complete, partial (some children failed) or open."""
+        statuses = [child.status for child in self.children]
+        if all(status in ("rejected", "not_sent") for status in statuses):
+            return "rejected"
+        if all(status == "complete" for status in statuses):
+            return "complete"
+        if any(status in ("rejected", "not_sent", "cancelled") for status in statuses):
+            return "partial"
+        return "open"
+
+    @property
+    def done(self) -> bool:
+        """No child can fill any further."""
+        return all(child.status in TERMINAL_ORDER_STATES or child.status == "not_sent" for child in self.children)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "order_id": self.order_id,
+            "symbol": self.leg.symbol,
+            "symbol_token": self.leg.symbol_token,
+            "exchange": self.leg.exchange,
+            "side": self.leg.side,
+            "quantity": self.leg.quantity,
+            "order_type": self.leg.order_type,
+            "price": self.leg.price,
+            "product_type": self.leg.product_type,
+            "status": self.status,
+            "filled_qty": self.filled_qty,
+            "average_price": self.average_price,
+            "children": [child.to_dict() for child in self.children],
+        }
+
+
+@dataclass
+class WorkingOrder:
+    """A live broker order whose fills are applied to the app's account P&L book as they are seen."""
+    app_id: int
+    leg: OrderLeg  # the side as sent
+    filled_qty: int = 0
+    filled_value: float = 0.0
+
+
+def validate_legs(legs: Sequence[OrderLeg], master: SymbolMaster, allow_slicing: bool = False) -> List[OrderLeg]:
+    """
+    Check every leg against the symbol master before anything is sent and
+    return the legs with symbol tokens (and canonical symbols) filled in.
+    Unless allow_slicing is set, legs at or above the exchange freeze
+    quantity are invalid. Raises BasketValidationError listing every
+    invalid leg.
+    """
+    if not legs:
+        raise BasketValidationError("Basket has no legs")
+    resolved, errors = [], {}
+    for index, leg in enumerate(legs):
+        exchange, side, order_type = leg.exchange.upper(), leg.side.upper(), leg.order_type.upper()
+        if leg.symbol_token:
+            instrument = master.get(exchange, leg.symbol_token)
+        else:
+            instrument = master.resolve(exchange, leg.symbol)
+        freeze_quantity = instrument and master.freeze_quantity(instrument)
+        if instrument is None:
+            errors[index] = f"Unknown instrument {exchange}:{leg.symbol_token or leg.symbol}"
+        elif side not in SIDES:
+            errors[index] = f"Side must be one of {', '.join(SIDES)}"
+        elif order_type not in BASKET_ORDER_TYPES:
+            errors[index] = f"Order type must be one of {', '.join(BASKET_ORDER_TYPES)}"
+        elif leg.quantity <= 0 or leg.quantity % instrument.lot_size:
+            errors[index] = f"Quantity {leg.quantity} is not a positive multiple of the lot size {instrument.lot_size}"
+        elif freeze_quantity and leg.quantity >= freeze_quantity and not allow_slicing:
+            errors[index] = f"Quantity {leg.quantity} is at or above the freeze quantity {freeze_quantity}"
+        elif order_type == "LIMIT" and leg.price <= 0:
+            errors[index] = "LIMIT orders need a price"
+        elif order_type == "LIMIT" and abs(leg.price / instrument.tick_size - round(leg.price / instrument.tick_size)) > 1e-6:
+            errors[index] = f"Price {leg.price} is not a multiple of the tick size {instrument.tick_size}"
+        else:
+            resolved.append(replace(
+                leg, symbol=instrument.symbol, exchange=exchange, side=side, order_type=order_type,
+                symbol_token=instrument.token, price=leg.price if order_type == "LIMIT" else 0.0
+            ))
+    if errors:
+        raise BasketValidationError(f"{len(errors)} of {len(legs)} legs are invalid", errors)
+    return resolved
+
+
+def slice_quantity(quantity: int, lot_size: int, freeze_quantity: Optional[int]) -> List[int]:
+    """
+    Split quantity into child quantities that are whole lots below the
+    freeze quantity: as many of the largest allowed size as fit, then the rest.
+    """
+    if not freeze_quantity or quantity < freeze_quantity:
+        return [quantity]
+    largest = (freeze_quantity - 1) // lot_size * lot_size
+    if largest <= 0:
+        raise ValueError(f"Lot size {lot_size} is not below the freeze quantity {freeze_quantity}")
+    full, rest = divmod(quantity, largest)
+    return [largest] * full + ([rest] if rest else [])
 
 
 class ExecutionLayer:
     """
     Receives trade intents, applies risk checks, and executes orders.
     Supports paper_mode for simulation.
+
+    Every live order it sends is tracked until it is complete, rejected or
+    cancelled; fills seen in any order book read (including its own reads
+    every ORDER_FILL_POLL seconds while orders are working) move the
+    account P&L book. Paper fills move it straight away.
+
+    paper_mode is read from the in-memory settings snapshot (per app) unless
+    explicitly overridden with set_paper_mode().
     """
-    def __init__(self, paper_mode: bool = True):
-        self.paper_mode = paper_mode
+    _instance = None
+
+    def __init__(self, paper_mode: Optional[bool] = None, settings_service: Optional[SettingsService] = None,
+                 pnl: Optional[PnLEngine] = None):
+        if ExecutionLayer._instance is not None:
+            raise Exception("ExecutionLayer is a singleton")
+        ExecutionLayer._instance = self
+        self.settings_service = settings_service or SettingsService.get_instance()
+        self.pnl = pnl or PnLEngine.get_instance()
+        self._paper_mode_override = paper_mode
+        self.settings_service.subscribe(self._on_settings_changed)
+        self._working: Dict[str, WorkingOrder] = {}
+        self._finished: set = set()  # tracked order ids that can fill no further
+        self._fill_task: Optional[asyncio.Task] = None
+        ResourceVersions.get_instance().subscribe(self._on_resource_changed)
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    @property
+    def paper_mode(self) -> bool:
+        return self.is_paper_mode()
+
+    def is_paper_mode(self, app_id: Optional[int] = None) -> bool:
+        if self._paper_mode_override is not None:
+            return self._paper_mode_override
+        return self.settings_service.get(app_id).paper_mode
+
+    def _on_settings_changed(self, old_state: SettingsState, new_state: SettingsState):
+        if old_state.global_settings.paper_mode != new_state.global_settings.paper_mode:
+            logger.info("paper_mode changed", extra={"paper_mode": new_state.global_settings.paper_mode})
 
     async def execute_order(
         self,
@@ -25,7 +309,7 @@ class ExecutionLayer:
         """
         Execute an order through SmartAPI or simulate in paper mode.
         """
-        if self.paper_mode:
+        if self.is_paper_mode(app_id):
             # Simulate order execution
             order_result = {
                 "order_id": f"PAPER_{app_id}_{strategy_id}_{symbol}",
@@ -43,6 +327,408 @@ class ExecutionLayer:
         # TODO: Store order in database
         return order_result
 
-    def set_paper_mode(self, enabled: bool):
-        self.paper_mode = enabled
+    async def execute_basket(
+        self,
+        client: SmartAPIClient,
+        app_id: int,
+        legs: Sequence[OrderLeg],
+        strategy_id: Optional[int] = None,
+        hedge_first: bool = True,
+        on_failure: str = "rollback"
+    ) -> BasketResult:
+        """
+        Place a multi-leg basket.
+
+        All legs are validated against the symbol master first; an invalid
+        leg rejects the whole basket before anything is sent. Legs are then
+        placed concurrently under the placeOrder rate limit. With hedge_first,
+        BUY legs go in a first wave and SELL legs only once every BUY leg is
+        open or complete at the exchange (placeOrder returns an id even for
+        orders RMS rejects moments later), so short legs get the hedged
+        margin. If a leg is rejected,
+        no further wave is sent and, with on_failure="rollback", accepted
+        legs are cancelled or, if already filled, closed with an opposite
+        MARKET order. With on_failure="flag" they are left as they are and
+        the basket is reported as partial.
+        """
+        if on_failure not in ("rollback", "flag"):
+            raise ValueError("on_failure must be 'rollback' or 'flag'")
+        master = await SymbolMasterService.get_instance().load(client)
+        legs = validate_legs(legs, master)
+        basket_id = uuid.uuid4().hex[:16]
+        results = [LegResult(index, leg) for index, leg in enumerate(legs)]
+
+        if self.is_paper_mode(app_id):
+            for result in results:
+                result.status, result.order_id = "filled", f"PAPER_{basket_id}_{result.index}"
+                self._account_fill(app_id, result.leg, result.leg.quantity, result.leg.price)
+        else:
+            waves = self._basket_waves(results, hedge_first)
+            for position, wave in enumerate(waves):
+                await asyncio.gather(*(self._place_leg(client, app_id, result) for result in wave))
+                if any(result.status != "placed" for result in wave):
+                    break
+                if position + 1 < len(waves):
+                    confirmed = await asyncio.gather(*(self._confirm_leg(client, result) for result in wave))
+                    if not all(confirmed):
+                        break
+            if on_failure == "rollback" and any(result.status != "placed" for result in results):
+                # Unwind the short legs before the hedges they rely on
+                for wave in reversed(waves):
+                    await asyncio.gather(*(
+                        self._unwind_leg(client, app_id, result) for result in wave if result.status == "placed"
+                    ))
+            ResourceVersions.get_instance().invalidate(app_id)
+
+        basket = BasketResult(basket_id, self._basket_status(results), results)
+        BASKET_ORDERS.labels(basket.status).inc()
+        if basket.status != "placed":
+            logger.warning(
+                "Basket %s %s", basket_id, basket.status,
+                extra={"app_id": app_id, "legs": [(r.index, r.status, r.error) for r in results]}
+            )
+        await asyncio.to_thread(self._record_basket, app_id, strategy_id, basket)
+        return basket
+
+    async def execute_sliced_order(
+        self,
+        client: SmartAPIClient,
+        app_id: int,
+        leg: OrderLeg,
+        strategy_id: Optional[int] = None,
+        slice_interval: Optional[float] = None
+    ) -> SlicedOrder:
+        """
+        Place an order of any size. Orders at or above the contract's freeze
+        quantity are split into whole-lot child orders below it, sent
+        concurrently under the placeOrder rate limit or, with a slice
+        interval (ORDER_SLICE_INTERVAL by default), one every that many
+        seconds. The order is recorded as one row in orders; refresh_order()
+        rolls the children's fills up into it.
+        """
+        master = await SymbolMasterService.get_instance().load(client)
+        leg = validate_legs([leg], master, allow_slicing=True)[0]
+        instrument = master.get(leg.exchange, leg.symbol_token)
+        children = [
+            ChildOrder(quantity)
+            for quantity in slice_quantity(leg.quantity, instrument.lot_size, master.freeze_quantity(instrument))
+        ]
+        interval = ORDER_SLICE_INTERVAL if slice_interval is None else slice_interval
+        paper = self.is_paper_mode(app_id)
+
+        if paper:
+            paper_id = uuid.uuid4().hex[:16]
+            for index, child in enumerate(children):
+                child.order_id, child.status = f"PAPER_{paper_id}_{index}", "complete"
+                child.filled_qty, child.average_price = child.quantity, leg.price or None
+            self._account_fill(app_id, leg, leg.quantity, leg.price)
+        elif interval > 0:
+            for index, child in enumerate(children):
+                if index:
+                    await asyncio.sleep(interval)
+                await self._place_child(client, app_id, leg, child)
+        else:
+            await asyncio.gather(*(self._place_child(client, app_id, leg, child) for child in children))
+        if not paper:
+            ResourceVersions.get_instance().invalidate(app_id)
+
+        if len(children) > 1:
+            CHILD_ORDERS.inc(len(children))
+            order_id = f"{SLICED_ORDER_PREFIX}{uuid.uuid4().hex[:16]}"
+            logger.info("Sliced %s %d into %d orders", leg.symbol, leg.quantity, len(children), extra={"order_id": order_id})
+        else:
+            order_id = children[0].order_id
+        order = SlicedOrder(order_id, leg, children)
+        await asyncio.to_thread(self._record_order, app_id, strategy_id, order)
+        return order
+
+    async def _place_child(self, client: SmartAPIClient, app_id: int, leg: OrderLeg, child: ChildOrder):
+        order_id, response = await self._place_order(client, leg, quantity=child.quantity)
+        if order_id:
+            child.order_id, child.status = order_id, "open"
+            self.track_order(app_id, replace(leg, quantity=child.quantity), order_id)
+        else:
+            child.status = "rejected"
+            child.error = response.get("message") or response.get("error") or "placeOrder failed"
+
+    async def refresh_order(self, client: SmartAPIClient, app_id: int, order_id: str) -> Optional[SlicedOrder]:
+        """
+        Update a recorded order's children from one order book fetch and roll
+        their fills up into the parent row. None if the order is unknown.
+        """
+        row = await asyncio.to_thread(self._load_order, app_id, order_id)
+        if row is None:
+            return None
+        order = self._order_from_record(row)
+        pending = {
+            child.order_id: child for child in order.children
+            if child.order_id and not child.order_id.startswith("PAPER_")
+        }
+        if pending:
+            async with client.rate_limiters["getOrderBook"]:
+                book = await client.get_order_book()
+            if not book.get("success"):
+                raise RuntimeError(book.get("error") or "getOrderBook failed")
+            for item in book["data"]:
+                child = pending.get(item.orderid)
+                if child is not None:
+                    # An order sent before a restart is followed on from what was recorded
+                    self.track_order(
+                        app_id, order.leg, child.order_id, child.filled_qty, child.filled_qty * (child.average_price or 0.0)
+                    )
+                    child.status = item.state or child.status
+                    child.filled_qty = item.filledshares or 0
+                    child.average_price = item.averageprice if child.filled_qty else None
+                    self.observe_order(child.order_id, child.status, child.filled_qty, child.average_price)
+            await asyncio.to_thread(self._record_order, app_id, None, order, row)
+        return order
+
+    def track_order(self, app_id: int, leg: OrderLeg, order_id: Optional[str], filled_qty: int = 0,
+                    filled_value: float = 0.0):
+        """Follow a live order's fills into the account P&L book; `filled_*` is what has been applied already."""
+        if order_id and not order_id.startswith("PAPER_") and order_id not in self._working \
+                and order_id not in self._finished:
+            self._working[order_id] = WorkingOrder(app_id, leg, filled_qty, filled_value)
+
+    def observe_order(self, order_id: str, state: Optional[str], filled_qty: Optional[int],
+                      average_price: Optional[float]):
+        """
+        Apply what a broker read shows of a tracked order. New fills are
+        priced from the change in filled value, so each partial fill moves
+        the book at its own price.
+        """
+        working = self._working.get(order_id)
+        if working is None:
+            return
+        filled_qty = filled_qty or 0
+        if filled_qty > working.filled_qty and average_price:
+            quantity, value = filled_qty - working.filled_qty, filled_qty * average_price
+            self._account_fill(working.app_id, working.leg, quantity, (value - working.filled_value) / quantity)
+            working.filled_qty, working.filled_value = filled_qty, value
+        if state in TERMINAL_ORDER_STATES:
+            del self._working[order_id]
+            self._finished.add(order_id)
+
+    def _on_resource_changed(self, app_id: int, resource: str, result: Dict[str, Any]):
+        if resource == ORDERS and not result.get("stale") and self._working:
+            for item in result["data"]:
+                self.observe_order(item.orderid, item.state, item.filledshares, item.averageprice)
+
+    async def _poll_fills(self):
+        session_manager = SessionManager.get_instance()
+        while True:
+            await asyncio.sleep(ORDER_FILL_POLL)
+            app_id, client = session_manager.get_active_app_id(), session_manager.get_smartapi_client()
+            if app_id and client and any(working.app_id == app_id for working in self._working.values()):
+                try:
+                    # Shared with the UI's order book reads; a changed book reaches _on_resource_changed
+                    await ResourceVersions.get_instance().fetch(app_id, ORDERS, client.get_order_book)
+                except Exception:
+                    logger.warning("Reading the order book for fills failed", extra={"app_id": app_id}, exc_info=True)
+
+    def start(self):
+        if self._fill_task is None:
+            self._fill_task = asyncio.create_task(self._poll_fills())
+
+    async def stop(self):
+        if self._fill_task is not None:
+            self._fill_task.cancel()
+            self._fill_task = None
+
+    def _account_fill(self, app_id: int, leg: OrderLeg, quantity: int, price: Optional[float]):
+        """Move the app's account P&L book by a fill of `leg` (priced at the last tick if price is 0)."""
+        if leg.symbol_token:
+            self.pnl.apply_fill(
+                (ACCOUNT, app_id), leg.exchange, leg.symbol_token, leg.product_type,
+                quantity if leg.side == "BUY" else -quantity, price or None
+            )
+
+    @staticmethod
+    def _order_from_record(row: Dict[str, Any]) -> SlicedOrder:
+        data = json.loads(row["response_json"])
+        leg = OrderLeg(
+            symbol=data["symbol"], exchange=data["exchange"], side=data["side"], quantity=data["quantity"],
+            order_type=data["order_type"], price=data["price"], symbol_token=data["symbol_token"],
+            product_type=data.get("product_type", "INTRADAY")
+        )
+        return SlicedOrder(row["order_id"], leg, [ChildOrder(**child) for child in data["children"]])
+
+    @staticmethod
+    def _load_order(app_id: int, order_id: str) -> Optional[Dict[str, Any]]:
+        db = SessionLocal()
+        try:
+            row = db.query(Order).filter(Order.app_id == app_id, Order.order_id == order_id).first()
+            if row is None or not row.response_json or '"children"' not in row.response_json:
+                return None
+            return {"id": row.id, "order_id": row.order_id, "response_json": row.response_json}
+        finally:
+            db.close()
+
+    @staticmethod
+    def _record_order(app_id: int, strategy_id: Optional[int], order: SlicedOrder,
+                      existing: Optional[Dict[str, Any]] = None):
+        """Insert the parent row, or update `existing` after a refresh."""
+        db = SessionLocal()
+        try:
+            row = db.get(Order, existing["id"]) if existing else None
+            if row is None:
+                row = Order(
+                    app_id=app_id,
+                    strategy_id=strategy_id,
+                    order_id=order.order_id,
+                    symbol=order.leg.symbol,
+                    qty=order.leg.quantity,
+                    price=order.leg.price
+                )
+                db.add(row)
+            row.status = order.status
+            row.filled_qty = order.filled_qty
+            row.average_price = order.average_price
+            row.response_json = json.dumps(order.to_dict())
+            db.commit()
+        except Exception:
+            db.rollback()
+            logger.exception("Recording order %s failed", order.order_id)
+        finally:
+            db.close()
+
+    @staticmethod
+    def _basket_waves(results: List[LegResult], hedge_first: bool) -> List[List[LegResult]]:
+        if not hedge_first:
+            return [results]
+        waves = [[r for r in results if r.leg.side == side] for side in SIDES]
+        return [wave for wave in waves if wave]
+
+    @staticmethod
+    def _basket_status(results: List[LegResult]) -> str:
+        statuses = {result.status for result in results}
+        if statuses <= {"placed", "filled"}:
+            return "placed"
+        if statuses & {"placed", "rollback_failed"}:
+            return "partial"
+        if "reversed" in statuses or "cancelled" in statuses:
+            return "rolled_back"
+        return "failed"
+
+    @staticmethod
+    async def _place_order(client: SmartAPIClient, leg: OrderLeg, side: Optional[str] = None,
+                           quantity: Optional[int] = None, order_type: Optional[str] = None) -> Tuple[Optional[str], Dict[str, Any]]:
+        """Place one order under the rate limit; returns (order id or None, response)."""
+        order_type = order_type or leg.order_type
+        async with client.rate_limiters["placeOrder"]:
+            response = await client.place_order(
+                leg.symbol, leg.exchange, side or leg.side, order_type, quantity or leg.quantity,
+                leg.price if order_type == "LIMIT" else 0.0, leg.product_type, symbol_token=leg.symbol_token
+            )
+        data = response.get("data") if response.get("status") else None
+        return (data or {}).get("orderid"), response
+
+    async def _place_leg(self, client: SmartAPIClient, app_id: int, result: LegResult):
+        order_id, result.response = await self._place_order(client, result.leg)
+        if order_id:
+            result.status, result.order_id = "placed", order_id
+            self.track_order(app_id, result.leg, order_id)
+        else:
+            result.status = "rejected"
+            result.error = result.response.get("message") or result.response.get("error") or "placeOrder failed"
+
+    @staticmethod
+    async def _order_state(client: SmartAPIClient, order_id: str) -> Tuple[str, int]:
+        """(broker order status, filled quantity) from the order details."""
+        details = await client.get_order_details(order_id)
+        if not details.get("success"):
+            raise RuntimeError(details.get("error") or "orderDetails failed")
+        order = details["data"]
+        return order.state, order.filledshares or 0
+
+    async def _wait_for_state(self, client: SmartAPIClient, order_id: str, states: Sequence[str]) -> Tuple[str, int]:
+        """
+        Poll the order until its status is one of `states` or
+        ORDER_STATE_TIMEOUT passes; returns the last (status, filled quantity).
+        Raises if the order could not be read at all.
+        """
+        deadline = time.monotonic() + ORDER_STATE_TIMEOUT
+        state, error = None, None
+        while True:
+            try:
+                state = await self._order_state(client, order_id)
+                if state[0] in states:
+                    return state
+            except Exception as e:
+                error = e
+            if time.monotonic() >= deadline:
+                if state is None:
+                    raise error
+                return state
+            await asyncio.sleep(ORDER_STATE_POLL)
+
+    async def _confirm_leg(self, client: SmartAPIClient, result: LegResult) -> bool:
+        """Whether a placed leg is working at the exchange; one the broker rejected is marked rejected."""
+        try:
+            status, _ = await self._wait_for_state(client, result.order_id, WORKING_ORDER_STATES + TERMINAL_ORDER_STATES)
+        except Exception as e:
+            result.error = f"Could not confirm the order: {e}"
+            return False
+        if status in WORKING_ORDER_STATES:
+            return True
+        if status in TERMINAL_ORDER_STATES:
+            result.status, result.error = "rejected", f"Order {status} after placement"
+        else:
+            # Left as placed, so a rollback cancels it
+            result.error = f"Order still {status or 'unknown'} after {ORDER_STATE_TIMEOUT:g}s"
+        return False
+
+    async def _unwind_leg(self, client: SmartAPIClient, app_id: int, result: LegResult):
+        """Cancel whatever is still open of a placed leg and close out what filled."""
+        try:
+            status, filled = await self._order_state(client, result.order_id)
+            if status not in TERMINAL_ORDER_STATES:
+                async with client.rate_limiters["cancelOrder"]:
+                    await client.cancel_order(result.order_id)
+                # Wait for the cancel to land; the order may have filled before it did
+                status, filled = await self._wait_for_state(client, result.order_id, TERMINAL_ORDER_STATES)
+                if status not in TERMINAL_ORDER_STATES:
+                    raise RuntimeError(f"Order is still {status} {ORDER_STATE_TIMEOUT:g}s after cancel")
+            if filled:
+                side = "SELL" if result.leg.side == "BUY" else "BUY"
+                order_id, response = await self._place_order(client, result.leg, side, filled, "MARKET")
+                if not order_id:
+                    raise RuntimeError(f"Closing order failed: {response.get('message') or response.get('error')}")
+                self.track_order(app_id, replace(result.leg, side=side, quantity=filled, order_type="MARKET"), order_id)
+                result.status, result.rollback_order_id = "reversed", order_id
+            else:
+                result.status = "cancelled"
+        except Exception as e:
+            logger.exception("Rolling back basket leg %s failed", result.order_id)
+            result.status, result.error = "rollback_failed", str(e)
+
+    @staticmethod
+    def _record_basket(app_id: int, strategy_id: Optional[int], basket: BasketResult):
+        db = SessionLocal()
+        try:
+            # Rejected and unsent legs too (without an order id), so the row set shows the whole basket
+            for result in basket.legs:
+                db.add(Order(
+                    app_id=app_id,
+                    strategy_id=strategy_id,
+                    order_id=result.order_id,
+                    symbol=result.leg.symbol,
+                    qty=result.leg.quantity,
+                    price=result.leg.price,
+                    status=result.status,
+                    response_json=json.dumps({
+                        "basket_id": basket.basket_id,
+                        "leg": result.to_dict(),
+                        "response": result.response,
+                    })
+                ))
+            db.commit()
+        except Exception:
+            db.rollback()
+            logger.exception("Recording basket %s failed", basket.basket_id)
+        finally:
+            db.close()
 
+    def set_paper_mode(self, enabled: Optional[bool]):
+        """Override the persisted paper_mode setting; pass None to follow settings again."""
+        self._paper_mode_override = enabled
@@ -0,0 +1,194 @@
+"""
+Incremental Indicators - O(1) per-bar updates for live strategy evaluation
+
+The pandas_ta functions in indicator_engine recompute a whole series; these
+keep just enough state to produce the next value from the next bar, and
+follow the same conventions (Wilder smoothing for RSI with pandas'
+adjusted weights, SMA-seeded EMA, smoothed %K for stochastics) so live
+values line up with backtests, warm-up bars included. Values are NaN
+until the indicator has seen enough bars.
+
+state() returns plain lists/floats that restore() accepts, so indicator
+state can be snapshotted and resumed without replaying history.
+"""
+import math
+from collections import deque
+from typing import Any, Dict, Mapping
+
+NAN = float("nan")
+
+
+class SMA:
+    __slots__ = ("length", "_window", "_total")
+
+    def __init__(self, length: int = 20):
+        self.length = length
+        self._window: deque = deque(maxlen=length)
+        self._total = 0.0
+
+    def update(self, value: float) -> float:
+        if len(self._window) == self.length:
+            self._total -= self._window[0]
+        self._window.append(value)
+        self._total += value
+        return self._total / self.length if len(self._window) == self.length else NAN
+
+    def state(self) -> list:
+        # The running total is kept as-is so a restored SMA continues bit-for-bit
+        return [list(self._window), self._total]
+
+    def restore(self, state: list):
+        window, self._total = state
+        self._window = deque(window, maxlen=self.length)
+
+
+class EMA:
+    __slots__ = ("length", "_alpha", "_seed", "_value")
+
+    def __init__(self, length: int = 20):
+        self.length = length
+        self._alpha = 2.0 / (length + 1)
+        self._seed = SMA(length)
+        self._value = NAN
+
+    def update(self, value: float) -> float:
+        if math.isnan(self._value):
+            # The first value is the SMA of the first `length` inputs
+            self._value = self._seed.update(value)
+        else:
+            self._value += self._alpha * (value - self._value)
+        return self._value
+
+    def state(self) -> list:
+        return [self._value, self._seed.state()]
+
+    def restore(self, state: list):
+        self._value = state[0]
+        self._seed.restore(state[1])
+
+
+class RSI:
+    """
+    Wilder's RSI weighted as pandas_ta's rma, which is pandas'
+    ewm(alpha=1/length, adjust=True): each average is a sum of changes
+    weighted (1 - alpha)^age, divided by the sum of the weights. Both
+    averages share that divisor, so only the weighted sums are kept.
+    """
+    __slots__ = ("length", "_decay", "_previous", "_gain", "_loss", "_count")
+
+    def __init__(self, length: int = 14):
+        self.length = length
+        self._decay = 1.0 - 1.0 / length
+        self._previous = NAN
+        self._gain = 0.0
+        self._loss = 0.0
+        self._count = 0
+
+    def update(self, close: float) -> float:
+        previous, self._previous = self._previous, close
+        if math.isnan(previous):
+            return NAN
+        change = close - previous
+        self._gain = self._gain * self._decay + max(change, 0.0)
+        self._loss = self._loss * self._decay + max(-change, 0.0)
+        self._count += 1
+        if self._count < self.length:
+            return NAN
+        total = self._gain + self._loss
+        return 100.0 * self._gain / total if total else 50.0
+
+    def state(self) -> list:
+        return [self._previous, self._gain, self._loss, self._count]
+
+    def restore(self, state: list):
+        self._previous, self._gain, self._loss, self._count = state
+
+
+class Stochastic:
+    """%K over `k` bars smoothed by a 3-bar SMA, and %D as an SMA of %K."""
+    __slots__ = ("k", "d", "_highs", "_lows", "_smooth", "_signal", "value_k", "value_d")
+
+    def __init__(self, k: int = 14, d: int = 3, smooth_k: int = 3):
+        self.k = k
+        self.d = d
+        self._highs: deque = deque(maxlen=k)
+        self._lows: deque = deque(maxlen=k)
+        self._smooth = SMA(smooth_k)
+        self._signal = SMA(d)
+        self.value_k = NAN
+        self.value_d = NAN
+
+    def update(self, high: float, low: float, close: float):
+        self._highs.append(high)
+        self._lows.append(low)
+        if len(self._highs) < self.k:
+            return
+        highest, lowest = max(self._highs), min(self._lows)
+        # A flat range reads as 0, as with pandas_ta's non_zero_range
+        raw = 100.0 * (close - lowest) / (highest - lowest) if highest != lowest else 0.0
+        self.value_k = self._smooth.update(raw)
+        if not math.isnan(self.value_k):
+            self.value_d = self._signal.update(self.value_k)
+
+    def state(self) -> list:
+        return [list(self._highs), list(self._lows), self._smooth.state(), self._signal.state(), self.value_k, self.value_d]
+
+    def restore(self, state: list):
+        highs, lows, smooth, signal, self.value_k, self.value_d = state
+        self._highs = deque(highs, maxlen=self.k)
+        self._lows = deque(lows, maxlen=self.k)
+        self._smooth.restore(smooth)
+        self._signal.restore(signal)
+
+
+class IndicatorSet:
+    """
+    The indicators named in a validated rule set (see strategy_rules),
+    updated together from each closed bar. Stochastic outputs that share
+    parameters share one calculator.
+    """
+    __slots__ = ("_closes", "_stochastics", "values")
+
+    def __init__(self, indicators: Mapping[str, Dict[str, Any]]):
+        self._closes = []
+        self._stochastics: Dict[tuple, list] = {}
+        self.values: Dict[str, float] = {}
+        for name, spec in indicators.items():
+            kind = spec["indicator"]
+            if kind in ("stoch_k", "stoch_d"):
+                key = (spec["k"], spec["d"])
+                if key not in self._stochastics:
+                    self._stochastics[key] = [Stochastic(spec["k"], spec["d"]), []]
+                self._stochastics[key][1].append((name, kind == "stoch_k"))
+            else:
+                calculator = {"rsi": RSI, "sma": SMA, "ema": EMA}[kind](spec["length"])
+                self._closes.append((name, calculator))
+            self.values[name] = NAN
+
+    def update(self, bar: Mapping[str, float]) -> Dict[str, float]:
+        """Advance every indicator by one bar; returns the bar fields plus indicator values."""
+        close = bar["close"]
+        values = self.values
+        for name, calculator in self._closes:
+            values[name] = calculator.update(close)
+        for stochastic, outputs in self._stochastics.values():
+            stochastic.update(bar["high"], bar["low"], close)
+            for name, is_k in outputs:
+                values[name] = stochastic.value_k if is_k else stochastic.value_d
+        return {**bar, **values}
+
+    def state(self) -> Dict[str, Any]:
+        return {
+            "values": dict(self.values),
+            "closes": {name: calculator.state() for name, calculator in self._closes},
+            "stochastics": [[list(key), stochastic.state()] for key, (stochastic, _) in self._stochastics.items()],
+        }
+
+    def restore(self, state: Mapping[str, Any]):
+        """Load state() output; raises KeyError if it was taken from different indicators."""
+        for name, calculator in self._closes:
+            calculator.restore(state["closes"][name])
+        saved = {tuple(key): stochastic_state for key, stochastic_state in state["stochastics"]}
+        for key, (stochastic, _) in self._stochastics.items():
+            stochastic.restore(saved[key])
+        self.values.update(state["values"])
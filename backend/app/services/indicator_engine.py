@@ -1,9 +1,34 @@
 """
 Indicator Engine - Computes technical indicators using pandas and pandas_ta
+
+pandas_ta takes seconds to import, so it is loaded on first indicator use
+(or ahead of time by warm_up() in a background task at startup).
 """
-import pandas as pd
-import pandas_ta as ta
-from typing import Dict, Optional
+from typing import TYPE_CHECKING, Any, Dict, Mapping, Optional
+from app.services.compute_pool import ComputePool, JobContext
+from app.services.metrics import CACHE_REQUESTS
+
+_CACHE_HIT = CACHE_REQUESTS.labels("indicator", "hit")
+_CACHE_MISS = CACHE_REQUESTS.labels("indicator", "miss")
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+_ta = None
+
+
+def _pandas_ta():
+    """Import pandas_ta (and pandas) on first use."""
+    global _ta
+    if _ta is None:
+        import pandas_ta
+        _ta = pandas_ta
+    return _ta
+
+
+def warm_up():
+    """Load the numeric libraries ahead of the first indicator computation."""
+    _pandas_ta()
 
 
 def compute_pivot(previous_day_ohlc: Dict[str, float]) -> Dict[str, float]:
@@ -30,21 +55,21 @@ def compute_pivot(previous_day_ohlc: Dict[str, float]) -> Dict[str, float]:
     }
 
 
-def compute_rsi(series: pd.Series, length: int = 14) -> float:
+def compute_rsi(series: "pd.Series", length: int = 14) -> float:
     """
     Compute RSI (Relative Strength Index).
     Returns the last RSI value.
     """
-    rsi = ta.rsi(series, length=length)
+    rsi = _pandas_ta().rsi(series, length=length)
     if rsi is not None and len(rsi) > 0:
         return float(rsi.iloc[-1])
     return 50.0  # Default neutral value
 
 
 def compute_stochastic(
-    high_series: pd.Series,
-    low_series: pd.Series,
-    close_series: pd.Series,
+    high_series: "pd.Series",
+    low_series: "pd.Series",
+    close_series: "pd.Series",
     k: int = 14,
     d: int = 3
 ) -> Dict[str, float]:
@@ -52,7 +77,7 @@ def compute_stochastic(
     Compute Stochastic Oscillator (%K and %D).
     Returns dict with 'k' and 'd' values.
     """
-    stoch = ta.stoch(high_series, low_series, close_series, k=k, d=d)
+    stoch = _pandas_ta().stoch(high_series, low_series, close_series, k=k, d=d)
     if stoch is not None and len(stoch) > 0:
         last_row = stoch.iloc[-1]
         # Try different possible column names for pandas-ta compatibility
@@ -75,7 +100,7 @@ def compute_stochastic(
 
 
 def compute_ma(
-    series: pd.Series,
+    series: "pd.Series",
     window: int,
     ma_type: str = 'sma'
 ) -> float:
@@ -83,6 +108,7 @@ def compute_ma(
     Compute Moving Average (SMA or EMA).
     Returns the last MA value.
     """
+    ta = _pandas_ta()
     if ma_type.lower() == 'ema':
         ma = ta.ema(series, length=window)
     else:
@@ -93,6 +119,43 @@ def compute_ma(
     return float(series.iloc[-1]) if len(series) > 0 else 0.0
 
 
+def compute_indicator_set(bars: Mapping[str, Any], specs: Dict[str, Dict]) -> Dict[str, Any]:
+    """
+    Compute several indicators over the same bars.
+
+    Args:
+        bars: Bar columns ('high', 'low', 'close', ...) as arrays or Series
+        specs: Output name -> spec, e.g. {"rsi_14": {"indicator": "rsi", "length": 14}}.
+               Indicators: rsi (length), stoch (k, d), sma/ema (length)
+    """
+    import pandas as pd
+
+    series = {column: pd.Series(values, copy=False) for column, values in bars.items()}
+    results: Dict[str, Any] = {}
+    for name, spec in specs.items():
+        params = {key: value for key, value in spec.items() if key != "indicator"}
+        indicator = spec["indicator"]
+        if indicator == "rsi":
+            results[name] = compute_rsi(series["close"], **params)
+        elif indicator == "stoch":
+            results[name] = compute_stochastic(series["high"], series["low"], series["close"], **params)
+        elif indicator in ("sma", "ema"):
+            results[name] = compute_ma(series["close"], params.get("length", 20), indicator)
+        else:
+            raise ValueError(f"Unknown indicator {indicator!r}")
+    return results
+
+
+def _indicator_set_job(ctx: JobContext, bars: Dict[str, Any], specs: Dict[str, Dict]) -> Dict[str, Any]:
+    ctx.check_cancelled()
+    return compute_indicator_set(bars, specs)
+
+
+async def compute_indicator_set_offloaded(bars: Mapping[str, Any], specs: Dict[str, Dict]) -> Dict[str, Any]:
+    """Run compute_indicator_set in the compute pool instead of on the event loop."""
+    return await ComputePool.get_instance().submit(_indicator_set_job, specs, bars=bars, name="indicators")
+
+
 class IndicatorCache:
     """
     Cache for storing recent indicator values per symbol.
@@ -103,7 +166,9 @@ class IndicatorCache:
     
     def get(self, symbol: str, indicator: str) -> Optional[float]:
         if symbol in self.cache and indicator in self.cache[symbol]:
+            _CACHE_HIT.inc()
             return self.cache[symbol][indicator]
+        _CACHE_MISS.inc()
         return None
     
     def set(self, symbol: str, indicator: str, value: float):
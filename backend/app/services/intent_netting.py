@@ -0,0 +1,351 @@
+"""
+Intent Netting - Combines trade intents across strategies before they reach the broker
+
+Intents for the same app, instrument and product that arrive within
+INTENT_NETTING_WINDOW seconds of the first are netted: opposing
+quantities cross internally and only the difference goes to the broker,
+as one (sliced if needed) order. Each strategy is still filled for its
+whole intent in its own ledger. The crossed part is filled at the
+intents' price; the rest is a pro rata share of the broker order's fills,
+allocated as they arrive, each batch at its own price. Allocations are
+recorded in orders (status "allocated") under the strategy, which is what
+the ledger is rebuilt from.
+"""
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import uuid
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+from app.models import Order
+from app.models.database import SessionLocal
+from app.services import metrics
+from app.services.execution import ExecutionLayer, OrderLeg, SlicedOrder
+from app.services.pnl_engine import STRATEGY, PnLEngine, apply_fill
+from app.services.session_manager import SessionManager
+from app.services.strategy_runner import TradeIntent
+
+logger = logging.getLogger(__name__)
+
+INTENT_NETTING_WINDOW = float(os.getenv("INTENT_NETTING_WINDOW", "0.2"))
+# How often, and for how long, a netted broker order is polled for fills
+INTENT_FILL_POLL = 1.0
+INTENT_FILL_TIMEOUT = 120.0
+
+NettingKey = Tuple[int, str, str, str]  # app_id, exchange, symbol token, product type
+
+INTENTS_RECEIVED = metrics.counter("intent_netting_intents_total", "Trade intents received by the netting stage")
+NETTED_ORDERS = metrics.counter(
+    "intent_netting_orders_total",
+    "Netting windows by outcome (order: a broker order was sent, crossed: fully matched internally, failed)",
+    ("outcome",)
+)
+CROSSED_QUANTITY = metrics.counter(
+    "intent_netting_crossed_quantity_total",
+    "Quantity matched between strategies instead of being sent to the broker"
+)
+
+
+def pro_rata(total: int, weights: List[int]) -> List[int]:
+    """Split an integer total in proportion to weights (largest remainder), summing exactly to total."""
+    weight_sum = sum(weights)
+    if not weight_sum:
+        return [0] * len(weights)
+    shares = [total * weight // weight_sum for weight in weights]
+    by_remainder = sorted(range(len(weights)), key=lambda i: total * weights[i] % weight_sum, reverse=True)
+    for i in by_remainder[:total - sum(shares)]:
+        shares[i] += 1
+    return shares
+
+
+class LedgerPosition:
+    """Net quantity (signed), average cost and realised P&L of one strategy in one instrument."""
+    __slots__ = ("quantity", "average_price", "realized_pnl")
+
+    def __init__(self):
+        self.quantity = 0
+        self.average_price = 0.0
+        self.realized_pnl = 0.0
+
+    def apply(self, quantity: int, price: float):
+        """Add a fill; quantity is negative for sells."""
+        self.quantity, self.average_price, realized = apply_fill(self.quantity, self.average_price, quantity, price)
+        self.realized_pnl += realized
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"quantity": self.quantity, "average_price": self.average_price, "realized_pnl": self.realized_pnl}
+
+
+LedgerKey = Tuple[int, str, str, str]  # strategy_id, exchange, symbol token, product type
+
+
+class StrategyLedger:
+    """Per-strategy positions built from allocated fills."""
+
+    def __init__(self):
+        self.positions: Dict[LedgerKey, LedgerPosition] = {}
+        self.symbols: Dict[Tuple[str, str], Optional[str]] = {}
+
+    def apply(self, strategy_id: int, exchange: str, token: str, product_type: str, side: str,
+              quantity: int, price: float, symbol: Optional[str] = None):
+        key = (strategy_id, exchange, token, product_type)
+        position = self.positions.get(key)
+        if position is None:
+            position = self.positions[key] = LedgerPosition()
+        position.apply(quantity if side == "BUY" else -quantity, price)
+        if symbol:
+            self.symbols[(exchange, token)] = symbol
+
+    def open_positions(self, strategy_id: int) -> List[Tuple[LedgerKey, LedgerPosition]]:
+        return [(key, position) for key, position in self.positions.items() if key[0] == strategy_id and position.quantity]
+
+    def for_strategy(self, strategy_id: int) -> List[Dict[str, Any]]:
+        return [
+            {
+                "exchange": exchange, "symbol_token": token, "symbol": self.symbols.get((exchange, token)),
+                "product_type": product_type, **position.to_dict()
+            }
+            for (owner, exchange, token, product_type), position in self.positions.items() if owner == strategy_id
+        ]
+
+    def rebuild(self):
+        """Replay every recorded allocation, oldest first."""
+        self.positions.clear()
+        db = SessionLocal()
+        try:
+            rows = db.query(Order).filter(Order.status == "allocated").order_by(Order.id).all()
+            for row in rows:
+                data = json.loads(row.response_json)
+                self.apply(
+                    row.strategy_id, data["exchange"], data["symbol_token"], data["product_type"],
+                    data["side"], row.qty, row.price, row.symbol
+                )
+        finally:
+            db.close()
+
+
+@dataclass
+class _Allocation:
+    intent: TradeIntent
+    crossed: int = 0
+    broker_share: int = 0  # part of the net broker order that belongs to this intent
+    broker_filled: int = 0  # of broker_share, allocated so far
+
+
+@dataclass
+class _AllocatedFills:
+    """The netted order's fills handed out so far; new fills are priced from the change."""
+    quantity: int = 0
+    value: float = 0.0
+
+
+class IntentNetter:
+    """
+    Intent handler for StrategyEngine: collects intents per NettingKey for
+    one window, then sends the net to the execution layer.
+    """
+    _instance = None
+
+    def __init__(self, execution: Optional[ExecutionLayer] = None, ledger: Optional[StrategyLedger] = None,
+                 window: Optional[float] = None, pnl: Optional[PnLEngine] = None):
+        if IntentNetter._instance is not None:
+            raise Exception("IntentNetter is a singleton")
+        IntentNetter._instance = self
+        self.execution = execution or ExecutionLayer.get_instance()
+        self.ledger = ledger or StrategyLedger()
+        self.pnl = pnl or PnLEngine.get_instance()
+        self.window = INTENT_NETTING_WINDOW if window is None else window
+        self._pending: Dict[NettingKey, List[TradeIntent]] = {}
+        self._tasks = set()
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    async def submit(self, intent: TradeIntent):
+        """Queue an intent; the first one for its key opens the netting window."""
+        INTENTS_RECEIVED.inc()
+        key = (intent.app_id, intent.exchange, intent.symbol_token, intent.product_type)
+        batch = self._pending.get(key)
+        if batch is None:
+            self._pending[key] = [intent]
+            self._spawn(self._flush_after(key))
+        else:
+            batch.append(intent)
+
+    def _spawn(self, coroutine):
+        task = asyncio.create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _flush_after(self, key: NettingKey):
+        await asyncio.sleep(self.window)
+        with contextlib.suppress(Exception):  # logged by flush
+            await self.flush(key)
+
+    async def flush(self, key: NettingKey) -> Optional[SlicedOrder]:
+        """Net and send the window for `key` now; returns the broker order, if one was needed."""
+        intents = self._pending.pop(key, None)
+        if not intents:
+            return None
+        try:
+            return await self._execute(key, intents)
+        except Exception:
+            NETTED_ORDERS.labels("failed").inc()
+            logger.exception("Netted order for %s:%s failed", key[1], key[2],
+                             extra={"strategies": [intent.strategy_id for intent in intents]})
+            raise
+
+    async def drain(self):
+        """Send every open window now and stop following fills (shutdown)."""
+        for key in list(self._pending):
+            with contextlib.suppress(Exception):
+                await self.flush(key)
+        for task in list(self._tasks):
+            task.cancel()
+
+    async def _execute(self, key: NettingKey, intents: List[TradeIntent]) -> Optional[SlicedOrder]:
+        app_id, exchange, token, product_type = key
+        allocations = [_Allocation(intent) for intent in intents]
+        buys = [a for a in allocations if a.intent.side == "BUY"]
+        sells = [a for a in allocations if a.intent.side == "SELL"]
+        bought = sum(a.intent.quantity for a in buys)
+        sold = sum(a.intent.quantity for a in sells)
+        crossed = min(bought, sold)
+        # The smaller side crosses in full; the larger crosses pro rata and sends the rest
+        larger, smaller = (buys, sells) if bought >= sold else (sells, buys)
+        for allocation in smaller:
+            allocation.crossed = allocation.intent.quantity
+        for allocation, share in zip(larger, pro_rata(crossed, [a.intent.quantity for a in larger])):
+            allocation.crossed = share
+            allocation.broker_share = allocation.intent.quantity - share
+
+        netting_id = uuid.uuid4().hex[:16]
+        reference_price = sum(i.price * i.quantity for i in intents) / max(1, sum(i.quantity for i in intents))
+        records = [
+            (a.intent, a.crossed, reference_price, f"NET_{netting_id}") for a in allocations if a.crossed
+        ]
+        if crossed:
+            CROSSED_QUANTITY.inc(crossed)
+        await self._allocate(netting_id, records)
+
+        net = bought - sold
+        if not net:
+            NETTED_ORDERS.labels("crossed").inc()
+            return None
+        client = SessionManager.get_instance().get_smartapi_client()
+        if client is None:
+            raise RuntimeError("No active broker session")
+        leg = OrderLeg(
+            symbol=intents[0].symbol or "", exchange=exchange, side="BUY" if net > 0 else "SELL",
+            quantity=abs(net), product_type=product_type, symbol_token=token
+        )
+        strategy_ids = {intent.strategy_id for intent in intents}
+        order = await self.execution.execute_sliced_order(
+            client, app_id, leg, strategy_id=strategy_ids.pop() if len(strategy_ids) == 1 else None
+        )
+        NETTED_ORDERS.labels("order").inc()
+        logger.info(
+            "Netted %d intents for %s:%s into %s %d", len(intents), exchange, token, leg.side, leg.quantity,
+            extra={"netting_id": netting_id, "order_id": order.order_id, "crossed": crossed}
+        )
+        broker_side = [a for a in larger if a.broker_share]
+        allocated = _AllocatedFills()
+        await self._allocate_fills(netting_id, order, broker_side, allocated, reference_price)
+        if not order.done:
+            self._spawn(self._follow_fills(netting_id, client, app_id, order, broker_side, allocated, reference_price))
+        return order
+
+    async def _allocate_fills(self, netting_id: str, order: SlicedOrder, allocations: List[_Allocation],
+                              allocated: _AllocatedFills, reference_price: float):
+        """
+        Hand out the order's fills not yet allocated, pro rata to each
+        intent's broker share, at the average price of just those fills.
+        """
+        filled_qty = order.filled_qty
+        if filled_qty <= allocated.quantity:
+            return
+        new_qty = filled_qty - allocated.quantity
+        if order.average_price:
+            value = filled_qty * order.average_price
+        else:
+            value = allocated.value + new_qty * reference_price
+        price = (value - allocated.value) / new_qty
+        allocated.quantity, allocated.value = filled_qty, value
+        targets = pro_rata(filled_qty, [a.broker_share for a in allocations])
+        records = []
+        for allocation, target in zip(allocations, targets):
+            quantity = min(target, allocation.broker_share) - allocation.broker_filled
+            if quantity > 0:
+                allocation.broker_filled += quantity
+                records.append((allocation.intent, quantity, price, order.order_id))
+        await self._allocate(netting_id, records)
+
+    async def _follow_fills(self, netting_id: str, client, app_id: int, order: SlicedOrder,
+                            allocations: List[_Allocation], allocated: _AllocatedFills, reference_price: float):
+        waited = 0.0
+        while waited < INTENT_FILL_TIMEOUT:
+            await asyncio.sleep(INTENT_FILL_POLL)
+            waited += INTENT_FILL_POLL
+            try:
+                order = await self.execution.refresh_order(client, app_id, order.order_id) or order
+            except Exception as e:
+                logger.warning("Refreshing netted order %s failed: %s", order.order_id, e)
+                continue
+            await self._allocate_fills(netting_id, order, allocations, allocated, reference_price)
+            if order.done:
+                return
+        unfilled = sum(a.broker_share - a.broker_filled for a in allocations)
+        logger.warning("Netted order %s still has %d unfilled after %.0fs", order.order_id, unfilled, waited,
+                       extra={"netting_id": netting_id})
+
+    async def _allocate(self, netting_id: str, records: List[Tuple[TradeIntent, int, float, Optional[str]]]):
+        if not records:
+            return
+        for intent, quantity, price, _ in records:
+            self.ledger.apply(
+                intent.strategy_id, intent.exchange, intent.symbol_token, intent.product_type,
+                intent.side, quantity, price, intent.symbol
+            )
+            position = self.ledger.positions[(intent.strategy_id, intent.exchange, intent.symbol_token, intent.product_type)]
+            self.pnl.set_position(
+                (STRATEGY, intent.strategy_id), intent.exchange, intent.symbol_token, intent.product_type,
+                position.quantity, position.average_price, position.realized_pnl
+            )
+        await asyncio.to_thread(self._record_allocations, netting_id, records)
+
+    @staticmethod
+    def _record_allocations(netting_id: str, records: List[Tuple[TradeIntent, int, float, Optional[str]]]):
+        db = SessionLocal()
+        try:
+            for intent, quantity, price, order_id in records:
+                db.add(Order(
+                    app_id=intent.app_id,
+                    strategy_id=intent.strategy_id,
+                    order_id=order_id,
+                    symbol=intent.symbol,
+                    qty=quantity,
+                    price=price,
+                    status="allocated",
+                    filled_qty=quantity,
+                    average_price=price,
+                    response_json=json.dumps({
+                        "netting_id": netting_id,
+                        "side": intent.side,
+                        "exchange": intent.exchange,
+                        "symbol_token": intent.symbol_token,
+                        "product_type": intent.product_type,
+                        "signal": intent.signal,
+                        "crossed": order_id == f"NET_{netting_id}",
+                    })
+                ))
+            db.commit()
+        except Exception:
+            db.rollback()
+            logger.exception("Recording allocations for netting %s failed", netting_id)
+        finally:
+            db.close()
@@ -0,0 +1,285 @@
+"""
+Market Breadth - Top gainers/losers, OI movers and OI buildup from the live feed
+
+Ticks for the subscribed universe are written into NumPy columns in O(1).
+Rankings are computed on demand with a partial sort (argpartition for the
+top N, then sorting only those N) and cached until the next tick, so the
+dashboard can poll as often as it likes without a broker call.
+
+The universe is the near-month future of every NFO underlying, the same
+contracts the broker's gainersLosers ranks. load() picks them from the
+symbol master once per trading day and seeds them from a getQuote FULL
+call; MarketStream then subscribes them in SnapQuote mode (the only mode
+that carries OI) and forwards their ticks to on_tick().
+
+OI change is measured against the first open interest seen for an
+instrument each session (or the value passed to seed()), since quotes do
+not carry the previous day's OI.
+"""
+import asyncio
+import logging
+import threading
+import time
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+import numpy as np
+from app.services.broker_models import Quote
+from app.services.smartapi_client import SmartAPIClient
+from app.services.symbol_master import IST, Instrument, SymbolMasterService
+
+logger = logging.getLogger(__name__)
+
+UNIVERSE_EXCHANGE = "NFO"
+FUTURE_TYPES = ("FUTIDX", "FUTSTK")
+
+# gainersLosers datatypes -> (metric, descending)
+DATATYPES = {
+    "PercPriceGainers": ("percent_change", True),
+    "PercPriceLosers": ("percent_change", False),
+    "PercOIGainers": ("oi_change_percent", True),
+    "PercOILosers": ("oi_change_percent", False),
+    "TopVolume": ("volume", True),
+}
+
+# OI buildup category -> (price direction, OI direction)
+BUILDUP_TYPES = {
+    "Long Built Up": (1, 1),
+    "Short Built Up": (-1, 1),
+    "Short Covering": (1, -1),
+    "Long Unwinding": (-1, -1),
+}
+
+
+def near_month_futures(instruments: Iterable[Instrument], today: date) -> List[Instrument]:
+    """The nearest unexpired future of each underlying among symbol master instruments."""
+    nearest: Dict[str, Tuple[date, Instrument]] = {}
+    for instrument in instruments:
+        if instrument.exchange != UNIVERSE_EXCHANGE or instrument.instrument_type not in FUTURE_TYPES:
+            continue
+        try:
+            expiry = datetime.strptime(instrument.expiry, "%d%b%Y").date()
+        except ValueError:
+            continue
+        if expiry >= today and (instrument.name not in nearest or expiry < nearest[instrument.name][0]):
+            nearest[instrument.name] = (expiry, instrument)
+    return [instrument for _, instrument in nearest.values()]
+
+
+class MarketBreadthService:
+    """
+    Holds the latest price/OI/volume per subscribed token in column arrays
+    (slot i of every array is token i) and ranks them on request.
+    """
+    _instance = None
+
+    def __init__(self, capacity: int = 1024):
+        if MarketBreadthService._instance is not None:
+            raise Exception("MarketBreadthService is a singleton")
+        MarketBreadthService._instance = self
+        self._lock = threading.Lock()
+        self._slots: Dict[str, int] = {}
+        self.tokens: List[str] = []
+        self.symbols: List[str] = []
+        self.ltp = np.full(capacity, np.nan)
+        self.close = np.full(capacity, np.nan)
+        self.oi = np.zeros(capacity)
+        self.reference_oi = np.full(capacity, np.nan)
+        self.volume = np.zeros(capacity)
+        self.version = 0
+        self.updated_at = 0.0
+        self._rankings: Dict[Tuple, List[Dict[str, Any]]] = {}
+        self._rankings_version = -1
+        self.universe: Set[Tuple[str, str]] = set()  # (exchange, token) to stream
+        self._universe_loaded_on = None
+        self._load_lock = asyncio.Lock()
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    def __len__(self) -> int:
+        return len(self.tokens)
+
+    def is_live(self, max_age: float = 60.0) -> bool:
+        """True if the universe is populated and has ticked recently."""
+        return bool(self.tokens) and time.monotonic() - self.updated_at <= max_age
+
+    def _slot(self, token: str, symbol: Optional[str]) -> int:
+        slot = self._slots.get(token)
+        if slot is None:
+            slot = len(self.tokens)
+            if slot == len(self.ltp):
+                self._grow()
+            self._slots[token] = slot
+            self.tokens.append(token)
+            self.symbols.append(symbol or token)
+        elif symbol and self.symbols[slot] == token:
+            self.symbols[slot] = symbol
+        return slot
+
+    def _grow(self):
+        size = len(self.ltp)
+        for name, fill in (("ltp", np.nan), ("close", np.nan), ("oi", 0.0), ("reference_oi", np.nan), ("volume", 0.0)):
+            column = getattr(self, name)
+            grown = np.full(size * 2, fill)
+            grown[:size] = column
+            setattr(self, name, grown)
+
+    def on_tick(
+        self,
+        token: str,
+        ltp: float,
+        close: Optional[float] = None,
+        oi: Optional[float] = None,
+        volume: Optional[float] = None,
+        symbol: Optional[str] = None
+    ):
+        """Record a tick. `close` is the previous session's close."""
+        with self._lock:
+            slot = self._slot(token, symbol)
+            self.ltp[slot] = ltp
+            if close is not None:
+                self.close[slot] = close
+            if oi is not None:
+                self.oi[slot] = oi
+                if np.isnan(self.reference_oi[slot]):
+                    self.reference_oi[slot] = oi
+            if volume is not None:
+                self.volume[slot] = volume
+            self.version += 1
+            self.updated_at = time.monotonic()
+
+    def seed(self, quotes: Iterable[Quote], reference_oi: Optional[Dict[str, float]] = None):
+        """
+        Initialise the universe from getQuote FULL results, optionally with
+        the previous day's OI per token.
+        """
+        reference_oi = reference_oi or {}
+        for quote in quotes:
+            token = str(quote.symbolToken)
+            if token in reference_oi:
+                with self._lock:
+                    self.reference_oi[self._slot(token, quote.tradingSymbol)] = reference_oi[token]
+            self.on_tick(
+                token,
+                np.nan if quote.ltp is None else quote.ltp,
+                close=quote.close,
+                oi=quote.opnInterest,
+                volume=quote.tradeVolume,
+                symbol=quote.tradingSymbol
+            )
+
+    async def load(self, client: SmartAPIClient) -> Set[Tuple[str, str]]:
+        """Pick and seed the day's universe, once per trading day; returns the instruments to stream."""
+        async with self._load_lock:
+            today = datetime.now(IST).date()
+            if self._universe_loaded_on != today:
+                master = await SymbolMasterService.get_instance().load(client)
+                futures = await asyncio.to_thread(near_month_futures, master.instruments(UNIVERSE_EXCHANGE), today)
+                batch = await client.get_quotes({UNIVERSE_EXCHANGE: [future.token for future in futures]}, mode="FULL")
+                if batch.unfetched:
+                    logger.warning(
+                        "Market breadth quotes missing for %d of %d futures", len(batch.unfetched), len(futures),
+                        extra={"reasons": sorted(set(batch.unfetched.values()))}
+                    )
+                self.clear()
+                self.seed(batch.quotes.values())
+                self.universe = {(UNIVERSE_EXCHANGE, future.token) for future in futures}
+                self._universe_loaded_on = today
+                logger.info("Market breadth universe: %d near-month futures", len(self.universe))
+        return self.universe
+
+    def clear(self):
+        """Drop every instrument, e.g. before the next day's universe is seeded."""
+        with self._lock:
+            self._slots.clear()
+            self.tokens.clear()
+            self.symbols.clear()
+            for name in ("ltp", "close", "reference_oi"):
+                getattr(self, name)[:] = np.nan
+            self.oi[:] = 0.0
+            self.volume[:] = 0.0
+            self.version += 1
+
+    def reset_session(self):
+        """Forget OI references at the start of a new trading day."""
+        with self._lock:
+            self.reference_oi[:] = np.nan
+            self.version += 1
+
+    def _metric(self, metric: str, count: int) -> np.ndarray:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            if metric == "percent_change":
+                return (self.ltp[:count] - self.close[:count]) / self.close[:count] * 100.0
+            if metric == "oi_change_percent":
+                return (self.oi[:count] - self.reference_oi[:count]) / self.reference_oi[:count] * 100.0
+        if metric == "volume":
+            return self.volume[:count]
+        raise ValueError(f"Unknown metric {metric!r}")
+
+    @staticmethod
+    def _top(values: np.ndarray, candidates: np.ndarray, limit: int, descending: bool) -> np.ndarray:
+        """Indices of the best `limit` candidates, ordered, via a partial sort."""
+        keys = -values[candidates] if descending else values[candidates]
+        if limit < len(candidates):
+            candidates = candidates[np.argpartition(keys, limit)[:limit]]
+            keys = -values[candidates] if descending else values[candidates]
+        return candidates[np.argsort(keys, kind="stable")]
+
+    def _row(self, slot: int) -> Dict[str, Any]:
+        close = self.close[slot]
+        reference = self.reference_oi[slot]
+        percent_change = (self.ltp[slot] - close) / close * 100.0 if close else np.nan
+        return {
+            "symbol": self.symbols[slot],
+            "symboltoken": self.tokens[slot],
+            "ltp": float(self.ltp[slot]),
+            "percentChange": round(float(percent_change), 2) if np.isfinite(percent_change) else 0.0,
+            "opnInterest": int(self.oi[slot]),
+            "netChangeOpnInterest": int(self.oi[slot] - reference) if np.isfinite(reference) else 0,
+            "tradeVolume": int(self.volume[slot])
+        }
+
+    def _cached(self, key: Tuple, build) -> List[Dict[str, Any]]:
+        if self._rankings_version != self.version:
+            self._rankings.clear()
+            self._rankings_version = self.version
+        ranking = self._rankings.get(key)
+        if ranking is None:
+            ranking = self._rankings[key] = build()
+        return ranking
+
+    def rank(self, datatype: str, limit: int = 20) -> List[Dict[str, Any]]:
+        """Top `limit` instruments for a gainersLosers datatype, in the broker's item shape."""
+        metric, descending = DATATYPES[datatype]
+
+        def build():
+            with self._lock:
+                count = len(self.tokens)
+                values = self._metric(metric, count)
+                # Gainers must be up and losers down, as in the broker's lists
+                candidates = np.flatnonzero(np.isfinite(values) & ((values > 0) if descending else (values < 0)))
+                return [self._row(slot) for slot in self._top(values, candidates, limit, descending)]
+
+        return self._cached(("rank", datatype, limit), build)
+
+    def oi_buildup(self, buildup_type: str, limit: int = 20) -> List[Dict[str, Any]]:
+        """Instruments in an OI buildup category, largest absolute OI change first."""
+        price_direction, oi_direction = BUILDUP_TYPES[buildup_type]
+
+        def build():
+            with self._lock:
+                count = len(self.tokens)
+                price_change = self._metric("percent_change", count)
+                oi_change = self._metric("oi_change_percent", count)
+                candidates = np.flatnonzero(
+                    (np.sign(price_change) == price_direction) & (np.sign(oi_change) == oi_direction)
+                )
+                return [
+                    {**self._row(slot), "oiChangePercent": round(float(oi_change[slot]), 2)}
+                    for slot in self._top(np.abs(oi_change), candidates, limit, True)
+                ]
+
+        return self._cached(("buildup", buildup_type, limit), build)
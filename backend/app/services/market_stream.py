@@ -0,0 +1,270 @@
+"""
+Market Stream - SmartStream ticks for the active account, fed into StrategyEngine.on_tick
+
+One WebSocket per active session, opened with its JWT and feed token.
+The instruments subscribed are whatever currently needs live prices:
+
+- instruments of loaded rule-based strategies (bars are built from ticks),
+- instruments with an open position in the P&L engine (mark-to-market),
+- "ticks" keys a browser subscribed to on /ws/live,
+- the market breadth universe, loaded and seeded once the session connects,
+- contracts of option chains being viewed.
+
+Every tick goes to StrategyEngine.on_tick; ticks of the breadth universe
+also go to MarketBreadthService.on_tick and NFO ticks to
+OptionChainService.on_tick.
+
+The wanted instruments and their modes are reconciled every
+MARKET_STREAM_RECONCILE seconds and only the difference is
+(un)subscribed. When the active app changes or logs out the stream is
+closed; after a dropped connection it reconnects with backoff and
+subscribes again from scratch.
+
+Packets are SmartStream v2 binary (little-endian, prices in paise; CDS in
+1e-7 rupees). Quote mode is requested so bars get the day volume;
+instruments that need OI are subscribed in SnapQuote mode, the only one
+that carries it.
+"""
+import asyncio
+import json
+import logging
+import math
+import os
+import struct
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+import websockets
+from app.services import metrics
+from app.services.market_breadth import MarketBreadthService
+from app.services.option_chain import OptionChainService
+from app.services.pnl_engine import PnLEngine
+from app.services.session_manager import SessionManager
+from app.services.strategy_engine import StrategyEngine
+from app.services.ui_feed import UIFeed
+
+logger = logging.getLogger(__name__)
+
+# Overrides the stream URL derived from the app's base URL
+SMARTAPI_STREAM_URL = os.getenv("SMARTAPI_STREAM_URL", "")
+# Seconds between checks of which instruments need live prices
+MARKET_STREAM_RECONCILE = float(os.getenv("MARKET_STREAM_RECONCILE", "1.0"))
+
+HEARTBEAT_INTERVAL = 30.0  # SmartStream closes connections that stop sending "ping"
+RECONNECT_DELAYS = (1.0, 2.0, 5.0, 10.0, 30.0)
+SUBSCRIBE, UNSUBSCRIBE = 1, 0
+LTP_MODE, QUOTE_MODE, SNAP_QUOTE_MODE = 1, 2, 3
+EXCHANGE_TYPES = {"NSE": 1, "NFO": 2, "BSE": 3, "BFO": 4, "MCX": 5, "CDS": 13}
+EXCHANGE_NAMES = {code: exchange for exchange, code in EXCHANGE_TYPES.items()}
+PRICE_DIVISORS = {"CDS": 1e7}  # everything else is in paise
+
+# mode, exchange type, token, sequence number, exchange time (ms), LTP
+_HEADER = struct.Struct("<bb25sqqq")
+_VOLUME = struct.Struct("<q")
+_VOLUME_OFFSET = 67  # after last traded quantity and average price (Quote and SnapQuote)
+_OI = struct.Struct("<q")
+_OI_OFFSET = 131  # after last traded time (SnapQuote only)
+
+Instrument = Tuple[str, str]  # (exchange, symbol token)
+
+STREAM_TICKS = metrics.counter("market_stream_ticks_total", "Ticks received from SmartStream")
+STREAM_CONNECTED = metrics.gauge("market_stream_connected", "1 while the SmartStream connection is open")
+STREAM_SUBSCRIPTIONS = metrics.gauge("market_stream_subscriptions", "Instruments subscribed on SmartStream")
+STREAM_RECONNECTS = metrics.counter("market_stream_reconnects_total", "SmartStream connections lost or refused")
+
+
+class StreamTick(NamedTuple):
+    exchange: str
+    token: str
+    ltp: float
+    time: float  # exchange time, seconds
+    volume: float
+    oi: float
+
+
+def parse_packet(packet: bytes) -> Optional[StreamTick]:
+    """Decode one binary SmartStream packet; None for packets that are too short or from unknown exchanges."""
+    if len(packet) < _HEADER.size:
+        return None
+    _, exchange_type, token, _, exchange_time, ltp = _HEADER.unpack_from(packet)
+    exchange = EXCHANGE_NAMES.get(exchange_type)
+    if exchange is None:
+        return None
+    divisor = PRICE_DIVISORS.get(exchange, 100.0)
+    volume = float(_VOLUME.unpack_from(packet, _VOLUME_OFFSET)[0]) if len(packet) >= _VOLUME_OFFSET + 8 else math.nan
+    oi = float(_OI.unpack_from(packet, _OI_OFFSET)[0]) if len(packet) >= _OI_OFFSET + 8 else math.nan
+    return StreamTick(
+        exchange, token.split(b"\x00", 1)[0].decode(), ltp / divisor, exchange_time / 1000.0, volume, oi
+    )
+
+
+def _finite(value: float) -> Optional[float]:
+    return None if math.isnan(value) else value
+
+
+def subscription_message(action: int, instruments: Iterable[Instrument], mode: int = QUOTE_MODE) -> str:
+    tokens: Dict[str, list] = {}
+    for exchange, token in instruments:
+        tokens.setdefault(exchange, []).append(token)
+    return json.dumps({
+        "correlationID": "algopilot",
+        "action": action,
+        "params": {
+            "mode": mode,
+            "tokenList": [
+                {"exchangeType": EXCHANGE_TYPES[exchange], "tokens": sorted(tokens[exchange])}
+                for exchange in sorted(tokens)
+            ],
+        },
+    })
+
+
+def _by_mode(modes: Dict[Instrument, int]) -> Dict[int, List[Instrument]]:
+    grouped: Dict[int, List[Instrument]] = {}
+    for instrument, mode in modes.items():
+        grouped.setdefault(mode, []).append(instrument)
+    return grouped
+
+
+class MarketStream:
+    """Keeps a SmartStream connection for the active session and forwards its ticks."""
+    _instance = None
+
+    def __init__(self, reconcile_interval: float = MARKET_STREAM_RECONCILE):
+        if MarketStream._instance is not None:
+            raise Exception("MarketStream is a singleton")
+        MarketStream._instance = self
+        self.reconcile_interval = reconcile_interval
+        self.subscribed: Dict[Instrument, int] = {}  # instrument -> mode
+        self._task: Optional[asyncio.Task] = None
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    def wanted(self) -> Dict[Instrument, int]:
+        """Instruments that currently need live prices, and the mode each needs."""
+        quoted = StrategyEngine.get_instance().instruments() | PnLEngine.get_instance().instruments()
+        for key in UIFeed.get_instance().subscribed_keys("ticks"):
+            exchange, _, token = key.partition(":")
+            if exchange in EXCHANGE_TYPES and token.isdigit():
+                quoted.add((exchange, token))
+        wanted = {(exchange, str(token)): QUOTE_MODE for exchange, token in quoted}
+        wanted.update(dict.fromkeys(MarketBreadthService.get_instance().universe, SNAP_QUOTE_MODE))
+        wanted.update(dict.fromkeys(OptionChainService.get_instance().instruments(), SNAP_QUOTE_MODE))
+        return {instrument: mode for instrument, mode in wanted.items() if instrument[0] in EXCHANGE_TYPES}
+
+    async def _load_breadth(self, client):
+        try:
+            await MarketBreadthService.get_instance().load(client)
+        except Exception:
+            logger.warning("Market breadth universe unavailable; gainers/losers fall back to the broker", exc_info=True)
+
+    @staticmethod
+    def _url(client) -> str:
+        return SMARTAPI_STREAM_URL or client.stream_url
+
+    async def _run(self):
+        session_manager = SessionManager.get_instance()
+        failures = 0
+        while True:
+            client = session_manager.get_smartapi_client()
+            if client is None or not client.access_token or not client.feed_token:
+                await asyncio.sleep(self.reconcile_interval)
+                continue
+            try:
+                await self._stream(client)
+                failures = 0
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                STREAM_RECONNECTS.inc()
+                delay = RECONNECT_DELAYS[min(failures, len(RECONNECT_DELAYS) - 1)]
+                failures += 1
+                logger.warning("SmartStream connection lost; reconnecting in %.0fs", delay, exc_info=True)
+                await asyncio.sleep(delay)
+
+    async def _stream(self, client):
+        """Run one connection until it drops or the session's client changes."""
+        headers = {
+            "Authorization": f"Bearer {client.access_token}",
+            "x-api-key": client.api_key,
+            "x-client-code": client.client_id,
+            "x-feed-token": client.feed_token,
+        }
+        session_manager = SessionManager.get_instance()
+        engine = StrategyEngine.get_instance()
+        breadth = MarketBreadthService.get_instance()
+        options = OptionChainService.get_instance()
+        async with websockets.connect(self._url(client), extra_headers=headers, ping_interval=None) as websocket:
+            STREAM_CONNECTED.set(1)
+            logger.info("SmartStream connected", extra={"client_id": client.client_id})
+            self.subscribed = {}
+            maintenance = asyncio.create_task(self._maintain(websocket, client, session_manager))
+            # The symbol master download can take a while; subscriptions don't wait for it
+            seeding = asyncio.create_task(self._load_breadth(client))
+            try:
+                async for message in websocket:
+                    if isinstance(message, str):
+                        continue  # "pong" and error notices
+                    tick = parse_packet(message)
+                    if tick is None:
+                        continue
+                    STREAM_TICKS.inc()
+                    try:
+                        await engine.on_tick(tick.exchange, tick.token, tick.ltp, tick.time, tick.volume, tick.oi)
+                        if (tick.exchange, tick.token) in breadth.universe:
+                            breadth.on_tick(tick.token, tick.ltp, oi=_finite(tick.oi), volume=_finite(tick.volume))
+                        if tick.exchange == "NFO":
+                            options.on_tick(tick.token, tick.ltp, oi=_finite(tick.oi), volume=_finite(tick.volume))
+                    except Exception:
+                        logger.exception("Tick handling failed", extra={"exchange": tick.exchange, "token": tick.token})
+            finally:
+                maintenance.cancel()
+                seeding.cancel()
+                self.subscribed = {}
+                STREAM_CONNECTED.set(0)
+                STREAM_SUBSCRIPTIONS.set(0)
+        if maintenance.done() and not maintenance.cancelled() and maintenance.exception() is not None:
+            raise maintenance.exception()
+        if session_manager.get_smartapi_client() is client:
+            raise ConnectionError(f"SmartStream closed the connection ({websocket.close_code})")
+
+    async def _maintain(self, websocket, client, session_manager):
+        """Heartbeat and subscription reconciliation; closes the socket when the session's client changes."""
+        loop = asyncio.get_running_loop()
+        last_ping = loop.time()
+        try:
+            while session_manager.get_smartapi_client() is client:
+                wanted = self.wanted()
+                # An instrument whose mode changes is unsubscribed in the old mode first
+                removed = {instrument: mode for instrument, mode in self.subscribed.items() if wanted.get(instrument) != mode}
+                added = {instrument: mode for instrument, mode in wanted.items() if self.subscribed.get(instrument) != mode}
+                for mode, instruments in _by_mode(removed).items():
+                    await websocket.send(subscription_message(UNSUBSCRIBE, instruments, mode))
+                for mode, instruments in _by_mode(added).items():
+                    await websocket.send(subscription_message(SUBSCRIBE, instruments, mode))
+                if added or removed:
+                    self.subscribed = wanted
+                    STREAM_SUBSCRIPTIONS.set(len(wanted))
+                if loop.time() - last_ping >= HEARTBEAT_INTERVAL:
+                    await websocket.send("ping")
+                    last_ping = loop.time()
+                await asyncio.sleep(self.reconcile_interval)
+            logger.info("Active session changed; closing SmartStream")
+        finally:
+            # Without subscriptions and heartbeats the connection is useless; end the receive loop too
+            await websocket.close()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
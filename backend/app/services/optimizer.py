@@ -0,0 +1,273 @@
+"""
+Optimizer - Parallel parameter sweeps over strategy templates
+
+A sweep shares the bars once through the compute pool and fans parameter
+sets out to the worker processes in chunks. Each worker keeps the
+indicator series it has computed for the shared block, so e.g. one RSI(14)
+serves every entry/exit threshold combination that uses it.
+
+With pruning, every parameter set is first scored on the leading
+`prune_fraction` of the bars and only the best `keep_ratio` are evaluated
+on the full history (one round of successive halving).
+"""
+import itertools
+import json
+import logging
+import math
+import random
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Mapping, Optional, Tuple
+import numpy as np
+from app.models import StrategyRun
+from app.models.database import SessionLocal
+from app.services.backtest import TRADING_DAYS_PER_YEAR, run_backtest
+from app.services.compute_pool import ComputePool, JobContext
+
+logger = logging.getLogger(__name__)
+
+OBJECTIVES = ("sharpe", "total_return", "win_rate")
+MAX_PARAM_SETS = 100_000
+# Aim for a few chunks per worker so stragglers don't hold up the sweep
+CHUNKS_PER_WORKER = 4
+MAX_CHUNK_SIZE = 256
+
+# Worker-side series cache for the shared block currently being swept
+_series_block: Optional[str] = None
+_series_cache: Dict[Tuple, np.ndarray] = {}
+
+
+class SeriesCache:
+    """Indicator series over the shared bars, computed once per worker process."""
+
+    def __init__(self, block_name: str, bars: Mapping[str, np.ndarray]):
+        global _series_block
+        if _series_block != block_name:
+            _series_cache.clear()
+            _series_block = block_name
+        self.bars = bars
+
+    def get(self, key: Tuple, compute: Callable[[], np.ndarray]) -> np.ndarray:
+        series = _series_cache.get(key)
+        if series is None:
+            series = _series_cache[key] = np.asarray(compute(), dtype=np.float64)
+        return series
+
+    def _close(self):
+        import pandas as pd
+        return pd.Series(self.bars["close"], copy=False)
+
+    def rsi(self, length: int) -> np.ndarray:
+        from app.services.indicator_engine import _pandas_ta
+        return self.get(("rsi", length), lambda: _pandas_ta().rsi(self._close(), length=length).to_numpy())
+
+    def ma(self, length: int, ma_type: str = "sma") -> np.ndarray:
+        from app.services.indicator_engine import _pandas_ta
+        compute = _pandas_ta().ema if ma_type == "ema" else _pandas_ta().sma
+        return self.get((ma_type, length), lambda: compute(self._close(), length=length).to_numpy())
+
+
+class SweepTemplate:
+    """A strategy family whose signals are a function of a few parameters."""
+    name = ""
+    defaults: Dict[str, Any] = {}
+
+    def signals(self, series: SeriesCache, params: Dict[str, Any]) -> Tuple[np.ndarray, np.ndarray]:
+        raise NotImplementedError
+
+    def valid(self, params: Dict[str, Any]) -> bool:
+        return True
+
+
+class RSIReversion(SweepTemplate):
+    """Buy when RSI drops below `entry_below`, sell when it rises above `exit_above`."""
+    name = "rsi_reversion"
+    defaults = {"rsi_length": 14, "entry_below": 30, "exit_above": 70}
+
+    def signals(self, series, params):
+        rsi = series.rsi(int(params["rsi_length"]))
+        return rsi < params["entry_below"], rsi > params["exit_above"]
+
+    def valid(self, params):
+        return params["entry_below"] < params["exit_above"]
+
+
+class MACrossover(SweepTemplate):
+    """Long while the fast moving average is above the slow one."""
+    name = "ma_crossover"
+    defaults = {"fast": 10, "slow": 30, "ma_type": "ema"}
+
+    def signals(self, series, params):
+        fast = series.ma(int(params["fast"]), params["ma_type"])
+        slow = series.ma(int(params["slow"]), params["ma_type"])
+        return fast > slow, fast < slow
+
+    def valid(self, params):
+        return params["fast"] < params["slow"]
+
+
+TEMPLATES: Dict[str, SweepTemplate] = {template.name: template for template in (RSIReversion(), MACrossover())}
+
+
+def grid_size(space: Dict[str, List[Any]]) -> int:
+    """How many parameter sets grid_search(space) makes, without making them."""
+    return math.prod(len(values) for values in space.values())
+
+
+def grid_search(space: Dict[str, List[Any]]) -> List[Dict[str, Any]]:
+    """Every combination of the listed values."""
+    names = list(space)
+    return [dict(zip(names, values)) for values in itertools.product(*(space[name] for name in names))]
+
+
+def random_search(space: Dict[str, Any], samples: int, seed: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    `samples` distinct random parameter sets. Each dimension is a list of
+    choices or {"min", "max"[, "step"]} (integers if min/max/step are ints).
+    """
+    rng = random.Random(seed)
+
+    def draw(spec):
+        if isinstance(spec, list):
+            return rng.choice(spec)
+        low, high, step = spec["min"], spec["max"], spec.get("step")
+        if step:
+            return low + step * rng.randint(0, int((high - low) // step))
+        if isinstance(low, int) and isinstance(high, int):
+            return rng.randint(low, high)
+        return rng.uniform(low, high)
+
+    seen, results = set(), []
+    for _ in range(samples * 20):
+        params = {name: draw(spec) for name, spec in space.items()}
+        key = tuple(sorted(params.items()))
+        if key not in seen:
+            seen.add(key)
+            results.append(params)
+            if len(results) == samples:
+                break
+    return results
+
+
+def _evaluate_job(
+    ctx: JobContext,
+    bars: Dict[str, np.ndarray],
+    block_name: str,
+    template_name: str,
+    param_sets: List[Dict[str, Any]],
+    bar_limit: Optional[int],
+    cost: float,
+    periods_per_year: float
+) -> List[Dict[str, float]]:
+    template = TEMPLATES[template_name]
+    series = SeriesCache(block_name, bars)
+    close = bars["close"][:bar_limit]
+    results = []
+    for params in param_sets:
+        ctx.check_cancelled()
+        entries, exits = template.signals(series, params)
+        results.append(run_backtest(close, entries[:bar_limit], exits[:bar_limit], cost, periods_per_year))
+    return results
+
+
+def _score(metrics: Dict[str, float], objective: str) -> float:
+    value = metrics[objective]
+    # Parameter sets that never trade can't be judged; rank them last
+    return value if metrics["trades"] and math.isfinite(value) else -math.inf
+
+
+async def run_sweep(
+    bars: Mapping[str, Any],
+    template_name: str,
+    param_sets: List[Dict[str, Any]],
+    objective: str = "sharpe",
+    prune_fraction: Optional[float] = 0.3,
+    keep_ratio: float = 0.25,
+    cost: float = 0.0,
+    periods_per_year: float = TRADING_DAYS_PER_YEAR,
+    pool: Optional[ComputePool] = None
+) -> Dict[str, Any]:
+    """
+    Evaluate param_sets in parallel and return them ranked by `objective`.
+    Pruning is skipped when prune_fraction is falsy or there are few sets.
+    """
+    template = TEMPLATES[template_name]
+    if objective not in OBJECTIVES:
+        raise ValueError(f"objective must be one of {', '.join(OBJECTIVES)}")
+    param_sets = [{**template.defaults, **params} for params in param_sets]
+    param_sets = [params for params in param_sets if template.valid(params)]
+    if len(param_sets) > MAX_PARAM_SETS:
+        raise ValueError(f"Sweep has {len(param_sets)} parameter sets, limit is {MAX_PARAM_SETS}")
+
+    pool = pool or ComputePool.get_instance()
+    started = time.perf_counter()
+
+    with pool.shared_bars(bars) as shared:
+        async def evaluate(candidates: List[Dict[str, Any]], bar_limit: Optional[int]) -> List[Dict[str, float]]:
+            chunk_size = max(1, min(MAX_CHUNK_SIZE, math.ceil(len(candidates) / (pool.max_workers * CHUNKS_PER_WORKER))))
+            jobs = [
+                pool.submit(
+                    _evaluate_job, shared.name, template_name, candidates[i:i + chunk_size],
+                    bar_limit, cost, periods_per_year, bars=shared, name="optimizer"
+                )
+                for i in range(0, len(candidates), chunk_size)
+            ]
+            try:
+                chunks = [await job for job in jobs]
+            except BaseException:
+                for job in jobs:
+                    job.cancel()
+                raise
+            return [metrics for chunk in chunks for metrics in chunk]
+
+        pruned = 0
+        candidates = param_sets
+        if prune_fraction and len(candidates) >= 20:
+            bar_limit = max(2, int(shared.length * prune_fraction))
+            early = await evaluate(candidates, bar_limit)
+            ranked = sorted(zip(candidates, early), key=lambda pair: _score(pair[1], objective), reverse=True)
+            keep = max(1, math.ceil(len(ranked) * keep_ratio))
+            candidates = [params for params, _ in ranked[:keep]]
+            pruned = len(ranked) - keep
+
+        results = await evaluate(candidates, None)
+
+    ranked = sorted(zip(candidates, results), key=lambda pair: _score(pair[1], objective), reverse=True)
+    return {
+        "template": template_name,
+        "objective": objective,
+        "evaluated": len(param_sets),
+        "pruned": pruned,
+        "bars": shared.length,
+        "duration_s": round(time.perf_counter() - started, 3),
+        "results": [{"params": params, "metrics": metrics} for params, metrics in ranked],
+    }
+
+
+async def optimize_strategy(
+    run_id: int,
+    bars: Mapping[str, Any],
+    template_name: str,
+    param_sets: List[Dict[str, Any]],
+    top: int = 50,
+    **sweep_options
+):
+    """Run a sweep and store the top results in the StrategyRun row `run_id`."""
+    status, result = "completed", None
+    try:
+        result = await run_sweep(bars, template_name, param_sets, **sweep_options)
+        result["results"] = result["results"][:top]
+    except Exception as e:
+        logger.exception("Optimisation run %s failed", run_id)
+        status, result = "failed", {"error": str(e)}
+
+    db = SessionLocal()
+    try:
+        run = db.query(StrategyRun).filter(StrategyRun.id == run_id).first()
+        if run is not None:
+            run.status = status
+            run.ended_at = datetime.now(timezone.utc)
+            run.result_json = json.dumps({"kind": "optimization", **result})
+            db.commit()
+    finally:
+        db.close()
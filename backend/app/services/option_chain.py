@@ -0,0 +1,431 @@
+"""
+Option Chain - Strike ladders with implied volatility and Greeks for NFO underlyings
+
+Contracts come from the symbol master, quotes from SmartAPIClient.get_quotes
+and, while a chain is being viewed, from MarketStream ticks. Freshness is
+kept per contract, so only contracts the stream has not updated recently
+are refetched. Each chain keeps its strikes and prices in
+NumPy arrays; IV (safeguarded Newton across all strikes at once), Greeks and
+PCR are recomputed in single vectorized passes over just the rows that
+changed since the last refresh.
+
+Pricing uses Black-76 on the forward implied by put-call parity near the
+money, so no separate underlying quote is needed.
+"""
+import asyncio
+import logging
+import math
+import os
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+import numpy as np
+from app.services.broker_models import Quote
+from app.services.smartapi_client import SmartAPIClient
+from app.services.symbol_master import Instrument, SymbolMasterService
+
+logger = logging.getLogger(__name__)
+
+IST = timezone(timedelta(hours=5, minutes=30))
+RISK_FREE_RATE = float(os.getenv("RISK_FREE_RATE", "0.065"))
+# Quotes older than this are refetched when a chain is requested
+QUOTE_MAX_AGE = float(os.getenv("OPTION_CHAIN_QUOTE_MAX_AGE", "1.0"))
+# Chains not requested for this many seconds stop being streamed
+STREAM_IDLE = float(os.getenv("OPTION_CHAIN_STREAM_IDLE", "300"))
+
+IV_MIN, IV_MAX = 1e-4, 5.0
+IV_TOLERANCE = 1e-6
+IV_MAX_ITERATIONS = 50
+MINUTES_PER_YEAR = 365.0 * 24 * 60
+
+
+def norm_cdf(x: np.ndarray) -> np.ndarray:
+    """Standard normal CDF to double precision (Hart 1968 / West 2005), vectorized."""
+    x = np.asarray(x, dtype=np.float64)
+    z = np.abs(x)
+    exponential = np.exp(-0.5 * z * z)
+
+    numerator = 3.52624965998911e-02 * z + 0.700383064443688
+    for coefficient in (6.37396220353165, 33.912866078383, 112.079291497871, 221.213596169931, 220.206867912376):
+        numerator = numerator * z + coefficient
+    denominator = 8.83883476483184e-02 * z + 1.75566716318264
+    for coefficient in (16.064177579207, 86.7807322029461, 296.564248779674, 637.333633378831, 793.826512519948, 440.413735824752):
+        denominator = denominator * z + coefficient
+    central = exponential * numerator / denominator
+
+    fraction = z + 0.65
+    for step in (4.0, 3.0, 2.0, 1.0):
+        fraction = z + step / fraction
+    tail = exponential / fraction / 2.506628274631
+
+    lower = np.where(z < 7.07106781186547, central, tail)
+    lower = np.where(z > 37.0, 0.0, lower)
+    return np.where(x > 0, 1.0 - lower, lower)
+
+
+def norm_pdf(x: np.ndarray) -> np.ndarray:
+    return np.exp(-0.5 * x * x) / math.sqrt(2.0 * math.pi)
+
+
+def black76_price(forward, strike, years, rate, sigma, is_call) -> np.ndarray:
+    """Discounted Black-76 option prices; all arguments broadcast."""
+    sqrt_t = np.sqrt(years)
+    d1 = (np.log(forward / strike) + 0.5 * sigma * sigma * years) / (sigma * sqrt_t)
+    d2 = d1 - sigma * sqrt_t
+    discount = np.exp(-rate * years)
+    call = discount * (forward * norm_cdf(d1) - strike * norm_cdf(d2))
+    put = discount * (strike * norm_cdf(-d2) - forward * norm_cdf(-d1))
+    return np.where(is_call, call, put)
+
+
+def implied_volatility(price, forward, strike, years, rate, is_call) -> np.ndarray:
+    """
+    Solve Black-76 IV for every element at once. Newton steps are kept inside
+    a shrinking [lo, hi] bracket and fall back to bisection when they leave it
+    or vega vanishes. Prices at or below intrinsic value give NaN.
+    """
+    price, forward, strike, is_call = np.broadcast_arrays(
+        np.asarray(price, dtype=np.float64), np.asarray(forward, dtype=np.float64),
+        np.asarray(strike, dtype=np.float64), np.asarray(is_call, dtype=bool)
+    )
+    discount = np.exp(-rate * years)
+    intrinsic = discount * np.where(is_call, np.maximum(forward - strike, 0.0), np.maximum(strike - forward, 0.0))
+    upper_bound = discount * np.where(is_call, forward, strike)
+    solvable = np.isfinite(price) & (price > intrinsic + 1e-12) & (price < upper_bound) & (years > 0)
+
+    lo = np.full(price.shape, IV_MIN)
+    hi = np.full(price.shape, IV_MAX)
+    # Brenner-Subrahmanyam starting point, clipped into the bracket
+    sigma = np.clip(np.sqrt(2.0 * math.pi / max(years, 1e-12)) * price / (discount * forward), 0.05, 2.0)
+    active = solvable.copy()
+    sqrt_t = math.sqrt(max(years, 1e-12))
+
+    for _ in range(IV_MAX_ITERATIONS):
+        if not active.any():
+            break
+        index = np.flatnonzero(active)
+        s, f, k = sigma[index], forward[index], strike[index]
+        diff = black76_price(f, k, years, rate, s, is_call[index]) - price[index]
+        d1 = (np.log(f / k) + 0.5 * s * s * years) / (s * sqrt_t)
+        vega = discount * f * norm_pdf(d1) * sqrt_t
+
+        too_high = diff > 0
+        hi[index] = np.where(too_high, s, hi[index])
+        lo[index] = np.where(too_high, lo[index], s)
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            step = s - diff / vega
+        bisect = ~np.isfinite(step) | (step <= lo[index]) | (step >= hi[index])
+        sigma[index] = np.where(bisect, 0.5 * (lo[index] + hi[index]), step)
+        active[index] = (np.abs(diff) > IV_TOLERANCE) & (hi[index] - lo[index] > 1e-10)
+
+    return np.where(solvable, sigma, np.nan)
+
+
+def black76_greeks(forward, strike, years, rate, sigma, is_call) -> Dict[str, np.ndarray]:
+    """
+    Spot Greeks for options on an underlying with forward `forward`:
+    delta, gamma, theta (per calendar day) and vega (per 1 vol point).
+    """
+    sqrt_t = np.sqrt(years)
+    discount = np.exp(-rate * years)
+    spot = forward * discount
+    with np.errstate(divide="ignore", invalid="ignore"):
+        d1 = (np.log(forward / strike) + 0.5 * sigma * sigma * years) / (sigma * sqrt_t)
+    d2 = d1 - sigma * sqrt_t
+    pdf_d1 = norm_pdf(d1)
+    decay = -spot * pdf_d1 * sigma / (2.0 * sqrt_t)
+    call_theta = decay - rate * strike * discount * norm_cdf(d2)
+    put_theta = decay + rate * strike * discount * norm_cdf(-d2)
+    return {
+        "delta": np.where(is_call, norm_cdf(d1), norm_cdf(d1) - 1.0),
+        "gamma": pdf_d1 / (spot * sigma * sqrt_t),
+        "theta": np.where(is_call, call_theta, put_theta) / 365.0,
+        "vega": spot * pdf_d1 * sqrt_t / 100.0,
+    }
+
+
+def parse_expiry(expiry: str) -> datetime:
+    """Symbol-master expiry ("28NOV2024") to the 15:30 IST expiry instant."""
+    return datetime.strptime(expiry.upper(), "%d%b%Y").replace(hour=15, minute=30, tzinfo=IST)
+
+
+def _number(value, default: float = np.nan) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+@dataclass(frozen=True)
+class OptionContract:
+    token: str
+    symbol: str
+    underlying: str
+    expiry: str
+    strike: float
+    option_type: str  # "CE" or "PE"
+    lot_size: int
+
+
+def index_option_contracts(instruments: Iterable[Instrument]) -> Dict[str, Dict[str, List[OptionContract]]]:
+    """Group NFO option instruments of the symbol master by underlying and expiry."""
+    index: Dict[str, Dict[str, List[OptionContract]]] = {}
+    for instrument in instruments:
+        if instrument.exchange != "NFO" or instrument.instrument_type not in ("OPTIDX", "OPTSTK"):
+            continue
+        option_type = instrument.symbol[-2:]
+        if option_type not in ("CE", "PE"):
+            continue
+        contract = OptionContract(
+            token=instrument.token,
+            symbol=instrument.symbol,
+            underlying=instrument.name,
+            expiry=instrument.expiry,
+            strike=instrument.strike,
+            option_type=option_type,
+            lot_size=instrument.lot_size
+        )
+        index.setdefault(contract.underlying, {}).setdefault(contract.expiry, []).append(contract)
+    return index
+
+
+class OptionChain:
+    """
+    One underlying/expiry. Row i of every array is strike i; call and put
+    columns are separate arrays. Ticks only write into the arrays and mark
+    the row dirty; refresh() does the maths.
+    """
+
+    SIDES = ("CE", "PE")
+
+    def __init__(self, underlying: str, expiry: str, contracts: List[OptionContract]):
+        self.underlying = underlying
+        self.expiry = expiry
+        self.expires_at = parse_expiry(expiry)
+        self.strikes = np.array(sorted({c.strike for c in contracts}), dtype=np.float64)
+        self.lot_size = contracts[0].lot_size if contracts else 1
+        shape = (2, len(self.strikes))
+        self.tokens = np.full(shape, "", dtype=object)
+        self.symbols = np.full(shape, "", dtype=object)
+        self.ltp = np.full(shape, np.nan)
+        self.oi = np.zeros(shape)
+        self.volume = np.zeros(shape)
+        self.iv = np.full(shape, np.nan)
+        self.greeks = {name: np.full(shape, np.nan) for name in ("delta", "gamma", "theta", "vega")}
+        self.forward = np.nan
+        # Monotonic time each contract was last quoted or ticked
+        self.quoted_at = np.zeros(shape)
+        self.requested_at = 0.0
+        self.computed_at: Optional[datetime] = None
+        self._dirty = np.ones(shape, dtype=bool)
+        # token -> (side, row) for O(1) tick updates
+        self.positions: Dict[str, Tuple[int, int]] = {}
+        rows = {strike: row for row, strike in enumerate(self.strikes)}
+        for contract in contracts:
+            side, row = self.SIDES.index(contract.option_type), rows[contract.strike]
+            self.tokens[side, row] = contract.token
+            self.symbols[side, row] = contract.symbol
+            self.positions[contract.token] = (side, row)
+
+    def update(self, token: str, ltp: Optional[float] = None, oi: Optional[float] = None, volume: Optional[float] = None) -> bool:
+        """Apply one quote or tick. Returns False if the token is not in this chain."""
+        position = self.positions.get(token)
+        if position is None:
+            return False
+        if ltp is not None:
+            self.ltp[position] = ltp
+            self._dirty[position] = True
+        if oi is not None:
+            self.oi[position] = oi
+        if volume is not None:
+            self.volume[position] = volume
+        self.quoted_at[position] = time.monotonic()
+        return True
+
+    def apply_quotes(self, quotes: Iterable[Quote]):
+        for quote in quotes:
+            self.update(
+                str(quote.symbolToken),
+                _number(quote.ltp),
+                _number(quote.opnInterest, 0.0),
+                _number(quote.tradeVolume, 0.0)
+            )
+
+    def stale_tokens(self, max_age: float = QUOTE_MAX_AGE) -> List[str]:
+        """Tokens of contracts last quoted or ticked more than max_age seconds ago."""
+        stale = (self.tokens != "") & (time.monotonic() - self.quoted_at > max_age)
+        return list(self.tokens[stale])
+
+    def _implied_forward(self) -> float:
+        """Median of K + (C - P) over the three strikes where C and P are closest."""
+        spread = self.ltp[0] - self.ltp[1]
+        usable = np.flatnonzero(np.isfinite(spread))
+        if usable.size == 0:
+            return np.nan
+        nearest = usable[np.argsort(np.abs(spread[usable]))[:3]]
+        return float(np.median(self.strikes[nearest] + spread[nearest]))
+
+    def refresh(self, now: Optional[datetime] = None, rate: float = RISK_FREE_RATE):
+        """Recompute IV and Greeks for rows whose price changed (all rows if the forward moved)."""
+        now = now or datetime.now(IST)
+        years = max((self.expires_at - now).total_seconds() / 60.0, 1.0) / MINUTES_PER_YEAR
+        forward = self._implied_forward()
+        if not np.isfinite(forward):
+            return
+        if forward != self.forward:
+            self._dirty[:] = True
+            self.forward = forward
+        # Time decay moves every row, so recompute everything at least once a minute
+        if self.computed_at is None or (now - self.computed_at).total_seconds() >= 60:
+            self._dirty[:] = True
+        if not self._dirty.any():
+            return
+
+        sides, rows = np.nonzero(self._dirty)
+        strike = self.strikes[rows]
+        is_call = sides == 0
+        sigma = implied_volatility(self.ltp[sides, rows], forward, strike, years, rate, is_call)
+        self.iv[sides, rows] = sigma
+        for name, values in black76_greeks(forward, strike, years, rate, sigma, is_call).items():
+            self.greeks[name][sides, rows] = values
+        self._dirty[:] = False
+        self.computed_at = now
+
+    def pcr(self) -> Dict[str, Optional[float]]:
+        call_oi, put_oi = self.oi[0].sum(), self.oi[1].sum()
+        call_volume, put_volume = self.volume[0].sum(), self.volume[1].sum()
+        return {
+            "oi": float(put_oi / call_oi) if call_oi else None,
+            "volume": float(put_volume / call_volume) if call_volume else None,
+        }
+
+    def to_dict(self, strikes_around_atm: Optional[int] = None) -> Dict[str, Any]:
+        rows = range(len(self.strikes))
+        atm_strike = None
+        if np.isfinite(self.forward) and len(self.strikes):
+            atm = int(np.argmin(np.abs(self.strikes - self.forward)))
+            atm_strike = float(self.strikes[atm])
+            if strikes_around_atm is not None:
+                rows = range(max(0, atm - strikes_around_atm), min(len(self.strikes), atm + strikes_around_atm + 1))
+
+        def leg(side: int, row: int) -> Optional[Dict[str, Any]]:
+            if not self.tokens[side, row]:
+                return None
+            values = {
+                "token": self.tokens[side, row],
+                "symbol": self.symbols[side, row],
+                "ltp": self.ltp[side, row],
+                "oi": self.oi[side, row],
+                "volume": self.volume[side, row],
+                "iv": self.iv[side, row],
+                **{name: array[side, row] for name, array in self.greeks.items()}
+            }
+            return {key: (None if isinstance(value, float) and not math.isfinite(value) else value) for key, value in values.items()}
+
+        return {
+            "underlying": self.underlying,
+            "expiry": self.expiry,
+            "lot_size": self.lot_size,
+            "forward": float(self.forward) if np.isfinite(self.forward) else None,
+            "atm_strike": atm_strike,
+            "pcr": self.pcr(),
+            "computed_at": self.computed_at.isoformat() if self.computed_at else None,
+            "strikes": [
+                {"strike": float(self.strikes[row]), "call": leg(0, row), "put": leg(1, row)}
+                for row in rows
+            ]
+        }
+
+
+class OptionChainService:
+    """
+    Holds the option contract index (built once from the symbol master) and
+    the live chains. Contracts of chains requested within STREAM_IDLE are
+    streamed by MarketStream, which passes their ticks to on_tick().
+    """
+    _instance = None
+
+    def __init__(self):
+        if OptionChainService._instance is not None:
+            raise Exception("OptionChainService is a singleton")
+        OptionChainService._instance = self
+        self._contracts: Optional[Dict[str, Dict[str, List[OptionContract]]]] = None
+        self._contracts_loaded_on = None
+        self._contracts_lock = asyncio.Lock()
+        self.chains: Dict[Tuple[str, str], OptionChain] = {}
+        self._token_chains: Dict[str, OptionChain] = {}
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    async def load_contracts(self, client: SmartAPIClient) -> Dict[str, Dict[str, List[OptionContract]]]:
+        """Index the option contracts of the symbol master once per trading day."""
+        async with self._contracts_lock:
+            today = datetime.now(IST).date()
+            if self._contracts is None or self._contracts_loaded_on != today:
+                master = await SymbolMasterService.get_instance().load(client)
+                self._contracts = await asyncio.to_thread(index_option_contracts, master.instruments("NFO"))
+                self._contracts_loaded_on = today
+                logger.info("Indexed option contracts for %d underlyings", len(self._contracts))
+        return self._contracts
+
+    async def expiries(self, client: SmartAPIClient, underlying: str) -> List[str]:
+        contracts = await self.load_contracts(client)
+        return sorted(contracts.get(underlying.upper(), {}), key=parse_expiry)
+
+    async def get_chain(self, client: SmartAPIClient, underlying: str, expiry: Optional[str] = None) -> OptionChain:
+        """
+        Return the chain for underlying/expiry (nearest expiry if omitted),
+        refetching the quotes of contracts not updated within QUOTE_MAX_AGE.
+        """
+        underlying = underlying.upper()
+        if expiry is None:
+            upcoming = [e for e in await self.expiries(client, underlying) if parse_expiry(e) > datetime.now(IST)]
+            if not upcoming:
+                raise KeyError(f"No upcoming expiries for {underlying}")
+            expiry = upcoming[0]
+        expiry = expiry.upper()
+
+        chain = self.chains.get((underlying, expiry))
+        if chain is None:
+            contracts = (await self.load_contracts(client)).get(underlying, {}).get(expiry)
+            if not contracts:
+                raise KeyError(f"No option contracts for {underlying} {expiry}")
+            chain = OptionChain(underlying, expiry, contracts)
+            self.chains[(underlying, expiry)] = chain
+            self._token_chains.update(dict.fromkeys(chain.positions, chain))
+
+        chain.requested_at = time.monotonic()
+        stale = chain.stale_tokens()
+        if stale:
+            chain.apply_quotes(await self._fetch_quotes(client, stale))
+        chain.refresh()
+        return chain
+
+    async def _fetch_quotes(self, client: SmartAPIClient, tokens: List[str]) -> List[Quote]:
+        batch = await client.get_quotes({"NFO": tokens})
+        if batch.unfetched:
+            logger.warning(
+                "Option chain quotes missing for %d of %d contracts", len(batch.unfetched), len(tokens),
+                extra={"reasons": sorted(set(batch.unfetched.values()))}
+            )
+        return list(batch.quotes.values())
+
+    def instruments(self) -> Set[Tuple[str, str]]:
+        """(exchange, token) of the contracts in chains requested within STREAM_IDLE."""
+        cutoff = time.monotonic() - STREAM_IDLE
+        return {
+            ("NFO", token)
+            for chain in self.chains.values() if chain.requested_at >= cutoff
+            for token in chain.positions
+        }
+
+    def on_tick(self, token: str, ltp: float, oi: Optional[float] = None, volume: Optional[float] = None) -> bool:
+        """Route a feed tick to its chain; the next get_chain/refresh picks it up."""
+        chain = self._token_chains.get(token)
+        return chain is not None and chain.update(token, ltp, oi, volume)
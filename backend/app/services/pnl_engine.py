@@ -0,0 +1,346 @@
+"""
+P&L Engine - Mark-to-market P&L per account and per strategy, updated on every tick
+
+Positions are held in arrays, one row per (book, exchange, token, product
+type); a book is an app's broker account or one strategy. On each tick
+only the rows of that instrument are revalued, and the running totals of
+the books they belong to are adjusted by the difference. So the cost of
+a tick does not grow with the number of positions held elsewhere.
+
+Where positions come from:
+
+- Account books are seeded from the broker's getPosition once a session
+  is active. They are reconciled whenever the positions are read again
+  through the shared broker cache, and in between move with our own
+  orders' fills (paper fills, and live fills ExecutionLayer sees in the
+  order book while it tracks the order).
+- Strategy books mirror the netting ledger, which is rebuilt at startup
+  and updated as intents are allocated fills.
+
+Changes are published on the UI feed ("pnl" per book, "pnl_positions"
+per row) and to subscribe()d callbacks, such as risk checks.
+"""
+import asyncio
+import logging
+import math
+import os
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+import numpy as np
+from app.services import metrics
+from app.services.resource_versions import POSITIONS, ResourceVersions
+from app.services.session_manager import SessionManager
+from app.services.settings_service import SettingsService
+from app.services.ui_feed import UIFeed
+
+logger = logging.getLogger(__name__)
+
+# How often to look for a newly active app whose account has not been seeded yet
+PNL_SEED_POLL = float(os.getenv("PNL_SEED_POLL", "2.0"))
+
+ACCOUNT, STRATEGY = "account", "strategy"
+Book = Tuple[str, int]  # (ACCOUNT, app id) or (STRATEGY, strategy id)
+RowKey = Tuple[Book, str, str, str]  # book, exchange, symbol token, product type
+PnLSubscriber = Callable[[str, float, float], None]  # book key, realised, unrealised
+
+PNL_TICKS = metrics.counter("pnl_ticks_total", "Ticks that revalued at least one position")
+PNL_TICK_DURATION = metrics.histogram(
+    "pnl_tick_duration_seconds",
+    "Time to revalue an instrument's positions and publish the changes",
+    buckets=(0.00001, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01)
+)
+PNL_ROWS = metrics.gauge("pnl_positions", "Position rows held by the P&L engine")
+
+
+def apply_fill(quantity: int, average_price: float, fill: int, price: float) -> Tuple[int, float, float]:
+    """
+    A position after a fill (negative quantities are short / sells):
+    (quantity, average price, P&L realised by this fill).
+    """
+    if quantity == 0 or (quantity > 0) == (fill > 0):
+        total = quantity + fill
+        return total, (average_price * abs(quantity) + price * abs(fill)) / abs(total), 0.0
+    direction = 1 if quantity > 0 else -1
+    realised = min(abs(fill), abs(quantity)) * (price - average_price) * direction
+    quantity += fill
+    if quantity == 0:
+        average_price = 0.0
+    elif (quantity > 0) != (direction > 0):
+        average_price = price  # flipped through flat
+    return quantity, average_price, realised
+
+
+def book_key(book: Book) -> str:
+    return f"{book[0]}:{book[1]}"
+
+
+class PnLEngine:
+    """Position arrays, per-book totals and the tick path that keeps them marked to market."""
+    _instance = None
+
+    def __init__(self, feed: Optional[UIFeed] = None, capacity: int = 256):
+        if PnLEngine._instance is not None:
+            raise Exception("PnLEngine is a singleton")
+        PnLEngine._instance = self
+        self.feed = feed or UIFeed.get_instance()
+        # Keys start with the book ("account:<app id>", "strategy:<id>"); each user sees only their own
+        self.feed.register_topic("pnl", ("realised", "unrealised", "mtm"), prices=("realised", "unrealised", "mtm"), owned=True)
+        self.feed.register_topic(
+            "pnl_positions", ("quantity", "average_price", "ltp", "realised", "unrealised"),
+            prices=("average_price", "ltp", "realised", "unrealised"), owned=True
+        )
+        # Row columns
+        self.quantity = np.zeros(capacity, dtype=np.int64)
+        self.average_price = np.zeros(capacity)
+        self.realised = np.zeros(capacity)
+        self.unrealised = np.zeros(capacity)
+        self.ltp = np.full(capacity, np.nan)
+        self.multiplier = np.ones(capacity)
+        self.row_book = np.zeros(capacity, dtype=np.int64)
+        self._rows: Dict[RowKey, int] = {}
+        self._row_keys: List[str] = []
+        self._instrument_rows: Dict[Tuple[str, str], np.ndarray] = {}
+        # Book totals
+        self.book_realised = np.zeros(16)
+        self.book_unrealised = np.zeros(16)
+        self._books: Dict[Book, int] = {}
+        self._book_keys: List[str] = []
+        self._book_rows: Dict[int, List[int]] = {}
+
+        self._last_price: Dict[Tuple[str, str], float] = {}
+        self._unpriced: Dict[Tuple[str, str], List[Tuple[Book, str, int]]] = {}
+        self._synced: set = set()
+        self._subscribers: List[PnLSubscriber] = []
+        self._seed_task: Optional[asyncio.Task] = None
+        ResourceVersions.get_instance().subscribe(self._on_resource_changed)
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    def subscribe(self, callback: PnLSubscriber):
+        """Register a callback invoked with (book key, realised, unrealised) whenever a book's P&L changes."""
+        if callback not in self._subscribers:
+            self._subscribers.append(callback)
+
+    def unsubscribe(self, callback: PnLSubscriber):
+        if callback in self._subscribers:
+            self._subscribers.remove(callback)
+
+    # Rows and books
+
+    def _book(self, book: Book) -> int:
+        slot = self._books.get(book)
+        if slot is None:
+            slot = self._books[book] = len(self._book_keys)
+            self._book_keys.append(book_key(book))
+            self._book_rows[slot] = []
+            if slot == len(self.book_realised):
+                self.book_realised = np.concatenate([self.book_realised, np.zeros(slot)])
+                self.book_unrealised = np.concatenate([self.book_unrealised, np.zeros(slot)])
+        return slot
+
+    def _row(self, book: Book, exchange: str, token: str, product_type: str) -> int:
+        key = (book, exchange, token, product_type)
+        row = self._rows.get(key)
+        if row is not None:
+            return row
+        row = self._rows[key] = len(self._row_keys)
+        if row == len(self.quantity):
+            self._grow()
+        slot = self._book(book)
+        self._row_keys.append(f"{book_key(book)}:{exchange}:{token}:{product_type}")
+        self.row_book[row] = slot
+        self._book_rows[slot].append(row)
+        instrument = (exchange, token)
+        rows = self._instrument_rows.get(instrument)
+        self._instrument_rows[instrument] = np.array([row] if rows is None else [*rows, row], dtype=np.int64)
+        self.ltp[row] = self._last_price.get(instrument, np.nan)
+        PNL_ROWS.set(len(self._row_keys))
+        return row
+
+    def _grow(self):
+        size = len(self.quantity)
+        self.quantity = np.concatenate([self.quantity, np.zeros(size, dtype=np.int64)])
+        self.average_price = np.concatenate([self.average_price, np.zeros(size)])
+        self.realised = np.concatenate([self.realised, np.zeros(size)])
+        self.unrealised = np.concatenate([self.unrealised, np.zeros(size)])
+        self.ltp = np.concatenate([self.ltp, np.full(size, np.nan)])
+        self.multiplier = np.concatenate([self.multiplier, np.ones(size)])
+        self.row_book = np.concatenate([self.row_book, np.zeros(size, dtype=np.int64)])
+
+    def _revalue(self, row: int):
+        ltp = self.ltp[row]
+        self.unrealised[row] = 0.0 if math.isnan(ltp) else (ltp - self.average_price[row]) * self.quantity[row] * self.multiplier[row]
+
+    def _total_book(self, slot: int):
+        rows = self._book_rows[slot]
+        self.book_realised[slot] = self.realised[rows].sum()
+        self.book_unrealised[slot] = self.unrealised[rows].sum()
+
+    # Updates
+
+    def on_tick(self, exchange: str, token, ltp: float):
+        """Revalue the positions in one instrument at `ltp`."""
+        instrument = (exchange, str(token))
+        self._last_price[instrument] = ltp
+        if instrument in self._unpriced:
+            for book, product_type, quantity in self._unpriced.pop(instrument):
+                self.apply_fill(book, exchange, instrument[1], product_type, quantity, ltp)
+        rows = self._instrument_rows.get(instrument)
+        if rows is None:
+            return
+        started = time.perf_counter()
+        self.ltp[rows] = ltp
+        unrealised = (ltp - self.average_price[rows]) * self.quantity[rows] * self.multiplier[rows]
+        np.add.at(self.book_unrealised, self.row_book[rows], unrealised - self.unrealised[rows])
+        self.unrealised[rows] = unrealised
+        self._publish(rows)
+        PNL_TICKS.inc()
+        PNL_TICK_DURATION.observe(time.perf_counter() - started)
+
+    def apply_fill(self, book: Book, exchange: str, token: str, product_type: str, quantity: int,
+                   price: Optional[float] = None):
+        """
+        Add a fill to a book; quantity is negative for sells. A fill without
+        a price (a paper MARKET order) is valued at the instrument's last
+        tick, or held until its next one.
+        """
+        token = str(token)
+        price = price or self._last_price.get((exchange, token))
+        if not price:
+            self._unpriced.setdefault((exchange, token), []).append((book, product_type, quantity))
+            return
+        row = self._row(book, exchange, token, product_type)
+        held, average, realised = apply_fill(int(self.quantity[row]), float(self.average_price[row]), quantity, price)
+        self.quantity[row], self.average_price[row] = held, average
+        self.realised[row] += realised * self.multiplier[row]
+        self._changed(row)
+
+    def set_position(self, book: Book, exchange: str, token: str, product_type: str, quantity: int,
+                     average_price: float, realised: float, multiplier: float = 1.0,
+                     ltp: Optional[float] = None, publish: bool = True) -> int:
+        """Replace one row with a position held elsewhere (the ledger or the broker); returns the row."""
+        row = self._row(book, exchange, str(token), product_type)
+        self.quantity[row], self.average_price[row], self.realised[row] = quantity, average_price, realised
+        self.multiplier[row] = multiplier or 1.0
+        if ltp and math.isnan(self.ltp[row]):
+            self.ltp[row] = ltp
+        if publish:
+            self._changed(row)
+        else:
+            self._revalue(row)
+            self._total_book(int(self.row_book[row]))
+        return row
+
+    def sync_account(self, app_id: int, positions: Iterable[Any]):
+        """Reconcile an app's account book with the broker's position book (Position models)."""
+        book = (ACCOUNT, app_id)
+        seen = set()
+        for position in positions:
+            if not position.symboltoken:
+                continue
+            netqty = position.netqty or 0
+            buy_price, sell_price = position.buyavgprice or 0.0, position.sellavgprice or 0.0
+            closed = min(position.buyqty or 0, position.sellqty or 0)
+            # SmartAPI reports -1 for instruments without a contract multiplier
+            multiplier = position.multiplier if position.multiplier and position.multiplier > 0 else 1.0
+            seen.add(self.set_position(
+                book, position.exchange or "NSE", position.symboltoken, position.producttype or "INTRADAY",
+                netqty, buy_price if netqty > 0 else sell_price if netqty < 0 else 0.0,
+                closed * (sell_price - buy_price) * multiplier, multiplier, position.ltp, publish=False
+            ))
+        slot = self._book(book)
+        for row in self._book_rows[slot]:
+            if row not in seen:
+                self.quantity[row], self.average_price[row], self.realised[row] = 0, 0.0, 0.0
+                self._revalue(row)
+        self._total_book(slot)
+        self._synced.add(app_id)
+        if self._book_rows[slot]:
+            self._publish(np.array(self._book_rows[slot], dtype=np.int64))
+
+    def load_ledger(self, ledger):
+        """Seed the strategy books from a StrategyLedger."""
+        for (strategy_id, exchange, token, product_type), position in ledger.positions.items():
+            self.set_position(
+                (STRATEGY, strategy_id), exchange, token, product_type,
+                position.quantity, position.average_price, position.realized_pnl, publish=False
+            )
+
+    def _changed(self, row: int):
+        self._revalue(row)
+        self._total_book(int(self.row_book[row]))
+        self._publish(np.array([row], dtype=np.int64))
+
+    def _publish(self, rows: np.ndarray):
+        for row in rows.tolist():
+            self.feed.publish("pnl_positions", self._row_keys[row], {
+                "quantity": int(self.quantity[row]), "average_price": float(self.average_price[row]),
+                "ltp": float(self.ltp[row]), "realised": float(self.realised[row]),
+                "unrealised": float(self.unrealised[row]),
+            })
+        for slot in np.unique(self.row_book[rows]).tolist():
+            realised, unrealised = float(self.book_realised[slot]), float(self.book_unrealised[slot])
+            key = self._book_keys[slot]
+            self.feed.publish("pnl", key, {"realised": realised, "unrealised": unrealised, "mtm": realised + unrealised})
+            for callback in list(self._subscribers):
+                try:
+                    callback(key, realised, unrealised)
+                except Exception:
+                    logger.exception("P&L subscriber %r failed", callback)
+
+    # Reads
+
+    def book(self, book: Book) -> Optional[Dict[str, Any]]:
+        """A book's totals and open or closed-today rows, or None if it has none."""
+        slot = self._books.get(book)
+        if slot is None:
+            return None
+        realised, unrealised = float(self.book_realised[slot]), float(self.book_unrealised[slot])
+        positions = []
+        for (owner, exchange, token, product_type), row in self._rows.items():
+            if owner == book and (self.quantity[row] or self.realised[row]):
+                ltp = float(self.ltp[row])
+                positions.append({
+                    "exchange": exchange, "symbol_token": token, "product_type": product_type,
+                    "quantity": int(self.quantity[row]), "average_price": float(self.average_price[row]),
+                    "ltp": None if math.isnan(ltp) else ltp, "realised": float(self.realised[row]),
+                    "unrealised": float(self.unrealised[row]),
+                })
+        return {"realised": realised, "unrealised": unrealised, "mtm": realised + unrealised, "positions": positions}
+
+    def instruments(self) -> Set[Tuple[str, str]]:
+        """(exchange, token) of every instrument held in some book, i.e. those that need ticks."""
+        return {key for key, rows in self._instrument_rows.items() if self.quantity[rows].any()}
+
+    # Account seeding
+
+    def _on_resource_changed(self, app_id: int, resource: str, result: Dict[str, Any]):
+        if resource == POSITIONS and not result.get("stale") and not SettingsService.get_instance().get(app_id).paper_mode:
+            self.sync_account(app_id, result["data"])
+
+    async def _seed_accounts(self):
+        session_manager = SessionManager.get_instance()
+        while True:
+            app_id, client = session_manager.get_active_app_id(), session_manager.get_smartapi_client()
+            if app_id and client and app_id not in self._synced and not SettingsService.get_instance().get(app_id).paper_mode:
+                try:
+                    result = await ResourceVersions.get_instance().fetch(app_id, POSITIONS, client.get_positions)
+                    if result.get("success"):
+                        self.sync_account(app_id, result["data"])
+                        logger.info("Seeded account P&L from broker positions", extra={"app_id": app_id})
+                except Exception:
+                    logger.warning("Seeding account P&L failed", extra={"app_id": app_id}, exc_info=True)
+            await asyncio.sleep(PNL_SEED_POLL)
+
+    def start(self):
+        if self._seed_task is None:
+            self._seed_task = asyncio.create_task(self._seed_accounts())
+
+    async def stop(self):
+        if self._seed_task is not None:
+            self._seed_task.cancel()
+            self._seed_task = None
@@ -0,0 +1,64 @@
+"""
+Rate Limiter - Async token buckets for SmartAPI's per-endpoint request limits
+"""
+import asyncio
+import time
+from typing import Dict, Optional
+
+# Requests per second allowed by SmartAPI, per API key
+SMARTAPI_RATE_LIMITS: Dict[str, float] = {
+    "getQuote": 10,
+    "getLtpData": 10,
+    "placeOrder": 20,
+    "modifyOrder": 20,
+    "cancelOrder": 20,
+    "getOrderBook": 1,
+    "getPosition": 1,
+    "getCandleData": 3,
+}
+
+
+class RateLimiter:
+    """
+    Token bucket allowing `rate` acquisitions per second with bursts of up
+    to `burst`. Waiters are served in arrival order.
+    """
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.burst = burst or rate
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class RateLimiters:
+    """Lazily created limiter per endpoint, sized from SMARTAPI_RATE_LIMITS."""
+
+    def __init__(self, limits: Optional[Dict[str, float]] = None):
+        self.limits = dict(SMARTAPI_RATE_LIMITS if limits is None else limits)
+        self._limiters: Dict[str, RateLimiter] = {}
+
+    def __getitem__(self, endpoint: str) -> RateLimiter:
+        limiter = self._limiters.get(endpoint)
+        if limiter is None:
+            limiter = self._limiters[endpoint] = RateLimiter(self.limits.get(endpoint, 1))
+        return limiter
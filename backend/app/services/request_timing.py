@@ -0,0 +1,84 @@
+"""
+Request Timing - Per-request timed spans for Server-Timing headers and slow-request logs
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import event
+
+
+# Spans recorded for the current request as (name, seconds); None outside a request
+_current_spans: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar("request_spans", default=None)
+
+
+def start_request() -> List[Tuple[str, float]]:
+    """Begin collecting spans for the current request context."""
+    spans: List[Tuple[str, float]] = []
+    _current_spans.set(spans)
+    return spans
+
+
+def record_span(name: str, duration: float):
+    """Record a completed span; a no-op outside a request."""
+    spans = _current_spans.get()
+    if spans is not None:
+        spans.append((name, duration))
+
+
+@contextmanager
+def span(name: str):
+    """Time the enclosed block as a span of the current request."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(name, time.perf_counter() - started)
+
+
+def timed(name: str):
+    """Decorator recording each call of an async function as a span."""
+    def decorator(func):
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                record_span(name, time.perf_counter() - started)
+        return wrapper
+    return decorator
+
+
+def summarize(spans: List[Tuple[str, float]]) -> Dict[str, Tuple[float, int]]:
+    """Aggregate spans by name into {name: (total_seconds, count)}, in first-seen order."""
+    summary: Dict[str, Tuple[float, int]] = {}
+    for name, duration in spans:
+        total, count = summary.get(name, (0.0, 0))
+        summary[name] = (total + duration, count + 1)
+    return summary
+
+
+def server_timing_header(summary: Dict[str, Tuple[float, int]], total: float) -> str:
+    """Render aggregated spans as a Server-Timing header value (durations in ms)."""
+    entries = []
+    for name, (duration, count) in summary.items():
+        entry = f"{name};dur={duration * 1000:.1f}"
+        if count > 1:
+            entry += f';desc="{count} calls"'
+        entries.append(entry)
+    entries.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(entries)
+
+
+def instrument_engine(engine):
+    """Record every SQL statement executed on `engine` as a `db` span."""
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("request_timing_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["request_timing_started"].pop()
+        record_span("db", time.perf_counter() - started)
@@ -0,0 +1,162 @@
+"""
+Resource Versions - ETags and change counters for positions, orders and strategies
+
+Positions and the order book are cached per app for BROKER_STATE_MAX_AGE
+seconds and shared by every request, so several tabs polling them cost
+one broker call per interval. Their ETag is a hash of the broker's raw
+response body, taken by SmartAPIClient when it parses the payload, so a
+conditional GET that matches is answered 304 without serializing
+anything. Strategies live in the database and only change through the
+API; their ETag is the app's strategy version, bumped on every write.
+
+Each resource also has a version per app that goes up whenever its
+content changes. GET /api/versions returns them so the UI can poll one
+tiny response and refetch a list only when its version moved.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from fastapi import Request, Response
+from app.services import metrics
+
+logger = logging.getLogger(__name__)
+
+BROKER_STATE_MAX_AGE = float(os.getenv("BROKER_STATE_MAX_AGE", "1.0"))
+
+POSITIONS, ORDERS, STRATEGIES = "positions", "orders", "strategies"
+RESOURCES = (POSITIONS, ORDERS, STRATEGIES)
+
+# Browsers keep the body but revalidate with If-None-Match on every request
+CACHE_CONTROL = "private, no-cache"
+
+CONDITIONAL_GETS = metrics.counter(
+    "conditional_get_total",
+    "GETs of positions, orders and strategies, by whether they were answered 304",
+    ("resource", "outcome")
+)
+BROKER_STATE_REQUESTS = metrics.counter(
+    "broker_state_requests_total",
+    "Positions and order book reads, by whether they were served from the shared cache",
+    ("resource", "result")
+)
+
+Key = Tuple[int, str]  # (app id, resource)
+ResourceSubscriber = Callable[[int, str, Dict[str, Any]], None]  # app id, resource, client result
+
+
+def content_etag(content: bytes) -> str:
+    """Strong ETag for a response body."""
+    return '"' + hashlib.blake2b(content, digest_size=12).hexdigest() + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header lists `etag` (weak comparison, as RFC 9110 asks for GET)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(candidate.strip().removeprefix("W/") == opaque for candidate in if_none_match.split(","))
+
+
+class ResourceVersions:
+    """Per-app versions, ETags and the shared positions / order book cache."""
+    _instance = None
+
+    def __init__(self, max_age: float = BROKER_STATE_MAX_AGE):
+        if ResourceVersions._instance is not None:
+            raise Exception("ResourceVersions is a singleton")
+        ResourceVersions._instance = self
+        self.max_age = max_age
+        # Version ETags must not survive a restart, when the counters start over
+        self._epoch = uuid.uuid4().hex[:8]
+        self._versions: Dict[Key, int] = {}
+        self._etags: Dict[Key, str] = {}
+        self._cached: Dict[Key, Tuple[float, Dict[str, Any]]] = {}
+        self._inflight: Dict[Key, asyncio.Task] = {}
+        self._subscribers: List[ResourceSubscriber] = []
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    def subscribe(self, callback: ResourceSubscriber):
+        """Register a callback invoked with (app id, resource, result) when a broker read finds new content."""
+        if callback not in self._subscribers:
+            self._subscribers.append(callback)
+
+    def unsubscribe(self, callback: ResourceSubscriber):
+        if callback in self._subscribers:
+            self._subscribers.remove(callback)
+
+    async def fetch(self, app_id: int, resource: str, fetch: Callable[[], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+        """
+        The client's result for `resource`, from the cache if it is younger
+        than max_age. Concurrent misses share one broker call. Successful
+        results carry an "etag"; a new one bumps the resource's version.
+        """
+        key = (app_id, resource)
+        cached = self._cached.get(key)
+        if cached and time.monotonic() - cached[0] < self.max_age:
+            BROKER_STATE_REQUESTS.labels(resource, "hit").inc()
+            return cached[1]
+        BROKER_STATE_REQUESTS.labels(resource, "miss").inc()
+        task = self._inflight.get(key)
+        if task is None:
+            task = self._inflight[key] = asyncio.ensure_future(self._refresh(key, fetch))
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def _refresh(self, key: Key, fetch: Callable[[], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+        result = await fetch()
+        if result.get("success") and result.get("etag"):
+            # Stale responses served by an open circuit keep their ETag but are not cached
+            if not result.get("stale"):
+                self._cached[key] = (time.monotonic(), result)
+            if self._etags.get(key) != result["etag"]:
+                self._etags[key] = result["etag"]
+                self._versions[key] = self._versions.get(key, 0) + 1
+                for callback in list(self._subscribers):
+                    try:
+                        callback(key[0], key[1], result)
+                    except Exception:
+                        logger.exception("Resource subscriber %r failed", callback)
+        return result
+
+    def invalidate(self, app_id: int, *resources: str):
+        """Drop cached broker state (after placing or cancelling orders) so the next read refetches."""
+        for resource in resources or (POSITIONS, ORDERS):
+            self._cached.pop((app_id, resource), None)
+
+    def touch(self, app_id: int, resource: str = STRATEGIES):
+        """Record a change made through the API to a resource with no broker ETag."""
+        key = (app_id, resource)
+        self._versions[key] = self._versions.get(key, 0) + 1
+        self._etags.pop(key, None)
+
+    def etag(self, app_id: int, resource: str) -> str:
+        key = (app_id, resource)
+        return self._etags.get(key) or f'"{resource}-{app_id}-{self._epoch}-{self._versions.get(key, 0)}"'
+
+    def versions(self, app_id: int) -> Dict[str, int]:
+        return {resource: self._versions.get((app_id, resource), 0) for resource in RESOURCES}
+
+    def not_modified(self, request: Request, response: Response, app_id: int, resource: str) -> Optional[Response]:
+        """
+        Set the ETag on `response`; if the request's If-None-Match already
+        has it, return the 304 to send instead of the body.
+        """
+        etag = self.etag(app_id, resource)
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            CONDITIONAL_GETS.labels(resource, "not_modified").inc()
+            return Response(status_code=304, headers={"ETag": etag, "Cache-Control": CACHE_CONTROL})
+        CONDITIONAL_GETS.labels(resource, "full").inc()
+        response.headers["ETag"] = etag
+        response.headers["Cache-Control"] = CACHE_CONTROL
+        return None
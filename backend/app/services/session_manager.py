@@ -1,10 +1,14 @@
 """
 Session Manager - Handles SmartAPI connections and per-app runtime sessions
 """
+import logging
 from typing import Optional, Dict
 from datetime import datetime, timedelta
 from app.models import App, AppSecret
 from app.services.smartapi_client import SmartAPIClient
+from app.services.request_timing import timed
+
+logger = logging.getLogger(__name__)
 
 
 class SessionManager:
@@ -132,8 +136,10 @@ class SessionManager:
         - Persist state
         """
         if self._active_session:
-            # TODO: Close WebSocket connection
+            # MarketStream closes its SmartStream connection once the active client changes
             # TODO: Stop running strategies
+            if self._smartapi_client is not None:
+                await self._smartapi_client.aclose()
             self._active_app_id = None
             self._active_session = None
             self._smartapi_client = None
@@ -152,6 +158,7 @@ class SessionManager:
         """Get the active session data."""
         return self._active_session
     
+    @timed("session_restore")
     async def restore_session(self, app_id: int, app: App, secrets: AppSecret, session_data: Optional[Dict] = None) -> bool:
         """
         Restore a session from stored session data or try to refresh existing session.
@@ -207,12 +214,12 @@ class SessionManager:
             
             # Check if token is still valid
             if not self._smartapi_client.is_token_valid():
-                print(f"Token expired, attempting to refresh...")
+                logger.info("Token expired, attempting to refresh", extra={"app_id": app_id})
                 # Try to refresh if we have refresh token
                 if self._smartapi_client.refresh_token:
                     refresh_result = await self._smartapi_client.refresh_session()
                     if refresh_result.get("success"):
-                        print(f"Token refreshed successfully")
+                        logger.info("Token refreshed successfully", extra={"app_id": app_id})
                         # Update active session with new tokens
                         if self._active_session:
                             self._active_session["access_token"] = self._smartapi_client.access_token
@@ -220,10 +227,10 @@ class SessionManager:
                             if self._smartapi_client.token_expiry:
                                 self._active_session["token_expiry"] = self._smartapi_client.token_expiry.isoformat()
                     else:
-                        print(f"Token refresh failed: {refresh_result.get('error')}")
+                        logger.warning("Token refresh failed: %s", refresh_result.get("error"), extra={"app_id": app_id})
                         return False
                 else:
-                    print("No refresh token available")
+                    logger.info("No refresh token available", extra={"app_id": app_id})
                     return False
             
             # Set active session
@@ -238,8 +245,6 @@ class SessionManager:
             
             return True
         except Exception as e:
-            print(f"Error restoring session: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("Error restoring session", extra={"app_id": app_id})
             return False
 
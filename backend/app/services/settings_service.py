@@ -0,0 +1,188 @@
+"""
+Settings Service - In-memory settings snapshot with change notifications
+"""
+import logging
+import threading
+from dataclasses import dataclass, field, fields, replace
+from typing import Any, Callable, Dict, List, Optional
+from app.models import Setting
+from app.models.database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class SettingsSnapshot:
+    """
+    Typed, immutable view of the effective settings for one scope.
+    """
+    paper_mode: bool = False
+    default_lot_size: int = 1
+
+
+@dataclass(frozen=True)
+class SettingsState:
+    """
+    Complete settings state: the global snapshot plus per-app snapshots
+    with their overrides already merged on top of the global values.
+    """
+    version: int = 0
+    global_settings: SettingsSnapshot = field(default_factory=SettingsSnapshot)
+    app_settings: Dict[int, SettingsSnapshot] = field(default_factory=dict)
+
+    def for_app(self, app_id: Optional[int] = None) -> SettingsSnapshot:
+        if app_id is None:
+            return self.global_settings
+        return self.app_settings.get(app_id, self.global_settings)
+
+
+SETTING_TYPES: Dict[str, type] = {f.name: f.type for f in fields(SettingsSnapshot)}
+
+
+def parse_setting_value(key: str, raw: Optional[str]) -> Any:
+    """Convert a stored string value into the typed value for `key`."""
+    value_type = SETTING_TYPES[key]
+    if value_type is bool:
+        # Older rows were written with str(bool), i.e. "True"/"False"
+        return str(raw).strip().lower() in ("true", "1", "yes", "on")
+    return value_type(raw)
+
+
+def format_setting_value(key: str, value: Any) -> str:
+    """Convert a typed value into its canonical stored string form."""
+    if SETTING_TYPES[key] is bool:
+        return "true" if value else "false"
+    return str(value)
+
+
+SettingsSubscriber = Callable[[SettingsState, SettingsState], None]
+
+
+class SettingsService:
+    """
+    Loads global and per-app settings once into an immutable state object.
+    Readers take `state` (a single attribute read) and never touch the database;
+    writers persist the change, build a new state and swap it in atomically,
+    then notify subscribers with (old_state, new_state).
+    """
+    _instance = None
+
+    def __init__(self):
+        if SettingsService._instance is not None:
+            raise Exception("SettingsService is a singleton")
+        SettingsService._instance = self
+        self._state: Optional[SettingsState] = None
+        self._write_lock = threading.Lock()
+        self._subscribers: List[SettingsSubscriber] = []
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    @property
+    def state(self) -> SettingsState:
+        state = self._state
+        if state is None:
+            state = self.reload()
+        return state
+
+    def get(self, app_id: Optional[int] = None) -> SettingsSnapshot:
+        """Get the effective settings for an app (or the global settings)."""
+        return self.state.for_app(app_id)
+
+    def subscribe(self, callback: SettingsSubscriber):
+        """Register a callback invoked with (old_state, new_state) after each swap."""
+        if callback not in self._subscribers:
+            self._subscribers.append(callback)
+
+    def unsubscribe(self, callback: SettingsSubscriber):
+        if callback in self._subscribers:
+            self._subscribers.remove(callback)
+
+    def reload(self, db=None) -> SettingsState:
+        """Rebuild the in-memory state from the settings table."""
+        with self._write_lock:
+            old_state = self._state
+            new_state = self._build_state(db, version=(old_state.version + 1) if old_state else 1)
+            self._state = new_state
+        if old_state is not None:
+            self._notify(old_state, new_state)
+        return new_state
+
+    def update(self, db, values: Dict[str, Any], app_id: Optional[int] = None) -> SettingsSnapshot:
+        """
+        Persist setting values for the global scope (app_id=None) or an app,
+        then swap in a new snapshot and notify subscribers.
+
+        Args:
+            db: SQLAlchemy session
+            values: Mapping of setting key to typed value; None values are ignored
+            app_id: App to override settings for, or None for global settings
+
+        Returns:
+            The effective settings for the updated scope
+        """
+        values = {key: value for key, value in values.items() if value is not None}
+        unknown = set(values) - set(SETTING_TYPES)
+        if unknown:
+            raise ValueError(f"Unknown settings: {', '.join(sorted(unknown))}")
+
+        with self._write_lock:
+            for key, value in values.items():
+                setting = db.query(Setting).filter(Setting.key == key, Setting.app_id == app_id).first()
+                if setting:
+                    setting.value = format_setting_value(key, value)
+                else:
+                    db.add(Setting(key=key, value=format_setting_value(key, value), app_id=app_id))
+            db.commit()
+
+            old_state = self._state or SettingsState()
+            new_state = self._build_state(db, version=old_state.version + 1)
+            self._state = new_state
+
+        self._notify(old_state, new_state)
+        return new_state.for_app(app_id)
+
+    def _build_state(self, db, version: int) -> SettingsState:
+        owns_session = db is None
+        if owns_session:
+            db = SessionLocal()
+        try:
+            rows = db.query(Setting).all()
+        finally:
+            if owns_session:
+                db.close()
+
+        global_values: Dict[str, Any] = {}
+        app_values: Dict[int, Dict[str, Any]] = {}
+        for row in rows:
+            if row.key not in SETTING_TYPES:
+                continue
+            try:
+                value = parse_setting_value(row.key, row.value)
+            except (TypeError, ValueError):
+                logger.warning("Ignoring invalid setting %s=%r", row.key, row.value, extra={"app_id": row.app_id})
+                continue
+            if row.app_id is None:
+                global_values[row.key] = value
+            else:
+                app_values.setdefault(row.app_id, {})[row.key] = value
+
+        global_settings = SettingsSnapshot(**global_values)
+        return SettingsState(
+            version=version,
+            global_settings=global_settings,
+            app_settings={
+                app_id: replace(global_settings, **overrides)
+                for app_id, overrides in app_values.items()
+            }
+        )
+
+    def _notify(self, old_state: SettingsState, new_state: SettingsState):
+        for callback in list(self._subscribers):
+            try:
+                callback(old_state, new_state)
+            except Exception as e:
+                logger.exception("Settings subscriber %r failed", callback)
@@ -1,12 +1,235 @@
 """
 SmartAPI Client - Handles Angel One SmartAPI authentication and API calls
 """
+import asyncio
 import httpx
 import json
+import logging
+import os
+import random
 import socket
 import re
-from typing import Optional, Dict, Any, List
+import time
+from dataclasses import dataclass, field
+from functools import wraps
+from typing import Optional, Dict, Any, Iterable, List, Mapping, Tuple, Union
 from datetime import datetime, timedelta
+from urllib.parse import urlsplit
+from app.services import metrics
+from app.services.broker_models import BrokerOrder, Funds, Position, Quote
+from app.services.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreakers, ResponseCache
+from app.services.deadlines import DEFAULT_DEADLINE, SMARTAPI_DEADLINES, endpoint_timeout, remaining
+from app.services.rate_limiter import RateLimiters
+from app.services.resource_versions import content_etag
+from app.services.request_timing import record_span
+
+logger = logging.getLogger(__name__)
+
+BROKER_LATENCY = metrics.histogram(
+    "smartapi_request_duration_seconds",
+    "SmartAPI call latency by endpoint",
+    ("endpoint",)
+)
+BROKER_REQUESTS = metrics.counter(
+    "smartapi_requests_total",
+    "SmartAPI calls by endpoint, outcome (ok/error/exception) and HTTP status",
+    ("endpoint", "outcome", "status_code")
+)
+BROKER_RATE_LIMITED = metrics.counter(
+    "smartapi_rate_limited_total",
+    "SmartAPI calls rejected for exceeding the access rate",
+    ("endpoint",)
+)
+BROKER_RETRIES = metrics.counter(
+    "smartapi_retries_total",
+    "SmartAPI read calls retried after a transient failure",
+    ("endpoint",)
+)
+BROKER_CIRCUIT = metrics.gauge(
+    "smartapi_circuit_open",
+    "1 while the endpoint's circuit breaker is open or probing",
+    ("endpoint",)
+)
+BROKER_STALE = metrics.counter(
+    "smartapi_stale_responses_total",
+    "Cached responses served while the endpoint's circuit breaker was open",
+    ("endpoint",)
+)
+
+
+def _is_rate_limited(result: Dict[str, Any]) -> bool:
+    if result.get("status_code") == 429:
+        return True
+    message = str(result.get("error") or result.get("message") or "").lower()
+    return "access rate" in message or "rate limit" in message
+
+
+# Endpoints that only read, and so can be retried without side effects
+READ_ENDPOINTS = frozenset({
+    "getProfile", "getPosition", "getHolding", "getOrderBook", "orderDetails", "getTradeBook", "getRMS",
+    "getMarketStatus", "getQuote", "getLtpData", "getSymbolMaster", "getCandleData", "gainersLosers",
+})
+READ_RETRIES = int(os.getenv("SMARTAPI_READ_RETRIES", "2"))
+# Full-jitter exponential backoff between read retries, in seconds
+RETRY_BASE_DELAY = 0.1
+RETRY_MAX_DELAY = 2.0
+
+_TRANSIENT_ERROR = re.compile(r"timed? ?out|timeout|server error|connect|request failed|temporarily", re.IGNORECASE)
+
+
+def _is_transient(result: Dict[str, Any]) -> bool:
+    """A failure worth retrying, and held against the endpoint's health: timeouts, network errors, 5xx."""
+    if result.get("timed_out"):
+        return True
+    status_code = result.get("status_code")
+    if isinstance(status_code, int) and status_code >= 500:
+        return True
+    return bool(_TRANSIENT_ERROR.search(str(result.get("error") or "")))
+
+
+def _failure(endpoint: str, error: str, **fields) -> Dict[str, Any]:
+    return {"success": False, "status": False, "error": error, **fields}
+
+
+def instrumented(endpoint: str):
+    """
+    Run a SmartAPIClient call under the endpoint's deadline and circuit
+    breaker, retry reads after transient failures with jittered backoff,
+    and record latency and outcome. Methods return response dicts rather
+    than raising, so failures are detected from `success`/`status` in
+    the result. While a read endpoint's breaker is open its last good
+    response for the same arguments is returned, marked `stale`.
+    """
+    def decorator(func):
+        latency = BROKER_LATENCY.labels(endpoint)
+        span_name = f"smartapi.{endpoint}"
+        attempts = 1 + READ_RETRIES if endpoint in READ_ENDPOINTS else 1
+        full_deadline = SMARTAPI_DEADLINES.get(endpoint, DEFAULT_DEADLINE)
+
+        async def attempt(self, args, kwargs) -> Tuple[Dict[str, Any], bool]:
+            """One call; returns (result, whether it counts against the endpoint's health)."""
+            timeout = endpoint_timeout(endpoint)
+            if timeout <= 0:
+                return _failure(endpoint, f"Request deadline passed before {endpoint}", timed_out=True), False
+            try:
+                result = await asyncio.wait_for(func(self, *args, **kwargs), timeout)
+            except asyncio.TimeoutError:
+                # Cut short by the caller's deadline says nothing about the endpoint
+                return _failure(endpoint, f"{endpoint} timed out after {timeout:.1f}s", timed_out=True), timeout >= full_deadline
+            failed = isinstance(result, dict) and (result.get("success") is False or result.get("status") is False)
+            return result, failed and _is_transient(result)
+
+        @wraps(func)
+        async def wrapper(self, *args, **kwargs):
+            breaker = self.circuit_breakers[endpoint]
+            cache_key = (endpoint, repr(args), repr(sorted(kwargs.items()))) if attempts > 1 else None
+            started = time.perf_counter()
+            if not breaker.allow():
+                result = _failure(endpoint, f"{endpoint} is unavailable (circuit open)", circuit_open=True)
+            else:
+                probe = breaker.state == HALF_OPEN
+                try:
+                    for number in range(attempts):
+                        if number:
+                            delay = random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** number))
+                            left = remaining()
+                            if left is not None and left < delay + RETRY_BASE_DELAY:
+                                break
+                            BROKER_RETRIES.labels(endpoint).inc()
+                            await asyncio.sleep(delay)
+                        result, unhealthy = await attempt(self, args, kwargs)
+                        if unhealthy:
+                            breaker.record_failure()
+                            if breaker.state == OPEN:
+                                break
+                            continue
+                        if not isinstance(result, dict) or not (result.get("timed_out") or _is_rate_limited(result)):
+                            breaker.record_success()
+                            break
+                        if result.get("timed_out"):
+                            break  # the caller's deadline ran out
+                except Exception:
+                    breaker.record_failure()
+                    BROKER_CIRCUIT.labels(endpoint).set(0 if breaker.state == CLOSED else 1)
+                    elapsed = time.perf_counter() - started
+                    latency.observe(elapsed)
+                    record_span(span_name, elapsed)
+                    BROKER_REQUESTS.labels(endpoint, "exception", "").inc()
+                    raise
+                finally:
+                    if probe:
+                        # No-op once the probe recorded a success or failure
+                        breaker.release_probe()
+            BROKER_CIRCUIT.labels(endpoint).set(0 if breaker.state == CLOSED else 1)
+            elapsed = time.perf_counter() - started
+            latency.observe(elapsed)
+            record_span(span_name, elapsed)
+
+            failed = isinstance(result, dict) and (
+                result.get("success") is False or result.get("status") is False
+            )
+            if failed:
+                status_code = result.get("status_code", "")
+                if _is_rate_limited(result):
+                    BROKER_RATE_LIMITED.labels(endpoint).inc()
+            else:
+                status_code = 200
+            BROKER_REQUESTS.labels(endpoint, "error" if failed else "ok", str(status_code)).inc()
+
+            if cache_key is not None:
+                if not failed:
+                    self._response_cache.put(cache_key, result)
+                elif breaker.state != CLOSED:
+                    cached = self._response_cache.get(cache_key)
+                    if cached is not None:
+                        BROKER_STALE.labels(endpoint).inc()
+                        stored_at, response = cached
+                        return {**response, "stale": True, "cached_at": datetime.fromtimestamp(stored_at).isoformat()}
+            return result
+        return wrapper
+    return decorator
+
+
+# SmartAPI rejects getQuote calls with more tokens than this, across all exchanges
+QUOTE_TOKENS_PER_REQUEST = 50
+
+QuoteKey = Tuple[str, str]  # (exchange, symbol token)
+
+# Keep-alive pool shared by the order endpoints, so concurrent basket legs
+# and bulk cancels reuse warm TLS connections instead of opening one each
+ORDER_CONNECTION_LIMITS = httpx.Limits(max_connections=20, max_keepalive_connections=20, keepalive_expiry=60.0)
+
+
+@dataclass
+class QuoteBatch:
+    """
+    Merged result of a batch quote fetch. `quotes` holds the parsed getQuote
+    item for every fetched instrument; `unfetched` maps the rest to a reason.
+    """
+    quotes: Dict[QuoteKey, Quote] = field(default_factory=dict)
+    unfetched: Dict[QuoteKey, str] = field(default_factory=dict)
+
+    def get(self, token: str, exchange: Optional[str] = None) -> Optional[Quote]:
+        """Look up a quote by token, optionally disambiguated by exchange."""
+        if exchange is not None:
+            return self.quotes.get((exchange, str(token)))
+        token = str(token)
+        return next((quote for (_, key), quote in self.quotes.items() if key == token), None)
+
+    def by_token(self) -> Dict[str, Quote]:
+        return {token: quote for (_, token), quote in self.quotes.items()}
+
+
+def chunk_quote_tokens(keys: Iterable[QuoteKey], size: int = QUOTE_TOKENS_PER_REQUEST) -> List[Dict[str, List[str]]]:
+    """Pack (exchange, token) pairs into as few exchangeTokens payloads of <= size tokens as possible."""
+    ordered = sorted(set(keys))
+    chunks = []
+    for start in range(0, len(ordered), size):
+        payload: Dict[str, List[str]] = {}
+        for exchange, token in ordered[start:start + size]:
+            payload.setdefault(exchange, []).append(token)
+        chunks.append(payload)
+    return chunks
 
 
 class SmartAPIClient:
@@ -39,6 +262,32 @@ class SmartAPIClient:
         self.feed_token: Optional[str] = None
         self._public_ip: Optional[str] = None
         self._local_ip: Optional[str] = None
+        self.rate_limiters = RateLimiters()
+        self.circuit_breakers = CircuitBreakers()
+        self._response_cache = ResponseCache()
+        # (mode, exchange, token) -> future for quotes currently being fetched
+        self._inflight_quotes: Dict[Tuple[str, str, str], asyncio.Future] = {}
+        self._http_client: Optional[httpx.AsyncClient] = None
+
+    @property
+    def stream_url(self) -> str:
+        """SmartStream URL: Angel One's for its own hosts, otherwise /smart-stream on the base URL's host (the mock broker)."""
+        parts = urlsplit(self.base_url)
+        if (parts.hostname or "").endswith(("angelbroking.com", "angelone.in")):
+            return self.BASE_URL_WS
+        return f"{'wss' if parts.scheme == 'https' else 'ws'}://{parts.netloc}/smart-stream"
+
+    def _http(self) -> httpx.AsyncClient:
+        """Pooled connection for the order endpoints, created on first use."""
+        if self._http_client is None or self._http_client.is_closed:
+            self._http_client = httpx.AsyncClient(limits=ORDER_CONNECTION_LIMITS, timeout=30.0)
+        return self._http_client
+
+    async def aclose(self):
+        """Close the pooled connection."""
+        if self._http_client is not None:
+            await self._http_client.aclose()
+            self._http_client = None
     
     def _get_local_ip(self) -> str:
         """Get local IP address."""
@@ -55,9 +304,12 @@ class SmartAPIClient:
             return "192.168.1.1"
     
     async def _get_public_ip(self) -> str:
-        """Get public IP address."""
+        """Get public IP address (SMARTAPI_PUBLIC_IP overrides the lookup)."""
         if self._public_ip:
             return self._public_ip
+        if os.getenv("SMARTAPI_PUBLIC_IP"):
+            self._public_ip = os.getenv("SMARTAPI_PUBLIC_IP")
+            return self._public_ip
         try:
             async with httpx.AsyncClient(timeout=5.0) as client:
                 # Try multiple services to get public IP
@@ -76,9 +328,12 @@ class SmartAPIClient:
                         continue
         except Exception:
             pass
-        # Fallback to local IP if public IP cannot be determined
-        return self._get_local_ip()
+        # Fallback to local IP if public IP cannot be determined; cache it so
+        # every request does not wait on the lookup services again
+        self._public_ip = self._get_local_ip()
+        return self._public_ip
         
+    @instrumented("loginByPassword")
     async def generate_session_by_password(self, totp: str) -> Dict[str, Any]:
         """
         Generate user session using password (MPIN) and TOTP via loginByPassword endpoint.
@@ -99,6 +354,7 @@ class SmartAPIClient:
         
         return await self._make_auth_request(url, payload)
     
+    @instrumented("loginByMPIN")
     async def generate_session(self, totp: str) -> Dict[str, Any]:
         """
         Generate user session using MPIN and TOTP (legacy method, uses loginByMPIN).
@@ -150,10 +406,7 @@ class SmartAPIClient:
             try:
                 response = await client.post(url, json=payload, headers=headers, timeout=30.0)
                 
-                # Log for debugging
-                print(f"API Request URL: {url}")
-                print(f"API Response Status: {response.status_code}")
-                print(f"API Response Headers: {dict(response.headers)}")
+                logger.debug("Auth response", extra={"url": url, "status_code": response.status_code})
                 
                 # Try to parse JSON response first
                 # If that fails, get the text for error reporting
@@ -166,8 +419,10 @@ class SmartAPIClient:
                     except Exception:
                         response_text = ""
                     
-                    print(f"JSON parsing error: {json_err}")
-                    print(f"Response text (first 500 chars): {response_text[:500] if response_text else '(empty)'}")
+                    logger.warning(
+                        "Auth response is not JSON: %s", json_err,
+                        extra={"url": url, "status_code": response.status_code}
+                    )
                     
                     # Check if response is empty
                     if not response_text or not response_text.strip():
@@ -266,6 +521,7 @@ class SmartAPIClient:
                     "requires_totp": True
                 }
     
+    @instrumented("generateTokens")
     async def refresh_session(self) -> Dict[str, Any]:
         """
         Refresh the access token using refresh token.
@@ -339,6 +595,7 @@ class SmartAPIClient:
             "X-PrivateKey": self.api_key
         }
     
+    @instrumented("getProfile")
     async def get_profile(self) -> Dict[str, Any]:
         """Get user profile information."""
         url = f"{self.base_url}/rest/secure/angelbroking/user/v1/getProfile"
@@ -359,6 +616,7 @@ class SmartAPIClient:
             except Exception as e:
                 return {"success": False, "error": str(e)}
     
+    @instrumented("placeOrder")
     async def place_order(
         self,
         symbol: str,
@@ -368,7 +626,9 @@ class SmartAPIClient:
         quantity: int,
         price: float = 0.0,
         product_type: str = "INTRADAY",  # INTRADAY, DELIVERY, MARGIN, etc.
-        validity: str = "DAY"  # DAY, IOC, etc.
+        validity: str = "DAY",  # DAY, IOC, etc.
+        symbol_token: str = "",
+        variety: str = "NORMAL"
     ) -> Dict[str, Any]:
         """
         Place an order.
@@ -382,13 +642,15 @@ class SmartAPIClient:
             price: Order price (0 for MARKET orders)
             product_type: INTRADAY, DELIVERY, MARGIN, etc.
             validity: DAY, IOC, etc.
+            symbol_token: Instrument token from the symbol master
+            variety: NORMAL, STOPLOSS, AMO, etc.
         """
         url = f"{self.base_url}/rest/secure/angelbroking/order/v1/placeOrder"
         
         payload = {
-            "variety": "NORMAL",
+            "variety": variety,
             "tradingsymbol": symbol,
-            "symboltoken": "",  # Will be fetched from symbol master if needed
+            "symboltoken": symbol_token,
             "transactiontype": transaction_type,
             "exchange": exchange,
             "ordertype": order_type,
@@ -400,85 +662,61 @@ class SmartAPIClient:
             "quantity": str(quantity)
         }
         
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.post(
-                    url,
-                    json=payload,
-                    headers=self._get_auth_headers(),
-                    timeout=30.0
-                )
-                response.raise_for_status()
-                return response.json()
-            except Exception as e:
-                return {"success": False, "error": str(e)}
+        try:
+            response = await self._http().post(url, json=payload, headers=self._get_auth_headers())
+            response.raise_for_status()
+            return response.json()
+        except Exception as e:
+            return {"success": False, "error": str(e)}
     
+    @instrumented("getPosition")
     async def get_positions(self) -> Dict[str, Any]:
-        """Get current positions."""
-        print("-" * 80)
-        print("SMARTAPI CLIENT: get_positions() called")
-        
+        """Get current positions, as Position models."""
         # Use apiconnect.angelone.in for positions endpoint if base_url is angelbroking.com
         base_url_for_request = self.base_url
         if self.base_url == "https://apiconnect.angelbroking.com":
             base_url_for_request = "https://apiconnect.angelone.in"
         
         url = f"{base_url_for_request}/rest/secure/angelbroking/portfolio/v1/getPosition"
-        print(f"Base URL: {self.base_url}")
-        print(f"Request Base URL: {base_url_for_request}")
-        print(f"Full URL: {url}")
         
         # Check token before making request
         if not self.access_token:
-            print("ERROR: No access token available")
             return {
                 "success": False,
                 "error": "No access token available. Please login first."
             }
         
         if not self.is_token_valid():
-            print("ERROR: Access token expired")
             return {
                 "success": False,
                 "error": "Access token expired. Please refresh session."
             }
         
-        print(f"Access token valid: {self.is_token_valid()}")
-        print(f"Access token (first 20 chars): {self.access_token[:20]}...")
-        
         async with httpx.AsyncClient() as client:
             try:
                 # Get real IP addresses for this request
                 local_ip = self._get_local_ip()
                 public_ip = await self._get_public_ip()
-                print(f"Local IP: {local_ip}, Public IP: {public_ip}")
                 
                 headers = self._get_auth_headers()
                 headers["X-ClientLocalIP"] = local_ip
                 headers["X-ClientPublicIP"] = public_ip
                 
-                print(f"Request headers keys: {list(headers.keys())}")
-                print(f"Authorization header present: {'Authorization' in headers}")
-                print(f"X-PrivateKey present: {'X-PrivateKey' in headers}")
-                
-                print("Making GET request to SmartAPI...")
                 response = await client.get(url, headers=headers, timeout=30.0)
-                
-                # Log response for debugging
-                print(f"Response received - Status: {response.status_code}")
-                print(f"Response headers: {dict(response.headers)}")
-                print(f"Response content length: {len(response.content) if response.content else 0}")
-                print(f"Response text length: {len(response.text) if response.text else 0}")
+                logger.debug(
+                    "getPosition response",
+                    extra={"url": url, "status_code": response.status_code, "bytes": len(response.content or b"")}
+                )
                 
                 # Check HTTP status
                 if response.status_code != 200:
                     # Check if response is HTML (indicates request was rejected by proxy/firewall)
                     if response.text and response.text.strip().startswith('<html'):
                         error_text = response.text[:500] if response.text else "No error message"
-                        print(f"Positions API: Request rejected (HTML response): {error_text}")
                         # Extract support ID from HTML if present
                         support_id_match = re.search(r'support ID is:\s*(\d+)', error_text, re.IGNORECASE)
                         support_id = support_id_match.group(1) if support_id_match else "N/A"
+                        logger.warning("getPosition rejected (HTML response)", extra={"support_id": support_id})
                         
                         return {
                             "success": False,
@@ -489,7 +727,7 @@ class SmartAPIClient:
                     try:
                         error_data = response.json()
                         error_msg = error_data.get("message", f"HTTP {response.status_code}")
-                        print(f"Positions API Error Response: {error_data}")
+                        logger.warning("getPosition error: %s", error_msg, extra={"status_code": response.status_code})
                         return {
                             "success": False,
                             "error": error_msg,
@@ -497,7 +735,7 @@ class SmartAPIClient:
                         }
                     except (ValueError, json.JSONDecodeError):
                         error_text = response.text[:500] if response.text else "No error message"
-                        print(f"Positions API Error Text: {error_text}")
+                        logger.warning("getPosition error: %s", error_text, extra={"status_code": response.status_code})
                         return {
                             "success": False,
                             "error": f"HTTP {response.status_code}: {error_text}",
@@ -506,7 +744,7 @@ class SmartAPIClient:
                 
                 # Check if response has content
                 if not response.text or not response.text.strip():
-                    print("Positions API: Empty response received")
+                    logger.warning("getPosition returned an empty response")
                     return {
                         "success": False,
                         "error": "Empty response from API. Please check your session and try again.",
@@ -515,32 +753,10 @@ class SmartAPIClient:
                 
                 # Try to parse JSON
                 try:
-                    print("Attempting to parse JSON response...")
                     result = response.json()
-                    print(f"JSON parsed successfully")
-                    print(f"Response type: {type(result)}")
-                    if isinstance(result, dict):
-                        print(f"Response keys: {list(result.keys())}")
-                        print(f"Response status: {result.get('status')}")
-                        print(f"Response message: {result.get('message')}")
-                        print(f"Response errorcode: {result.get('errorcode')}")
-                        data = result.get('data')
-                        if data is not None:
-                            print(f"Response data type: {type(data)}")
-                            if isinstance(data, list):
-                                print(f"Response data length: {len(data)}")
-                            else:
-                                print(f"Response data: {str(data)[:200]}")
-                        else:
-                            print("Response data is None")
-                    else:
-                        print(f"Response is not a dict: {result}")
                 except (ValueError, json.JSONDecodeError) as json_err:
                     response_text = response.text[:1000] if response.text else "(empty)"
-                    print(f"JSON PARSING ERROR: {type(json_err).__name__}: {str(json_err)}")
-                    print(f"Response text (first 1000 chars): {response_text}")
-                    print(f"Response status code: {response.status_code}")
-                    print(f"Response headers: {dict(response.headers)}")
+                    logger.warning("getPosition returned invalid JSON: %s", json_err, extra={"status_code": response.status_code})
                     return {
                         "success": False,
                         "error": f"Invalid JSON response: {str(json_err)}. Response: {response_text[:200]}",
@@ -548,22 +764,15 @@ class SmartAPIClient:
                     }
                 
                 if result.get("status") and result.get("data") is not None:
-                    data = result.get("data", [])
-                    print(f"SUCCESS: Returning {len(data) if isinstance(data, list) else 'non-list'} positions")
-                    print("-" * 80)
                     return {
                         "success": True,
-                        "data": data
+                        "data": Position.from_payloads(result["data"]),
+                        "etag": content_etag(response.content)
                     }
                 else:
                     error_msg = result.get("message", "Failed to fetch positions")
                     errorcode = result.get("errorcode", "")
-                    print(f"ERROR: API returned failure")
-                    print(f"  Status: {result.get('status')}")
-                    print(f"  Message: {error_msg}")
-                    print(f"  Error code: {errorcode}")
-                    print(f"  Full response: {result}")
-                    print("-" * 80)
+                    logger.warning("getPosition failed: %s", error_msg, extra={"errorcode": errorcode})
                     return {
                         "success": False,
                         "error": error_msg,
@@ -575,19 +784,18 @@ class SmartAPIClient:
                     error_msg = error_data.get("message", f"HTTP {e.response.status_code}")
                 except (ValueError, json.JSONDecodeError):
                     error_msg = f"HTTP {e.response.status_code}: {e.response.text[:200] if e.response.text else 'No error message'}"
-                print(f"Positions API HTTPStatusError: {error_msg}")
+                logger.warning("getPosition HTTP error: %s", error_msg)
                 return {"success": False, "error": error_msg, "status_code": e.response.status_code}
             except httpx.RequestError as e:
                 error_msg = f"Request failed: {str(e)}"
-                print(f"Positions API RequestError: {error_msg}")
+                logger.warning("getPosition request error: %s", error_msg)
                 return {"success": False, "error": error_msg}
             except Exception as e:
                 error_msg = f"Unexpected error: {str(e)}"
-                print(f"Positions API Exception: {error_msg}")
-                import traceback
-                traceback.print_exc()
+                logger.exception("getPosition unexpected error")
                 return {"success": False, "error": error_msg}
     
+    @instrumented("getHolding")
     async def get_holdings(self) -> Dict[str, Any]:
         """Get holdings."""
         url = f"{self.base_url}/rest/secure/angelbroking/portfolio/v1/getHolding"
@@ -600,8 +808,9 @@ class SmartAPIClient:
             except Exception as e:
                 return {"success": False, "error": str(e)}
     
+    @instrumented("getOrderBook")
     async def get_order_book(self) -> Dict[str, Any]:
-        """Get order book."""
+        """Get order book, as BrokerOrder models."""
         url = f"{self.base_url}/rest/secure/angelbroking/order/v1/getOrderBook"
         
         async with httpx.AsyncClient() as client:
@@ -636,10 +845,12 @@ class SmartAPIClient:
                 
                 result = response.json()
                 
-                if result.get("status") and result.get("data"):
+                # An empty order book comes back with data null
+                if result.get("status"):
                     return {
                         "success": True,
-                        "data": result.get("data", [])
+                        "data": BrokerOrder.from_payloads(result.get("data")),
+                        "etag": content_etag(response.content)
                     }
                 else:
                     error_msg = result.get("message", "Failed to fetch order book")
@@ -660,8 +871,9 @@ class SmartAPIClient:
             except Exception as e:
                 return {"success": False, "error": str(e)}
     
+    @instrumented("orderDetails")
     async def get_order_details(self, order_id: str) -> Dict[str, Any]:
-        """Get order details by order ID."""
+        """Get order details by order ID, as a BrokerOrder."""
         url = f"{self.base_url}/rest/secure/angelbroking/order/v1/details/{order_id}"
         
         async with httpx.AsyncClient() as client:
@@ -699,7 +911,7 @@ class SmartAPIClient:
                 if result.get("status") and result.get("data"):
                     return {
                         "success": True,
-                        "data": result.get("data")
+                        "data": BrokerOrder.from_payload(result["data"])
                     }
                 else:
                     error_msg = result.get("message", "Failed to fetch order details")
@@ -720,6 +932,7 @@ class SmartAPIClient:
             except Exception as e:
                 return {"success": False, "error": str(e)}
     
+    @instrumented("getTradeBook")
     async def get_trade_book(self) -> Dict[str, Any]:
         """Get trade book (executed orders)."""
         url = f"{self.base_url}/rest/secure/angelbroking/order/v1/getTradeBook"
@@ -732,6 +945,7 @@ class SmartAPIClient:
             except Exception as e:
                 return {"success": False, "error": str(e)}
     
+    @instrumented("cancelOrder")
     async def cancel_order(self, order_id: str, variety: str = "NORMAL") -> Dict[str, Any]:
         """Cancel an order."""
         url = f"{self.base_url}/rest/secure/angelbroking/order/v1/cancelOrder"
@@ -741,19 +955,14 @@ class SmartAPIClient:
             "orderid": order_id
         }
         
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.post(
-                    url,
-                    json=payload,
-                    headers=self._get_auth_headers(),
-                    timeout=30.0
-                )
-                response.raise_for_status()
-                return response.json()
-            except Exception as e:
-                return {"success": False, "error": str(e)}
+        try:
+            response = await self._http().post(url, json=payload, headers=self._get_auth_headers())
+            response.raise_for_status()
+            return response.json()
+        except Exception as e:
+            return {"success": False, "error": str(e)}
     
+    @instrumented("modifyOrder")
     async def modify_order(
         self,
         order_id: str,
@@ -777,21 +986,16 @@ class SmartAPIClient:
             "quantity": quantity
         }
         
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.post(
-                    url,
-                    json=payload,
-                    headers=self._get_auth_headers(),
-                    timeout=30.0
-                )
-                response.raise_for_status()
-                return response.json()
-            except Exception as e:
-                return {"success": False, "error": str(e)}
+        try:
+            response = await self._http().post(url, json=payload, headers=self._get_auth_headers())
+            response.raise_for_status()
+            return response.json()
+        except Exception as e:
+            return {"success": False, "error": str(e)}
     
+    @instrumented("getRMS")
     async def get_funds(self) -> Dict[str, Any]:
-        """Get available funds and margin details (RMS)."""
+        """Get available funds and margin details (RMS); data is a Funds model."""
         url = f"{self.base_url}/rest/secure/angelbroking/user/v1/getRMS"
         
         async with httpx.AsyncClient() as client:
@@ -806,10 +1010,14 @@ class SmartAPIClient:
                 
                 response = await client.get(url, headers=headers, timeout=30.0)
                 response.raise_for_status()
-                return response.json()
+                result = response.json()
+                if result.get("status") and isinstance(result.get("data"), dict):
+                    result["data"] = Funds.from_payload(result["data"])
+                return result
             except Exception as e:
                 return {"success": False, "error": str(e)}
     
+    @instrumented("getMarketStatus")
     async def get_market_status(self) -> Dict[str, Any]:
         """Get market status (open/close)."""
         url = f"{self.base_url}/rest/secure/angelbroking/market/v1/getMarketStatus"
@@ -822,6 +1030,7 @@ class SmartAPIClient:
             except Exception as e:
                 return {"success": False, "error": str(e)}
     
+    @instrumented("getQuote")
     async def get_quote(
         self,
         mode: str = "FULL",
@@ -855,6 +1064,81 @@ class SmartAPIClient:
             except Exception as e:
                 return {"success": False, "error": str(e)}
     
+    async def get_quotes(
+        self,
+        instruments: Union[Mapping[str, Iterable[str]], Iterable[QuoteKey]],
+        mode: str = "FULL"
+    ) -> QuoteBatch:
+        """
+        Fetch quotes for any number of instruments.
+
+        Tokens are packed into getQuote calls of at most QUOTE_TOKENS_PER_REQUEST,
+        sent concurrently under the getQuote rate limit, and merged into one
+        QuoteBatch. Instruments already being fetched by another concurrent
+        call (same mode) are awaited instead of requested twice.
+
+        Args:
+            instruments: {"NSE": ["3045", ...], "NFO": [...]} or (exchange, token) pairs
+            mode: Quote mode (FULL, OHLC, LTP)
+        """
+        if isinstance(instruments, Mapping):
+            keys = {(exchange, str(token)) for exchange, tokens in instruments.items() for token in tokens}
+        else:
+            keys = {(exchange, str(token)) for exchange, token in instruments}
+
+        loop = asyncio.get_running_loop()
+        waiting: Dict[QuoteKey, asyncio.Future] = {}
+        owned: Dict[QuoteKey, asyncio.Future] = {}
+        for exchange, token in keys:
+            inflight_key = (mode, exchange, token)
+            future = self._inflight_quotes.get(inflight_key)
+            if future is None:
+                future = self._inflight_quotes[inflight_key] = loop.create_future()
+                owned[(exchange, token)] = future
+            waiting[(exchange, token)] = future
+
+        async def fetch_chunk(exchange_tokens: Dict[str, List[str]]):
+            async with self.rate_limiters["getQuote"]:
+                result = await self.get_quote(mode, exchange_tokens)
+            if not result.get("status"):
+                reason = result.get("message") or result.get("error") or "getQuote failed"
+                for exchange, tokens in exchange_tokens.items():
+                    for token in tokens:
+                        _resolve((exchange, token), None, reason)
+                return
+            data = result.get("data") or {}
+            for quote in data.get("fetched") or []:
+                _resolve((quote.get("exchange"), str(quote.get("symbolToken"))), Quote.from_payload(quote), None)
+            for item in data.get("unfetched") or []:
+                _resolve((item.get("exchange"), str(item.get("symbolToken"))), None, item.get("message") or "unfetched")
+            # Anything the broker silently left out
+            for exchange, tokens in exchange_tokens.items():
+                for token in tokens:
+                    _resolve((exchange, token), None, "not returned")
+
+        def _resolve(key: QuoteKey, quote: Optional[Quote], reason: Optional[str]):
+            future = owned.get(key)
+            if future is not None and not future.done():
+                future.set_result((quote, reason))
+
+        try:
+            await asyncio.gather(*(fetch_chunk(chunk) for chunk in chunk_quote_tokens(owned)))
+        finally:
+            for (exchange, token), future in owned.items():
+                if not future.done():
+                    future.set_result((None, "cancelled"))
+                self._inflight_quotes.pop((mode, exchange, token), None)
+
+        batch = QuoteBatch()
+        for key, future in waiting.items():
+            quote, reason = await future
+            if quote is not None:
+                batch.quotes[key] = quote
+            else:
+                batch.unfetched[key] = reason
+        return batch
+
+    @instrumented("getSymbolMaster")
     async def get_symbol_master(self) -> Dict[str, Any]:
         """Get symbol master data for all exchanges. Large file, use for reference."""
         url = f"{self.base_url}/rest/secure/angelbroking/market/v1/getSymbolMaster"
@@ -867,6 +1151,28 @@ class SmartAPIClient:
             except Exception as e:
                 return {"success": False, "error": str(e)}
     
+    @instrumented("getSymbolMaster")
+    async def download_symbol_master(self, path: str) -> Dict[str, Any]:
+        """
+        Stream the symbol master to `path` instead of parsing it in memory;
+        see SymbolMasterService for how it is read back.
+        """
+        url = f"{self.base_url}/rest/secure/angelbroking/market/v1/getSymbolMaster"
+        
+        async with httpx.AsyncClient() as client:
+            try:
+                async with client.stream("GET", url, headers=self._get_auth_headers(), timeout=60.0) as response:
+                    response.raise_for_status()
+                    size = 0
+                    with open(path, "wb") as f:
+                        async for chunk in response.aiter_bytes():
+                            f.write(chunk)
+                            size += len(chunk)
+                return {"success": True, "path": path, "bytes": size}
+            except Exception as e:
+                return {"success": False, "error": str(e)}
+    
+    @instrumented("logout")
     async def logout(self) -> Dict[str, Any]:
         """Logout and invalidate current session."""
         url = f"{self.base_url}/rest/secure/angelbroking/user/v1/logout"
@@ -884,11 +1190,14 @@ class SmartAPIClient:
             except Exception as e:
                 return {"success": False, "error": str(e)}
     
+    @instrumented("getCandleData")
     async def get_market_data(
         self,
         exchange: str,
         symbol_token: str,
-        interval: str = "ONE_MINUTE"
+        interval: str = "ONE_MINUTE",
+        from_date: Optional[datetime] = None,
+        to_date: Optional[datetime] = None
     ) -> Dict[str, Any]:
         """
         Get historical market data.
@@ -897,15 +1206,18 @@ class SmartAPIClient:
             exchange: Exchange (NSE, BSE, NFO, etc.)
             symbol_token: Symbol token
             interval: ONE_MINUTE, FIVE_MINUTE, etc.
+            from_date, to_date: Range to fetch (default: the last 7 days)
         """
         url = f"{self.base_url}/rest/secure/angelbroking/historical/v1/getCandleData"
         
+        to_date = to_date or datetime.now()
+        from_date = from_date or to_date - timedelta(days=7)
         payload = {
             "exchange": exchange,
             "symboltoken": symbol_token,
             "interval": interval,
-            "fromdate": (datetime.now() - timedelta(days=7)).strftime("%Y-%m-%d %H:%M"),
-            "todate": datetime.now().strftime("%Y-%m-%d %H:%M")
+            "fromdate": from_date.strftime("%Y-%m-%d %H:%M"),
+            "todate": to_date.strftime("%Y-%m-%d %H:%M")
         }
         
         async with httpx.AsyncClient() as client:
@@ -921,6 +1233,7 @@ class SmartAPIClient:
             except Exception as e:
                 return {"success": False, "error": str(e)}
     
+    @instrumented("gainersLosers")
     async def get_top_gainers_losers(
         self,
         datatype: str = "PercPriceGainers",
@@ -981,17 +1294,17 @@ class SmartAPIClient:
                     timeout=30.0
                 )
                 
-                # Log response for debugging
-                print(f"GainersLosers API Request URL: {url}")
-                print(f"GainersLosers API Request Payload: {payload}")
-                print(f"GainersLosers API Response Status: {response.status_code}")
+                logger.debug(
+                    "gainersLosers response",
+                    extra={"datatype": datatype, "expirytype": expirytype, "status_code": response.status_code}
+                )
                 
                 # Check HTTP status
                 if response.status_code != 200:
                     try:
                         error_data = response.json()
                         error_msg = error_data.get("message", f"HTTP {response.status_code}")
-                        print(f"GainersLosers API Error Response: {error_data}")
+                        logger.warning("gainersLosers error: %s", error_msg, extra={"status_code": response.status_code})
                         return {
                             "success": False,
                             "error": error_msg,
@@ -999,7 +1312,7 @@ class SmartAPIClient:
                         }
                     except (ValueError, json.JSONDecodeError):
                         error_text = response.text[:500] if response.text else "No error message"
-                        print(f"GainersLosers API Error Text: {error_text}")
+                        logger.warning("gainersLosers error: %s", error_text, extra={"status_code": response.status_code})
                         return {
                             "success": False,
                             "error": f"HTTP {response.status_code}: {error_text}",
@@ -1007,7 +1320,6 @@ class SmartAPIClient:
                         }
                 
                 result = response.json()
-                print(f"GainersLosers API Response Data: {result}")
                 
                 if result.get("status") and result.get("data"):
                     # Limit results
@@ -1033,7 +1345,7 @@ class SmartAPIClient:
                     }
                 else:
                     error_msg = result.get("message", "Failed to fetch gainers/losers")
-                    print(f"GainersLosers API Error: {error_msg}, Full response: {result}")
+                    logger.warning("gainersLosers failed: %s", error_msg, extra={"errorcode": result.get("errorcode", "")})
                     return {
                         "success": False,
                         "error": error_msg,
@@ -1045,16 +1357,14 @@ class SmartAPIClient:
                     error_msg = error_data.get("message", f"HTTP {e.response.status_code}")
                 except (ValueError, json.JSONDecodeError):
                     error_msg = f"HTTP {e.response.status_code}: {e.response.text[:200] if e.response.text else 'No error message'}"
-                print(f"GainersLosers API HTTPStatusError: {error_msg}")
+                logger.warning("gainersLosers HTTP error: %s", error_msg)
                 return {"success": False, "error": error_msg, "status_code": e.response.status_code}
             except httpx.RequestError as e:
                 error_msg = f"Request failed: {str(e)}"
-                print(f"GainersLosers API RequestError: {error_msg}")
+                logger.warning("gainersLosers request error: %s", error_msg)
                 return {"success": False, "error": error_msg}
             except Exception as e:
                 error_msg = f"Unexpected error: {str(e)}"
-                print(f"GainersLosers API Exception: {error_msg}")
-                import traceback
-                traceback.print_exc()
+                logger.exception("gainersLosers unexpected error")
                 return {"success": False, "error": error_msg}
 
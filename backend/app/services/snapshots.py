@@ -0,0 +1,228 @@
+"""
+Snapshots - Periodic warm-restart snapshots of the strategy engine
+
+Every STRATEGY_SNAPSHOT_INTERVAL seconds (and on shutdown) the engine's
+state is written to STRATEGY_SNAPSHOT_PATH. That covers the running
+strategies, their incremental indicator and rule state, their position
+flags and the forming bars. On startup a recent snapshot is restored, and
+once a broker session is available only the bars missed while the process
+was down are fetched and replayed. So a mid-session restart resumes in
+seconds instead of backfilling days of history.
+
+File format: a fixed header (magic, format version, save time, CRC32 of
+the payload) followed by a zlib-compressed pickle. The pickle contains only
+plain containers, numbers and strings, and is loaded with an unpickler
+that refuses every class.
+"""
+import asyncio
+import io
+import logging
+import os
+import pickle
+import struct
+import time
+import zlib
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+from app.models import Strategy
+from app.models.database import SessionLocal
+from app.services import metrics
+from app.services.session_manager import SessionManager
+from app.services.strategy_engine import StrategyEngine
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_MAGIC = b"APSNAP"
+SNAPSHOT_VERSION = 2  # 2: RSI state holds weighted sums, not averages
+_HEADER = struct.Struct("<6sHdI")  # magic, version, saved_at, crc32
+
+STRATEGY_SNAPSHOT_PATH = os.getenv("STRATEGY_SNAPSHOT_PATH", "./strategy_state.snap")
+STRATEGY_SNAPSHOT_INTERVAL = float(os.getenv("STRATEGY_SNAPSHOT_INTERVAL", "30"))
+# Older snapshots are from a previous session and are ignored
+STRATEGY_SNAPSHOT_MAX_AGE = float(os.getenv("STRATEGY_SNAPSHOT_MAX_AGE", "21600"))
+# How long after startup to wait for a broker session before giving up on catching up
+CATCH_UP_WAIT = 600.0
+
+IST = timezone(timedelta(hours=5, minutes=30))
+CANDLE_INTERVALS = {
+    60: "ONE_MINUTE", 180: "THREE_MINUTE", 300: "FIVE_MINUTE", 600: "TEN_MINUTE",
+    900: "FIFTEEN_MINUTE", 1800: "THIRTY_MINUTE", 3600: "ONE_HOUR", 86400: "ONE_DAY",
+}
+
+SNAPSHOT_DURATION = metrics.histogram(
+    "strategy_snapshot_duration_seconds",
+    "Time to collect and write a strategy engine snapshot"
+)
+SNAPSHOT_BYTES = metrics.gauge("strategy_snapshot_bytes", "Size of the last strategy engine snapshot")
+
+
+class SnapshotError(ValueError):
+    """The snapshot file is corrupt, truncated or from an unknown format version."""
+
+
+class _PlainUnpickler(pickle.Unpickler):
+    def find_class(self, module, name):
+        raise SnapshotError(f"Snapshot references {module}.{name}")
+
+
+def encode_snapshot(state: Dict[str, Any]) -> bytes:
+    payload = zlib.compress(pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL), 1)
+    return _HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, state.get("saved_at", time.time()), zlib.crc32(payload)) + payload
+
+
+def decode_snapshot(data: bytes) -> Dict[str, Any]:
+    if len(data) < _HEADER.size:
+        raise SnapshotError("Snapshot is truncated")
+    magic, version, _, crc = _HEADER.unpack_from(data)
+    if magic != SNAPSHOT_MAGIC:
+        raise SnapshotError("Not a strategy snapshot")
+    if version != SNAPSHOT_VERSION:
+        raise SnapshotError(f"Snapshot format version {version} is not supported")
+    payload = data[_HEADER.size:]
+    if zlib.crc32(payload) != crc:
+        raise SnapshotError("Snapshot checksum mismatch")
+    try:
+        return _PlainUnpickler(io.BytesIO(zlib.decompress(payload))).load()
+    except (zlib.error, pickle.UnpicklingError, EOFError) as e:
+        raise SnapshotError(f"Snapshot payload is unreadable: {e}")
+
+
+def write_snapshot(path: str, state: Dict[str, Any]) -> int:
+    """Atomically replace `path` with the encoded state; returns the size in bytes."""
+    data = encode_snapshot(state)
+    temporary = f"{path}.tmp"
+    with open(temporary, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary, path)
+    return len(data)
+
+
+def read_snapshot(path: str, max_age: Optional[float] = None) -> Optional[Dict[str, Any]]:
+    """The snapshot at `path`, or None if there is none or it is older than max_age seconds."""
+    try:
+        with open(path, "rb") as f:
+            state = decode_snapshot(f.read())
+    except FileNotFoundError:
+        return None
+    if max_age is not None and time.time() - state["saved_at"] > max_age:
+        logger.info("Ignoring snapshot from %.0f minutes ago", (time.time() - state["saved_at"]) / 60)
+        return None
+    return state
+
+
+async def fetch_missed_bars(exchange: str, token: str, after: float, interval: int) -> List[Dict[str, float]]:
+    """Closed candles starting after `after` from the active broker session."""
+    client = SessionManager.get_instance().get_smartapi_client()
+    if client is None:
+        raise RuntimeError("No active broker session")
+    if interval not in CANDLE_INTERVALS:
+        raise ValueError(f"No candle interval for {interval}s bars")
+    now = time.time()
+    result = await client.get_market_data(
+        exchange, token, CANDLE_INTERVALS[interval],
+        from_date=datetime.fromtimestamp(after + interval, IST).replace(tzinfo=None),
+        to_date=datetime.fromtimestamp(now, IST).replace(tzinfo=None)
+    )
+    if not result.get("status"):
+        raise RuntimeError(result.get("message") or result.get("error") or "getCandleData failed")
+    bars = []
+    for timestamp, open_, high, low, close, volume in result.get("data") or []:
+        start = datetime.fromisoformat(timestamp).timestamp()
+        # Skip what the engine has already seen and the still-forming candle
+        if after < start and start + interval <= now:
+            bars.append({"time": start, "open": open_, "high": high, "low": low, "close": close, "volume": volume})
+    return bars
+
+
+class SnapshotService:
+    """Writes snapshots periodically and restores the latest one on startup."""
+    _instance = None
+
+    def __init__(self, engine: Optional[StrategyEngine] = None, path: Optional[str] = None):
+        if SnapshotService._instance is not None:
+            raise Exception("SnapshotService is a singleton")
+        SnapshotService._instance = self
+        self.engine = engine or StrategyEngine.get_instance()
+        self.path = path or STRATEGY_SNAPSHOT_PATH
+        self.last_saved_at: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+        self._catch_up_task: Optional[asyncio.Task] = None
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    async def save(self) -> Optional[int]:
+        started = time.perf_counter()
+        state = await self.engine.snapshot()
+        if not state["strategies"] and self.last_saved_at is None and not os.path.exists(self.path):
+            return None
+        size = await asyncio.to_thread(write_snapshot, self.path, state)
+        SNAPSHOT_DURATION.observe(time.perf_counter() - started)
+        SNAPSHOT_BYTES.set(size)
+        self.last_saved_at = state["saved_at"]
+        return size
+
+    async def restore(self) -> List[int]:
+        """
+        Restore the engine from a recent snapshot and start catching up on
+        missed bars in the background. Returns the restored strategy ids.
+        """
+        try:
+            snapshot = await asyncio.to_thread(read_snapshot, self.path, STRATEGY_SNAPSHOT_MAX_AGE)
+        except SnapshotError as e:
+            logger.warning("Ignoring strategy snapshot: %s", e)
+            return []
+        if snapshot is None or not snapshot["strategies"]:
+            return []
+
+        db = SessionLocal()
+        try:
+            rows = db.query(Strategy).filter(Strategy.id.in_(list(snapshot["strategies"]))).all()
+            strategies = {strategy.id: strategy for strategy in rows}
+        finally:
+            db.close()
+        restored = await self.engine.restore(snapshot, strategies)
+        logger.info("Restored %d of %d strategies from snapshot", len(restored), len(snapshot["strategies"]),
+                    extra={"age_s": round(time.time() - snapshot["saved_at"], 1)})
+        if restored:
+            self._catch_up_task = asyncio.create_task(self._catch_up(snapshot))
+        return restored
+
+    async def _catch_up(self, snapshot: Dict[str, Any]):
+        deadline = time.monotonic() + CATCH_UP_WAIT
+        while SessionManager.get_instance().get_smartapi_client() is None:
+            if time.monotonic() > deadline:
+                logger.warning("No broker session to fetch missed bars; restored strategies resume with a gap")
+                return
+            await asyncio.sleep(1.0)
+        replayed = await self.engine.catch_up(fetch_missed_bars, snapshot)
+        logger.info("Caught up on %d missed bars", replayed)
+
+    async def _run(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.save()
+            except Exception:
+                logger.exception("Strategy snapshot failed")
+
+    def start(self, interval: Optional[float] = None):
+        interval = STRATEGY_SNAPSHOT_INTERVAL if interval is None else interval
+        if interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._run(interval))
+
+    async def stop(self):
+        """Stop the periodic task and write a final snapshot."""
+        for task in (self._task, self._catch_up_task):
+            if task is not None and not task.done():
+                task.cancel()
+        self._task = self._catch_up_task = None
+        try:
+            await self.save()
+        except Exception:
+            logger.exception("Final strategy snapshot failed")
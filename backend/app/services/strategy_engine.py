@@ -1,31 +1,128 @@
 """
 Strategy Engine - Executes and manages strategy lifecycle
 """
-from typing import Dict, List, Optional
+import asyncio
+import hashlib
+import logging
+import math
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Mapping, Optional, Set, Tuple
 from app.models import Strategy
+from app.services.compute_pool import ComputeJob, ComputePool
+from app.services.pnl_engine import PnLEngine
+from app.services.settings_service import SettingsService, SettingsState
+from app.services.strategy_rules import RULE_CACHE, CompiledStrategy
+from app.services.strategy_runner import BarBuilder, StrategyRunner, TradeIntent
+from app.services.strategy_shards import IntentHandler, StrategyShardPool
+from app.services.ui_feed import UIFeed
+from app.services import metrics
+
+logger = logging.getLogger(__name__)
+
+# Bar length the engine builds from ticks
+STRATEGY_BAR_INTERVAL = int(os.getenv("STRATEGY_BAR_INTERVAL", "60"))
+
+# (exchange, token, after, interval) -> closed bars starting after `after`, oldest first
+BarFetcher = Callable[[str, str, float, int], Awaitable[List[Dict[str, float]]]]
+
+RUNNING_STRATEGIES = metrics.gauge(
+    "strategy_engine_strategies",
+    "Strategies loaded in the engine by status",
+    ("status",)
+)
 
 
 class StrategyEngine:
     """
     Manages strategy execution lifecycle.
     Strategies can be: initialized, running, paused, stopped
+
+    Rule-based strategies with a symbol_token are evaluated from on_bar():
+    in this process, or in the shard processes when STRATEGY_SHARDS is set.
+    Either way their trade intents go to the intent handler.
     """
-    def __init__(self):
+    _instance = None
+
+    def __init__(
+        self,
+        settings_service: Optional[SettingsService] = None,
+        compute_pool: Optional[ComputePool] = None,
+        shards: Optional[StrategyShardPool] = None,
+        intent_handler: Optional[IntentHandler] = None,
+        feed: Optional[UIFeed] = None,
+        pnl: Optional[PnLEngine] = None
+    ):
+        if StrategyEngine._instance is not None:
+            raise Exception("StrategyEngine is a singleton")
+        StrategyEngine._instance = self
         self.running_strategies: Dict[int, Dict] = {}
+        self.compute_pool = compute_pool or ComputePool.get_instance()
+        self.settings_service = settings_service or SettingsService.get_instance()
+        self.settings_service.subscribe(self._on_settings_changed)
+        self.shards = shards or StrategyShardPool.get_instance()
+        self.feed = feed or UIFeed.get_instance()
+        self.pnl = pnl or PnLEngine.get_instance()
+        self.intent_handler: Optional[IntentHandler] = None
+        if intent_handler is not None:
+            self.set_intent_handler(intent_handler)
+        self.bar_interval = STRATEGY_BAR_INTERVAL
+        self._bar_builders: Dict[Tuple[str, str], BarBuilder] = {}
 
-    async def start_strategy(self, strategy: Strategy) -> bool:
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    def set_intent_handler(self, handler: Optional[IntentHandler]):
+        """Receive TradeIntents from in-process and sharded strategies alike."""
+        self.intent_handler = handler
+        self.shards.set_intent_handler(handler)
+
+    def _update_metrics(self):
+        counts = {"running": 0, "paused": 0}
+        for entry in self.running_strategies.values():
+            counts[entry["status"]] = counts.get(entry["status"], 0) + 1
+        for status, count in counts.items():
+            RUNNING_STRATEGIES.labels(status).set(count)
+
+    def _on_settings_changed(self, old_state: SettingsState, new_state: SettingsState):
+        """Rebind each running strategy to the settings of its app."""
+        for entry in self.running_strategies.values():
+            entry["settings"] = new_state.for_app(entry["strategy"].app_id)
+
+    async def start_strategy(self, strategy: Strategy, state: Optional[Mapping[str, Any]] = None) -> bool:
         """
-        Start a strategy execution.
+        Start a strategy execution. `state` resumes a rule-based strategy
+        from a snapshot (see snapshot()) instead of from empty indicators.
         """
         # TODO: Implement strategy execution loop
         # - Subscribe to required symbols
         # - Evaluate on new candles/OI updates
         # - Generate trade intents
-        
+
+        # Compile (or reuse the cached) rules up front; raises StrategyRuleError if invalid
+        rules: Optional[CompiledStrategy] = RULE_CACHE.get(strategy)
+        runner, shard = None, None
+        if rules is not None:
+            if self.shards.enabled and rules.symbol_token is not None:
+                shard = self.shards.add_strategy(strategy.id, strategy.app_id, strategy.params_json, state)
+            else:
+                rules.reset()
+                runner = StrategyRunner(strategy.id, strategy.app_id, rules)
+                if state is not None:
+                    runner.restore(state)
+
         self.running_strategies[strategy.id] = {
             "strategy": strategy,
-            "status": "running"
+            "status": "running",
+            "runner": runner,
+            "shard": shard,
+            "settings": self.settings_service.get(strategy.app_id),
+            "jobs": set()
         }
+        self._update_metrics()
         return True
 
     async def stop_strategy(self, strategy_id: int):
@@ -34,7 +131,29 @@ class StrategyEngine:
         """
         if strategy_id in self.running_strategies:
             # TODO: Gracefully stop execution
+            for job in self.running_strategies[strategy_id]["jobs"]:
+                job.cancel()
+            if self.running_strategies[strategy_id]["shard"] is not None:
+                self.shards.remove_strategy(strategy_id)
             del self.running_strategies[strategy_id]
+            self._update_metrics()
+
+    async def reload_strategy(self, strategy: Strategy) -> bool:
+        """
+        Restart a loaded strategy with its edited params, in or out of the
+        shards as the new rules require. Like a stop and start, indicator
+        and position state begin fresh; a paused strategy stays paused.
+        Returns False if the strategy was not loaded.
+        """
+        entry = self.running_strategies.get(strategy.id)
+        if entry is None:
+            return False
+        status = entry["status"]
+        await self.stop_strategy(strategy.id)
+        await self.start_strategy(strategy)
+        if status == "paused":
+            await self.pause_strategy(strategy.id)
+        return True
 
     async def pause_strategy(self, strategy_id: int):
         """
@@ -42,6 +161,251 @@ class StrategyEngine:
         """
         if strategy_id in self.running_strategies:
             self.running_strategies[strategy_id]["status"] = "paused"
+            if self.running_strategies[strategy_id]["shard"] is not None:
+                self.shards.pause_strategy(strategy_id)
+            self._update_metrics()
+
+    async def offload(
+        self,
+        strategy_id: int,
+        fn: Callable,
+        *args,
+        bars: Optional[Mapping[str, Any]] = None,
+        name: str = "strategy"
+    ) -> Any:
+        """
+        Run a CPU-bound job (scan, backtest, indicator batch) for a strategy
+        in the compute pool. Jobs still running when the strategy is stopped
+        are cancelled.
+        """
+        job: ComputeJob = self.compute_pool.submit(fn, *args, bars=bars, name=name)
+        entry = self.running_strategies.get(strategy_id)
+        if entry is not None:
+            entry["jobs"].add(job)
+        try:
+            return await job
+        finally:
+            if entry is not None:
+                entry["jobs"].discard(job)
+
+    def evaluate_bar(self, strategy_id: int, values: Dict[str, float]) -> Optional[str]:
+        """
+        Feed one closed bar (indicator and bar-field values by name) to a
+        running rule-based strategy. Returns "entry", "exit" or None.
+        """
+        entry = self.running_strategies.get(strategy_id)
+        if entry is None or entry["status"] != "running" or entry["runner"] is None:
+            return None
+        runner = entry["runner"]
+        runner.rules.update(values)
+        signal = runner.rules.signal(runner.in_position)
+        if signal is not None:
+            runner.in_position = signal == "entry"
+        return signal
+
+    async def on_tick(
+        self,
+        exchange: str,
+        token,
+        ltp: float,
+        time_: Optional[float] = None,
+        volume: float = math.nan,
+        oi: float = math.nan
+    ) -> List[TradeIntent]:
+        """
+        Forward a market tick to the shards, the UI feed and the P&L engine
+        and add it to the instrument's forming bar; the first tick of a new
+        interval closes the bar and runs on_bar() with it. `volume` is the
+        cumulative day volume.
+        """
+        time_ = time_ or time.time()
+        if self.shards.running:
+            self.shards.publish_tick(exchange, token, ltp, time_=time_, volume=volume, oi=oi)
+        self.feed.publish("ticks", f"{exchange}:{token}", {"ltp": ltp, "volume": volume, "oi": oi, "time": int(time_ * 1000)})
+        self.pnl.on_tick(exchange, token, ltp)
+        key = (exchange, str(token))
+        builder = self._bar_builders.get(key)
+        if builder is None:
+            builder = self._bar_builders[key] = BarBuilder(self.bar_interval)
+        closed = builder.update(time_, ltp, volume)
+        if closed is None:
+            return []
+        return await self.on_bar(
+            exchange, token, closed["time"], closed["open"], closed["high"], closed["low"],
+            closed["close"], closed["volume"], self.bar_interval
+        )
+
+    async def on_bar(
+        self,
+        exchange: str,
+        token,
+        time_: float,
+        open_: float,
+        high: float,
+        low: float,
+        close: float,
+        volume: float = 0.0,
+        interval: int = 60,
+        evaluate: bool = True
+    ) -> List[TradeIntent]:
+        """
+        Distribute a closed bar: published to the shards, and evaluated here for
+        in-process strategies on that instrument. Returns the in-process intents
+        (shard intents arrive at the handler asynchronously). evaluate=False
+        replays a missed bar into indicator state without taking signals.
+        """
+        if self.shards.running:
+            self.shards.publish_bar(exchange, token, time_, open_, high, low, close, volume, interval, replay=not evaluate)
+
+        token = str(token)
+        bar = {"time": time_, "open": open_, "high": high, "low": low, "close": close, "volume": volume}
+        intents = []
+        for strategy_id, entry in self.running_strategies.items():
+            runner: Optional[StrategyRunner] = entry["runner"]
+            if (
+                runner is None or entry["status"] != "running"
+                or runner.symbol_token != token or runner.rules.exchange != exchange
+            ):
+                continue
+            try:
+                intent = runner.on_bar(bar, evaluate)
+            except Exception:
+                logger.exception("Strategy %s failed on bar", strategy_id, extra={"strategy_id": strategy_id})
+                continue
+            if intent is not None:
+                intents.append(intent)
+        for intent in intents:
+            await self._dispatch(intent)
+        return intents
+
+    @staticmethod
+    def params_hash(params_json: Optional[str]) -> str:
+        """Fingerprint of a strategy's params, to tell whether a snapshot still applies."""
+        return hashlib.sha1((params_json or "").encode()).hexdigest()
+
+    async def snapshot(self) -> Dict[str, Any]:
+        """
+        Plain-data state of every loaded strategy (indicator, rule and
+        position state for rule-based ones) and of the forming bars.
+        """
+        shard_states: Dict[int, Any] = {}
+        if self.shards.running:
+            shard_states = await asyncio.to_thread(self.shards.snapshot_strategies)
+        strategies = {}
+        for strategy_id, entry in list(self.running_strategies.items()):
+            strategy = entry["strategy"]
+            if entry["runner"] is not None:
+                runner_state = entry["runner"].state()
+            else:
+                runner_state = shard_states.get(strategy_id)
+            strategies[strategy_id] = {
+                "app_id": strategy.app_id,
+                "status": entry["status"],
+                "params_hash": self.params_hash(strategy.params_json),
+                "state": runner_state,
+            }
+        return {
+            "saved_at": time.time(),
+            "bar_interval": self.bar_interval,
+            "strategies": strategies,
+            "bars": [[exchange, token, builder.state()] for (exchange, token), builder in self._bar_builders.items()],
+        }
+
+    async def restore(self, snapshot: Mapping[str, Any], strategies: Mapping[int, Strategy]) -> List[int]:
+        """
+        Restart the strategies in a snapshot from their saved state. Strategies
+        that no longer exist or whose params changed since are skipped (edited
+        ones start from empty state on their next start). Returns restored ids.
+        """
+        restored = []
+        for strategy_id, saved in snapshot["strategies"].items():
+            strategy = strategies.get(strategy_id)
+            if strategy is None or self.params_hash(strategy.params_json) != saved["params_hash"]:
+                logger.info("Not restoring strategy %s: deleted or edited since the snapshot", strategy_id,
+                            extra={"strategy_id": strategy_id})
+                continue
+            try:
+                await self.start_strategy(strategy, saved["state"])
+            except Exception:
+                logger.exception("Could not restore strategy %s", strategy_id, extra={"strategy_id": strategy_id})
+                continue
+            if saved["status"] == "paused":
+                await self.pause_strategy(strategy_id)
+            restored.append(strategy_id)
+
+        if snapshot.get("bar_interval") == self.bar_interval:
+            current = time.time() // self.bar_interval * self.bar_interval
+            for exchange, token, builder_state in snapshot["bars"]:
+                builder = BarBuilder(self.bar_interval)
+                builder.restore(builder_state)
+                # A bar from an interval that has already ended is covered by catch_up()
+                if builder.bar is not None and builder.bar["time"] < current:
+                    builder.bar = None
+                self._bar_builders[(exchange, token)] = builder
+        return restored
+
+    def instruments(self) -> Set[Tuple[str, str]]:
+        """(exchange, token) of every loaded rule-based strategy, i.e. the instruments whose ticks build bars."""
+        instruments = set()
+        for entry in self.running_strategies.values():
+            rules = RULE_CACHE.get(entry["strategy"])
+            if rules is not None and rules.symbol_token is not None:
+                instruments.add((rules.exchange, rules.symbol_token))
+        return instruments
+
+    def _instrument_progress(self, last_bar_times: Optional[Mapping[int, Optional[float]]] = None) -> Dict[Tuple[str, str], float]:
+        """Earliest last-bar time per instrument over the loaded rule-based strategies."""
+        progress: Dict[Tuple[str, str], float] = {}
+        for strategy_id, entry in self.running_strategies.items():
+            rules = RULE_CACHE.get(entry["strategy"])
+            if rules is None or rules.symbol_token is None:
+                continue
+            if entry["runner"] is not None:
+                last = entry["runner"].last_bar_time
+            else:
+                last = (last_bar_times or {}).get(strategy_id)
+            if last is None:
+                continue
+            key = (rules.exchange, rules.symbol_token)
+            progress[key] = min(progress.get(key, last), last)
+        return progress
+
+    async def catch_up(self, fetch_bars: BarFetcher, snapshot: Optional[Mapping[str, Any]] = None) -> int:
+        """
+        Replay the bars each instrument missed since its strategies' last bar
+        into their indicator state (no signals are taken for them). Sharded
+        strategies' progress is read from `snapshot`. Returns bars replayed.
+        """
+        last_bar_times = {}
+        for strategy_id, saved in ((snapshot or {}).get("strategies") or {}).items():
+            if saved.get("state"):
+                last_bar_times[strategy_id] = saved["state"]["last_bar_time"]
+        replayed = 0
+        for (exchange, token), after in self._instrument_progress(last_bar_times).items():
+            try:
+                bars = await fetch_bars(exchange, token, after, self.bar_interval)
+            except Exception:
+                logger.exception("Could not fetch missed bars for %s:%s", exchange, token)
+                continue
+            for bar in bars:
+                await self.on_bar(
+                    exchange, token, bar["time"], bar["open"], bar["high"], bar["low"],
+                    bar["close"], bar.get("volume", 0.0), self.bar_interval, evaluate=False
+                )
+            replayed += len(bars)
+            logger.info("Replayed %d missed bars for %s:%s", len(bars), exchange, token,
+                        extra={"exchange": exchange, "token": token, "bars": len(bars)})
+        return replayed
+
+    async def _dispatch(self, intent: TradeIntent):
+        if self.intent_handler is None:
+            return
+        try:
+            result = self.intent_handler(intent)
+            if asyncio.iscoroutine(result):
+                await result
+        except Exception:
+            logger.exception("Trade intent handler failed", extra=intent.to_dict())
 
     async def run_once(self, strategy_id: int):
         """
@@ -0,0 +1,317 @@
+"""
+Strategy Rules - Validate and compile Strategy.params_json into a per-bar evaluator
+
+Rule format:
+
+    {
+        "indicators": {
+            "rsi": {"indicator": "rsi", "length": 14},
+            "fast": {"indicator": "ema", "length": 10},
+            "slow": {"indicator": "ema", "length": 30}
+        },
+        "entry": {"all": [
+            {"left": "rsi", "op": "<", "right": 30},
+            {"left": "fast", "op": "crosses_above", "right": "slow"}
+        ]},
+        "exit": {"any": [{"left": "rsi", "op": ">", "right": 70}]},
+        "side": "BUY",
+        "quantity": 1,
+        "symbol_token": "2885",
+        "exchange": "NSE",
+        "symbol": "RELIANCE-EQ",
+        "product_type": "INTRADAY"
+    }
+
+Operands are indicator names, bar fields (open/high/low/close/volume) or
+numbers. Groups ("all"/"any") nest. symbol_token (with exchange, default
+NSE) names the instrument whose bars drive the strategy. Each rule is compiled once into a
+Python function over IndicatorHandle objects, so evaluating a bar costs a
+few attribute reads and comparisons; no JSON is parsed or walked per bar.
+Compiled rules are cached per strategy and invalidated when the strategy
+is edited through the API, which also restarts it if it is running.
+"""
+import json
+import math
+import threading
+from typing import Any, Callable, Dict, List, Mapping, Optional, Tuple
+from app.services.tick_bus import EXCHANGES
+
+BAR_FIELDS = ("open", "high", "low", "close", "volume")
+INDICATORS = {
+    "rsi": {"length": 14},
+    "sma": {"length": 20},
+    "ema": {"length": 20},
+    "stoch_k": {"k": 14, "d": 3},
+    "stoch_d": {"k": 14, "d": 3},
+}
+COMPARISONS = {"<", "<=", ">", ">=", "==", "!="}
+CROSSES = {"crosses_above": ">", "crosses_below": "<"}
+SIDES = ("BUY", "SELL")
+PRODUCT_TYPES = ("INTRADAY", "DELIVERY", "CARRYFORWARD", "MARGIN")
+MAX_DEPTH = 8
+
+
+class StrategyRuleError(ValueError):
+    """params_json is not a valid rule set; the message names the offending path."""
+
+
+class IndicatorHandle:
+    """Latest and previous value of one indicator or bar field."""
+    __slots__ = ("name", "value", "previous")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.value = float("nan")
+        self.previous = float("nan")
+
+
+class CompiledStrategy:
+    """
+    Evaluator bound to its own handles. Per bar: update(values), then
+    entry()/exit() (or signal()).
+    """
+    __slots__ = (
+        "indicators", "handles", "_handle_list", "entry", "exit", "side", "quantity",
+        "symbol_token", "exchange", "symbol", "product_type", "params"
+    )
+
+    def __init__(
+        self,
+        indicators: Dict[str, Dict[str, Any]],
+        handles: Dict[str, IndicatorHandle],
+        entry: Callable[[], bool],
+        exit: Callable[[], bool],
+        side: str,
+        quantity: int,
+        params: Dict[str, Any],
+        symbol_token: Optional[str] = None,
+        exchange: str = "NSE",
+        symbol: Optional[str] = None,
+        product_type: str = "INTRADAY"
+    ):
+        self.indicators = indicators
+        self.handles = handles
+        self._handle_list = tuple(handles.values())
+        self.entry = entry
+        self.exit = exit
+        self.side = side
+        self.quantity = quantity
+        self.symbol_token = symbol_token
+        self.exchange = exchange
+        self.symbol = symbol
+        self.product_type = product_type
+        self.params = params
+
+    def update(self, values: Mapping[str, float]):
+        """Shift in the new bar's indicator and bar-field values."""
+        for handle in self._handle_list:
+            handle.previous = handle.value
+            handle.value = values.get(handle.name, handle.value)
+
+    def reset(self):
+        """Forget bar history, e.g. when the strategy is restarted."""
+        for handle in self._handle_list:
+            handle.value = handle.previous = float("nan")
+
+    def state(self) -> List[List[float]]:
+        """Current and previous value of every handle, in handle order."""
+        return [[handle.value, handle.previous] for handle in self._handle_list]
+
+    def restore(self, state: List[List[float]]):
+        if len(state) != len(self._handle_list):
+            raise ValueError("Rule state does not match the compiled rules")
+        for handle, (value, previous) in zip(self._handle_list, state):
+            handle.value, handle.previous = value, previous
+
+    def signal(self, in_position: bool) -> Optional[str]:
+        """'exit' while in a position and the exit rule holds, 'entry' when flat and the entry rule holds."""
+        if in_position:
+            return "exit" if self.exit() else None
+        return "entry" if self.entry() else None
+
+
+def _validate_indicators(specs: Any) -> Dict[str, Dict[str, Any]]:
+    if not isinstance(specs, dict):
+        raise StrategyRuleError("indicators: expected an object")
+    indicators = {}
+    for name, spec in specs.items():
+        path = f"indicators.{name}"
+        # Python NFKC-normalises non-ASCII identifiers, so the ligature "ﬁ" and "fi" would be one variable
+        if not (name.isascii() and name.isidentifier()) or name in BAR_FIELDS:
+            raise StrategyRuleError(f"{path}: name must be an ASCII identifier and not a bar field")
+        if not isinstance(spec, dict) or spec.get("indicator") not in INDICATORS:
+            raise StrategyRuleError(f"{path}: indicator must be one of {', '.join(INDICATORS)}")
+        params = dict(INDICATORS[spec["indicator"]])
+        for key, value in spec.items():
+            if key == "indicator":
+                continue
+            if key not in params:
+                raise StrategyRuleError(f"{path}.{key}: unknown parameter")
+            if not isinstance(value, int) or isinstance(value, bool) or value < 1:
+                raise StrategyRuleError(f"{path}.{key}: expected a positive integer")
+            params[key] = value
+        indicators[name] = {"indicator": spec["indicator"], **params}
+    return indicators
+
+
+class _Compiler:
+    """Turns a condition tree into Python source over handle variables."""
+
+    def __init__(self, indicators: Dict[str, Dict[str, Any]]):
+        self.indicators = indicators
+        self.handles: Dict[str, IndicatorHandle] = {}
+        self.variables: Dict[str, str] = {}  # operand name -> positional variable in the source
+
+    def _operand(self, value: Any, path: str) -> Tuple[str, str]:
+        """Source for the current and previous value of an operand."""
+        if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+            raise StrategyRuleError(f"{path}: expected a number, indicator or bar field")
+        if isinstance(value, (int, float)):
+            # json.loads accepts NaN and Infinity (and 1e999 overflows to it), which have no literal
+            try:
+                number = float(value)
+            except OverflowError:
+                number = math.inf
+            if not math.isfinite(number):
+                raise StrategyRuleError(f"{path}: expected a finite number")
+            literal = repr(number)
+            return literal, literal
+        if value not in self.indicators and value not in BAR_FIELDS:
+            raise StrategyRuleError(f"{path}: unknown operand {value!r}")
+        if value not in self.handles:
+            self.handles[value] = IndicatorHandle(value)
+            self.variables[value] = f"h_{len(self.variables)}"
+        variable = self.variables[value]
+        return f"{variable}.value", f"{variable}.previous"
+
+    def condition(self, node: Any, path: str, depth: int = 0) -> str:
+        if depth > MAX_DEPTH:
+            raise StrategyRuleError(f"{path}: nested too deeply")
+        if not isinstance(node, dict):
+            raise StrategyRuleError(f"{path}: expected an object")
+        for group, joiner in (("all", " and "), ("any", " or ")):
+            if group in node:
+                children = node[group]
+                if not isinstance(children, list) or not children:
+                    raise StrategyRuleError(f"{path}.{group}: expected a non-empty list")
+                parts = [self.condition(child, f"{path}.{group}[{i}]", depth + 1) for i, child in enumerate(children)]
+                return "(" + joiner.join(parts) + ")"
+
+        op = node.get("op")
+        left, left_previous = self._operand(node.get("left"), f"{path}.left")
+        right, right_previous = self._operand(node.get("right"), f"{path}.right")
+        if op in COMPARISONS:
+            return f"({left} {op} {right})"
+        if op in CROSSES:
+            now = CROSSES[op]
+            before = "<=" if now == ">" else ">="
+            return f"({left_previous} {before} {right_previous} and {left} {now} {right})"
+        raise StrategyRuleError(f"{path}.op: expected one of {', '.join(sorted(COMPARISONS | set(CROSSES)))}")
+
+    def function(self, source: str) -> Callable[[], bool]:
+        names = list(self.variables.values())
+        # Source is built only from positional variable names, operators and float literals.
+        # The outer lambda binds the handles as closure cells for the evaluator.
+        factory = eval(f"lambda {', '.join(names)}: lambda: {source}", {"__builtins__": {}})
+        return factory(*self.handles.values())
+
+
+def is_rule_format(params: Any) -> bool:
+    return isinstance(params, dict) and ("entry" in params or "exit" in params)
+
+
+def compile_rules(params_json: Optional[str]) -> CompiledStrategy:
+    """Validate params_json and compile it. Raises StrategyRuleError."""
+    try:
+        params = json.loads(params_json or "{}")
+    except json.JSONDecodeError as e:
+        raise StrategyRuleError(f"params_json is not valid JSON: {e.msg}")
+    if not isinstance(params, dict):
+        raise StrategyRuleError("params_json must be an object")
+    for key in ("entry", "exit"):
+        if key not in params:
+            raise StrategyRuleError(f"{key}: required")
+
+    side = params.get("side", "BUY")
+    if side not in SIDES:
+        raise StrategyRuleError("side: expected BUY or SELL")
+    quantity = params.get("quantity", 1)
+    if not isinstance(quantity, int) or isinstance(quantity, bool) or quantity < 1:
+        raise StrategyRuleError("quantity: expected a positive integer")
+    symbol_token = params.get("symbol_token")
+    if symbol_token is not None:
+        symbol_token = str(symbol_token)
+        if not symbol_token.isdigit():
+            raise StrategyRuleError("symbol_token: expected a numeric instrument token")
+    exchange = params.get("exchange", "NSE")
+    if exchange not in EXCHANGES:
+        raise StrategyRuleError(f"exchange: expected one of {', '.join(EXCHANGES)}")
+    symbol = params.get("symbol")
+    if symbol is not None and not isinstance(symbol, str):
+        raise StrategyRuleError("symbol: expected a string")
+    product_type = params.get("product_type", "INTRADAY")
+    if product_type not in PRODUCT_TYPES:
+        raise StrategyRuleError(f"product_type: expected one of {', '.join(PRODUCT_TYPES)}")
+
+    compiler = _Compiler(_validate_indicators(params.get("indicators", {})))
+    entry_source = compiler.condition(params["entry"], "entry")
+    exit_source = compiler.condition(params["exit"], "exit")
+    return CompiledStrategy(
+        indicators=compiler.indicators,
+        handles=compiler.handles,
+        entry=compiler.function(entry_source),
+        exit=compiler.function(exit_source),
+        side=side,
+        quantity=quantity,
+        params=params,
+        symbol_token=symbol_token,
+        exchange=exchange,
+        symbol=symbol,
+        product_type=product_type
+    )
+
+
+def validate_params_json(params_json: Optional[str]):
+    """Reject malformed JSON, and compile rule-format params to surface errors early."""
+    try:
+        params = json.loads(params_json or "{}")
+    except json.JSONDecodeError as e:
+        raise StrategyRuleError(f"params_json is not valid JSON: {e.msg}")
+    if is_rule_format(params):
+        compile_rules(params_json)
+
+
+class CompiledRuleCache:
+    """
+    Compiled evaluators by strategy id. Entries live until invalidate()
+    is called for that strategy (on edit or delete).
+    """
+
+    def __init__(self):
+        self._compiled: Dict[int, CompiledStrategy] = {}
+        self._lock = threading.Lock()
+
+    def get(self, strategy) -> Optional[CompiledStrategy]:
+        """The compiled evaluator for a Strategy, or None if it isn't in rule format."""
+        compiled = self._compiled.get(strategy.id)
+        if compiled is None:
+            try:
+                params = json.loads(strategy.params_json or "{}")
+            except json.JSONDecodeError as e:
+                raise StrategyRuleError(f"params_json is not valid JSON: {e.msg}")
+            if not is_rule_format(params):
+                return None
+            compiled = compile_rules(strategy.params_json)
+            with self._lock:
+                self._compiled[strategy.id] = compiled
+        return compiled
+
+    def invalidate(self, strategy_id: int):
+        with self._lock:
+            self._compiled.pop(strategy_id, None)
+
+    def __len__(self) -> int:
+        return len(self._compiled)
+
+
+RULE_CACHE = CompiledRuleCache()
@@ -0,0 +1,147 @@
+"""
+Strategy Runner - Drives one rule-based strategy from closed bars to trade intents
+
+Used by StrategyEngine in-process and by the strategy shard processes, so
+a strategy behaves the same wherever it runs. BarBuilder turns an
+instrument's ticks into the closed bars the runners consume.
+"""
+import math
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, Mapping, Optional
+from app.services.incremental_indicators import IndicatorSet
+from app.services.strategy_rules import CompiledStrategy, compile_rules
+
+
+@dataclass(frozen=True)
+class TradeIntent:
+    """A strategy's request to trade, handed to the execution layer."""
+    strategy_id: int
+    app_id: int
+    symbol_token: str
+    exchange: str
+    symbol: Optional[str]
+    side: str
+    quantity: int
+    signal: str  # entry or exit
+    price: float
+    bar_time: float
+    product_type: str = "INTRADAY"
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+class BarBuilder:
+    """
+    Aggregates one instrument's ticks into `interval`-second bars. A bar is
+    closed by the first tick of a later interval. Tick volume is the
+    cumulative day volume, so bar volume is the difference across the bar.
+    """
+    __slots__ = ("interval", "bar", "_volume_at_open", "_last_volume")
+
+    def __init__(self, interval: int = 60):
+        self.interval = interval
+        self.bar: Optional[Dict[str, float]] = None
+        self._volume_at_open = math.nan
+        self._last_volume = math.nan
+
+    def update(self, time_: float, ltp: float, volume: float = math.nan) -> Optional[Dict[str, float]]:
+        """Add a tick; returns the bar it closed, if any."""
+        start = time_ - time_ % self.interval
+        closed = None
+        bar = self.bar
+        if bar is not None and start > bar["time"]:
+            closed, bar = bar, None
+        if bar is None:
+            self.bar = bar = {"time": start, "open": ltp, "high": ltp, "low": ltp, "close": ltp, "volume": 0.0}
+            self._volume_at_open = self._last_volume
+        else:
+            if ltp > bar["high"]:
+                bar["high"] = ltp
+            elif ltp < bar["low"]:
+                bar["low"] = ltp
+            bar["close"] = ltp
+        if not math.isnan(volume):
+            if math.isnan(self._volume_at_open):
+                self._volume_at_open = volume
+            self._last_volume = volume
+            bar["volume"] = volume - self._volume_at_open
+        return closed
+
+    def state(self) -> list:
+        return [self.bar and dict(self.bar), self._volume_at_open, self._last_volume]
+
+    def restore(self, state: list):
+        self.bar, self._volume_at_open, self._last_volume = state
+
+
+class StrategyRunner:
+    """Indicator state, compiled rules and position flag for one strategy."""
+    __slots__ = ("strategy_id", "app_id", "rules", "indicators", "in_position", "last_bar_time")
+
+    def __init__(self, strategy_id: int, app_id: int, rules: CompiledStrategy):
+        self.strategy_id = strategy_id
+        self.app_id = app_id
+        self.rules = rules
+        self.indicators = IndicatorSet(rules.indicators)
+        self.in_position = False
+        self.last_bar_time: Optional[float] = None
+
+    @classmethod
+    def from_params(cls, strategy_id: int, app_id: int, params_json: str) -> "StrategyRunner":
+        return cls(strategy_id, app_id, compile_rules(params_json))
+
+    @property
+    def symbol_token(self) -> Optional[str]:
+        return self.rules.symbol_token
+
+    def state(self) -> Dict[str, Any]:
+        return {
+            "in_position": self.in_position,
+            "last_bar_time": self.last_bar_time,
+            "indicators": self.indicators.state(),
+            "rules": self.rules.state(),
+        }
+
+    def restore(self, state: Mapping[str, Any]):
+        self.indicators.restore(state["indicators"])
+        self.rules.restore(state["rules"])
+        self.in_position = state["in_position"]
+        self.last_bar_time = state["last_bar_time"]
+
+    def on_bar(self, bar: Mapping[str, float], evaluate: bool = True) -> Optional[TradeIntent]:
+        """
+        Feed one closed bar (time, open, high, low, close, volume). Bars at
+        or before the last one seen are ignored. With evaluate=False (catching
+        up on missed bars) only the indicator state advances; no signal is
+        taken, so the position flag stays in line with real orders.
+        """
+        time_ = bar.get("time")
+        if time_ is not None:
+            if self.last_bar_time is not None and time_ <= self.last_bar_time:
+                return None
+            self.last_bar_time = time_
+        rules = self.rules
+        rules.update(self.indicators.update(bar))
+        if not evaluate:
+            return None
+        signal = rules.signal(self.in_position)
+        if signal is None:
+            return None
+        self.in_position = signal == "entry"
+        side = rules.side
+        if signal == "exit":
+            side = "SELL" if side == "BUY" else "BUY"
+        return TradeIntent(
+            strategy_id=self.strategy_id,
+            app_id=self.app_id,
+            symbol_token=rules.symbol_token,
+            exchange=rules.exchange,
+            symbol=rules.symbol,
+            side=side,
+            quantity=rules.quantity,
+            signal=signal,
+            price=bar["close"],
+            bar_time=bar.get("time", 0.0),
+            product_type=rules.product_type
+        )
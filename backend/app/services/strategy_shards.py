@@ -0,0 +1,378 @@
+"""
+Strategy Shards - Run rule-based strategies across worker processes
+
+With STRATEGY_SHARDS > 0, StrategyEngine hands strategies to shard
+processes instead of evaluating them on the API process's event loop, so
+100+ strategies are not serialized by one GIL. Market events reach every
+shard through the shared-memory TickBus; each shard evaluates only the
+strategies it owns and sends trade intents back over a queue to the API
+process, where the execution layer places the orders.
+
+Strategies are sent to a shard as (id, app_id, params_json) and compiled
+there, since compiled rules can't be pickled. Shards report their
+strategy count, bus lag and gaps once a second, and return their
+strategies' state on request for warm-restart snapshots.
+
+Commands travel over a queue while events travel over the bus, so the
+parent also counts the commands it has issued to each shard in shared
+memory. After each poll a shard applies commands until it has caught up
+with that count, so a strategy added before a bar was published always
+sees that bar.
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import threading
+import time
+import traceback
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from app.services import metrics
+from app.services.strategy_rules import StrategyRuleError, compile_rules
+from app.services.strategy_runner import StrategyRunner, TradeIntent
+from app.services.tick_bus import BAR, EXCHANGE_CODES, REPLAY, TickBus, TickBusReader
+
+logger = logging.getLogger(__name__)
+
+STRATEGY_SHARDS = int(os.getenv("STRATEGY_SHARDS", "0"))
+# Longest a shard sleeps when the bus is idle
+SHARD_IDLE_SLEEP = 0.002
+STATS_INTERVAL = 1.0
+
+SHARD_STRATEGIES = metrics.gauge(
+    "strategy_shard_strategies",
+    "Strategies assigned to each shard process",
+    ("shard",)
+)
+SHARD_LAG = metrics.gauge(
+    "strategy_shard_lag_events",
+    "Tick bus events published but not yet read by each shard",
+    ("shard",)
+)
+SHARD_GAPS = metrics.counter(
+    "strategy_shard_gap_events_total",
+    "Tick bus events a shard missed because it fell a full ring behind",
+    ("shard",)
+)
+SHARD_INTENTS = metrics.counter(
+    "strategy_shard_intents_total",
+    "Trade intents received from shard processes",
+    ("shard",)
+)
+
+IntentHandler = Callable[[TradeIntent], Any]
+
+
+def _shard_main(index: int, bus_name: str, commands, issued, results):
+    """Shard process loop: apply commands, evaluate bars from the bus, report."""
+    # The bus is created with the shards, so nothing published is skipped
+    reader = TickBusReader(bus_name, from_start=True)
+    applied = 0
+    runners: Dict[int, StrategyRunner] = {}
+    by_instrument: Dict[Tuple[int, int], List[StrategyRunner]] = {}
+    paused = set()
+    bars_seen = 0
+    next_report = 0.0
+    idle_sleep = 0.0
+
+    def reindex():
+        by_instrument.clear()
+        for strategy_id, runner in runners.items():
+            if strategy_id not in paused:
+                key = (EXCHANGE_CODES[runner.rules.exchange], int(runner.symbol_token))
+                by_instrument.setdefault(key, []).append(runner)
+
+    try:
+        while True:
+            events = reader.poll()
+            changed = False
+            while applied < issued[index]:
+                command = commands.get()
+                applied += 1
+                action = command[0]
+                if action == "stop":
+                    return
+                if action == "snapshot":
+                    states = {strategy_id: runner.state() for strategy_id, runner in runners.items()}
+                    results.put(("snapshot", index, command[1], states))
+                    continue
+                strategy_id = command[1]
+                if action == "add":
+                    try:
+                        runner = StrategyRunner.from_params(strategy_id, command[2], command[3])
+                        if command[4] is not None:
+                            runner.restore(command[4])
+                        runners[strategy_id] = runner
+                    except Exception as e:
+                        results.put(("error", index, strategy_id, f"Could not load strategy: {e}"))
+                    paused.discard(strategy_id)
+                elif action == "remove":
+                    runners.pop(strategy_id, None)
+                    paused.discard(strategy_id)
+                elif action == "pause":
+                    paused.add(strategy_id)
+                changed = True
+            if changed:
+                reindex()
+
+            for event in events:
+                if event.kind != BAR and event.kind != REPLAY:
+                    continue
+                group = by_instrument.get((event.exchange, event.token))
+                if not group:
+                    continue
+                bars_seen += 1
+                bar = {
+                    "time": event.time, "open": event.open, "high": event.high,
+                    "low": event.low, "close": event.close, "volume": event.volume
+                }
+                for runner in group:
+                    try:
+                        intent = runner.on_bar(bar, event.kind == BAR)
+                    except Exception:
+                        results.put(("error", index, runner.strategy_id, traceback.format_exc()))
+                        continue
+                    if intent is not None:
+                        results.put(("intent", index, intent.to_dict()))
+
+            now = time.monotonic()
+            if now >= next_report:
+                results.put(("stats", index, {
+                    "strategies": len(runners), "paused": len(paused), "bars": bars_seen,
+                    "lag": reader.lag, "gaps": reader.gaps
+                }))
+                next_report = now + STATS_INTERVAL
+            if events:
+                idle_sleep = 0.0
+            else:
+                # Back off gradually so a quiet bus costs little CPU
+                idle_sleep = min(SHARD_IDLE_SLEEP, idle_sleep + 0.0002)
+                time.sleep(idle_sleep)
+    finally:
+        reader.close()
+
+
+class StrategyShardPool:
+    """
+    Owns the tick bus, the shard processes and the thread that receives
+    their intents. Processes are started with the first strategy.
+    """
+    _instance = None
+
+    def __init__(self, shards: Optional[int] = None, bus_capacity: Optional[int] = None):
+        if StrategyShardPool._instance is not None:
+            raise Exception("StrategyShardPool is a singleton")
+        StrategyShardPool._instance = self
+        self.shards = STRATEGY_SHARDS if shards is None else shards
+        self.bus_capacity = bus_capacity
+        self.bus: Optional[TickBus] = None
+        self._processes: List[multiprocessing.Process] = []
+        self._commands: List[Any] = []
+        self._issued = None
+        self._results = None
+        self._listener: Optional[threading.Thread] = None
+        self._assignments: Dict[int, int] = {}
+        self._stats: Dict[int, Dict[str, Any]] = {}
+        self._intent_handler: Optional[IntentHandler] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+        self._snapshot_ready = threading.Condition()
+        self._snapshot_request = 0
+        self._snapshot_replies: Dict[int, Dict[int, Any]] = {}
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    @property
+    def enabled(self) -> bool:
+        return self.shards > 0
+
+    @property
+    def running(self) -> bool:
+        return self.bus is not None
+
+    def set_intent_handler(self, handler: Optional[IntentHandler], loop: Optional[asyncio.AbstractEventLoop] = None):
+        """
+        Called with each TradeIntent from the shards. Coroutine handlers are
+        scheduled on `loop` (default: the running loop at registration).
+        """
+        if loop is None:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                loop = None
+        self._intent_handler = handler
+        self._loop = loop
+
+    def _start(self):
+        context = multiprocessing.get_context("spawn")
+        self.bus = TickBus(self.bus_capacity)
+        self._results = context.Queue()
+        self._issued = context.RawArray("Q", self.shards)
+        for index in range(self.shards):
+            commands = context.Queue()
+            process = context.Process(
+                target=_shard_main,
+                args=(index, self.bus.name, commands, self._issued, self._results),
+                name=f"strategy-shard-{index}",
+                daemon=True
+            )
+            process.start()
+            self._commands.append(commands)
+            self._processes.append(process)
+        self._listener = threading.Thread(target=self._listen, name="strategy-shard-results", daemon=True)
+        self._listener.start()
+        logger.info("Started %d strategy shards", self.shards)
+
+    def _listen(self):
+        while True:
+            message = self._results.get()
+            if message is None:
+                return
+            kind, index = message[0], message[1]
+            if kind == "intent":
+                SHARD_INTENTS.labels(str(index)).inc()
+                self._dispatch(TradeIntent(**message[2]))
+            elif kind == "stats":
+                self._record_stats(index, message[2])
+            elif kind == "snapshot":
+                with self._snapshot_ready:
+                    if message[2] == self._snapshot_request:
+                        self._snapshot_replies[index] = message[3]
+                        self._snapshot_ready.notify_all()
+            elif kind == "error":
+                logger.error("Strategy %s failed in shard %d: %s", message[2], index, message[3],
+                             extra={"strategy_id": message[2], "shard": index})
+
+    def _record_stats(self, index: int, stats: Dict[str, Any]):
+        shard = str(index)
+        previous = self._stats.get(index, {}).get("gaps", 0)
+        if stats["gaps"] > previous:
+            SHARD_GAPS.labels(shard).inc(stats["gaps"] - previous)
+            logger.warning("Shard %d missed %d tick bus events", index, stats["gaps"] - previous)
+        SHARD_STRATEGIES.labels(shard).set(stats["strategies"])
+        SHARD_LAG.labels(shard).set(stats["lag"])
+        self._stats[index] = stats
+
+    def _dispatch(self, intent: TradeIntent):
+        handler = self._intent_handler
+        if handler is None:
+            logger.warning("Dropping trade intent with no handler", extra=intent.to_dict())
+            return
+        try:
+            if asyncio.iscoroutinefunction(handler):
+                if self._loop is None or self._loop.is_closed():
+                    logger.warning("Dropping trade intent: no event loop", extra=intent.to_dict())
+                    return
+                asyncio.run_coroutine_threadsafe(handler(intent), self._loop)
+            else:
+                handler(intent)
+        except Exception:
+            logger.exception("Trade intent handler failed", extra=intent.to_dict())
+
+    def _send(self, index: int, command: tuple):
+        # Called with self._lock held; the count is raised after the put so a
+        # shard that sees it can always get() the command
+        self._commands[index].put(command)
+        self._issued[index] += 1
+
+    def add_strategy(self, strategy_id: int, app_id: int, params_json: str, state: Optional[Dict[str, Any]] = None) -> int:
+        """
+        Assign a strategy to the least-loaded shard (or its current one) and
+        return the shard index. `state` is a StrategyRunner.state() to resume
+        from. Raises StrategyRuleError for invalid rules.
+        """
+        rules = compile_rules(params_json)
+        if rules.symbol_token is None:
+            raise StrategyRuleError("symbol_token: required to run in a shard")
+        with self._lock:
+            if self.bus is None:
+                self._start()
+            index = self._assignments.get(strategy_id)
+            if index is None:
+                loads = [0] * self.shards
+                for assigned in self._assignments.values():
+                    loads[assigned] += 1
+                index = loads.index(min(loads))
+                self._assignments[strategy_id] = index
+            self._send(index, ("add", strategy_id, app_id, params_json, state))
+        return index
+
+    def remove_strategy(self, strategy_id: int):
+        with self._lock:
+            index = self._assignments.pop(strategy_id, None)
+            if index is not None:
+                self._send(index, ("remove", strategy_id))
+
+    def pause_strategy(self, strategy_id: int):
+        """Stop evaluating a strategy; add_strategy() resumes it from fresh state."""
+        with self._lock:
+            index = self._assignments.get(strategy_id)
+            if index is not None:
+                self._send(index, ("pause", strategy_id))
+
+    def publish_tick(self, exchange: str, token, ltp: float, **fields):
+        if self.bus is not None:
+            self.bus.publish_tick(exchange, token, ltp, **fields)
+
+    def publish_bar(self, exchange: str, token, time_: float, open_: float, high: float, low: float,
+                    close: float, volume: float = 0.0, interval: int = 60, replay: bool = False):
+        if self.bus is not None:
+            self.bus.publish_bar(exchange, token, time_, open_, high, low, close, volume, interval, replay=replay)
+
+    def snapshot_strategies(self, timeout: float = 5.0) -> Dict[int, Any]:
+        """
+        StrategyRunner state of every sharded strategy by id. Blocks until
+        every shard has answered or `timeout`; missing shards are logged.
+        """
+        with self._lock:
+            if self.bus is None:
+                return {}
+            with self._snapshot_ready:
+                self._snapshot_request += 1
+                request = self._snapshot_request
+                self._snapshot_replies = {}
+            for index in range(self.shards):
+                self._send(index, ("snapshot", request))
+        deadline = time.monotonic() + timeout
+        with self._snapshot_ready:
+            while len(self._snapshot_replies) < self.shards:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    logger.warning("Only %d of %d shards answered the snapshot request",
+                                   len(self._snapshot_replies), self.shards)
+                    break
+                self._snapshot_ready.wait(remaining)
+            replies = self._snapshot_replies
+        return {strategy_id: state for states in replies.values() for strategy_id, state in states.items()}
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "shards": self.shards,
+            "running": self.running,
+            "published": self.bus.published if self.bus is not None else 0,
+            "assignments": len(self._assignments),
+            "shard_stats": {index: dict(stats) for index, stats in self._stats.items()},
+        }
+
+    def shutdown(self, timeout: float = 5.0):
+        """Stop the shard processes and release the bus."""
+        with self._lock:
+            if self.bus is None:
+                return
+            for index in range(self.shards):
+                self._send(index, ("stop",))
+            for process in self._processes:
+                process.join(timeout)
+                if process.is_alive():
+                    process.terminate()
+            self._results.put(None)
+            self._listener.join(timeout)
+            self.bus.close()
+            self.bus = None
+            self._processes, self._commands = [], []
+            self._assignments.clear()
+            self._stats.clear()
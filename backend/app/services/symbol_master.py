@@ -0,0 +1,398 @@
+"""
+Symbol Master - Instrument lookup by exchange and trading symbol or token
+
+The broker's symbol master is downloaded once per trading day and shared,
+so order placement, the option chain and anything else that needs tokens,
+lot sizes or tick sizes use one copy.
+
+The master is a JSON list of several hundred thousand rows, so it is
+streamed to disk and parsed a row at a time into columns rather than
+loaded whole: integer tokens, NumPy arrays for strike, lot size, tick
+size and expiry, interned codes for exchange, name and instrument type,
+and one UTF-8 blob for the trading symbols. The columns are saved as .npy
+files under SYMBOL_MASTER_DIR and memory-mapped, so every process that
+opens the day's master shares one copy through the page cache. Instrument
+objects are only built for the rows that are looked up.
+
+The master has no freeze quantities (the largest order the exchange
+accepts per contract), so those come from FREEZE_QUANTITIES, keyed by
+underlying, which ORDER_FREEZE_QUANTITIES ("NIFTY=1801,BANKNIFTY=901")
+extends or overrides when the exchange revises them.
+"""
+import asyncio
+import bisect
+import json
+import logging
+import os
+import re
+import shutil
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+import numpy as np
+from app.services.smartapi_client import SmartAPIClient
+
+logger = logging.getLogger(__name__)
+
+IST = timezone(timedelta(hours=5, minutes=30))
+
+SYMBOL_MASTER_DIR = Path(os.getenv("SYMBOL_MASTER_DIR", "./symbol_master"))
+
+# Exchange freeze quantities for index derivatives, in units; orders must be smaller
+FREEZE_QUANTITIES: Dict[str, int] = {
+    "NIFTY": 1801,
+    "BANKNIFTY": 901,
+    "FINNIFTY": 1801,
+    "MIDCPNIFTY": 2801,
+    "NIFTYNXT50": 601,
+    "SENSEX": 1001,
+    "BANKEX": 901,
+}
+DERIVATIVE_EXCHANGES = ("NFO", "BFO", "MCX", "CDS")
+
+
+def _parse_freeze_quantities(value: str) -> Dict[str, int]:
+    overrides = {}
+    for item in value.split(","):
+        if "=" in item:
+            name, quantity = item.split("=", 1)
+            overrides[name.strip().upper()] = int(quantity)
+    return overrides
+
+
+FREEZE_QUANTITIES.update(_parse_freeze_quantities(os.getenv("ORDER_FREEZE_QUANTITIES", "")))
+
+
+def _number(value, default: float = 0.0) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+@dataclass(frozen=True)
+class Instrument:
+    token: str
+    symbol: str
+    name: str
+    exchange: str
+    instrument_type: str  # "" for equities, OPTIDX, FUTSTK, ...
+    expiry: str
+    strike: float
+    lot_size: int
+    tick_size: float
+
+
+_READ_SIZE = 1 << 20
+_ROW_LIST = re.compile(r'"data"\s*:\s*\[')
+_EXPIRY_FORMAT = "%d%b%Y"
+_EPOCH = date(1970, 1, 1)
+_NO_EXPIRY = np.iinfo(np.int64).min  # NaT as datetime64[D]
+
+
+def iter_master_rows(path: Path) -> Iterator[Dict[str, Any]]:
+    """
+    Yield the rows of a downloaded symbol master one at a time. The file is
+    either the bare row list or a {"data": [...]} response envelope.
+    """
+    decoder = json.JSONDecoder()
+    with open(path, "r", encoding="utf-8") as f:
+        buffer, eof = f.read(_READ_SIZE), False
+
+        def refill(keep_from: int):
+            nonlocal buffer, eof
+            chunk = f.read(_READ_SIZE)
+            eof = not chunk
+            buffer = buffer[keep_from:] + chunk
+
+        while True:
+            stripped = buffer.lstrip()
+            if stripped.startswith("["):
+                position = len(buffer) - len(stripped) + 1
+                break
+            match = _ROW_LIST.search(buffer)
+            if match:
+                position = match.end()
+                break
+            if eof:
+                raise ValueError(f"No instrument list in symbol master: {buffer[:200]}")
+            refill(0)
+
+        while True:
+            while position < len(buffer) and buffer[position] in " \t\r\n,":
+                position += 1
+            if position >= len(buffer):
+                if eof:
+                    raise ValueError("Symbol master ends inside the instrument list")
+                refill(position)
+                position = 0
+                continue
+            if buffer[position] == "]":
+                return
+            try:
+                row, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                refill(position)  # the row continues in the next chunk
+                position = 0
+                continue
+            yield row
+
+
+class _ColumnBuilder:
+    """Accumulates rows into the columns SymbolMaster stores."""
+
+    def __init__(self):
+        self.tokens: List[int] = []
+        self.exchanges: List[int] = []
+        self.names: List[int] = []
+        self.instrument_types: List[int] = []
+        self.expiries: List[int] = []
+        self.strikes: List[float] = []
+        self.lot_sizes: List[int] = []
+        self.tick_sizes: List[float] = []
+        self.symbols = bytearray()
+        self.symbol_offsets: List[int] = [0]
+        self.tables: Dict[str, Dict[str, int]] = {"exchange": {}, "name": {}, "instrument_type": {}}
+        self._expiry_days: Dict[str, int] = {}
+        self.skipped = 0
+
+    def _code(self, table: str, value: str) -> int:
+        codes = self.tables[table]
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(codes)
+        return code
+
+    def _expiry(self, expiry: str) -> int:
+        days = self._expiry_days.get(expiry)
+        if days is None:
+            try:
+                days = (datetime.strptime(expiry, _EXPIRY_FORMAT).date() - _EPOCH).days
+            except ValueError:
+                days = _NO_EXPIRY
+            self._expiry_days[expiry] = days
+        return days
+
+    def add(self, row: Dict[str, Any]):
+        """One symbol master row. Strikes and tick sizes are given in paise."""
+        try:
+            token = int(row["token"])
+        except (KeyError, TypeError, ValueError):
+            self.skipped += 1
+            return
+        self.tokens.append(token)
+        self.exchanges.append(self._code("exchange", row.get("exch_seg", "")))
+        self.names.append(self._code("name", row.get("name", "")))
+        self.instrument_types.append(self._code("instrument_type", row.get("instrumenttype", "")))
+        self.expiries.append(self._expiry(row.get("expiry", "").upper()))
+        self.strikes.append(_number(row.get("strike")) / 100.0)
+        self.lot_sizes.append(max(1, int(_number(row.get("lotsize"), 1))))
+        self.tick_sizes.append(_number(row.get("tick_size"), 5.0) / 100.0)
+        self.symbols += row.get("symbol", "").encode()
+        self.symbol_offsets.append(len(self.symbols))
+
+    def build(self) -> "SymbolMaster":
+        exchanges = np.array(self.exchanges, dtype=np.uint8)
+        tokens = np.array(self.tokens, dtype=np.int64)
+        token_keys = (exchanges.astype(np.int64) << 48) | tokens
+        token_order = np.argsort(token_keys, kind="stable").astype(np.int32)
+        blob = bytes(self.symbols)
+        offsets = self.symbol_offsets
+        symbol_order = sorted(
+            range(len(tokens)),
+            key=lambda i: (self.exchanges[i], blob[offsets[i]:offsets[i + 1]].decode().upper())
+        )
+        columns = {
+            "token": tokens,
+            "exchange": exchanges,
+            "name": np.array(self.names, dtype=np.uint32),
+            "instrument_type": np.array(self.instrument_types, dtype=np.uint16),
+            "expiry": np.array(self.expiries, dtype=np.int64).view("datetime64[D]"),
+            "strike": np.array(self.strikes, dtype=np.float64),
+            "lot_size": np.array(self.lot_sizes, dtype=np.int32),
+            "tick_size": np.array(self.tick_sizes, dtype=np.float64),
+            "symbols": np.frombuffer(blob, dtype=np.uint8),
+            "symbol_offsets": np.array(offsets, dtype=np.int64),
+            "token_keys": token_keys[token_order],
+            "token_order": token_order,
+            "symbol_order": np.array(symbol_order, dtype=np.int32),
+        }
+        tables = {table: list(codes) for table, codes in self.tables.items()}
+        return SymbolMaster(columns, tables)
+
+
+class SymbolMaster:
+    """Instruments in columnar form, looked up by (exchange, symbol) or (exchange, token)."""
+    COLUMNS = (
+        "token", "exchange", "name", "instrument_type", "expiry", "strike", "lot_size", "tick_size",
+        "symbols", "symbol_offsets", "token_keys", "token_order", "symbol_order",
+    )
+
+    def __init__(self, columns: Dict[str, np.ndarray], tables: Dict[str, List[str]]):
+        self.columns = columns
+        self.tables = tables
+        self._exchange_codes = {exchange: code for code, exchange in enumerate(tables["exchange"])}
+        self._symbols = columns["symbols"]
+        self._symbol_offsets = columns["symbol_offsets"]
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Dict[str, Any]]) -> "SymbolMaster":
+        builder = _ColumnBuilder()
+        for row in rows:
+            builder.add(row)
+        if builder.skipped:
+            logger.info("Skipped %d symbol master rows without a numeric token", builder.skipped)
+        return builder.build()
+
+    @classmethod
+    def open(cls, path: Path) -> "SymbolMaster":
+        """Memory-map a master saved by save()."""
+        path = Path(path)
+        tables = json.loads((path / "tables.json").read_text())
+        columns = {name: np.load(path / f"{name}.npy", mmap_mode="r") for name in cls.COLUMNS}
+        return cls(columns, tables)
+
+    def save(self, path: Path):
+        """Write the columns under `path`, atomically replacing nothing that is already there."""
+        path = Path(path)
+        staging = path.with_name(f".{path.name}.{os.getpid()}")
+        shutil.rmtree(staging, ignore_errors=True)
+        staging.mkdir(parents=True)
+        for name in self.COLUMNS:
+            np.save(staging / f"{name}.npy", np.asarray(self.columns[name]))
+        (staging / "tables.json").write_text(json.dumps(self.tables))
+        try:
+            staging.rename(path)
+        except OSError:
+            # Another process saved the same day first; theirs is identical
+            shutil.rmtree(staging, ignore_errors=True)
+
+    def __len__(self) -> int:
+        return len(self.columns["token"])
+
+    def __iter__(self) -> Iterator[Instrument]:
+        return (self._instrument(i) for i in range(len(self)))
+
+    def _symbol(self, i: int) -> str:
+        return bytes(self._symbols[self._symbol_offsets[i]:self._symbol_offsets[i + 1]]).decode()
+
+    def _instrument(self, i: int) -> Instrument:
+        columns = self.columns
+        expiry = columns["expiry"][i]
+        return Instrument(
+            token=str(int(columns["token"][i])),
+            symbol=self._symbol(i),
+            name=self.tables["name"][columns["name"][i]],
+            exchange=self.tables["exchange"][columns["exchange"][i]],
+            instrument_type=self.tables["instrument_type"][columns["instrument_type"][i]],
+            expiry="" if np.isnat(expiry) else expiry.astype(date).strftime(_EXPIRY_FORMAT).upper(),
+            strike=float(columns["strike"][i]),
+            lot_size=int(columns["lot_size"][i]),
+            tick_size=float(columns["tick_size"][i])
+        )
+
+    def resolve(self, exchange: str, symbol: str) -> Optional[Instrument]:
+        code = self._exchange_codes.get(exchange.upper())
+        if code is None:
+            return None
+        target = (code, symbol.upper())
+        exchanges, order = self.columns["exchange"], self.columns["symbol_order"]
+        position = bisect.bisect_left(order, target, key=lambda i: (int(exchanges[i]), self._symbol(i).upper()))
+        if position < len(order) and int(exchanges[order[position]]) == code \
+                and self._symbol(order[position]).upper() == target[1]:
+            return self._instrument(int(order[position]))
+        return None
+
+    def get(self, exchange: str, token: str) -> Optional[Instrument]:
+        code = self._exchange_codes.get(exchange.upper())
+        try:
+            key = (code << 48) | int(token) if code is not None else None
+        except (TypeError, ValueError):
+            return None
+        if key is None:
+            return None
+        keys = self.columns["token_keys"]
+        position = int(np.searchsorted(keys, key))
+        if position < len(keys) and keys[position] == key:
+            return self._instrument(int(self.columns["token_order"][position]))
+        return None
+
+    def freeze_quantity(self, instrument: Instrument) -> Optional[int]:
+        """Freeze quantity for a derivative contract, or None if orders of any size are accepted."""
+        if instrument.exchange not in DERIVATIVE_EXCHANGES:
+            return None
+        return FREEZE_QUANTITIES.get(instrument.name.upper())
+
+    def instruments(self, exchange: Optional[str] = None) -> List[Instrument]:
+        if exchange is None:
+            return list(self)
+        code = self._exchange_codes.get(exchange)
+        if code is None:
+            return []
+        return [self._instrument(int(i)) for i in np.flatnonzero(self.columns["exchange"] == code)]
+
+
+class SymbolMasterService:
+    """Downloads, converts and memory-maps the symbol master once per trading day."""
+    _instance = None
+
+    def __init__(self, directory: Optional[Path] = None):
+        if SymbolMasterService._instance is not None:
+            raise Exception("SymbolMasterService is a singleton")
+        SymbolMasterService._instance = self
+        self.directory = Path(directory or SYMBOL_MASTER_DIR)
+        self._master: Optional[SymbolMaster] = None
+        self._loaded_on = None
+        self._lock = asyncio.Lock()
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    @property
+    def master(self) -> Optional[SymbolMaster]:
+        """The last loaded master, without checking whether it is stale."""
+        return self._master
+
+    def path_for(self, day: date) -> Path:
+        """Where the master for `day` is saved; other processes can SymbolMaster.open() it."""
+        return self.directory / day.isoformat()
+
+    async def load(self, client: SmartAPIClient) -> SymbolMaster:
+        async with self._lock:
+            today = datetime.now(IST).date()
+            if self._master is None or self._loaded_on != today:
+                path = self.path_for(today)
+                if not (path / "tables.json").exists():
+                    await self._download(client, path)
+                self._master = await asyncio.to_thread(SymbolMaster.open, path)
+                self._loaded_on = today
+                logger.info("Loaded symbol master with %d instruments", len(self._master))
+        return self._master
+
+    async def _download(self, client: SmartAPIClient, path: Path):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        download = path.with_name(f"{path.name}.{os.getpid()}.json")
+        try:
+            result = await client.download_symbol_master(str(download))
+            if not result.get("success") or result.get("stale"):
+                raise RuntimeError(f"Symbol master unavailable: {result.get('error', 'unexpected response')}")
+            await asyncio.to_thread(self._convert, download, path)
+        finally:
+            download.unlink(missing_ok=True)
+
+    def _convert(self, download: Path, path: Path):
+        try:
+            master = SymbolMaster.from_rows(iter_master_rows(download))
+        except ValueError as e:
+            raise RuntimeError(f"Symbol master unavailable: {e}")
+        master.save(path)
+        # Earlier days are no longer needed; processes still mapping them keep their copy
+        for old in self.directory.iterdir():
+            if old.is_dir() and old != path and not old.name.startswith("."):
+                shutil.rmtree(old, ignore_errors=True)
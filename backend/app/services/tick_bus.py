@@ -0,0 +1,171 @@
+"""
+Tick Bus - Single-writer, many-reader ring buffer of market events in shared memory
+
+The API process publishes ticks and bar closes; strategy shard processes
+read them without locks or pickling. Every event carries a sequence
+number. A slot's sequence number is cleared while the slot is being
+written and set last, and readers check it before and after copying the
+record, so a reader that falls more than `capacity` events behind sees a
+gap (counted, then skipped) instead of a torn record.
+
+Layout: a 64-byte header holding the capacity and the last published
+sequence number, followed by `capacity` fixed-size records.
+"""
+import math
+import os
+import struct
+import threading
+import time
+from multiprocessing import shared_memory
+from typing import List, NamedTuple, Optional
+from app.services import metrics
+
+# REPLAY is a missed bar re-sent after a restart, for indicator state only
+TICK, BAR, REPLAY = 1, 2, 3
+EXCHANGES = ("NSE", "NFO", "BSE", "BFO", "MCX", "CDS")
+EXCHANGE_CODES = {exchange: code for code, exchange in enumerate(EXCHANGES)}
+
+TICK_BUS_CAPACITY = int(os.getenv("TICK_BUS_CAPACITY", "65536"))
+
+_HEADER = struct.Struct("<IIQ")  # capacity, record size, last published sequence
+_HEADER_SIZE = 64
+_CURSOR_OFFSET = 8
+# seq, kind, exchange, interval seconds, token, time, open, high, low, close, volume, oi
+_RECORD = struct.Struct("<QHHIqddddddd")
+_SEQ = struct.Struct("<Q")
+
+EVENTS_PUBLISHED = metrics.counter(
+    "tick_bus_events_total",
+    "Events published to the strategy tick bus",
+    ("kind",)
+)
+_TICKS_PUBLISHED = EVENTS_PUBLISHED.labels("tick")
+_BARS_PUBLISHED = EVENTS_PUBLISHED.labels("bar")
+
+
+class TickEvent(NamedTuple):
+    seq: int
+    kind: int
+    exchange: int
+    interval: int
+    token: int
+    time: float
+    open: float
+    high: float
+    low: float
+    close: float  # last traded price for ticks
+    volume: float
+    oi: float
+
+
+class TickBus:
+    """Writer side. Owns the shared-memory block; one publisher at a time."""
+
+    def __init__(self, capacity: Optional[int] = None):
+        self.capacity = capacity or TICK_BUS_CAPACITY
+        self._block = shared_memory.SharedMemory(create=True, size=_HEADER_SIZE + self.capacity * _RECORD.size)
+        self._buf = self._block.buf
+        self._buf[:_HEADER_SIZE] = bytes(_HEADER_SIZE)
+        _HEADER.pack_into(self._buf, 0, self.capacity, _RECORD.size, 0)
+        self._seq = 0
+        self._lock = threading.Lock()
+
+    @property
+    def name(self) -> str:
+        return self._block.name
+
+    @property
+    def published(self) -> int:
+        return self._seq
+
+    def _publish(self, kind: int, exchange: str, interval: int, token, time_: float,
+                 open_: float, high: float, low: float, close: float, volume: float, oi: float):
+        exchange_code = EXCHANGE_CODES[exchange]
+        with self._lock:
+            seq = self._seq + 1
+            offset = _HEADER_SIZE + (seq % self.capacity) * _RECORD.size
+            buf = self._buf
+            _SEQ.pack_into(buf, offset, 0)  # slot is being rewritten
+            _RECORD.pack_into(
+                buf, offset, 0, kind, exchange_code, interval, int(token), time_,
+                open_, high, low, close, volume, oi
+            )
+            _SEQ.pack_into(buf, offset, seq)
+            _SEQ.pack_into(buf, _CURSOR_OFFSET, seq)
+            self._seq = seq
+
+    def publish_tick(self, exchange: str, token, ltp: float, time_: Optional[float] = None,
+                     volume: float = math.nan, oi: float = math.nan):
+        self._publish(TICK, exchange, 0, token, time_ or time.time(), ltp, ltp, ltp, ltp, volume, oi)
+        _TICKS_PUBLISHED.inc()
+
+    def publish_bar(self, exchange: str, token, time_: float, open_: float, high: float, low: float,
+                    close: float, volume: float = 0.0, interval: int = 60, oi: float = math.nan,
+                    replay: bool = False):
+        """Publish a closed bar; `time_` is the bar's start time (epoch seconds)."""
+        self._publish(REPLAY if replay else BAR, exchange, interval, token, time_, open_, high, low, close, volume, oi)
+        _BARS_PUBLISHED.inc()
+
+    def close(self):
+        self._buf = None
+        self._block.close()
+        self._block.unlink()
+
+
+class TickBusReader:
+    """
+    Reader side, one per process. Starts at the current head unless
+    from_start is set; gaps counts events lost by falling behind.
+    """
+
+    def __init__(self, name: str, from_start: bool = False):
+        self._block = shared_memory.SharedMemory(name=name)
+        self._buf = self._block.buf
+        self.capacity, record_size, head = _HEADER.unpack_from(self._buf, 0)
+        if record_size != _RECORD.size:
+            raise RuntimeError(f"Tick bus record size {record_size} does not match {_RECORD.size}")
+        self.next_seq = 1 if from_start else head + 1
+        self.gaps = 0
+
+    def head(self) -> int:
+        return _SEQ.unpack_from(self._buf, _CURSOR_OFFSET)[0]
+
+    @property
+    def lag(self) -> int:
+        """Published events not yet read."""
+        return max(0, self.head() - self.next_seq + 1)
+
+    def _skip_to_oldest(self, head: int):
+        # The slot after head may already be being rewritten, so resume one past it
+        oldest = head - self.capacity + 2
+        if oldest > self.next_seq:
+            self.gaps += oldest - self.next_seq
+            self.next_seq = oldest
+
+    def poll(self, max_events: int = 1024) -> List[TickEvent]:
+        """Events published since the last poll, oldest first, at most max_events."""
+        buf = self._buf
+        head = self.head()
+        if head - self.next_seq + 1 >= self.capacity:
+            self._skip_to_oldest(head)
+        events = []
+        seq = self.next_seq
+        last = min(head, seq + max_events - 1)
+        while seq <= last:
+            offset = _HEADER_SIZE + (seq % self.capacity) * _RECORD.size
+            record = _RECORD.unpack_from(buf, offset)
+            if record[0] != seq or _SEQ.unpack_from(buf, offset)[0] != seq:
+                # Overwritten while we were behind; resync to the oldest intact event
+                self.next_seq = seq
+                self._skip_to_oldest(self.head())
+                seq = self.next_seq
+                last = min(self.head(), seq + max_events - 1 - len(events))
+                continue
+            events.append(TickEvent._make(record))
+            seq += 1
+        self.next_seq = seq
+        return events
+
+    def close(self):
+        self._buf = None
+        self._block.close()
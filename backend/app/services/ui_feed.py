@@ -0,0 +1,293 @@
+"""
+UI Feed - Live updates pushed to the browser over the /ws/live WebSocket
+
+Updates are published per topic ("ticks", ...) and key ("NFO:43210").
+Each connection is sent only what changed since it last heard about a key:
+
+- Encoding is negotiated with the WebSocket subprotocol:
+  algopilot.msgpack.v1 (binary MessagePack frames) or algopilot.json.v1
+  (JSON text frames, also used when the client offers neither).
+- The first frame is always a JSON "hello" naming the encoding, each
+  topic's fields and PRICE_SCALE. Fields are sent by index, not name.
+- Prices that are a whole number of paise are sent as integers
+  (value * PRICE_SCALE), so they pack as small ints instead of float64
+  and compare exactly. Others, such as CDS quotes in 0.0025 ticks or
+  P&L with fractions of a paisa, are sent as the float itself, which is
+  never integral; so a client divides integers by PRICE_SCALE and takes
+  anything else as is.
+- The first update for a key carries every field; later ones only the
+  fields whose value changed.
+- Updates are batched into one frame per UI_FEED_FLUSH_INTERVAL. A key
+  that changes several times within an interval is sent once, with its
+  latest values, so a slow client falls behind by at most one frame.
+
+Data frame: [seq, [[topic index, key, {field index: value, ...}], ...]]
+
+Clients send JSON text: {"action": "subscribe" | "unsubscribe",
+"topic": "ticks", "keys": ["NSE:2885", ...]}; without keys a subscription
+covers the whole topic. A new subscription is sent the latest values at once.
+
+Keys of an owned topic ("pnl", ...) start with their owner ("account:3",
+"strategy:12"). A connection is sent those only if its may_see(owner)
+allows it, whether it subscribed to the keys or to the whole topic.
+"""
+import asyncio
+import json
+import logging
+import math
+import os
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional, Set, Tuple, Union
+from starlette.websockets import WebSocket, WebSocketDisconnect
+from app.services import metrics
+
+try:
+    import msgpack
+except ImportError:  # JSON frames only
+    msgpack = None
+
+logger = logging.getLogger(__name__)
+
+UI_FEED_FLUSH_INTERVAL = float(os.getenv("UI_FEED_FLUSH_INTERVAL", "0.1"))
+PRICE_SCALE = 100  # paise
+
+MSGPACK_PROTOCOL, JSON_PROTOCOL = "algopilot.msgpack.v1", "algopilot.json.v1"
+FEED_PROTOCOLS = {MSGPACK_PROTOCOL: "msgpack", JSON_PROTOCOL: "json"}
+
+FEED_CONNECTIONS = metrics.gauge("ui_feed_connections", "Open /ws/live connections")
+FEED_FRAMES = metrics.counter("ui_feed_frames_total", "Frames sent on /ws/live", ("encoding",))
+FEED_BYTES = metrics.counter("ui_feed_bytes_total", "Bytes of frames sent on /ws/live", ("encoding",))
+
+FeedKey = Tuple[int, str]  # (topic index, key)
+
+
+def key_owner(key: str) -> str:
+    """The owner an owned topic's key starts with: "account:3:NSE:2885:INTRADAY" -> "account:3"."""
+    return ":".join(key.split(":", 2)[:2])
+
+
+class Topic:
+    """A topic's fields, in wire order, which of them are prices, and whether its keys are owned."""
+
+    def __init__(self, index: int, name: str, fields: Iterable[str], prices: Iterable[str] = (), owned: bool = False):
+        self.index = index
+        self.name = name
+        self.fields = tuple(fields)
+        self.prices = frozenset(prices)
+        self.owned = owned
+        self._columns = [(i, field, field in self.prices) for i, field in enumerate(self.fields)]
+
+    def encode(self, values: Mapping[str, Any]) -> Dict[int, Any]:
+        """Field index -> wire value; missing, None and NaN fields are left out."""
+        encoded = {}
+        for i, field, is_price in self._columns:
+            value = values.get(field)
+            if value is None or (isinstance(value, float) and math.isnan(value)):
+                continue
+            if is_price:
+                scaled = value * PRICE_SCALE
+                ticks = round(scaled)
+                if abs(scaled - ticks) < 1e-6:
+                    value = ticks
+            elif isinstance(value, float) and value.is_integer():
+                value = int(value)
+            encoded[i] = value
+        return encoded
+
+
+def negotiate(offered: Iterable[str]) -> Tuple[Optional[str], str]:
+    """(subprotocol to accept with, encoding) for the client's offered subprotocols, in its order."""
+    for protocol in offered:
+        encoding = FEED_PROTOCOLS.get(protocol)
+        if encoding == "msgpack" and msgpack is None:
+            continue
+        if encoding:
+            return protocol, encoding
+    return None, "json"
+
+
+class FeedConnection:
+    """One browser: its subscriptions, what it was last sent, and what is waiting to go."""
+
+    def __init__(self, websocket: WebSocket, encoding: str, may_see: Optional[Callable[[str], bool]] = None):
+        self.websocket = websocket
+        self.encoding = encoding
+        self.may_see = may_see  # owner -> allowed; without it no owned key is sent
+        self.subscriptions: Dict[int, Optional[Set[str]]] = {}  # topic index -> keys, None for all
+        self.seq = 0
+        self._pending: Dict[FeedKey, Dict[int, Any]] = {}
+        self._sent: Dict[FeedKey, Dict[int, Any]] = {}
+        self._ready = asyncio.Event()
+
+    def wants(self, topic: int, key: str) -> bool:
+        if topic not in self.subscriptions:
+            return False
+        keys = self.subscriptions[topic]
+        return keys is None or key in keys
+
+    def sees(self, topic: Topic, key: str) -> bool:
+        return not topic.owned or (self.may_see is not None and self.may_see(key_owner(key)))
+
+    def queue(self, topic: int, key: str, values: Dict[int, Any]):
+        pending = self._pending.get((topic, key))
+        if pending is None:
+            self._pending[(topic, key)] = dict(values)
+        else:
+            pending.update(values)
+        self._ready.set()
+
+    def forget(self, topic: int, keys: Optional[Iterable[str]] = None):
+        """Drop what was sent for a topic's keys, so a later subscription starts from a full update."""
+        wanted = None if keys is None else set(keys)
+        for feed_key in [k for k in self._sent if k[0] == topic and (wanted is None or k[1] in wanted)]:
+            del self._sent[feed_key]
+            self._pending.pop(feed_key, None)
+
+    def take_frame(self) -> Optional[Union[bytes, str]]:
+        """Encode everything pending as one frame of deltas; None if nothing changed."""
+        messages: List[list] = []
+        for feed_key, values in self._pending.items():
+            sent = self._sent.get(feed_key)
+            if sent is None:
+                delta = values
+                self._sent[feed_key] = dict(values)
+            else:
+                delta = {i: value for i, value in values.items() if sent.get(i) != value}
+                sent.update(delta)
+            if delta:
+                messages.append([feed_key[0], feed_key[1], delta])
+        self._pending.clear()
+        if not messages:
+            return None
+        self.seq += 1
+        frame = [self.seq, messages]
+        if self.encoding == "msgpack":
+            return msgpack.packb(frame)
+        return json.dumps(frame, separators=(",", ":"))
+
+
+class UIFeed:
+    """Topics, connections and the latest values of every key."""
+    _instance = None
+
+    def __init__(self, flush_interval: float = UI_FEED_FLUSH_INTERVAL):
+        if UIFeed._instance is not None:
+            raise Exception("UIFeed is a singleton")
+        UIFeed._instance = self
+        self.flush_interval = flush_interval
+        self.topics: Dict[str, Topic] = {}
+        self.connections: Set[FeedConnection] = set()
+        self._latest: Dict[FeedKey, Dict[int, Any]] = {}
+        self.register_topic("ticks", ("ltp", "volume", "oi", "time"), prices=("ltp",))
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    def register_topic(self, name: str, fields: Iterable[str], prices: Iterable[str] = (), owned: bool = False) -> Topic:
+        topic = self.topics.get(name)
+        if topic is None:
+            topic = self.topics[name] = Topic(len(self.topics), name, fields, prices, owned)
+        return topic
+
+    def subscribed_keys(self, topic: str) -> Set[str]:
+        """Keys of a topic that some connection subscribed to by name (whole-topic subscriptions add none)."""
+        index = self.topics[topic].index
+        keys: Set[str] = set()
+        for connection in self.connections:
+            keys |= connection.subscriptions.get(index) or set()
+        return keys
+
+    def hello(self, encoding: str) -> Dict[str, Any]:
+        return {
+            "type": "hello",
+            "encoding": encoding,
+            "price_scale": PRICE_SCALE,
+            "topics": [
+                {"name": topic.name, "fields": list(topic.fields), "prices": sorted(topic.prices)}
+                for topic in self.topics.values()
+            ],
+        }
+
+    def publish(self, topic: str, key: str, values: Mapping[str, Any]):
+        """Record a key's latest values and queue them for every connection subscribed to it."""
+        feed_topic = self.topics[topic]
+        encoded = feed_topic.encode(values)
+        if not encoded:
+            return
+        feed_key = (feed_topic.index, key)
+        latest = self._latest.get(feed_key)
+        if latest is None:
+            self._latest[feed_key] = dict(encoded)
+        else:
+            latest.update(encoded)
+        for connection in self.connections:
+            if connection.wants(feed_topic.index, key) and connection.sees(feed_topic, key):
+                connection.queue(feed_topic.index, key, encoded)
+
+    async def serve(self, websocket: WebSocket, encoding: str, may_see: Optional[Callable[[str], bool]] = None):
+        """Run an accepted connection until the client goes away. `may_see` scopes owned topics."""
+        connection = FeedConnection(websocket, encoding, may_see)
+        self.connections.add(connection)
+        FEED_CONNECTIONS.set(len(self.connections))
+        sender = asyncio.create_task(self._send_frames(connection))
+        try:
+            await websocket.send_text(json.dumps(self.hello(encoding)))
+            while True:
+                text = await websocket.receive_text()
+                try:
+                    self._handle(connection, json.loads(text))
+                except (ValueError, TypeError, KeyError) as e:
+                    logger.debug("Ignoring feed message %r: %s", text[:200], e)
+        except WebSocketDisconnect:
+            pass
+        finally:
+            sender.cancel()
+            self.connections.discard(connection)
+            FEED_CONNECTIONS.set(len(self.connections))
+
+    def _handle(self, connection: FeedConnection, message: Mapping[str, Any]):
+        action = message["action"]
+        feed_topic = self.topics[message["topic"]]
+        topic = feed_topic.index
+        keys = message.get("keys")
+        if action == "subscribe":
+            current = connection.subscriptions.get(topic, set())
+            if keys is None or current is None:
+                connection.subscriptions[topic] = None
+            else:
+                connection.subscriptions[topic] = current | set(keys)
+            wanted = None if keys is None else set(keys)
+            for (latest_topic, key), values in self._latest.items():
+                if latest_topic == topic and (wanted is None or key in wanted) and connection.sees(feed_topic, key):
+                    connection.queue(topic, key, values)
+        elif action == "unsubscribe":
+            current = connection.subscriptions.get(topic)
+            if keys is None:
+                connection.subscriptions.pop(topic, None)
+            elif current is not None:
+                current.difference_update(keys)
+            connection.forget(topic, keys)
+        else:
+            raise ValueError(f"unknown action {action!r}")
+
+    async def _send_frames(self, connection: FeedConnection):
+        try:
+            while True:
+                await connection._ready.wait()
+                connection._ready.clear()
+                frame = connection.take_frame()
+                if frame is not None:
+                    if isinstance(frame, bytes):
+                        await connection.websocket.send_bytes(frame)
+                    else:
+                        await connection.websocket.send_text(frame)
+                    FEED_FRAMES.labels(connection.encoding).inc()
+                    FEED_BYTES.labels(connection.encoding).inc(len(frame))
+                # Batch whatever arrives meanwhile into the next frame
+                await asyncio.sleep(self.flush_interval)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.debug("Feed connection closed while sending", exc_info=True)
@@ -0,0 +1,87 @@
+"""
+Startup Profile - Phase timings and slowest imports during backend startup
+
+Phase timings are always collected. Per-module import timing wraps
+builtins.__import__ and is enabled with STARTUP_PROFILE=1; it must be
+installed before the heavy imports, so app.main imports this module first.
+"""
+import builtins
+import logging
+import os
+import sys
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+PROCESS_STARTED = time.perf_counter()
+
+
+class StartupProfile:
+    def __init__(self):
+        self.phases: List[Tuple[str, float]] = []
+        # module -> (cumulative seconds, self seconds excluding nested first-time imports)
+        self.imports: Dict[str, Tuple[float, float]] = {}
+        self._original_import = None
+        self._stack: List[float] = []
+
+    @contextmanager
+    def phase(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.perf_counter() - started))
+
+    def install_import_timer(self):
+        if self._original_import is not None:
+            return
+        original = self._original_import = builtins.__import__
+        stack = self._stack
+        imports = self.imports
+
+        def timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+            # Only first-time absolute imports cost anything worth reporting
+            if level or name in sys.modules:
+                return original(name, globals, locals, fromlist, level)
+            started = time.perf_counter()
+            stack.append(0.0)
+            try:
+                return original(name, globals, locals, fromlist, level)
+            finally:
+                elapsed = time.perf_counter() - started
+                nested = stack.pop()
+                if stack:
+                    stack[-1] += elapsed
+                imports[name] = (elapsed, elapsed - nested)
+
+        builtins.__import__ = timed_import
+
+    def uninstall_import_timer(self):
+        if self._original_import is not None:
+            builtins.__import__ = self._original_import
+            self._original_import = None
+
+    def report(self, top: int = 15):
+        """Log phase timings and the slowest imports, then stop timing imports."""
+        self.uninstall_import_timer()
+        total = time.perf_counter() - PROCESS_STARTED
+        logger.info(
+            "Startup completed in %.0fms", total * 1000,
+            extra={"phases_ms": {name: round(seconds * 1000, 1) for name, seconds in self.phases}}
+        )
+        if self.imports:
+            slowest = sorted(self.imports.items(), key=lambda item: item[1][1], reverse=True)[:top]
+            logger.info(
+                "Slowest imports (self time)",
+                extra={"imports_ms": {
+                    name: {"self": round(own * 1000, 1), "cumulative": round(cumulative * 1000, 1)}
+                    for name, (cumulative, own) in slowest
+                }}
+            )
+
+
+startup_profile = StartupProfile()
+if os.getenv("STARTUP_PROFILE", "").lower() in ("1", "true", "yes"):
+    startup_profile.install_import_timer()
@@ -0,0 +1,322 @@
+"""
+Indicator Benchmark - Throughput, latency and numerical agreement of indicator paths
+
+Each indicator has one or more implementation "paths" (the engine functions in
+app.services.indicator_engine and the bar-by-bar calculators in
+app.services.incremental_indicators) and a reference computed directly with
+pandas_ta. Every path is timed across series lengths and symbol counts, and
+its output is checked against the reference. The engine wraps pandas_ta
+itself, so it is timed but cannot disagree; the incremental path is an
+independent implementation and is what the agreement check guards.
+
+Runs fully offline on synthetic random-walk bars (seeded, so runs are
+reproducible) or on recorded candles saved from getCandleData.
+
+Usage (from backend/):
+    python -m benchmarks.indicator_bench
+    python -m benchmarks.indicator_bench --lengths 500,5000 --symbols 1,50 --repeat 20
+    python -m benchmarks.indicator_bench --data recorded/NIFTY.json --output results/nifty.json
+    python -m benchmarks.indicator_bench --compare results/indicators_abc123.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+import pandas_ta as ta
+
+from app.services import incremental_indicators, indicator_engine
+
+
+DEFAULT_LENGTHS = (200, 1000, 5000)
+DEFAULT_SYMBOLS = (1, 20, 100)
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+# Max absolute difference from the reference before a path is reported as disagreeing
+TOLERANCE = 1e-6
+
+
+# ---------------------------------------------------------------------------
+# Data
+# ---------------------------------------------------------------------------
+
+def synthetic_bars(length: int, seed: int) -> pd.DataFrame:
+    """Geometric random-walk OHLCV bars with realistic intrabar ranges."""
+    rng = np.random.default_rng(seed)
+    close = 100.0 * np.exp(np.cumsum(rng.normal(0, 0.002, length)))
+    open_ = np.concatenate(([close[0]], close[:-1]))
+    spread = np.abs(rng.normal(0, 0.0015, length)) * close
+    high = np.maximum(open_, close) + spread
+    low = np.minimum(open_, close) - spread
+    volume = rng.integers(1_000, 100_000, length).astype(float)
+    return pd.DataFrame({"open": open_, "high": high, "low": low, "close": close, "volume": volume})
+
+
+def load_recorded_bars(path: str) -> pd.DataFrame:
+    """
+    Load recorded candles. Accepts a getCandleData response (JSON with
+    data = [[timestamp, open, high, low, close, volume], ...]), a bare JSON
+    list of such rows, or a CSV with open/high/low/close/volume columns.
+    """
+    if path.endswith(".csv"):
+        frame = pd.read_csv(path)
+        frame.columns = [column.lower() for column in frame.columns]
+        return frame[["open", "high", "low", "close", "volume"]].astype(float).reset_index(drop=True)
+
+    with open(path) as f:
+        payload = json.load(f)
+    rows = payload.get("data", []) if isinstance(payload, dict) else payload
+    frame = pd.DataFrame(rows, columns=["timestamp", "open", "high", "low", "close", "volume"])
+    return frame[["open", "high", "low", "close", "volume"]].astype(float).reset_index(drop=True)
+
+
+def make_universe(length: int, symbols: int, recorded: Optional[pd.DataFrame], seed: int) -> List[pd.DataFrame]:
+    """Bars for `symbols` symbols of `length` bars each."""
+    if recorded is None:
+        return [synthetic_bars(length, seed + i) for i in range(symbols)]
+    if len(recorded) < length:
+        raise ValueError(f"Recorded data has {len(recorded)} bars, need {length}")
+    # Offset windows so symbols do not all see identical bars
+    step = max(1, (len(recorded) - length) // max(1, symbols))
+    return [recorded.iloc[(i * step) % (len(recorded) - length + 1):][:length].reset_index(drop=True) for i in range(symbols)]
+
+
+# ---------------------------------------------------------------------------
+# Paths: each takes one symbol's bars and returns a dict of named values
+# ---------------------------------------------------------------------------
+
+def _previous_day(bars: pd.DataFrame) -> Dict[str, float]:
+    return {"high": float(bars["high"].max()), "low": float(bars["low"].min()), "close": float(bars["close"].iloc[-1])}
+
+
+def _last(series: pd.Series) -> float:
+    return float(series.iloc[-1])
+
+
+def _incremental(calculator, bars: pd.DataFrame) -> float:
+    value = float("nan")
+    for close in bars["close"].to_numpy().tolist():
+        value = calculator.update(close)
+    return value
+
+
+def _stoch_incremental(bars: pd.DataFrame) -> Dict[str, float]:
+    stochastic = incremental_indicators.Stochastic(k=14, d=3)
+    for high, low, close in zip(bars["high"].to_numpy().tolist(), bars["low"].to_numpy().tolist(), bars["close"].to_numpy().tolist()):
+        stochastic.update(high, low, close)
+    return {"k": stochastic.value_k, "d": stochastic.value_d}
+
+
+def _stoch_reference(bars: pd.DataFrame) -> Dict[str, float]:
+    stoch = ta.stoch(bars["high"], bars["low"], bars["close"], k=14, d=3)
+    k_col = next(column for column in stoch.columns if column.upper().startswith("STOCHK"))
+    d_col = next(column for column in stoch.columns if column.upper().startswith("STOCHD"))
+    return {"k": _last(stoch[k_col]), "d": _last(stoch[d_col])}
+
+
+def _pivot_reference(bars: pd.DataFrame) -> Dict[str, float]:
+    high, low, close = bars["high"].max(), bars["low"].min(), bars["close"].iloc[-1]
+    pivot = (high + low + close) / 3
+    return {
+        "pivot": pivot,
+        "r1": 2 * pivot - low,
+        "r2": pivot + (high - low),
+        "s1": 2 * pivot - high,
+        "s2": pivot - (high - low)
+    }
+
+
+INDICATORS: Dict[str, Dict[str, Callable[[pd.DataFrame], Dict[str, float]]]] = {
+    "rsi_14": {
+        "reference": lambda bars: {"value": _last(ta.rsi(bars["close"], length=14))},
+        "engine": lambda bars: {"value": indicator_engine.compute_rsi(bars["close"], length=14)},
+        "incremental": lambda bars: {"value": _incremental(incremental_indicators.RSI(14), bars)},
+    },
+    "stoch_14_3": {
+        "reference": _stoch_reference,
+        "engine": lambda bars: indicator_engine.compute_stochastic(bars["high"], bars["low"], bars["close"], k=14, d=3),
+        "incremental": _stoch_incremental,
+    },
+    "sma_20": {
+        "reference": lambda bars: {"value": _last(ta.sma(bars["close"], length=20))},
+        "engine": lambda bars: {"value": indicator_engine.compute_ma(bars["close"], 20, "sma")},
+        "incremental": lambda bars: {"value": _incremental(incremental_indicators.SMA(20), bars)},
+    },
+    "ema_20": {
+        "reference": lambda bars: {"value": _last(ta.ema(bars["close"], length=20))},
+        "engine": lambda bars: {"value": indicator_engine.compute_ma(bars["close"], 20, "ema")},
+        "incremental": lambda bars: {"value": _incremental(incremental_indicators.EMA(20), bars)},
+    },
+    # pandas_ta has no classic floor-pivot function; the reference is the textbook formula
+    "pivot": {
+        "reference": _pivot_reference,
+        "engine": lambda bars: indicator_engine.compute_pivot(_previous_day(bars)),
+    },
+}
+
+
+# ---------------------------------------------------------------------------
+# Measurement
+# ---------------------------------------------------------------------------
+
+def max_abs_error(result: Dict[str, float], reference: Dict[str, float]) -> float:
+    worst = 0.0
+    for key, expected in reference.items():
+        actual = result.get(key)
+        if actual is None:
+            return float("inf")
+        if np.isnan(expected) or np.isnan(actual):
+            # NaN on one side only is a mismatch; max() would silently skip it
+            if np.isnan(expected) and np.isnan(actual):
+                continue
+            return float("inf")
+        worst = max(worst, abs(float(actual) - float(expected)))
+    return worst
+
+
+def run_case(indicator: str, path: str, universe: List[pd.DataFrame], repeat: int, warmup: int) -> Dict:
+    func = INDICATORS[indicator][path]
+    reference = INDICATORS[indicator]["reference"]
+
+    error = max(max_abs_error(func(bars), reference(bars)) for bars in universe)
+
+    for _ in range(warmup):
+        for bars in universe:
+            func(bars)
+
+    # Latency: one call on one symbol; throughput: one pass over the whole universe
+    call_times = []
+    pass_times = []
+    for _ in range(repeat):
+        pass_started = time.perf_counter()
+        for bars in universe:
+            started = time.perf_counter()
+            func(bars)
+            call_times.append(time.perf_counter() - started)
+        pass_times.append(time.perf_counter() - pass_started)
+
+    call_times.sort()
+    bars_per_pass = sum(len(bars) for bars in universe)
+    best_pass = min(pass_times)
+    return {
+        "indicator": indicator,
+        "path": path,
+        "length": len(universe[0]),
+        "symbols": len(universe),
+        "latency_ms": {
+            "min": call_times[0] * 1000,
+            "p50": statistics.median(call_times) * 1000,
+            "p95": call_times[min(len(call_times) - 1, int(len(call_times) * 0.95))] * 1000,
+        },
+        "pass_ms": best_pass * 1000,
+        "throughput_bars_per_s": bars_per_pass / best_pass if best_pass > 0 else float("inf"),
+        "max_abs_error": error,
+        "agrees": error <= TOLERANCE,
+    }
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(__file__), stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except Exception:
+        return "unknown"
+
+
+def run(args) -> Dict:
+    recorded = load_recorded_bars(args.data) if args.data else None
+    indicators = args.indicators.split(",") if args.indicators else list(INDICATORS)
+    results = []
+    for length in args.lengths:
+        for symbols in args.symbols:
+            universe = make_universe(length, symbols, recorded, args.seed)
+            for indicator in indicators:
+                for path in INDICATORS[indicator]:
+                    case = run_case(indicator, path, universe, args.repeat, args.warmup)
+                    results.append(case)
+                    print(
+                        f"{indicator:<11} {path:<11} len={length:<6} sym={symbols:<4} "
+                        f"p50={case['latency_ms']['p50']:8.3f}ms  p95={case['latency_ms']['p95']:8.3f}ms  "
+                        f"{case['throughput_bars_per_s']:>14,.0f} bars/s  err={case['max_abs_error']:.2e}"
+                        f"{'' if case['agrees'] else '  MISMATCH'}"
+                    )
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "dataset": args.data or f"synthetic(seed={args.seed})",
+            "repeat": args.repeat,
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "pandas_ta": getattr(ta, "version", getattr(ta, "__version__", "unknown")),
+            "machine": f"{platform.system()} {platform.machine()} ({os.cpu_count()} cpus)",
+        },
+        "results": results,
+    }
+
+
+def compare(current: Dict, baseline_path: str):
+    """Print p50 latency and throughput ratios against a previous results file."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    key = lambda case: (case["indicator"], case["path"], case["length"], case["symbols"])
+    previous = {key(case): case for case in baseline["results"]}
+
+    print(f"\nCompared with {baseline['meta']['commit']} ({baseline_path}):")
+    for case in current["results"]:
+        before = previous.get(key(case))
+        if before is None:
+            continue
+        latency_ratio = case["latency_ms"]["p50"] / before["latency_ms"]["p50"] if before["latency_ms"]["p50"] else float("nan")
+        throughput_ratio = case["throughput_bars_per_s"] / before["throughput_bars_per_s"] if before["throughput_bars_per_s"] else float("nan")
+        print(
+            f"{case['indicator']:<11} {case['path']:<11} len={case['length']:<6} sym={case['symbols']:<4} "
+            f"p50 x{latency_ratio:5.2f}  throughput x{throughput_ratio:5.2f}"
+        )
+
+
+def _int_list(value: str) -> List[int]:
+    return [int(item) for item in value.split(",") if item]
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark indicator paths against pandas_ta")
+    parser.add_argument("--lengths", type=_int_list, default=list(DEFAULT_LENGTHS), help="Comma-separated series lengths")
+    parser.add_argument("--symbols", type=_int_list, default=list(DEFAULT_SYMBOLS), help="Comma-separated symbol counts")
+    parser.add_argument("--indicators", help=f"Comma-separated subset of {','.join(INDICATORS)}")
+    parser.add_argument("--repeat", type=int, default=10, help="Timed passes per case")
+    parser.add_argument("--warmup", type=int, default=2, help="Untimed passes per case")
+    parser.add_argument("--seed", type=int, default=42, help="Seed for synthetic data")
+    parser.add_argument("--data", help="Recorded candles (.json from getCandleData, or .csv)")
+    parser.add_argument("--output", help="Results file (default: benchmarks/results/indicators_<commit>.json)")
+    parser.add_argument("--compare", help="Previous results file to compare against")
+    args = parser.parse_args(argv)
+
+    current = run(args)
+
+    output = args.output or os.path.join(RESULTS_DIR, f"indicators_{current['meta']['commit']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(current, f, indent=2)
+    print(f"\nResults written to {output}")
+
+    if args.compare:
+        compare(current, args.compare)
+
+    # Non-zero exit when any path disagrees with the reference, so CI can gate on it
+    return 0 if all(case["agrees"] for case in current["results"]) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
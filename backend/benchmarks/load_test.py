@@ -0,0 +1,275 @@
+"""
+Load Test - Drive the FastAPI backend at fixed concurrency and report latency percentiles
+
+Logs in, points an app at the mock SmartAPI (benchmarks.mock_smartapi), switches
+to it, then runs weighted scenarios from N concurrent workers for a fixed
+duration or request count. Reports p50/p95/p99 latency, throughput and errors
+per scenario.
+
+Usage (from backend/):
+    # Start the mock and the backend as subprocesses, then run
+    python -m benchmarks.load_test --spawn --concurrency 50 --duration 30 --scenario positions:3,orders:1
+
+    # Against already-running servers, with broker latency injected in the mock
+    python -m benchmarks.load_test --target http://127.0.0.1:8000 --mock-url http://127.0.0.1:9100 \\
+        --mock-config '{"latency_ms": 80, "jitter_ms": 40}'
+
+Scenarios:
+    positions    GET /api/positions
+    orders       GET /api/orders
+    profile      GET /api/profile
+    funds        GET /api/profile/funds
+    gainers      GET /api/profile/market/gainers-losers
+    place_order  SmartAPIClient.place_order directly against the mock (no API route exists yet)
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+from app.services.smartapi_client import SmartAPIClient
+
+
+API_SCENARIOS = {
+    "positions": "/api/positions",
+    "orders": "/api/orders",
+    "profile": "/api/profile",
+    "funds": "/api/profile/funds",
+    "gainers": "/api/profile/market/gainers-losers",
+}
+CLIENT_SCENARIOS = ("place_order",)
+
+LOADTEST_USER = {"username": "loadtest", "password": "loadtest-password"}
+LOADTEST_APP = "loadtest-mock"
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return float("nan")
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.statuses: Dict[str, Counter] = defaultdict(Counter)
+        self.errors: Dict[str, int] = defaultdict(int)
+
+    def record(self, scenario: str, seconds: float, status: str, ok: bool):
+        self.latencies[scenario].append(seconds)
+        self.statuses[scenario][status] += 1
+        if not ok:
+            self.errors[scenario] += 1
+
+    def summary(self, elapsed: float) -> Dict:
+        result = {}
+        for scenario, values in self.latencies.items():
+            values = sorted(values)
+            result[scenario] = {
+                "requests": len(values),
+                "errors": self.errors[scenario],
+                "throughput_rps": len(values) / elapsed if elapsed else 0.0,
+                "p50_ms": percentile(values, 0.50) * 1000,
+                "p95_ms": percentile(values, 0.95) * 1000,
+                "p99_ms": percentile(values, 0.99) * 1000,
+                "max_ms": values[-1] * 1000 if values else float("nan"),
+                "statuses": dict(self.statuses[scenario]),
+            }
+        return result
+
+
+async def wait_until_up(url: str, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                await client.get(url, timeout=1.0)
+                return
+            except httpx.HTTPError:
+                await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+async def setup_session(client: httpx.AsyncClient, mock_url: str) -> Dict[str, str]:
+    """Create/login the load-test user, point an app at the mock and switch to it."""
+    await client.post("/api/register", json=LOADTEST_USER)
+    response = await client.post("/api/login", json=LOADTEST_USER)
+    response.raise_for_status()
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    app_payload = {
+        "name": LOADTEST_APP, "account_id": "MOCK001", "api_key": "mock-key", "secret_key": "mock-secret",
+        "mpin": "0000", "base_url": mock_url, "is_default": True
+    }
+    apps = (await client.get("/api/apps", headers=headers)).json()
+    app = next((item for item in apps if item["name"] == LOADTEST_APP), None)
+    if app is None:
+        response = await client.post("/api/apps", json=app_payload, headers=headers)
+    else:
+        response = await client.put(f"/api/apps/{app['id']}", json=app_payload, headers=headers)
+    response.raise_for_status()
+    app_id = response.json()["id"]
+
+    response = await client.post(f"/api/apps/{app_id}/switch", json={"totp": "000000"}, headers=headers)
+    if response.status_code != 200:
+        raise RuntimeError(f"Could not switch to mock app: {response.status_code} {response.text}")
+    return headers
+
+
+def parse_scenarios(spec: str) -> List[Tuple[str, int]]:
+    scenarios = []
+    for item in spec.split(","):
+        name, _, weight = item.partition(":")
+        name = name.strip()
+        if name not in API_SCENARIOS and name not in CLIENT_SCENARIOS:
+            raise argparse.ArgumentTypeError(f"Unknown scenario {name!r}")
+        scenarios.append((name, int(weight or 1)))
+    return scenarios
+
+
+async def run_load(args) -> Dict:
+    scenarios = parse_scenarios(args.scenario)
+    names = [name for name, _ in scenarios]
+    weights = [weight for _, weight in scenarios]
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.target, limits=limits, timeout=args.timeout) as client:
+        headers = await setup_session(client, args.mock_url)
+
+        if args.mock_config:
+            await client.post(f"{args.mock_url}/__mock__/config", json=json.loads(args.mock_config))
+
+        broker = SmartAPIClient("mock-key", "mock-secret", "MOCK001", "0000", base_url=args.mock_url)
+        if "place_order" in names:
+            await broker.generate_session_by_password("000000")
+
+        recorder = Recorder()
+        remaining = [args.requests] if args.requests else None
+        measure_from = time.monotonic() + args.warmup
+        deadline = measure_from + args.duration
+        rng = random.Random(args.seed)
+
+        async def one_request(scenario: str) -> Tuple[str, bool]:
+            if scenario == "place_order":
+                result = await broker.place_order(
+                    symbol="SBIN-EQ", exchange="NSE", transaction_type="BUY",
+                    order_type="LIMIT", quantity=1, price=500.0
+                )
+                ok = bool(result.get("status"))
+                return ("ok" if ok else "error"), ok
+            response = await client.get(API_SCENARIOS[scenario], headers=headers)
+            return str(response.status_code), response.status_code < 400
+
+        async def worker():
+            while True:
+                if remaining is not None:
+                    if remaining[0] <= 0:
+                        return
+                    remaining[0] -= 1
+                elif time.monotonic() >= deadline:
+                    return
+                scenario = rng.choices(names, weights)[0]
+                measured = remaining is not None or time.monotonic() >= measure_from
+                started = time.perf_counter()
+                try:
+                    status, ok = await one_request(scenario)
+                except httpx.HTTPError as e:
+                    status, ok = type(e).__name__, False
+                if measured:
+                    recorder.record(scenario, time.perf_counter() - started, status, ok)
+
+        started = time.monotonic()
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        elapsed = time.monotonic() - (started if remaining is not None else measure_from)
+
+    return {
+        "config": {
+            "target": args.target, "mock_url": args.mock_url, "concurrency": args.concurrency,
+            "duration": args.duration, "requests": args.requests, "scenario": args.scenario,
+            "mock_config": json.loads(args.mock_config) if args.mock_config else None,
+        },
+        "elapsed_s": elapsed,
+        "scenarios": recorder.summary(elapsed),
+    }
+
+
+def print_report(report: Dict):
+    print(f"\n{'scenario':<12} {'reqs':>7} {'errs':>6} {'rps':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}  statuses")
+    for scenario, stats in report["scenarios"].items():
+        print(
+            f"{scenario:<12} {stats['requests']:>7} {stats['errors']:>6} {stats['throughput_rps']:>9.1f} "
+            f"{stats['p50_ms']:>9.1f} {stats['p95_ms']:>9.1f} {stats['p99_ms']:>9.1f} {stats['max_ms']:>9.1f}  {stats['statuses']}"
+        )
+    print(f"\nMeasured over {report['elapsed_s']:.1f}s at concurrency {report['config']['concurrency']}")
+
+
+def spawn_servers(args) -> List[subprocess.Popen]:
+    """Start the mock SmartAPI and the backend (on a throwaway SQLite database)."""
+    backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    db_path = os.path.join(tempfile.mkdtemp(prefix="algopilot-load-"), "load.db")
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{db_path}", SMARTAPI_PUBLIC_IP="127.0.0.1", LOG_LEVEL="WARNING")
+
+    mock_port = httpx.URL(args.mock_url).port
+    target_port = httpx.URL(args.target).port
+    processes = [
+        subprocess.Popen(
+            [sys.executable, "-m", "benchmarks.mock_smartapi", "--port", str(mock_port)] + args.mock_args.split(),
+            cwd=backend_dir, env=env
+        ),
+        subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(target_port), "--log-level", "warning"],
+            cwd=backend_dir, env=env
+        ),
+    ]
+    return processes
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Load-test the AlgoPilot backend against the mock SmartAPI")
+    parser.add_argument("--target", default="http://127.0.0.1:8000", help="Backend base URL")
+    parser.add_argument("--mock-url", default="http://127.0.0.1:9100", help="Mock SmartAPI base URL")
+    parser.add_argument("--spawn", action="store_true", help="Start the mock and the backend as subprocesses")
+    parser.add_argument("--mock-args", default="", help="Extra arguments for the spawned mock, e.g. '--latency-ms 50'")
+    parser.add_argument("--mock-config", help="JSON applied to the running mock via /__mock__/config")
+    parser.add_argument("--scenario", default="positions:1,orders:1", help="Weighted scenarios, e.g. positions:3,orders:1")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--duration", type=float, default=20.0, help="Measured seconds (ignored with --requests)")
+    parser.add_argument("--requests", type=int, default=0, help="Total requests instead of a duration")
+    parser.add_argument("--warmup", type=float, default=2.0, help="Unmeasured seconds before the run")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Per-request client timeout")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="Write the report as JSON to this file")
+    args = parser.parse_args(argv)
+
+    processes = spawn_servers(args) if args.spawn else []
+    try:
+        if processes:
+            asyncio.run(wait_until_up(f"{args.mock_url}/__mock__/config"))
+            asyncio.run(wait_until_up(f"{args.target}/health"))
+        report = asyncio.run(run_load(args))
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait(timeout=10)
+
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,474 @@
+"""
+Mock SmartAPI - Local stand-in for the Angel One REST API and SmartStream WebSocket
+
+Serves the REST endpoints used by SmartAPIClient with synthetic data, plus a
+SmartStream v2 compatible WebSocket (binary LTP/Quote/SnapQuote packets), so the backend
+can be load-tested without touching the live broker. Latency, errors and rate
+limiting can be injected at startup or changed at runtime:
+
+    python -m benchmarks.mock_smartapi --port 9100 --latency-ms 40 --jitter-ms 20 \\
+        --error-rate 0.01 --rate-limit 10 --endpoint-rate getPosition=1,placeOrder=20
+
+    curl -X POST localhost:9100/__mock__/config -d '{"latency_ms": 200}' -H 'Content-Type: application/json'
+
+Point an app's base_url at http://127.0.0.1:9100 to use it. Any TOTP is accepted.
+"""
+import argparse
+import asyncio
+import json
+import random
+import struct
+import time
+import uuid
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse
+
+
+@dataclass
+class MockConfig:
+    latency_ms: float = 0.0
+    jitter_ms: float = 0.0
+    error_rate: float = 0.0           # Fraction of requests answered with HTTP 500
+    rate_limit: float = 0.0           # Requests/second per endpoint, 0 = unlimited
+    rate_limit_status: int = 403      # SmartAPI answers rate-limited calls with 403
+    endpoint_rates: Dict[str, float] = field(default_factory=dict)
+    positions: int = 20
+    orders: int = 50
+    tick_hz: float = 1.0              # Ticks per second per subscribed token
+    seed: int = 7
+
+
+class TokenBucket:
+    __slots__ = ("rate", "tokens", "updated")
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+
+    def try_acquire(self) -> bool:
+        now = time.monotonic()
+        self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+def envelope(data, message: str = "SUCCESS", status: bool = True, errorcode: str = "") -> Dict:
+    return {"status": status, "message": message, "errorcode": errorcode, "data": data}
+
+
+class MockBroker:
+    """Synthetic account state shared by the REST handlers and the feed."""
+
+    SYMBOLS = [
+        ("RELIANCE-EQ", "2885", "NSE"), ("TCS-EQ", "11536", "NSE"), ("INFY-EQ", "1594", "NSE"),
+        ("HDFCBANK-EQ", "1333", "NSE"), ("ICICIBANK-EQ", "4963", "NSE"), ("SBIN-EQ", "3045", "NSE"),
+        ("ITC-EQ", "1660", "NSE"), ("LT-EQ", "11483", "NSE"), ("AXISBANK-EQ", "5900", "NSE"),
+        ("NIFTY", "99926000", "NSE"), ("BANKNIFTY", "99926009", "NSE"),
+    ]
+
+    def __init__(self, config: MockConfig):
+        self.config = config
+        self.rng = random.Random(config.seed)
+        self.prices: Dict[str, float] = {}
+        self.open_interests: Dict[str, int] = {}
+        self.orders: Dict[str, Dict] = {}
+        self.buckets: Dict[str, TokenBucket] = {}
+        for _ in range(config.orders):
+            self._new_order(self.rng.choice(self.SYMBOLS)[0], "BUY", "LIMIT", 1, 100.0, status="complete")
+
+    def futures(self) -> List[Dict]:
+        """A near-month NFO future per symbol, as symbol master rows (the market breadth universe)."""
+        expiry = (datetime.now() + timedelta(days=20)).strftime("%d%b%Y").upper()
+        return [
+            {"token": str(50000 + index), "symbol": f"{symbol.split('-')[0]}{expiry[:2]}{expiry[2:5]}{expiry[-2:]}FUT",
+             "name": symbol.split("-")[0], "expiry": expiry, "strike": "-1.000000", "lotsize": "25",
+             "instrumenttype": "FUTIDX" if symbol in ("NIFTY", "BANKNIFTY") else "FUTSTK", "exch_seg": "NFO",
+             "tick_size": "5.000000"}
+            for index, (symbol, _, _) in enumerate(self.SYMBOLS)
+        ]
+
+    def open_interest(self, token: str) -> int:
+        oi = self.open_interests.get(token)
+        if oi is None:
+            oi = self.rng.randint(10 ** 4, 10 ** 6)
+        oi = max(0, oi + self.rng.randint(-500, 500))
+        self.open_interests[token] = oi
+        return oi
+
+    def price(self, token: str) -> float:
+        price = self.prices.get(token)
+        if price is None:
+            price = self.prices[token] = round(self.rng.uniform(100, 3000), 2)
+        price = round(max(1.0, price * (1 + self.rng.gauss(0, 0.0005))), 2)
+        self.prices[token] = price
+        return price
+
+    def _symbol(self, index: int):
+        symbol, token, exchange = self.SYMBOLS[index % len(self.SYMBOLS)]
+        if index >= len(self.SYMBOLS):
+            symbol, token = f"{symbol}{index}", str(100000 + index)
+        return symbol, token, exchange
+
+    def _new_order(self, symbol, transaction_type, order_type, quantity, price, status="open") -> Dict:
+        order_id = str(uuid.uuid4().int)[:15]
+        order = {
+            "variety": "NORMAL", "ordertype": order_type, "producttype": "INTRADAY", "duration": "DAY",
+            "price": float(price), "triggerprice": 0.0, "quantity": str(quantity), "disclosedquantity": "0",
+            "squareoff": 0.0, "stoploss": 0.0, "trailingstoploss": 0.0, "tradingsymbol": symbol,
+            "transactiontype": transaction_type, "exchange": "NSE", "symboltoken": "",
+            "ordertag": "", "instrumenttype": "", "strikeprice": -1.0, "optiontype": "", "expirydate": "",
+            "lotsize": "1", "cancelsize": "0", "averageprice": float(price) if status == "complete" else 0.0,
+            "filledshares": str(quantity) if status == "complete" else "0",
+            "unfilledshares": "0" if status == "complete" else str(quantity),
+            "orderid": order_id, "text": "", "status": status, "orderstatus": status,
+            "updatetime": datetime.now().strftime("%d-%b-%Y %H:%M:%S"), "exchtime": "",
+            "exchorderupdatetime": "", "fillid": "", "filltime": "", "parentorderid": "", "uniqueorderid": str(uuid.uuid4())
+        }
+        self.orders[order_id] = order
+        return order
+
+    def positions(self) -> List[Dict]:
+        result = []
+        for index in range(self.config.positions):
+            symbol, token, exchange = self._symbol(index)
+            ltp = self.price(token)
+            qty = self.rng.choice([-2, -1, 1, 2, 5]) * 25
+            avg = round(ltp * (1 + self.rng.gauss(0, 0.01)), 2)
+            result.append({
+                "exchange": exchange, "symboltoken": token, "producttype": "INTRADAY", "tradingsymbol": symbol,
+                "symbolname": symbol.split("-")[0], "instrumenttype": "", "priceden": "1.00", "pricenum": "1.00",
+                "genden": "1.00", "gennum": "1.00", "precision": "2", "multiplier": "-1", "boardlotsize": "1",
+                "buyqty": str(max(qty, 0)), "sellqty": str(max(-qty, 0)), "buyamount": str(round(max(qty, 0) * avg, 2)),
+                "sellamount": str(round(max(-qty, 0) * avg, 2)), "symbolgroup": "EQ", "strikeprice": "-1",
+                "optiontype": "", "expirydate": "", "lotsize": "1", "cfbuyqty": "0", "cfsellqty": "0",
+                "cfbuyamount": "0.00", "cfsellamount": "0.00", "buyavgprice": str(avg), "sellavgprice": str(avg),
+                "avgnetprice": str(avg), "netvalue": str(round(-qty * avg, 2)), "netqty": str(qty),
+                "totalbuyvalue": str(round(max(qty, 0) * avg, 2)), "totalsellvalue": str(round(max(-qty, 0) * avg, 2)),
+                "cfbuyavgprice": "0.00", "cfsellavgprice": "0.00", "totalbuyavgprice": str(avg),
+                "totalsellavgprice": str(avg), "netprice": str(avg), "ltp": str(ltp),
+                "pnl": str(round((ltp - avg) * qty, 2)), "close": str(round(avg * 0.99, 2))
+            })
+        return result
+
+    def quote(self, exchange: str, token: str, mode: str) -> Dict:
+        ltp = self.price(token)
+        quote = {"exchange": exchange, "tradingSymbol": token, "symbolToken": token, "ltp": ltp}
+        if mode.upper() in ("OHLC", "FULL"):
+            quote.update({"open": round(ltp * 0.99, 2), "high": round(ltp * 1.01, 2), "low": round(ltp * 0.98, 2), "close": round(ltp * 0.995, 2)})
+        if mode.upper() == "FULL":
+            quote.update({
+                "lastTradeQty": 25, "exchFeedTime": datetime.now().strftime("%d-%b-%Y %H:%M:%S"),
+                "exchTradeTime": datetime.now().strftime("%d-%b-%Y %H:%M:%S"), "netChange": round(ltp * 0.005, 2),
+                "percentChange": 0.5, "avgPrice": ltp, "tradeVolume": self.rng.randint(1000, 10 ** 7),
+                "opnInterest": self.open_interest(token), "lowerCircuit": round(ltp * 0.9, 2),
+                "upperCircuit": round(ltp * 1.1, 2), "totBuyQuan": self.rng.randint(0, 10 ** 5),
+                "totSellQuan": self.rng.randint(0, 10 ** 5), "52WeekLow": round(ltp * 0.7, 2), "52WeekHigh": round(ltp * 1.3, 2),
+                "depth": {"buy": [{"price": round(ltp - 0.05 * i, 2), "quantity": 100, "orders": 1} for i in range(1, 6)],
+                          "sell": [{"price": round(ltp + 0.05 * i, 2), "quantity": 100, "orders": 1} for i in range(1, 6)]}
+            })
+        return quote
+
+
+def create_app(config: MockConfig) -> FastAPI:
+    app = FastAPI(title="Mock SmartAPI")
+    broker = MockBroker(config)
+    app.state.broker = broker
+    app.state.config = config
+
+    async def simulate(endpoint: str) -> Optional[JSONResponse]:
+        """Apply latency, rate limiting and error injection; returns an error response or None."""
+        cfg = app.state.config
+        delay = cfg.latency_ms + (random.uniform(-cfg.jitter_ms, cfg.jitter_ms) if cfg.jitter_ms else 0)
+        if delay > 0:
+            await asyncio.sleep(delay / 1000)
+
+        rate = cfg.endpoint_rates.get(endpoint, cfg.rate_limit)
+        if rate > 0:
+            bucket = broker.buckets.get(endpoint)
+            if bucket is None or bucket.rate != rate:
+                bucket = broker.buckets[endpoint] = TokenBucket(rate)
+            if not bucket.try_acquire():
+                return JSONResponse(
+                    status_code=cfg.rate_limit_status,
+                    content=envelope(None, "Access denied because of exceeding access rate", False, "AB1019")
+                )
+
+        if cfg.error_rate and random.random() < cfg.error_rate:
+            return JSONResponse(status_code=500, content=envelope(None, "Internal Error (injected)", False, "AB2001"))
+        return None
+
+    def mock_endpoint(method: str, path: str, endpoint: str):
+        def decorator(handler):
+            async def route(request: Request):
+                error = await simulate(endpoint)
+                if error is not None:
+                    return error
+                body = {}
+                if method == "POST":
+                    raw = await request.body()
+                    body = json.loads(raw) if raw else {}
+                result = handler(body, **request.path_params)
+                return JSONResponse(content=result)
+            app.add_api_route(path, route, methods=[method], name=endpoint)
+            return handler
+        return decorator
+
+    def session_tokens() -> Dict:
+        return {
+            "jwtToken": f"mock-jwt-{uuid.uuid4().hex}",
+            "refreshToken": f"mock-refresh-{uuid.uuid4().hex}",
+            "feedToken": f"mock-feed-{uuid.uuid4().hex}"
+        }
+
+    @mock_endpoint("POST", "/rest/auth/angelbroking/user/v1/loginByPassword", "loginByPassword")
+    def login_by_password(body):
+        return envelope(session_tokens())
+
+    @mock_endpoint("POST", "/rest/auth/angelbroking/user/v1/loginByMPIN", "loginByMPIN")
+    def login_by_mpin(body):
+        return envelope(session_tokens())
+
+    @mock_endpoint("POST", "/rest/auth/angelbroking/jwt/v1/generateTokens", "generateTokens")
+    def generate_tokens(body):
+        return envelope(session_tokens())
+
+    @mock_endpoint("GET", "/rest/secure/angelbroking/user/v1/getProfile", "getProfile")
+    def get_profile(body):
+        return envelope({
+            "clientcode": "MOCK001", "name": "Mock User", "email": "", "mobileno": "",
+            "exchanges": ["NSE", "BSE", "NFO"], "products": ["MARGIN", "MIS", "NRML", "CNC"],
+            "lastlogintime": "", "brokerid": "B2C"
+        })
+
+    @mock_endpoint("GET", "/rest/secure/angelbroking/user/v1/getRMS", "getRMS")
+    def get_rms(body):
+        return envelope({
+            "net": "100000.00", "availablecash": "100000.00", "availableintradaypayin": "0",
+            "availablelimitmargin": "0", "collateral": "0", "m2munrealized": "0", "m2mrealized": "0",
+            "utiliseddebits": "0", "utilisedspan": None, "utilisedoptionpremium": None,
+            "utilisedholdingsales": None, "utilisedexposure": None, "utilisedturnover": None, "utilisedpayout": "0"
+        })
+
+    @mock_endpoint("GET", "/rest/secure/angelbroking/portfolio/v1/getPosition", "getPosition")
+    def get_position(body):
+        return envelope(broker.positions())
+
+    @mock_endpoint("GET", "/rest/secure/angelbroking/portfolio/v1/getHolding", "getHolding")
+    def get_holding(body):
+        return envelope([])
+
+    @mock_endpoint("GET", "/rest/secure/angelbroking/order/v1/getOrderBook", "getOrderBook")
+    def get_order_book(body):
+        return envelope(list(broker.orders.values()))
+
+    @mock_endpoint("GET", "/rest/secure/angelbroking/order/v1/getTradeBook", "getTradeBook")
+    def get_trade_book(body):
+        return envelope([order for order in broker.orders.values() if order["status"] == "complete"])
+
+    @mock_endpoint("GET", "/rest/secure/angelbroking/order/v1/details/{order_id}", "orderDetails")
+    def get_order_details(body, order_id):
+        order = broker.orders.get(order_id)
+        if order is None:
+            return envelope(None, "Order not found", False, "AB4008")
+        return envelope(order)
+
+    @mock_endpoint("POST", "/rest/secure/angelbroking/order/v1/placeOrder", "placeOrder")
+    def place_order(body):
+        order = broker._new_order(
+            body.get("tradingsymbol", ""), body.get("transactiontype", "BUY"), body.get("ordertype", "MARKET"),
+            int(body.get("quantity") or 0), float(body.get("price") or 0)
+        )
+        order["symboltoken"] = body.get("symboltoken", "")
+        return envelope({"script": order["tradingsymbol"], "orderid": order["orderid"], "uniqueorderid": order["uniqueorderid"]})
+
+    @mock_endpoint("POST", "/rest/secure/angelbroking/order/v1/modifyOrder", "modifyOrder")
+    def modify_order(body):
+        order = broker.orders.get(body.get("orderid", ""))
+        if order is None:
+            return envelope(None, "Order not found", False, "AB4008")
+        order.update({"price": float(body.get("price") or 0), "quantity": str(body.get("quantity", order["quantity"]))})
+        return envelope({"orderid": order["orderid"], "uniqueorderid": order["uniqueorderid"]})
+
+    @mock_endpoint("POST", "/rest/secure/angelbroking/order/v1/cancelOrder", "cancelOrder")
+    def cancel_order(body):
+        order = broker.orders.get(body.get("orderid", ""))
+        if order is None:
+            return envelope(None, "Order not found", False, "AB4008")
+        order["status"] = order["orderstatus"] = "cancelled"
+        return envelope({"orderid": order["orderid"], "uniqueorderid": order["uniqueorderid"]})
+
+    @mock_endpoint("GET", "/rest/secure/angelbroking/market/v1/getMarketStatus", "getMarketStatus")
+    def get_market_status(body):
+        return envelope({"marketStatus": "open"})
+
+    @mock_endpoint("POST", "/rest/secure/angelbroking/market/v1/getQuote", "getQuote")
+    def get_quote(body):
+        mode = body.get("mode", "FULL")
+        exchange_tokens = body.get("exchangeTokens") or {}
+        if sum(len(tokens) for tokens in exchange_tokens.values()) > 50:
+            return envelope(None, "Token limit exceeded (max 50)", False, "AB4017")
+        fetched = [broker.quote(exchange, token, mode) for exchange, tokens in exchange_tokens.items() for token in tokens]
+        return envelope({"fetched": fetched, "unfetched": []})
+
+    @mock_endpoint("GET", "/rest/secure/angelbroking/market/v1/getSymbolMaster", "getSymbolMaster")
+    def get_symbol_master(body):
+        return [
+            {"token": token, "symbol": symbol, "name": symbol.split("-")[0], "expiry": "", "strike": "-1.000000",
+             "lotsize": "1", "instrumenttype": "", "exch_seg": exchange, "tick_size": "5.000000"}
+            for symbol, token, exchange in broker.SYMBOLS
+        ] + broker.futures()
+
+    @mock_endpoint("POST", "/rest/secure/angelbroking/historical/v1/getCandleData", "getCandleData")
+    def get_candle_data(body):
+        token = body.get("symboltoken", "0")
+        start = datetime.now() - timedelta(minutes=375)
+        candles = []
+        for minute in range(375):
+            close = broker.price(token)
+            candles.append([
+                (start + timedelta(minutes=minute)).strftime("%Y-%m-%dT%H:%M:%S+05:30"),
+                close, round(close * 1.001, 2), round(close * 0.999, 2), close, broker.rng.randint(100, 10000)
+            ])
+        return envelope(candles)
+
+    @mock_endpoint("POST", "/rest/secure/angelbroking/marketData/v1/gainersLosers", "gainersLosers")
+    def gainers_losers(body):
+        losers = "Losers" in body.get("datatype", "")
+        data = []
+        for index in range(20):
+            symbol, token, _ = broker._symbol(index)
+            change = round(broker.rng.uniform(0.5, 10), 2)
+            data.append({
+                "tradingSymbol": symbol, "symbolToken": token, "percentChange": -change if losers else change,
+                "opnInterest": broker.rng.randint(0, 10 ** 6), "netChangeOpnInterest": broker.rng.randint(-10 ** 4, 10 ** 4)
+            })
+        data.sort(key=lambda item: item["percentChange"], reverse=not losers)
+        return envelope(data)
+
+    @mock_endpoint("POST", "/rest/secure/angelbroking/user/v1/logout", "logout")
+    def logout(body):
+        return envelope(None)
+
+    @app.get("/__mock__/config")
+    async def get_config():
+        return asdict(app.state.config)
+
+    @app.post("/__mock__/config")
+    async def update_config(request: Request):
+        changes = await request.json()
+        for key, value in changes.items():
+            if hasattr(app.state.config, key):
+                setattr(app.state.config, key, value)
+        return asdict(app.state.config)
+
+    @app.websocket("/smart-stream")
+    async def smart_stream(websocket: WebSocket):
+        await websocket.accept()
+        subscriptions: Dict[tuple, int] = {}  # (exchange_type, token) -> mode
+        sequence = 0
+
+        async def receive():
+            while True:
+                message = await websocket.receive_text()
+                if message == "ping":
+                    await websocket.send_text("pong")
+                    continue
+                request = json.loads(message)
+                params = request.get("params", {})
+                for group in params.get("tokenList", []):
+                    for token in group.get("tokens", []):
+                        key = (int(group.get("exchangeType", 1)), str(token))
+                        if request.get("action") == 0:
+                            subscriptions.pop(key, None)
+                        else:
+                            subscriptions[key] = int(params.get("mode", 1))
+
+        receiver = asyncio.create_task(receive())
+        try:
+            while not receiver.done():
+                await asyncio.sleep(1 / max(app.state.config.tick_hz, 0.001))
+                for (exchange_type, token), mode in list(subscriptions.items()):
+                    sequence += 1
+                    await websocket.send_bytes(pack_tick(broker, exchange_type, token, mode, sequence))
+        except WebSocketDisconnect:
+            pass
+        finally:
+            receiver.cancel()
+
+    return app
+
+
+def pack_tick(broker: MockBroker, exchange_type: int, token: str, mode: int, sequence: int) -> bytes:
+    """
+    Encode a SmartStream v2 binary packet (little-endian, prices in paise).
+    Mode 1 (LTP) is 51 bytes, mode 2 (Quote) 123 and mode 3 (SnapQuote) 379:
+    the Quote layout plus last trade time, OI, OI change, best five and circuit/52-week prices.
+    """
+    ltp = broker.price(token)
+    paise = int(round(ltp * 100))
+    now = int(time.time() * 1000)
+    packet = struct.pack("<bb25sqqq", mode, exchange_type, token.encode()[:25], sequence, now, paise)
+    if mode == 1:
+        return packet
+    packet += struct.pack(
+        "<qqqddqqqq",
+        25, paise, broker.rng.randint(10 ** 4, 10 ** 7),
+        float(broker.rng.randint(0, 10 ** 5)), float(broker.rng.randint(0, 10 ** 5)),
+        int(paise * 0.99), int(paise * 1.01), int(paise * 0.98), int(paise * 0.995)
+    )
+    if mode == 2:
+        return packet
+    best_five = b"".join(
+        struct.pack("<hqqh", side, 100, paise + (5 if side == 0 else -5) * level, 1)
+        for side in (1, 0) for level in range(1, 6)
+    )
+    return packet + struct.pack("<qqd", now, broker.open_interest(token), 0.0) + best_five + struct.pack(
+        "<qqqq", int(paise * 1.1), int(paise * 0.9), int(paise * 1.3), int(paise * 0.7)
+    )
+
+
+def _parse_rates(value: str) -> Dict[str, float]:
+    rates = {}
+    for item in value.split(","):
+        name, sep, rate = item.partition("=")
+        if sep:
+            rates[name.strip()] = float(rate)
+    return rates
+
+
+def main(argv=None):
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Run a local mock SmartAPI server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Added latency per request")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="Uniform +/- jitter on the latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests failed with HTTP 500")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="Requests/second per endpoint (0 = off)")
+    parser.add_argument("--rate-limit-status", type=int, default=403, help="HTTP status for rate-limited requests")
+    parser.add_argument("--endpoint-rate", type=_parse_rates, default={}, help="Per-endpoint limits, e.g. getPosition=1,getQuote=10")
+    parser.add_argument("--positions", type=int, default=20, help="Open positions returned by getPosition")
+    parser.add_argument("--orders", type=int, default=50, help="Orders initially in the order book")
+    parser.add_argument("--tick-hz", type=float, default=1.0, help="Feed ticks per second per subscribed token")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args(argv)
+
+    config = MockConfig(
+        latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate,
+        rate_limit=args.rate_limit, rate_limit_status=args.rate_limit_status, endpoint_rates=args.endpoint_rate,
+        positions=args.positions, orders=args.orders, tick_hz=args.tick_hz, seed=args.seed
+    )
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,23 @@
+"""
+Migration script to scope settings keys per app.
+Replaces the UNIQUE(key) constraint on the settings table with UNIQUE(key, app_id)
+so apps can override global settings, and normalises boolean values to "true"/"false".
+
+The backend applies this automatically on startup (app.models.migrations);
+run this script to migrate a database without starting the backend.
+"""
+import os
+from sqlalchemy import create_engine
+
+# Database path
+db_path = os.path.join(os.path.dirname(__file__), "algopilot.db")
+
+if not os.path.exists(db_path):
+    print(f"Database file not found at {db_path}")
+    print("The database will be created automatically when you start the backend.")
+    exit(0)
+
+from app.models.migrations import run_migrations
+
+run_migrations(create_engine(f"sqlite:///{db_path}"))
+print("\nMigration completed successfully!")
@@ -0,0 +1,93 @@
+"""
+Half-open probes that end without a verdict must not leave a SmartAPI
+endpoint's circuit breaker stuck refusing every call.
+"""
+import asyncio
+import unittest
+from app.services import deadlines
+from app.services.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitBreakers
+from app.services.smartapi_client import instrumented
+
+SERVER_ERROR = {"success": False, "status": False, "error": "Internal server error", "status_code": 502}
+RATE_LIMITED = {"success": False, "status": False, "message": "Access rate exceeded", "status_code": 429}
+PLACED = {"status": True, "message": "SUCCESS", "data": {"orderid": "1"}}
+
+
+class FakeClient:
+    """The parts of SmartAPIClient that instrumented() uses, with scripted placeOrder responses."""
+
+    def __init__(self):
+        # Opens on the first failure and allows a probe straight away
+        self.circuit_breakers = CircuitBreakers(threshold=1, cooldown=0.0)
+        self.responses = []  # a response dict, or seconds to hang before answering PLACED
+
+    @instrumented("placeOrder")
+    async def place_order(self):
+        response = self.responses.pop(0)
+        if isinstance(response, float):
+            await asyncio.sleep(response)
+            return PLACED
+        return response
+
+    @property
+    def breaker(self) -> CircuitBreaker:
+        return self.circuit_breakers["placeOrder"]
+
+
+class HalfOpenProbeTests(unittest.TestCase):
+
+    def setUp(self):
+        self.client = FakeClient()
+        self.client.responses.append(SERVER_ERROR)
+        asyncio.run(self.client.place_order())
+        self.assertEqual(self.client.breaker.state, OPEN)
+
+    def assert_recovers(self):
+        """After an inconclusive probe the next call probes again and a healthy answer closes the breaker."""
+        self.assertEqual(self.client.breaker.state, OPEN)
+        self.client.responses.append(PLACED)
+        self.assertEqual(asyncio.run(self.client.place_order()), PLACED)
+        self.assertEqual(self.client.breaker.state, CLOSED)
+
+    def test_probe_cut_short_by_caller_deadline(self):
+        async def probe():
+            with deadlines.deadline(0.05):
+                return await self.client.place_order()
+
+        self.client.responses.append(1.0)
+        result = asyncio.run(probe())
+        self.assertTrue(result.get("timed_out"))
+        self.assert_recovers()
+
+    def test_rate_limited_probe(self):
+        self.client.responses.append(RATE_LIMITED)
+        result = asyncio.run(self.client.place_order())
+        self.assertEqual(result["status_code"], 429)
+        self.assert_recovers()
+
+    def test_cancelled_probe(self):
+        async def probe():
+            task = asyncio.create_task(self.client.place_order())
+            await asyncio.sleep(0.01)
+            self.assertEqual(self.client.breaker.state, HALF_OPEN)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+        self.client.responses.append(1.0)
+        asyncio.run(probe())
+        self.assert_recovers()
+
+    def test_failed_probe_reopens_with_a_new_cooldown(self):
+        breaker = CircuitBreaker(threshold=1, cooldown=60.0)
+        breaker.record_failure()
+        breaker._opened_at -= 60.0
+        self.assertTrue(breaker.allow())
+        breaker.record_failure()
+        breaker.release_probe()
+        self.assertEqual(breaker.state, OPEN)
+        self.assertFalse(breaker.allow())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+"""
+Fills of tracked live orders move the account P&L book once each, at the
+price of that fill, whichever broker read sees them first.
+"""
+import unittest
+from types import SimpleNamespace
+from app.services.execution import ExecutionLayer, OrderLeg
+from app.services.pnl_engine import ACCOUNT, PnLEngine
+from app.services.resource_versions import ORDERS
+from app.services.ui_feed import UIFeed
+
+LEG = OrderLeg("SBIN-EQ", "NSE", "BUY", 30, symbol_token="3045")
+
+
+class FakeSettings:
+    def subscribe(self, callback):
+        pass
+
+
+def book_item(order_id: str, state: str, filled: int, average_price: float):
+    return SimpleNamespace(orderid=order_id, state=state, filledshares=filled, averageprice=average_price)
+
+
+class FillTrackingTest(unittest.TestCase):
+    def setUp(self):
+        for singleton in (UIFeed, PnLEngine, ExecutionLayer):
+            singleton._instance = None
+        self.pnl = PnLEngine()
+        self.execution = ExecutionLayer(paper_mode=False, settings_service=FakeSettings(), pnl=self.pnl)
+
+    def tearDown(self):
+        for singleton in (UIFeed, PnLEngine, ExecutionLayer):
+            singleton._instance = None
+
+    def position(self):
+        return self.pnl.book((ACCOUNT, 1))["positions"][0]
+
+    def test_partial_fills_are_priced_individually(self):
+        self.execution.track_order(1, LEG, "101")
+        self.execution.observe_order("101", "open", 10, 100.0)
+        self.execution.observe_order("101", "open", 10, 100.0)  # seen again by another read
+        self.execution.observe_order("101", "complete", 30, 102.0)  # 20 more at 103
+        position = self.position()
+        self.assertEqual(position["quantity"], 30)
+        self.assertAlmostEqual(position["average_price"], 102.0)
+
+    def test_order_book_reads_apply_fills_and_finish_orders(self):
+        self.execution.track_order(1, LEG, "101")
+        self.execution._on_resource_changed(1, ORDERS, {"data": [book_item("101", "complete", 30, 100.0)]})
+        self.assertEqual(self.position()["quantity"], 30)
+        # A later refresh of the same order does not count its fills again
+        self.execution.track_order(1, LEG, "101")
+        self.execution.observe_order("101", "complete", 30, 100.0)
+        self.assertEqual(self.position()["quantity"], 30)
+
+    def test_untracked_and_paper_orders_are_ignored(self):
+        self.execution.track_order(1, LEG, "PAPER_x_0")
+        self.execution.observe_order("PAPER_x_0", "complete", 30, 100.0)
+        self.execution.observe_order("999", "complete", 30, 100.0)
+        self.assertIsNone(self.pnl.book((ACCOUNT, 1)))
+
+
+if __name__ == "__main__":
+    unittest.main()
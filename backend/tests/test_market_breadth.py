@@ -0,0 +1,44 @@
+"""
+The market breadth universe is the nearest unexpired future of each NFO
+underlying, and streamed ticks move its rankings.
+"""
+import unittest
+from datetime import date
+from app.services.market_breadth import MarketBreadthService, near_month_futures
+from app.services.symbol_master import Instrument
+
+
+def instrument(token: str, name: str, expiry: str, instrument_type: str = "FUTSTK", exchange: str = "NFO") -> Instrument:
+    return Instrument(token, f"{name}{expiry}FUT", name, exchange, instrument_type, expiry, -0.01, 25, 0.05)
+
+
+class NearMonthFuturesTest(unittest.TestCase):
+    def test_nearest_unexpired_future_per_underlying(self):
+        instruments = [
+            instrument("1", "SBIN", "26SEP2024"),  # expired
+            instrument("2", "SBIN", "31OCT2024"),
+            instrument("3", "SBIN", "28NOV2024"),
+            instrument("4", "NIFTY", "28NOV2024", "FUTIDX"),
+            instrument("5", "NIFTY", "31OCT2024", "OPTIDX"),
+            instrument("6", "SBIN", "", "", "NSE"),
+        ]
+        futures = near_month_futures(instruments, date(2024, 10, 1))
+        self.assertEqual(sorted(future.token for future in futures), ["2", "4"])
+
+
+class BreadthTicksTest(unittest.TestCase):
+    def test_ticks_rank_gainers_and_oi_buildup(self):
+        MarketBreadthService._instance = None
+        breadth = MarketBreadthService.get_instance()
+        breadth.on_tick("2", 100.0, close=100.0, oi=1000.0, symbol="SBIN")
+        breadth.on_tick("4", 100.0, close=100.0, oi=1000.0, symbol="NIFTY")
+        breadth.on_tick("2", 105.0, oi=1200.0)
+        breadth.on_tick("4", 98.0, oi=900.0)
+        self.assertTrue(breadth.is_live())
+        self.assertEqual([row["symbol"] for row in breadth.rank("PercPriceGainers")], ["SBIN"])
+        self.assertEqual([row["symbol"] for row in breadth.oi_buildup("Long Built Up")], ["SBIN"])
+        self.assertEqual([row["symbol"] for row in breadth.oi_buildup("Long Unwinding")], ["NIFTY"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+"""
+SmartStream packets decode to the ticks StrategyEngine.on_tick expects,
+and subscription messages group tokens by exchange type.
+"""
+import json
+import math
+import struct
+import unittest
+from app.services.market_stream import SUBSCRIBE, parse_packet, subscription_message
+
+
+def packet(exchange_type: int, token: str, ltp: int, mode: int = 1, volume: int = 0) -> bytes:
+    header = struct.pack("<bb25sqqq", mode, exchange_type, token.encode(), 7, 1_700_000_000_000, ltp)
+    if mode == 1:
+        return header
+    return header + struct.pack("<qqqddqqqq", 25, ltp, volume, 0.0, 0.0, ltp, ltp, ltp, ltp)
+
+
+class ParsePacketTest(unittest.TestCase):
+    def test_ltp_packet(self):
+        tick = parse_packet(packet(1, "2885", 123456))
+        self.assertEqual((tick.exchange, tick.token, tick.ltp, tick.time), ("NSE", "2885", 1234.56, 1_700_000_000.0))
+        self.assertTrue(math.isnan(tick.volume))
+        self.assertTrue(math.isnan(tick.oi))
+
+    def test_quote_packet_carries_volume(self):
+        tick = parse_packet(packet(2, "43210", 5025, mode=2, volume=98765))
+        self.assertEqual((tick.exchange, tick.ltp, tick.volume), ("NFO", 50.25, 98765.0))
+        self.assertTrue(math.isnan(tick.oi))
+
+    def test_currency_prices_use_seven_decimals(self):
+        self.assertAlmostEqual(parse_packet(packet(13, "1", 832_512_500)).ltp, 83.25125)
+
+    def test_short_or_unknown_packets_are_skipped(self):
+        self.assertIsNone(parse_packet(packet(1, "2885", 100)[:40]))
+        self.assertIsNone(parse_packet(packet(7, "2885", 100)))
+
+
+class SubscriptionMessageTest(unittest.TestCase):
+    def test_tokens_grouped_by_exchange_type(self):
+        message = json.loads(subscription_message(SUBSCRIBE, [("NSE", "2885"), ("NFO", "43210"), ("NSE", "11536")]))
+        self.assertEqual(message["action"], 1)
+        self.assertEqual(message["params"]["mode"], 2)
+        self.assertEqual(message["params"]["tokenList"], [
+            {"exchangeType": 2, "tokens": ["43210"]},
+            {"exchangeType": 1, "tokens": ["11536", "2885"]},
+        ])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+"""
+A chain's contracts are streamed while it is being viewed, and only
+contracts without a recent quote or tick are refetched.
+"""
+import asyncio
+import unittest
+from datetime import datetime
+from types import SimpleNamespace
+from app.services.broker_models import Quote
+from app.services.option_chain import IST, OptionChainService, OptionContract
+
+EXPIRY = f"28NOV{datetime.now(IST).year + 1}"
+CONTRACTS = [
+    OptionContract(token, f"NIFTY{EXPIRY}{strike}{side}", "NIFTY", EXPIRY, float(strike), side, 25)
+    for token, strike, side in (("1", 24000, "CE"), ("2", 24000, "PE"), ("3", 24100, "CE"), ("4", 24100, "PE"))
+]
+PRICES = {"1": 150.0, "2": 140.0, "3": 100.0, "4": 190.0}
+
+
+class FakeClient:
+    def __init__(self):
+        self.requested = []
+
+    async def get_quotes(self, tokens):
+        self.requested.append(sorted(tokens["NFO"]))
+        quotes = {
+            token: Quote.from_payload({"symbolToken": token, "ltp": PRICES[token], "opnInterest": 1000, "tradeVolume": 10})
+            for token in tokens["NFO"]
+        }
+        return SimpleNamespace(quotes=quotes, unfetched={})
+
+
+class OptionChainFreshnessTest(unittest.TestCase):
+    def setUp(self):
+        OptionChainService._instance = None
+        self.service = OptionChainService.get_instance()
+        self.service._contracts = {"NIFTY": {EXPIRY: CONTRACTS}}
+        self.service._contracts_loaded_on = datetime.now(IST).date()
+        self.client = FakeClient()
+
+    def tearDown(self):
+        OptionChainService._instance = None
+
+    def get_chain(self):
+        return asyncio.run(self.service.get_chain(self.client, "NIFTY", EXPIRY))
+
+    def test_only_contracts_without_recent_ticks_are_refetched(self):
+        chain = self.get_chain()
+        self.assertEqual(self.client.requested, [["1", "2", "3", "4"]])
+        self.assertEqual(self.service.instruments(), {("NFO", token) for token in PRICES})
+
+        chain.quoted_at[:] -= 60  # every quote is now stale
+        self.assertTrue(self.service.on_tick("3", 105.0, oi=1200.0))
+        self.assertFalse(self.service.on_tick("99", 1.0))
+        self.get_chain()
+        self.assertEqual(self.client.requested[-1], ["1", "2", "4"])
+        self.assertEqual(chain.ltp[0, 1], 105.0)
+        self.assertEqual(chain.oi[0, 1], 1200.0)
+
+    def test_idle_chains_are_not_streamed(self):
+        chain = self.get_chain()
+        chain.requested_at -= 3600
+        self.assertEqual(self.service.instruments(), set())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,36 @@
+"""
+Indicator names that Python would treat as the same identifier are
+rejected, and compiled rules read each operand from its own handle.
+"""
+import json
+import unittest
+from app.services.strategy_rules import StrategyRuleError, compile_rules
+
+
+def rules(indicators, entry, exit_):
+    return json.dumps({"indicators": indicators, "entry": entry, "exit": exit_, "symbol_token": "2885"})
+
+
+class IndicatorNameTest(unittest.TestCase):
+    def test_non_ascii_names_are_rejected(self):
+        params = rules(
+            {"ﬁ": {"indicator": "sma"}, "fi": {"indicator": "ema"}},
+            {"left": "ﬁ", "op": ">", "right": "fi"},
+            {"left": "fi", "op": ">", "right": "ﬁ"},
+        )
+        with self.assertRaisesRegex(StrategyRuleError, "ASCII identifier"):
+            compile_rules(params)
+
+    def test_operands_use_their_own_handles(self):
+        compiled = compile_rules(rules(
+            {"fast": {"indicator": "ema", "length": 10}, "slow": {"indicator": "ema", "length": 30}},
+            {"left": "fast", "op": ">", "right": "slow"},
+            {"left": "fast", "op": "<", "right": "slow"},
+        ))
+        compiled.handles["fast"].value, compiled.handles["slow"].value = 101.0, 100.0
+        self.assertEqual(compiled.signal(in_position=False), "entry")
+        self.assertIsNone(compiled.signal(in_position=True))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,52 @@
+"""
+Owned topics (P&L) only reach connections allowed to see the key's owner,
+for whole-topic subscriptions and for the latest values replayed on subscribe.
+"""
+import unittest
+from app.services.ui_feed import FeedConnection, UIFeed
+
+
+class OwnedTopicTest(unittest.TestCase):
+    def setUp(self):
+        UIFeed._instance = None
+        self.feed = UIFeed()
+        self.feed.register_topic("pnl", ("realised", "unrealised", "mtm"), prices=("realised",), owned=True)
+        self.topic = self.feed.topics["pnl"].index
+        self.feed.publish("pnl", "account:2", {"realised": 5.0})
+
+    def tearDown(self):
+        UIFeed._instance = None
+
+    def connect(self, may_see=None) -> FeedConnection:
+        connection = FeedConnection(None, "json", may_see)
+        self.feed.connections.add(connection)
+        return connection
+
+    def pending_keys(self, connection: FeedConnection):
+        return sorted(key for _, key in connection._pending)
+
+    def test_whole_topic_subscription_is_scoped(self):
+        mine = self.connect(lambda owner: owner in ("account:1", "strategy:7"))
+        self.feed._handle(mine, {"action": "subscribe", "topic": "pnl"})
+        self.assertEqual(self.pending_keys(mine), [])  # account:2 is not replayed
+        for key in ("account:1", "account:2", "strategy:7", "strategy:8"):
+            self.feed.publish("pnl", key, {"realised": 1.0})
+        self.assertEqual(self.pending_keys(mine), ["account:1", "strategy:7"])
+
+    def test_named_keys_of_other_owners_are_not_sent(self):
+        mine = self.connect(lambda owner: owner == "account:1")
+        self.feed._handle(mine, {"action": "subscribe", "topic": "pnl", "keys": ["account:2"]})
+        self.feed.publish("pnl", "account:2", {"realised": 6.0})
+        self.assertEqual(self.pending_keys(mine), [])
+
+    def test_connection_without_scope_sees_no_owned_keys(self):
+        anonymous = self.connect()
+        self.feed._handle(anonymous, {"action": "subscribe", "topic": "pnl"})
+        self.feed._handle(anonymous, {"action": "subscribe", "topic": "ticks"})
+        self.feed.publish("pnl", "account:1", {"realised": 1.0})
+        self.feed.publish("ticks", "NSE:2885", {"ltp": 100.0})
+        self.assertEqual(self.pending_keys(anonymous), ["NSE:2885"])
+
+
+if __name__ == "__main__":
+    unittest.main()
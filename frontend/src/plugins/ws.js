@@ -4,6 +4,79 @@ export class WSMessage {
   }
 }
 
+// Subprotocols of the /ws/live feed, in order of preference
+const PROTOCOLS = {
+  msgpack: 'algopilot.msgpack.v1',
+  json: 'algopilot.json.v1'
+}
+
+const textDecoder = new TextDecoder()
+
+// MessagePack decoder for the feed's frames (everything but extension types)
+export function decodeMsgpack(buffer) {
+  const view = new DataView(buffer)
+  const bytes = new Uint8Array(buffer)
+  let offset = 0
+
+  // Advance past a value that was read at the current offset
+  const take = (size, value) => {
+    offset += size
+    return value
+  }
+  const str = (length) => take(length, textDecoder.decode(bytes.subarray(offset, offset + length)))
+  const bin = (length) => take(length, bytes.slice(offset, offset + length))
+  const array = (length) => {
+    const value = new Array(length)
+    for (let i = 0; i < length; i++) value[i] = read()
+    return value
+  }
+  const map = (length) => {
+    const value = {}
+    for (let i = 0; i < length; i++) {
+      const key = read()
+      value[key] = read()
+    }
+    return value
+  }
+
+  function read() {
+    const type = bytes[offset++]
+    if (type <= 0x7f) return type
+    if (type <= 0x8f) return map(type & 0x0f)
+    if (type <= 0x9f) return array(type & 0x0f)
+    if (type <= 0xbf) return str(type & 0x1f)
+    if (type >= 0xe0) return type - 0x100
+    switch (type) {
+      case 0xc0: return null
+      case 0xc2: return false
+      case 0xc3: return true
+      case 0xc4: return bin(take(1, view.getUint8(offset)))
+      case 0xc5: return bin(take(2, view.getUint16(offset)))
+      case 0xc6: return bin(take(4, view.getUint32(offset)))
+      case 0xca: return take(4, view.getFloat32(offset))
+      case 0xcb: return take(8, view.getFloat64(offset))
+      case 0xcc: return take(1, view.getUint8(offset))
+      case 0xcd: return take(2, view.getUint16(offset))
+      case 0xce: return take(4, view.getUint32(offset))
+      case 0xcf: return take(8, Number(view.getBigUint64(offset)))
+      case 0xd0: return take(1, view.getInt8(offset))
+      case 0xd1: return take(2, view.getInt16(offset))
+      case 0xd2: return take(4, view.getInt32(offset))
+      case 0xd3: return take(8, Number(view.getBigInt64(offset)))
+      case 0xd9: return str(take(1, view.getUint8(offset)))
+      case 0xda: return str(take(2, view.getUint16(offset)))
+      case 0xdb: return str(take(4, view.getUint32(offset)))
+      case 0xdc: return array(take(2, view.getUint16(offset)))
+      case 0xdd: return array(take(4, view.getUint32(offset)))
+      case 0xde: return map(take(2, view.getUint16(offset)))
+      case 0xdf: return map(take(4, view.getUint32(offset)))
+    }
+    throw new Error(`Unsupported MessagePack type 0x${type.toString(16)}`)
+  }
+
+  return read()
+}
+
 class WebSocketClient {
   constructor() {
     this.ws = null
@@ -11,15 +84,23 @@ class WebSocketClient {
     this.reconnectAttempts = 0
     this.maxReconnectAttempts = 5
     this.reconnectDelay = 3000
+    this.preferredEncoding = 'msgpack'
+    this.schema = null // topics, fields and price scale from the server's hello
+    this.state = {} // topic -> key -> latest fields
+    this.callbacks = []
+    this.subscriptions = new Map() // topic -> Set of keys, or null for the whole topic
   }
 
-  connect(token) {
+  connect(token, encoding = this.preferredEncoding) {
     const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:'
     const host = import.meta.env.VITE_WS_HOST || 'localhost:8000'
     this.url = `${protocol}//${host}/ws/live?token=${token}`
+    this.preferredEncoding = encoding
 
     try {
-      this.ws = new WebSocket(this.url)
+      const protocols = encoding === 'msgpack' ? [PROTOCOLS.msgpack, PROTOCOLS.json] : [PROTOCOLS.json]
+      this.ws = new WebSocket(this.url, protocols)
+      this.ws.binaryType = 'arraybuffer'
       this.setupHandlers()
     } catch (error) {
       console.error('WebSocket connection error:', error)
@@ -33,8 +114,14 @@ class WebSocketClient {
     this.ws.onopen = () => {
       console.log('WebSocket connected')
       this.reconnectAttempts = 0
+      // The server forgets subscriptions with the connection
+      this.subscriptions.forEach((keys, topic) => {
+        this.send({ action: 'subscribe', topic, keys: keys && [...keys] })
+      })
     }
 
+    this.ws.onmessage = (event) => this.handleFrame(event.data)
+
     this.ws.onerror = (error) => {
       console.error('WebSocket error:', error)
     }
@@ -56,17 +143,68 @@ class WebSocketClient {
     }, this.reconnectDelay)
   }
 
-  onMessage(callback) {
-    if (this.ws) {
-      this.ws.onmessage = (event) => {
-        try {
-          const message = JSON.parse(event.data)
-          callback(message)
-        } catch (error) {
-          console.error('Error parsing WebSocket message:', error)
+  // Frames are [seq, [[topic index, key, {field index: value}], ...]] holding
+  // only changed fields. Prices come as integers in units of 1 / price_scale,
+  // or as the price itself when it is not a whole number of those units
+  handleFrame(data) {
+    let frame
+    try {
+      frame = typeof data === 'string' ? JSON.parse(data) : decodeMsgpack(data)
+    } catch (error) {
+      console.error('Error parsing WebSocket message:', error)
+      return
+    }
+
+    if (!Array.isArray(frame)) {
+      if (frame.type === 'hello') {
+        this.schema = {
+          ...frame,
+          topics: frame.topics.map((topic) => ({ ...topic, prices: new Set(topic.prices) }))
         }
+        this.state = {}
+      } else {
+        this.callbacks.forEach((callback) => callback(frame))
       }
+      return
+    }
+
+    const [, updates] = frame
+    for (const [topicIndex, key, fields] of updates) {
+      const topic = this.schema.topics[topicIndex]
+      const changed = {}
+      for (const [index, value] of Object.entries(fields)) {
+        const name = topic.fields[index]
+        const scaled = topic.prices.has(name) && Number.isInteger(value)
+        changed[name] = scaled ? value / this.schema.price_scale : value
+      }
+      const topicState = this.state[topic.name] || (this.state[topic.name] = {})
+      const data = Object.assign(topicState[key] || (topicState[key] = {}), changed)
+      this.callbacks.forEach((callback) => callback({ type: 'update', topic: topic.name, key, data, changed }))
+    }
+  }
+
+  onMessage(callback) {
+    this.callbacks.push(callback)
+  }
+
+  // keys like 'NSE:2885'; without keys, every key of the topic
+  subscribe(topic, keys = null) {
+    const current = this.subscriptions.get(topic)
+    const merged = keys && current !== null ? new Set([...(current || []), ...keys]) : null
+    this.subscriptions.set(topic, merged)
+    this.send({ action: 'subscribe', topic, keys })
+  }
+
+  unsubscribe(topic, keys = null) {
+    const current = this.subscriptions.get(topic)
+    if (!keys) {
+      this.subscriptions.delete(topic)
+    } else if (current) {
+      keys.forEach((key) => current.delete(key))
     }
+    const topicState = this.state[topic]
+    if (topicState) (keys || Object.keys(topicState)).forEach((key) => delete topicState[key])
+    this.send({ action: 'unsubscribe', topic, keys })
   }
 
   send(data) {
@@ -84,4 +222,3 @@ class WebSocketClient {
 }
 
 export const wsClient = new WebSocketClient()
-